@@ -0,0 +1,29 @@
+"""
+Module that defines the configs of stockmonitor project.
+"""
+
+from django.apps import AppConfig
+
+
+class StockMonitorConfig(AppConfig):
+    """
+    Class defining the configs of stockmonitor project.
+
+    Attributes:
+        name: Name of the app.
+
+    Methods:
+        ready: Connects project wide database tuning to new connections.
+    """
+
+    name = 'stockmonitor'
+
+
+    def ready(self):
+        """Method to connect project wide database tuning to new
+        connections, once apps are ready.
+        """
+
+        from .db import connect_signals
+
+        connect_signals()
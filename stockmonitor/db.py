@@ -0,0 +1,71 @@
+"""
+Module that defines project wide database tuning, applied to every new
+database connection.
+
+SQLite connections get the `SQLITE_PRAGMAS` setting applied as soon as they
+are opened, e.g. write-ahead logging, so that readers don't block the
+writer and writers wait for each other instead of failing. The receiver is
+connected by the project's app config (`stockmonitor.apps`) when apps are
+ready.
+
+Settings:
+    SQLITE_PRAGMAS (Dict[str, Union[int, str]]): Pragmas applied to every
+        new SQLite connection, like {'journal_mode': 'wal'} (default: none).
+"""
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+import re
+
+
+VALID_PRAGMA = re.compile(r'^[a-z_]+$')
+VALID_PRAGMA_VALUE = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+def apply_sqlite_pragmas(connection, pragmas):
+    """Applies pragmas to an open SQLite connection.
+
+    Args:
+        connection (DatabaseWrapper): A Django SQLite connection.
+        pragmas (Dict[str, Union[int, str]]): Pragmas and their values.
+
+    Raises:
+        ValueError: If a pragma or its value is not a plain name or number.
+    """
+
+    with connection.cursor() as cursor:
+        for pragma, value in pragmas.items():
+            # Pragmas don't accept parameters, so only plain names and
+            # numbers are formatted in.
+            if (
+                not VALID_PRAGMA.match(pragma) or
+                not VALID_PRAGMA_VALUE.match(str(value))
+            ):
+                raise ValueError('Invalid SQLite pragma {}={!r}.'.format(
+                    pragma, value
+                ))
+            cursor.execute('PRAGMA {} = {}'.format(pragma, value))
+
+
+def tune_new_connection(sender, connection, **kwargs):
+    """Function to apply `SQLITE_PRAGMAS` setting to every new SQLite
+    connection.
+
+    Args:
+        sender (Type): Class of the connection.
+        connection (DatabaseWrapper): The new connection.
+    """
+
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if connection.vendor == 'sqlite' and pragmas:
+        apply_sqlite_pragmas(connection, pragmas)
+
+
+def connect_signals():
+    """Connects the receivers of this module, called once apps are ready.
+    """
+
+    connection_created.connect(
+        tune_new_connection, dispatch_uid='stockmonitor.db.tune_new_connection'
+    )
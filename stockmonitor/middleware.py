@@ -0,0 +1,301 @@
+"""
+Module that defines project wide middlewares.
+
+Middlewares:
+    - CompressionMiddleware: Compresses JSON API responses with the best
+        encoding accepted by the client, out of zstd (when `zstandard` is
+        installed), brotli (when `brotli` is installed) and gzip. Compressed
+        bodies are kept in an LRU keyed by the hash of the body, so
+        identical payloads, like symbols data served from cache to many
+        users, are compressed only once. Other content types, like HTML
+        pages with CSRF tokens, are not compressed, as compression is
+        deterministic (no random padding like django's GZipMiddleware) and
+        would leak their secrets to BREACH like attacks.
+
+Settings:
+    RESPONSE_COMPRESSION (Dict[str, Any]): Configuration of compression.
+        Like below:
+        - ENCODINGS (List[str]): Encodings in order of preference (default:
+            ['zstd', 'br', 'gzip']). Encodings whose library isn't installed
+            are skipped.
+        - MIN_SIZE (int): Bodies smaller than this are not compressed
+            (default: 1024).
+        - CACHE_MAX_BYTES (int): Max bytes of compressed bodies kept in LRU,
+            0 disables it (default: 32 MB).
+        - CONTENT_TYPES (List[str]): Media types of compressed responses
+            (default: ['application/json']).
+"""
+
+from collections import OrderedDict
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.cache import patch_vary_headers
+
+import gzip
+import hashlib
+import re
+import threading
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+DEFAULT_RESPONSE_COMPRESSION_SETTINGS = {
+    'ENCODINGS': ['zstd', 'br', 'gzip'],
+    'MIN_SIZE': 1024,
+    'CACHE_MAX_BYTES': 32 * 1024 * 1024,
+    'CONTENT_TYPES': ['application/json'],
+}
+
+ACCEPT_ENCODING_ITEM = re.compile(
+    r'\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*'
+)
+
+
+def _compress_gzip(body):
+    # mtime is fixed, so that same body is always compressed to same bytes.
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+def _compress_brotli(body):
+    return brotli.compress(body, quality=5)
+
+
+def _compress_zstd(body):
+    return zstandard.ZstdCompressor(level=3).compress(body)
+
+
+COMPRESSORS = {
+    'gzip': _compress_gzip,
+}
+if brotli is not None:
+    COMPRESSORS['br'] = _compress_brotli
+if zstandard is not None:
+    COMPRESSORS['zstd'] = _compress_zstd
+
+
+def get_response_compression_settings():
+    """Returns the response compression settings merged over defaults.
+
+    Returns:
+        Dict[str, Any]: Response compression settings.
+    """
+
+    return {
+        **DEFAULT_RESPONSE_COMPRESSION_SETTINGS,
+        **getattr(settings, 'RESPONSE_COMPRESSION', {})
+    }
+
+
+def parse_accept_encoding(header):
+    """Parses an `Accept-Encoding` header.
+
+    Args:
+        header (str): Value of the header, like 'gzip, br;q=0.9'.
+
+    Returns:
+        Dict[str, float]: Quality of each accepted encoding.
+    """
+
+    qualities = {}
+    for item in header.split(','):
+        match = ACCEPT_ENCODING_ITEM.fullmatch(item)
+        if not match:
+            continue
+        try:
+            quality = float(match.group(2)) if match.group(2) else 1.0
+        except ValueError:
+            continue
+        qualities[match.group(1).lower()] = quality
+    return qualities
+
+
+def choose_encoding(header, encodings):
+    """Returns the encoding to use for a client, the one with highest
+    quality, ties broken by order of preference.
+
+    Args:
+        header (str): Value of `Accept-Encoding` header.
+        encodings (List[str]): Available encodings in order of preference.
+
+    Returns:
+        Optional[str]: Encoding, or None if client accepts none of them.
+    """
+
+    qualities = parse_accept_encoding(header)
+    best_encoding = None
+    best_quality = 0.0
+    for encoding in encodings:
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best_encoding = encoding
+            best_quality = quality
+    return best_encoding
+
+
+class CompressedBodyCache:
+    """
+    Class defining a thread safe LRU of compressed bodies, keyed by the
+    hash of the uncompressed body and the encoding, and bounded by the total
+    size of compressed bodies.
+
+    Attributes:
+        max_bytes: Max bytes of compressed bodies kept.
+        hits: Number of bodies served from LRU.
+        misses: Number of bodies compressed.
+
+    Methods:
+        get_or_compress: Returns the compressed body, compressing it when it
+            is not kept.
+        clear: Removes every compressed body.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._bodies = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+
+    def get_or_compress(self, body, encoding):
+        """Returns the compressed body, compressing it when it is not kept.
+
+        Args:
+            body (bytes): Uncompressed body.
+            encoding (str): Encoding of `COMPRESSORS`.
+
+        Returns:
+            bytes: Compressed body.
+        """
+
+        if not self.max_bytes:
+            return COMPRESSORS[encoding](body)
+
+        key = (hashlib.blake2b(body, digest_size=16).digest(), encoding)
+        with self._lock:
+            compressed_body = self._bodies.get(key)
+            if compressed_body is not None:
+                self._bodies.move_to_end(key)
+                self.hits += 1
+                return compressed_body
+            self.misses += 1
+
+        compressed_body = COMPRESSORS[encoding](body)
+        if len(compressed_body) > self.max_bytes:
+            return compressed_body
+
+        with self._lock:
+            if key not in self._bodies:
+                self._bodies[key] = compressed_body
+                self._size += len(compressed_body)
+            while self._size > self.max_bytes:
+                _, evicted_body = self._bodies.popitem(last=False)
+                self._size -= len(evicted_body)
+        return compressed_body
+
+
+    def clear(self):
+        """Removes every compressed body."""
+
+        with self._lock:
+            self._bodies.clear()
+            self._size = 0
+            self.hits = 0
+            self.misses = 0
+
+
+compressed_body_cache = CompressedBodyCache(
+    get_response_compression_settings()['CACHE_MAX_BYTES']
+)
+
+
+class CompressionMiddleware:
+    """
+    Middleware which compresses responses with the best encoding accepted
+    by the client. Only responses of `CONTENT_TYPES` are compressed, and
+    streaming responses, already encoded responses and small bodies are left
+    as they are.
+
+    Attributes:
+        get_response: Next middleware or view.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+
+    def __call__(self, request):
+        """Compresses the response of a request when possible.
+
+        Args:
+            request (HttpRequest): A Django request object.
+
+        Returns:
+            HttpResponse: Compressed or unchanged response.
+        """
+
+        response = self.get_response(request)
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+
+        compression_settings = get_response_compression_settings()
+        content_type = response.get('Content-Type', '').split(';')[0]
+        if content_type.strip().lower() not in (
+            compression_settings['CONTENT_TYPES']
+        ):
+            return response
+        if len(response.content) < compression_settings['MIN_SIZE']:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''), [
+                encoding for encoding in compression_settings['ENCODINGS']
+                if encoding in COMPRESSORS
+            ]
+        )
+        if encoding is None:
+            return response
+
+        compressed_body = compressed_body_cache.get_or_compress(
+            response.content, encoding
+        )
+        if len(compressed_body) >= len(response.content):
+            return response
+
+        response.content = compressed_body
+        response['Content-Length'] = str(len(compressed_body))
+        response['Content-Encoding'] = encoding
+        # Same as django's GZipMiddleware, a strong ETag of uncompressed
+        # body is made weak.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
+
+
+@receiver(setting_changed)
+def reset_compressed_body_cache_on_setting_change(sender, setting, **kwargs):
+    """Function to resize the compressed body cache when compression
+    settings are changed, like in tests.
+
+    Args:
+        sender (Type): A sender of setting changed signal.
+        setting (str): Name of the changed setting.
+    """
+
+    if setting == 'RESPONSE_COMPRESSION':
+        compressed_body_cache.clear()
+        compressed_body_cache.max_bytes = (
+            get_response_compression_settings()['CACHE_MAX_BYTES']
+        )
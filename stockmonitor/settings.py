@@ -12,6 +12,9 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 
+import os
+import tempfile
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -37,6 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'stockmonitor',
     'users',
     'watch_list',
     'rest_framework',
@@ -45,6 +49,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'stockmonitor.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -104,6 +109,38 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+AUTHENTICATION_BACKENDS = [
+    'users.backends.WatchListModelBackend',
+]
+
+
+# Password hashing
+# https://docs.djangoproject.com/en/4.2/topics/auth/passwords/
+#
+# Preferred hasher and its work factor can be changed with `PASSWORD_HASHER`
+# and `PASSWORD_HASH_ITERATIONS` environment variables. Stored passwords are
+# rehashed with the preferred settings on user's next successful login.
+
+PASSWORD_HASH_ITERATIONS = int(
+    os.environ.get('PASSWORD_HASH_ITERATIONS', 600000)
+)
+
+PASSWORD_HASHER = os.environ.get(
+    'PASSWORD_HASHER', 'users.hashers.ConfigurablePBKDF2PasswordHasher'
+)
+
+PASSWORD_HASHERS = [PASSWORD_HASHER] + [
+    hasher for hasher in [
+        'users.hashers.ConfigurablePBKDF2PasswordHasher',
+        'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+        'django.contrib.auth.hashers.Argon2PasswordHasher',
+        'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+        'django.contrib.auth.hashers.ScryptPasswordHasher',
+    ]
+    if hasher != PASSWORD_HASHER
+]
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
 
@@ -127,3 +164,211 @@ STATIC_ROOT = '/home/sahiljoster32/stock_monitor_backend'
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+#
+# Parsed symbols data is cached in `series` cache, which is file based so that
+# every worker process of a host shares one warm copy without any external
+# service. Its directory can be changed with `SERIES_CACHE_LOCATION`
+# environment variable, e.g. to a tmpfs mount like `/dev/shm/...`.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'series': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get(
+            'SERIES_CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'stockmonitor-series-cache')
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': 20000,
+        },
+    },
+}
+
+
+# Compression of responses, with LRU of compressed bodies shared by the
+# requests of a process. zstd and brotli are used when `zstandard` and
+# `brotli` packages are installed. Only JSON API responses are compressed,
+# pages with secrets like CSRF tokens are not.
+
+RESPONSE_COMPRESSION = {
+    'ENCODINGS': ['zstd', 'br', 'gzip'],
+    'MIN_SIZE': 1024,
+    'CACHE_MAX_BYTES': 32 * 1024 * 1024,
+    'CONTENT_TYPES': ['application/json'],
+}
+
+
+# Watchlist symbols write buffer, when enabled watchlist writes of many
+# requests are deferred and written in a single transaction.
+
+WATCHLIST_WRITE_BUFFER = {
+    'ENABLED': False,
+    'MAX_PENDING': 500,
+    'FLUSH_INTERVAL': 2.0,
+}
+
+
+# In-memory cache of auth tokens used by `CachedTokenAuthentication`, whose
+# entries are invalidated through versions of users kept in the cache shared
+# by worker processes.
+
+TOKEN_AUTH_CACHE = {
+    'MAX_SIZE': 10000,
+    'TTL': 300,
+    'CACHE_ALIAS': 'series',
+}
+
+
+# Listing file of the symbol master, used to reject unknown symbols and to
+# autocomplete symbols. Download it with `python manage.py update_symbol_master`.
+
+SYMBOL_MASTER_FILE = BASE_DIR / 'data' / 'listing_status.csv'
+
+
+# Alpha avantage quota and symbols data fetching. Symbols beyond the quota are
+# fetched in the background, so a watch list can have more symbols than quota.
+
+# Comma separated keys of `ALPHA_AVANTAGE_API_KEYS` environment variable are
+# used in turn, each one with its own quota of calls per minute. A key is
+# quarantined for `ALPHA_AVANTAGE_KEY_QUARANTINE` seconds once its quota is
+# reached. There is no default key, fetching symbols data without any key
+# raises `ImproperlyConfigured`.
+
+ALPHA_AVANTAGE_API_KEYS = [
+    key.strip() for key in os.environ.get(
+        'ALPHA_AVANTAGE_API_KEYS', ''
+    ).split(',') if key.strip()
+]
+
+# Windows and quarantines of keys are shared by the worker processes of the
+# host through state files of this directory, so N workers don't spend N
+# times the quota of a key.
+
+ALPHA_AVANTAGE_QUOTA_DIR = os.environ.get(
+    'ALPHA_AVANTAGE_QUOTA_DIR',
+    os.path.join(tempfile.gettempdir(), 'stockmonitor-quota')
+)
+
+ALPHA_AVANTAGE_API_URL = os.environ.get(
+    'ALPHA_AVANTAGE_API_URL', 'https://www.alphavantage.co/query'
+)
+
+ALPHA_AVANTAGE_CALLS_PER_MINUTE = 5
+
+ALPHA_AVANTAGE_KEY_QUARANTINE = 60
+
+SYMBOLS_DATA_CACHE_TTL = 60
+
+SYMBOLS_DATA_CACHE_ALIAS = 'series'
+
+WATCHLIST_MAX_SYMBOLS = 500
+
+# On-disk history of fetched candles, memory-mapped by every worker process.
+
+CANDLE_STORE = {
+    'ENABLED': True,
+    'DIR': os.environ.get(
+        'CANDLE_STORE_DIR',
+        os.path.join(tempfile.gettempdir(), 'stockmonitor-candles')
+    ),
+    'COMPACT_AFTER': 1024,
+}
+
+# Worker processes parsing large batches of upstream payloads, only used
+# when the host has more than one cpu.
+
+PARSE_POOL = {
+    'ENABLED': (os.cpu_count() or 1) > 1,
+    'WORKERS': None,
+    'MIN_BATCH': 16,
+}
+
+# Record or replay of upstream api responses, see
+# `watch_list/wrapper/cassette.py`.
+
+UPSTREAM_CASSETTE = {
+    'MODE': os.environ.get('UPSTREAM_CASSETTE_MODE') or None,
+    'PATH': os.environ.get(
+        'UPSTREAM_CASSETTE_PATH', BASE_DIR / 'upstream_cassette.jsonl.gz'
+    ),
+    'REPLAY_TIMING': os.environ.get(
+        'UPSTREAM_CASSETTE_REPLAY_TIMING', 'original'
+    ),
+}
+
+# Background fetch jobs of asynchronous `watchList/symbols-data` requests.
+
+FETCH_JOBS = {
+    'WORKERS': 4,
+    'TIMEOUT': 300,
+    'RESULT_TTL': 900,
+}
+
+# Price alerts evaluated on ingested candles, see
+# `watch_list/price_alerts.py`.
+
+PRICE_ALERTS = {
+    'ENABLED': True,
+    'MAX_PER_USER': 100,
+    'SYNC_INTERVAL': 60,
+    'SYNC_OVERLAP': 300,
+}
+
+# Max outbound requests in flight to each upstream provider, see
+# `watch_list/wrapper/concurrency.py`.
+
+UPSTREAM_CONCURRENCY = {
+    'MAX_CONCURRENT': 8,
+}
+
+# Load shedding of `watchList/symbols-data` requests with 503 errors, see
+# `watch_list/admission.py`.
+
+ADMISSION_CONTROL = {
+    'ENABLED': True,
+    'MAX_CONCURRENT': 16,
+    'MAX_QUEUE': 64,
+    'MAX_WAIT': 5.0,
+}
+
+# Sliding window rate of `watchList/symbols-data` requests of each user, see
+# `watch_list/throttling.py`. Set `CACHE_ALIAS` to share counts by worker
+# processes.
+
+SYMBOLS_DATA_THROTTLE = {
+    'ENABLED': True,
+    'RATE': '60/m',
+    'CACHE_ALIAS': None,
+}
+
+# Trading sessions of exchanges, with holidays of `HOLIDAYS_FILE`, see
+# `watch_list/wrapper/market_calendar.py`.
+
+MARKET_CALENDAR = {
+    'DEFAULT_EXCHANGE': 'US',
+}
+
+# Background refresh of watched and requested symbols while their market is
+# open, more often the more they are in demand, see
+# `watch_list/refresh_scheduler.py`.
+
+REFRESH_SCHEDULER = {
+    'ENABLED': True,
+    'INTERVAL': '5min',
+    'MIN_INTERVAL': 300,
+    'MAX_INTERVAL': 3600,
+    'HOT_SCORE': 10,
+    'CLOSE_DELAY': 60,
+    # Scheduler runs in the worker process holding the lock file of this
+    # directory, other processes hand their symbols over to it.
+    'STATE_DIR': os.environ.get(
+        'REFRESH_SCHEDULER_STATE_DIR',
+        os.path.join(tempfile.gettempdir(), 'stockmonitor-refresh')
+    ),
+}
@@ -0,0 +1,106 @@
+"""
+Production settings for stockmonitor project, on top of `settings`.
+
+Use it with `DJANGO_SETTINGS_MODULE=stockmonitor.settings_production`, along
+with `DJANGO_SECRET_KEY` and `DJANGO_ALLOWED_HOSTS` (comma separated)
+environment variables, which are required. Database connections are
+persistent (`CONN_MAX_AGE`) and checked before reuse (`CONN_HEALTH_CHECKS`),
+so a request doesn't pay for a new connection.
+
+SQLite is used by default, tuned for concurrent writers of many worker
+processes (see `stockmonitor.sqlite3` and `stockmonitor.db`). Setting
+`POSTGRES_DB` environment variable switches to PostgreSQL, with
+`POSTGRES_USER`, `POSTGRES_PASSWORD`, `POSTGRES_HOST` and `POSTGRES_PORT`.
+Connections are pooled per worker thread by `CONN_MAX_AGE`; to pool them
+across workers, point `POSTGRES_HOST` to pgbouncer and set
+`POSTGRES_POOLER=pgbouncer`.
+"""
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+
+import os
+
+
+# Secret key and hosts of development settings are not used in production.
+
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', '')
+
+if not SECRET_KEY:
+    raise ImproperlyConfigured(
+        'DJANGO_SECRET_KEY environment variable is required in production.'
+    )
+
+DEBUG = False
+
+ALLOWED_HOSTS = [
+    host.strip()
+    for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',')
+    if host.strip()
+]
+
+if not ALLOWED_HOSTS:
+    raise ImproperlyConfigured(
+        'DJANGO_ALLOWED_HOSTS environment variable is required in '
+        'production.'
+    )
+
+
+# Database
+# https://docs.djangoproject.com/en/4.2/ref/databases/#persistent-connections
+
+CONN_MAX_AGE = int(os.environ.get('DATABASE_CONN_MAX_AGE', 600))
+
+if os.environ.get('POSTGRES_DB'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ['POSTGRES_DB'],
+            'USER': os.environ.get('POSTGRES_USER', ''),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            # Server side cursors don't work with transaction pooling of
+            # pgbouncer.
+            'DISABLE_SERVER_SIDE_CURSORS': (
+                os.environ.get('POSTGRES_POOLER') == 'pgbouncer'
+            ),
+            'OPTIONS': {
+                'connect_timeout': 5,
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'stockmonitor.sqlite3',
+            'NAME': os.environ.get(
+                'SQLITE_PATH', BASE_DIR / 'db.sqlite3'  # noqa: F405
+            ),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # Seconds a writer waits for the lock of another writer.
+                'timeout': 20,
+                # Transactions take the write lock when they begin, so they
+                # wait for other writers instead of failing.
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
+    }
+
+# Applied to every new SQLite connection by `stockmonitor.db`. With WAL
+# readers don't block the writer, and with synchronous=NORMAL commits don't
+# wait for fsync of the WAL (a power loss may lose last commits, but never
+# corrupts the database).
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 20000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'memory',
+}
@@ -0,0 +1,3 @@
+"""
+SQLite database backend of stockmonitor project, see `base`.
+"""
@@ -0,0 +1,58 @@
+"""
+Module that defines the SQLite database backend of stockmonitor project,
+django's SQLite backend with a configurable transaction mode.
+
+Django starts transactions of SQLite with a plain `BEGIN`, which takes the
+write lock only at the first write. When another connection writes in the
+meantime, the upgrade fails at once with 'database is locked', whatever the
+busy timeout, so concurrent read-modify-write transactions fail under load.
+With `'transaction_mode': 'IMMEDIATE'` in `OPTIONS`, transactions take the
+write lock when they begin and wait for it up to the busy timeout instead.
+The option has the same name and meaning as in django 5.1.
+
+Usage:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'stockmonitor.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+        }
+    }
+"""
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    Class defining a SQLite connection which begins transactions in the
+    `transaction_mode` of its `OPTIONS`.
+    """
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        transaction_mode = params.pop('transaction_mode', None)
+        if (
+            transaction_mode is not None and
+            transaction_mode.upper() not in TRANSACTION_MODES
+        ):
+            raise ImproperlyConfigured(
+                'transaction_mode must be one of {}.'.format(
+                    ', '.join(TRANSACTION_MODES)
+                )
+            )
+        return params
+
+
+    def _start_transaction_under_autocommit(self):
+        transaction_mode = self.settings_dict['OPTIONS'].get(
+            'transaction_mode'
+        )
+        if transaction_mode is None:
+            super()._start_transaction_under_autocommit()
+        else:
+            self.cursor().execute('BEGIN {}'.format(transaction_mode.upper()))
@@ -0,0 +1,402 @@
+"""
+Module for defining the authentication classes of users app.
+
+`CachedTokenAuthentication` resolves the DRF auth tokens through a bounded
+in-memory LRU cache with expiry, so an authenticated request doesn't need a
+DB query to find its user and the user's watchlist.
+
+Every user has a version kept in a cache backend shared by worker
+processes, which is changed whenever a token of the user is deleted, or the
+user (or user's watchlist) is changed or deleted, in any process. A cached
+entry is only used while the version of its user is the one it was cached
+with, so it costs a shared cache lookup instead of a DB query. Changes made
+by queryset `update` calls, which send no signal, are picked up once the
+entry expires. The symbols of a cached watchlist are not trusted to be the
+stored ones, see `WatchList.get_stored_symbols`.
+
+Settings:
+    TOKEN_AUTH_CACHE (Dict[str, Any]): Configuration of token cache. Like
+        below:
+        - MAX_SIZE (int): Max number of cached tokens (default: 10000).
+        - TTL (float): Seconds after which a cached token expires
+            (default: 300).
+        - CACHE_ALIAS (Optional[str]): Cache backend of versions of users,
+            shared by worker processes. When not set, only changes of this
+            process invalidate cached tokens (default: None).
+"""
+
+from collections import OrderedDict
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .models import WatchList, watchlist_symbols_bulk_updated
+
+import copy
+import threading
+import time
+import uuid
+
+
+DEFAULT_TOKEN_AUTH_CACHE_SETTINGS = {
+    'MAX_SIZE': 10000,
+    'TTL': 300,
+    'CACHE_ALIAS': None,
+}
+
+
+class TokenCache:
+    """
+    Class defining a thread safe LRU cache of token key to user, where
+    every entry expires after `ttl` seconds, or once the shared version of
+    its user is changed.
+
+    Attributes:
+        max_size: Max number of cached tokens, least recently used token
+            is evicted when cache is full.
+        ttl: Seconds after which a cached token expires.
+        cache_alias: Cache backend of versions of users, or None.
+
+    Methods:
+        get: Returns a copy of the cached user of a token key.
+        set: Caches the user of a token key.
+        get_version: Returns the shared version of a user.
+        invalidate_key: Removes a token key from cache.
+        invalidate_user: Removes all token keys of a user from cache, in
+            every process.
+        clear: Removes everything from cache.
+    """
+
+    def __init__(self, max_size=10000, ttl=300, cache_alias=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.cache_alias = cache_alias
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self._lock = threading.Lock()
+
+
+    def get(self, key):
+        """Returns a copy of the cached user of a token key, copy is
+        returned so that a request can change its user (or user's watchlist)
+        without changing the cached one.
+
+        Args:
+            key (str): Token key.
+
+        Returns:
+            Optional[User]: Cached user along with its watchlist, or None
+            if the key is not cached, expired or its user was changed.
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            user, expires_at, version = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                return None
+
+        if self.cache_alias and version != caches[self.cache_alias].get(
+            get_user_version_key(user.pk)
+        ):
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    self._remove(key)
+            return None
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        return copy_user_with_watchlist(user)
+
+
+    def set(self, key, user):
+        """Caches the user of a token key.
+
+        Args:
+            key (str): Token key.
+            user (User): User (with loaded watchlist) of the token.
+        """
+
+        version = self.get_version(user.pk)
+        user = copy_user_with_watchlist(user)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (user, time.monotonic() + self.ttl, version)
+            self._keys_by_user.setdefault(user.pk, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+
+    def get_version(self, user_id):
+        """Returns the shared version of a user, a version is created when
+        the user has none yet (or it was evicted).
+
+        Args:
+            user_id (int): Primary key of the user.
+
+        Returns:
+            Optional[str]: Version, or None if versions are not shared.
+        """
+
+        if not self.cache_alias:
+            return None
+        cache = caches[self.cache_alias]
+        version_key = get_user_version_key(user_id)
+        cache.add(version_key, uuid.uuid4().hex, None)
+        return cache.get(version_key)
+
+
+    def invalidate_key(self, key):
+        """Removes a token key from cache.
+
+        Args:
+            key (str): Token key.
+        """
+
+        with self._lock:
+            self._remove(key)
+
+
+    def invalidate_user(self, user_id):
+        """Removes all token keys of a user from cache, and changes the
+        shared version of the user so that other processes drop them too.
+        Version is changed again once the current transaction commits, so a
+        process which loaded the user before the commit drops it as well.
+
+        Args:
+            user_id (int): Primary key of the user.
+        """
+
+        with self._lock:
+            for key in list(self._keys_by_user.get(user_id, ())):
+                self._remove(key)
+
+        if self.cache_alias:
+            self._change_version(user_id)
+            transaction.on_commit(lambda: self._change_version(user_id))
+
+
+    def _change_version(self, user_id):
+        """Changes the shared version of a user.
+
+        Args:
+            user_id (int): Primary key of the user.
+        """
+
+        caches[self.cache_alias].set(
+            get_user_version_key(user_id), uuid.uuid4().hex, None
+        )
+
+
+    def clear(self):
+        """Removes everything from cache."""
+
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    def _remove(self, key):
+        """Removes a token key from cache, lock must be held by caller.
+
+        Args:
+            key (str): Token key.
+        """
+
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        user_keys = self._keys_by_user.get(entry[0].pk)
+        if user_keys is not None:
+            user_keys.discard(key)
+            if not user_keys:
+                del self._keys_by_user[entry[0].pk]
+
+
+def get_user_version_key(user_id):
+    """Returns the shared cache key of version of a user.
+
+    Args:
+        user_id (int): Primary key of the user.
+
+    Returns:
+        str: Cache key.
+    """
+
+    return 'token-user-version:{}'.format(user_id)
+
+
+def copy_user_with_watchlist(user):
+    """Returns a copy of user along with a copy of its loaded watchlist.
+    Snapshot of the stored symbols of watchlist is not copied, as another
+    process may write the symbols while the copy is cached.
+
+    Args:
+        user (User): A user model instance.
+
+    Returns:
+        User: Copy of the user model instance.
+    """
+
+    user_copy = copy.copy(user)
+    watchlist = User.watchlist.related.get_cached_value(user, default=None)
+    if watchlist is not None:
+        watchlist_copy = copy.copy(watchlist)
+        watchlist_copy.symbols = copy.deepcopy(watchlist.symbols)
+        watchlist_copy.__dict__.pop('_loaded_symbols', None)
+        User.watchlist.related.set_cached_value(user_copy, watchlist_copy)
+        WatchList.user.field.set_cached_value(watchlist_copy, user_copy)
+    return user_copy
+
+
+def get_token_cache_settings():
+    """Returns the token cache settings merged over defaults.
+
+    Returns:
+        Dict[str, Any]: Token cache settings.
+    """
+
+    return {
+        **DEFAULT_TOKEN_AUTH_CACHE_SETTINGS,
+        **getattr(settings, 'TOKEN_AUTH_CACHE', {})
+    }
+
+
+token_cache = TokenCache(
+    max_size=get_token_cache_settings()['MAX_SIZE'],
+    ttl=get_token_cache_settings()['TTL'],
+    cache_alias=get_token_cache_settings()['CACHE_ALIAS']
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token based authentication which resolves token keys through
+    `token_cache`. On a cache miss, token, user and user's watchlist are
+    loaded with a single DB query.
+
+    Methods:
+        authenticate_credentials: Returns the user and token of a token key.
+    """
+
+    def authenticate_credentials(self, key):
+        """This method returns the user and token of a token key, from
+        cache if possible otherwise from DB.
+
+        Args:
+            key (str): Token key sent by the client.
+
+        Returns:
+            Tuple[User, str]: Authenticated user and token key.
+
+        Raises:
+            AuthenticationFailed: Invalid token.
+            AuthenticationFailed: User inactive or deleted.
+        """
+
+        user = token_cache.get(key)
+        if user is not None:
+            return (user, key)
+
+        try:
+            token = Token.objects.select_related(
+                'user', 'user__watchlist'
+            ).get(key=key)
+        except Token.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+
+        token_cache.set(key, token.user)
+        return (token.user, key)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    """Function to remove a deleted token from token cache, of every
+    process.
+
+    Args:
+        sender (Type[Model]): A model from which delete signal is generated.
+        instance (Model): A deleted model instance.
+    """
+
+    token_cache.invalidate_key(instance.key)
+    token_cache.invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_changed_user(sender, instance, **kwargs):
+    """Function to remove the tokens of a changed (like deactivated) or
+    deleted user from token cache.
+
+    Args:
+        sender (Type[Model]): A model from which signal is generated.
+        instance (Model): A changed or deleted model instance.
+    """
+
+    token_cache.invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=WatchList)
+def invalidate_changed_watchlist(sender, instance, **kwargs):
+    """Function to remove the tokens of a user from token cache whenever
+    user's watchlist is changed.
+
+    Args:
+        sender (Type[Model]): A model from which save signal is generated.
+        instance (Model): A changed model instance.
+    """
+
+    token_cache.invalidate_user(instance.user_id)
+
+
+@receiver(watchlist_symbols_bulk_updated)
+def invalidate_bulk_updated_watchlists(sender, watchlists, **kwargs):
+    """Function to remove the tokens of users from token cache whenever
+    their watchlists are changed through a bulk update.
+
+    Args:
+        sender (Type[Model]): A model from which signal is generated.
+        watchlists (List[WatchList]): Changed watchlists.
+    """
+
+    for watchlist in watchlists:
+        token_cache.invalidate_user(watchlist.user_id)
+
+
+@receiver(setting_changed)
+def reset_token_cache_on_setting_change(sender, setting, **kwargs):
+    """Function to reconfigure and clear token cache when its settings are
+    changed, like in tests.
+
+    Args:
+        sender (Type): A sender of setting changed signal.
+        setting (str): Name of the changed setting.
+    """
+
+    if setting == 'TOKEN_AUTH_CACHE':
+        token_settings = get_token_cache_settings()
+        token_cache.max_size = token_settings['MAX_SIZE']
+        token_cache.ttl = token_settings['TTL']
+        token_cache.cache_alias = token_settings['CACHE_ALIAS']
+        token_cache.clear()
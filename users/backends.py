@@ -0,0 +1,56 @@
+"""
+Module for defining the authentication backends of users app.
+"""
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+
+UserModel = get_user_model()
+
+
+class WatchListModelBackend(ModelBackend):
+    """
+    Authentication backend which authenticates against django's user model
+    like `ModelBackend`, but loads the user along with its watchlist and
+    auth token in a single query. So, a login doesn't need further queries
+    to build its response.
+
+    Methods:
+        authenticate: Authenticates the user with username and password.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        """This method authenticates the user with username and password,
+        and rehashes the stored password when password hasher settings are
+        changed.
+
+        Args:
+            request (Request): A Django request object.
+            username (str): Username of the user.
+            password (str): Password of the user.
+            **kwargs: Additional keyword arguments.
+
+        Returns:
+            Optional[User]: Authenticated user, or None if credentials are
+            not correct.
+        """
+
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        try:
+            user = UserModel._default_manager.select_related(
+                'watchlist', 'auth_token'
+            ).get(**{UserModel.USERNAME_FIELD: username})
+        except UserModel.DoesNotExist:
+            # Running the password hasher once to reduce the timing difference
+            # between an existing and a nonexistent user.
+            UserModel().set_password(password)
+            return None
+
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
@@ -0,0 +1,37 @@
+"""
+Module for defining the password hashers of users app.
+
+Password hashing is the most CPU expensive part of a login, so its work
+factor is configurable through `PASSWORD_HASH_ITERATIONS` setting. Whenever
+the work factor (or the preferred hasher in `PASSWORD_HASHERS`) is changed,
+the stored password of a user is transparently rehashed on user's next
+successful login.
+"""
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class ConfigurablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2 + HMAC + SHA256 password hasher, whose number of iterations is
+    read from `PASSWORD_HASH_ITERATIONS` setting. It keeps the algorithm name
+    of django's default hasher, so already stored passwords are verified
+    by it.
+
+    Attributes:
+        iterations: Number of PBKDF2 iterations used for new hashes.
+    """
+
+    @property
+    def iterations(self):
+        """Returns the number of PBKDF2 iterations used for new hashes.
+
+        Returns:
+            int: Number of PBKDF2 iterations.
+        """
+
+        return getattr(
+            settings, 'PASSWORD_HASH_ITERATIONS',
+            PBKDF2PasswordHasher.iterations
+        )
@@ -0,0 +1,249 @@
+"""
+Module that defines `bench_db_writes` management command, which measures
+concurrent write throughput of the configured database engine, with worker
+processes updating watchlist-like rows in read-modify-write transactions
+like `FetchSymbolsData` does.
+
+For SQLite, every profile runs on its own scratch database file:
+    - django's SQLite backend with a new connection per write (defaults),
+    - django's SQLite backend with a persistent connection,
+    - configured backend and `OPTIONS`, with `SQLITE_PRAGMAS` of settings
+        (like WAL) and a persistent connection.
+Other engines run on the configured database, in a scratch table which is
+dropped afterwards.
+
+Usage:
+    python manage.py bench_db_writes --workers 16 --seconds 5
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError
+from django.db.utils import ConnectionHandler
+
+from multiprocessing import get_all_start_methods, get_context
+import os
+import tempfile
+import time
+
+
+# Number of rows updated by workers, like watchlists of different users.
+ROWS = 1000
+
+TABLE = 'bench_db_writes'
+
+
+def _run_worker(index, db_settings, settings_overrides, reconnect,
+                barrier, seconds, results):
+    """Updates random rows until time is up, runs in a worker process.
+    Django is set up when worker is not forked from an already set up
+    process.
+
+    Args:
+        index (int): Index of the worker.
+        db_settings (Dict[str, Any]): Settings of the database.
+        settings_overrides (Dict[str, Any]): Settings to override in worker.
+        reconnect (bool): Whether a new connection is opened per write.
+        barrier (Barrier): Barrier of workers starting together.
+        seconds (float): Duration of the benchmark.
+        results (Queue): Queue of (writes, errors, latencies) of workers.
+    """
+
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+    for name, value in settings_overrides.items():
+        setattr(settings, name, value)
+
+    connection = ConnectionHandler({'default': db_settings})['default']
+    row = index
+    writes = 0
+    errors = 0
+    latencies = []
+    barrier.wait()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        row = (row * 7919 + 17) % ROWS
+        start = time.perf_counter()
+        try:
+            # Same as `transaction.atomic`, so that transactions begin like
+            # in views.
+            connection.set_autocommit(
+                False, force_begin_transaction_with_broken_autocommit=True
+            )
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        'SELECT version FROM {} WHERE id = %s'.format(TABLE),
+                        [row]
+                    )
+                    version = cursor.fetchone()[0]
+                    cursor.execute(
+                        'UPDATE {} SET symbols = %s, version = %s '
+                        'WHERE id = %s'.format(TABLE),
+                        ['MSFT GOOG TSLA {}'.format(version), version + 1, row]
+                    )
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            finally:
+                connection.set_autocommit(True)
+        except OperationalError:
+            # Like 'database is locked' of SQLite.
+            errors += 1
+            continue
+        finally:
+            if reconnect:
+                connection.close()
+        writes += 1
+        latencies.append(time.perf_counter() - start)
+    connection.close()
+    results.put((writes, errors, latencies))
+
+
+class Command(BaseCommand):
+    """
+    Class defining `bench_db_writes` management command.
+
+    Attributes:
+        help: Help text of the command.
+    """
+
+    help = 'Measures concurrent write throughput of the database.'
+
+
+    def add_arguments(self, parser):
+        """Method to define arguments of the command.
+
+        Args:
+            parser (ArgumentParser): Parser of command arguments.
+        """
+
+        parser.add_argument(
+            '--workers', type=int, default=16,
+            help='Number of concurrent worker processes.'
+        )
+        parser.add_argument(
+            '--seconds', type=float, default=5.0,
+            help='Duration of each run.'
+        )
+
+
+    def handle(self, *args, **options):
+        """Method which runs the benchmark and prints its results.
+
+        Args:
+            *args: Additional named arguments.
+            **options: Parsed command arguments.
+        """
+
+        db_settings = dict(settings.DATABASES['default'])
+        self.stdout.write('engine: {}, workers: {}, seconds: {}'.format(
+            db_settings['ENGINE'], options['workers'], options['seconds']
+        ))
+
+        connection = ConnectionHandler({'default': db_settings})['default']
+        if connection.vendor != 'sqlite':
+            self.run('configured database', db_settings, {}, False, options)
+            return
+
+        default_db_settings = {
+            **db_settings,
+            'ENGINE': 'django.db.backends.sqlite3',
+            'OPTIONS': {},
+        }
+        pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+        with tempfile.TemporaryDirectory() as directory:
+            for index, (name, run_db_settings, run_pragmas, reconnect) in (
+                enumerate((
+                    ('default sqlite, connection per write',
+                     default_db_settings, {}, True),
+                    ('default sqlite, persistent connection',
+                     default_db_settings, {}, False),
+                    ('{} {}, SQLITE_PRAGMAS {}, persistent connection'.format(
+                        db_settings['ENGINE'], db_settings['OPTIONS'],
+                        pragmas
+                    ), db_settings, pragmas, False),
+                ))
+            ):
+                self.run(name, {
+                    **run_db_settings,
+                    'NAME': os.path.join(
+                        directory, 'bench{}.sqlite3'.format(index)
+                    ),
+                }, {'SQLITE_PRAGMAS': run_pragmas}, reconnect, options)
+
+
+    def run(self, name, db_settings, settings_overrides, reconnect, options):
+        """Method which creates the scratch table, runs the workers and
+        prints their throughput.
+
+        Args:
+            name (str): Name of the run.
+            db_settings (Dict[str, Any]): Settings of the database.
+            settings_overrides (Dict[str, Any]): Settings to override in
+                workers.
+            reconnect (bool): Whether a new connection is opened per write.
+            options (Dict[str, Any]): Parsed command arguments.
+        """
+
+        for setting_name, value in settings_overrides.items():
+            setattr(settings, setting_name, value)
+        connection = ConnectionHandler({'default': db_settings})['default']
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS {}'.format(TABLE))
+            cursor.execute(
+                'CREATE TABLE {} (id integer PRIMARY KEY, symbols text, '
+                'version integer)'.format(TABLE)
+            )
+            for row in range(ROWS):
+                cursor.execute(
+                    'INSERT INTO {} VALUES (%s, %s, 0)'.format(TABLE),
+                    [row, 'MSFT']
+                )
+        connection.close()
+
+        context = get_context(
+            'fork' if 'fork' in get_all_start_methods() else 'spawn'
+        )
+        barrier = context.Barrier(options['workers'])
+        results = context.Queue()
+        workers = [
+            context.Process(target=_run_worker, args=(
+                index, db_settings, settings_overrides, reconnect, barrier,
+                options['seconds'], results
+            ))
+            for index in range(options['workers'])
+        ]
+        for worker in workers:
+            worker.start()
+        writes = 0
+        errors = 0
+        latencies = []
+        for _ in workers:
+            worker_writes, worker_errors, worker_latencies = results.get()
+            writes += worker_writes
+            errors += worker_errors
+            latencies.extend(worker_latencies)
+        for worker in workers:
+            worker.join()
+
+        if connection.vendor != 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('DROP TABLE {}'.format(TABLE))
+            connection.close()
+
+        latencies.sort()
+        self.stdout.write(name)
+        self.stdout.write(
+            '  {:.0f} writes/s, {} failed, p50 {:.2f} ms, '
+            'p99 {:.2f} ms'.format(
+                writes / options['seconds'], errors,
+                latencies[len(latencies) // 2] * 1e3 if latencies else 0,
+                latencies[int(len(latencies) * 0.99)] * 1e3
+                if latencies else 0
+            )
+        )
@@ -0,0 +1,129 @@
+"""
+Module that defines `bench_logins` management command, which benchmarks
+the login endpoint in a single process and reports logins per second per
+core. Benchmark user is created in a transaction which is rolled back at
+the end, so the DB is left untouched.
+
+Usage:
+    python manage.py bench_logins --logins 200 --iterations 600000
+"""
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, reset_queries, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+import time
+
+
+class Command(BaseCommand):
+    """
+    Class defining `bench_logins` management command.
+
+    Attributes:
+        help: Help text of the command.
+    """
+
+    help = 'Benchmarks the login endpoint and reports logins/sec per core.'
+
+
+    def add_arguments(self, parser):
+        """Method to define arguments of the command.
+
+        Args:
+            parser (ArgumentParser): Parser of command arguments.
+        """
+
+        parser.add_argument(
+            '--logins', type=int, default=200,
+            help='Number of logins to make.'
+        )
+        parser.add_argument(
+            '--iterations', type=int, default=None,
+            help='PBKDF2 iterations, defaults to PASSWORD_HASH_ITERATIONS.'
+        )
+
+
+    def handle(self, *args, **options):
+        """Method which runs the benchmark and prints its results.
+
+        Args:
+            *args: Additional named arguments.
+            **options: Parsed command arguments.
+        """
+
+        hasher_settings = {}
+        if options['iterations'] is not None:
+            hasher_settings['PASSWORD_HASH_ITERATIONS'] = options['iterations']
+
+        with override_settings(**hasher_settings):
+            with transaction.atomic():
+                results = self.run_benchmark(options['logins'])
+                transaction.set_rollback(True)
+
+        self.stdout.write('logins: {}'.format(options['logins']))
+        self.stdout.write(
+            'queries per login: {}'.format(results['queries_per_login'])
+        )
+        self.stdout.write(
+            'password hash time: {:.2f} ms'.format(results['hash_ms'])
+        )
+        self.stdout.write(
+            'wall time per login: {:.2f} ms'.format(results['wall_ms'])
+        )
+        self.stdout.write(
+            'cpu time per login: {:.2f} ms'.format(results['cpu_ms'])
+        )
+        self.stdout.write(
+            'logins per second per core: {:.1f}'.format(
+                1000 / results['cpu_ms']
+            )
+        )
+
+
+    def run_benchmark(self, logins):
+        """Method which logs a benchmark user in `logins` times.
+
+        Args:
+            logins (int): Number of logins to make.
+
+        Returns:
+            Dict[str, float]: Timings of the benchmark.
+        """
+
+        credentials = {
+            'username': 'bench_logins_user',
+            'password': 'bench@12345'
+        }
+        User.objects.create_user(**credentials)
+        api_client = APIClient()
+        url = reverse('login_user')
+
+        # First login creates the token, so it is not measured.
+        api_client.post(url, credentials, format='json')
+        # Requests reset the queries log, so it is emptied beforehand.
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            api_client.post(url, credentials, format='json')
+
+        hash_start = time.perf_counter()
+        make_password(credentials['password'])
+        hash_ms = (time.perf_counter() - hash_start) * 1000
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        for _ in range(logins):
+            response = api_client.post(url, credentials, format='json')
+            assert response.status_code == 200, response.content
+        cpu_ms = (time.process_time() - cpu_start) * 1000 / logins
+        wall_ms = (time.perf_counter() - wall_start) * 1000 / logins
+
+        return {
+            'queries_per_login': len(queries),
+            'hash_ms': hash_ms,
+            'wall_ms': wall_ms,
+            'cpu_ms': cpu_ms,
+        }
@@ -0,0 +1,366 @@
+"""
+Module that defines `import_users` management command, which provisions
+users along with their watchlists in bulk from a CSV or JSONL file.
+
+Unlike the registration endpoint, users are inserted with `bulk_create`,
+uniqueness of usernames and emails is checked against a single query of
+existing users, passwords are hashed in parallel across a process pool, and
+watchlists and their `WatchListSymbol` rows are inserted directly (without
+`post_save` signals).
+
+Every record needs `username`, `email` and either `password` or an already
+hashed `password_hash`, and can have `first_name`, `last_name` and `symbols`.
+In CSV files symbols are separated by spaces, e.g. `MSFT GOOG`, whereas in
+JSONL files symbols are a list.
+
+Password hashing dominates the import time, so for load-test environments
+`--hash-iterations` can be lowered. Such passwords are rehashed with the
+configured work factor on user's first login.
+
+Usage:
+    python manage.py import_users users.csv --hash-iterations 1000
+"""
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+
+from users.models import WatchList, WatchListSymbol, get_symbols_set
+
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import json
+import os
+import time
+
+
+def _init_hash_worker(settings_module, settings_overrides):
+    """Initializes a password hashing worker process. Django is set up when
+    worker is not forked from an already set up process.
+
+    Args:
+        settings_module (str): Django settings module.
+        settings_overrides (Dict[str, Any]): Settings to override in worker.
+    """
+
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+        django.setup()
+    for name, value in settings_overrides.items():
+        setattr(settings, name, value)
+
+
+def _hash_passwords(passwords):
+    """Hashes a chunk of passwords with the preferred password hasher.
+
+    Args:
+        passwords (List[str]): Raw passwords.
+
+    Returns:
+        List[str]: Hashed passwords.
+    """
+
+    return [make_password(password) for password in passwords]
+
+
+class Command(BaseCommand):
+    """
+    Class defining `import_users` management command.
+
+    Attributes:
+        help: Help text of the command.
+    """
+
+    help = 'Provisions users and their watchlists in bulk from CSV or JSONL.'
+
+
+    def add_arguments(self, parser):
+        """Method to define arguments of the command.
+
+        Args:
+            parser (ArgumentParser): Parser of command arguments.
+        """
+
+        parser.add_argument('path', help='Path of the CSV or JSONL file.')
+        parser.add_argument(
+            '--format', choices=('csv', 'jsonl'), default=None,
+            help='Format of the file, defaults to the file extension.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=2000,
+            help='Number of rows per insert query.'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Number of password hashing processes.'
+        )
+        parser.add_argument(
+            '--hash-iterations', type=int, default=None,
+            help='PBKDF2 iterations, defaults to PASSWORD_HASH_ITERATIONS.'
+        )
+
+
+    def handle(self, *args, **options):
+        """Method which imports the users and prints a summary.
+
+        Args:
+            *args: Additional named arguments.
+            **options: Parsed command arguments.
+
+        Raises:
+            CommandError: If file can't be read or a record is not valid.
+        """
+
+        start = time.perf_counter()
+        settings_overrides = {}
+        if options['hash_iterations'] is not None:
+            settings_overrides['PASSWORD_HASH_ITERATIONS'] = (
+                options['hash_iterations']
+            )
+
+        records = self.read_records(options['path'], options['format'])
+        records, skipped = self.exclude_existing(records)
+
+        with override_settings(**settings_overrides):
+            password_hashes = self.hash_passwords(
+                records, options['workers'], settings_overrides
+            )
+
+        with transaction.atomic():
+            self.create_users(records, password_hashes, options['batch_size'])
+
+        self.stdout.write(
+            'Imported {} users, skipped {} existing or duplicate users '
+            'in {:.1f}s.'.format(
+                len(records), skipped, time.perf_counter() - start
+            )
+        )
+
+
+    def read_records(self, path, file_format):
+        """Method which reads and validates the records of the file.
+
+        Args:
+            path (str): Path of the CSV or JSONL file.
+            file_format (Optional[str]): Format of the file.
+
+        Returns:
+            List[Dict[str, Any]]: Validated records.
+
+        Raises:
+            CommandError: If file can't be read or a record is not valid.
+        """
+
+        if file_format is None:
+            file_format = 'csv' if path.endswith('.csv') else 'jsonl'
+
+        try:
+            with open(path, newline='', encoding='utf-8') as records_file:
+                if file_format == 'csv':
+                    raw_records = list(csv.DictReader(records_file))
+                else:
+                    raw_records = [
+                        json.loads(line) for line in records_file
+                        if line.strip()
+                    ]
+        except (OSError, ValueError) as exc:
+            raise CommandError('Unable to read {}: {}'.format(path, exc))
+
+        return [
+            self.clean_record(line_number, raw_record)
+            for line_number, raw_record in enumerate(raw_records, start=1)
+        ]
+
+
+    def clean_record(self, line_number, raw_record):
+        """Method which validates a record and normalizes its fields.
+
+        Args:
+            line_number (int): Number of the record in file.
+            raw_record (Dict[str, Any]): Record as read from file.
+
+        Returns:
+            Dict[str, Any]: Validated record.
+
+        Raises:
+            CommandError: If record is not valid.
+        """
+
+        for field in ('username', 'email'):
+            if not raw_record.get(field):
+                raise CommandError(
+                    'Record {} is missing "{}".'.format(line_number, field)
+                )
+        if not raw_record.get('password') and not raw_record.get(
+            'password_hash'
+        ):
+            raise CommandError(
+                'Record {} is missing "password" or "password_hash".'.format(
+                    line_number
+                )
+            )
+
+        symbols = raw_record.get('symbols') or []
+        if isinstance(symbols, str):
+            symbols = symbols.split()
+        if not all(isinstance(symbol, str) for symbol in symbols):
+            raise CommandError(
+                'Record {}: symbols must be a string value.'.format(
+                    line_number
+                )
+            )
+
+        return {
+            'username': raw_record['username'],
+            'email': raw_record['email'],
+            'password': raw_record.get('password'),
+            'password_hash': raw_record.get('password_hash'),
+            'first_name': raw_record.get('first_name') or '',
+            'last_name': raw_record.get('last_name') or '',
+            # Removing duplicate symbols while keeping their order.
+            'symbols': list(dict.fromkeys(symbols)),
+        }
+
+
+    def exclude_existing(self, records):
+        """Method which excludes records whose username or email is already
+        taken, either by an existing user or by a previous record. Existing
+        usernames and emails are fetched with a single query.
+
+        Args:
+            records (List[Dict[str, Any]]): Validated records.
+
+        Returns:
+            Tuple[List[Dict[str, Any]], int]: Records to import and number
+            of excluded records.
+        """
+
+        usernames = set()
+        emails = set()
+        for username, email in User.objects.values_list('username', 'email'):
+            usernames.add(username)
+            emails.add(email)
+
+        new_records = []
+        for record in records:
+            if record['username'] in usernames or record['email'] in emails:
+                continue
+            usernames.add(record['username'])
+            emails.add(record['email'])
+            new_records.append(record)
+        return new_records, len(records) - len(new_records)
+
+
+    def hash_passwords(self, records, workers, settings_overrides):
+        """Method which hashes the raw passwords of records, in a process
+        pool when there are enough of them.
+
+        Args:
+            records (List[Dict[str, Any]]): Records to import.
+            workers (int): Number of password hashing processes.
+            settings_overrides (Dict[str, Any]): Settings to override in
+                worker processes.
+
+        Returns:
+            List[str]: Hashed password of each record.
+        """
+
+        passwords = [
+            record['password'] for record in records
+            if not record['password_hash']
+        ]
+
+        if workers <= 1 or len(passwords) < workers * 2:
+            hashes = iter(_hash_passwords(passwords))
+        else:
+            chunk_size = max(1, min(500, len(passwords) // (workers * 4)))
+            chunks = [
+                passwords[index:index + chunk_size]
+                for index in range(0, len(passwords), chunk_size)
+            ]
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_hash_worker,
+                initargs=(
+                    os.environ.get('DJANGO_SETTINGS_MODULE'),
+                    settings_overrides
+                )
+            ) as executor:
+                hashes = iter([
+                    password_hash
+                    for chunk_hashes in executor.map(_hash_passwords, chunks)
+                    for password_hash in chunk_hashes
+                ])
+
+        return [
+            record['password_hash'] or next(hashes) for record in records
+        ]
+
+
+    def create_users(self, records, password_hashes, batch_size):
+        """Method which inserts users, their watchlists and watchlists'
+        `WatchListSymbol` rows in batches. Watchlists are inserted directly,
+        so `post_save` signals are not sent for them.
+
+        Args:
+            records (List[Dict[str, Any]]): Records to import.
+            password_hashes (List[str]): Hashed password of each record.
+            batch_size (int): Number of rows per insert query.
+        """
+
+        users = User.objects.bulk_create(
+            [
+                User(
+                    username=record['username'],
+                    email=record['email'],
+                    first_name=record['first_name'],
+                    last_name=record['last_name'],
+                    password=password_hash
+                )
+                for record, password_hash in zip(records, password_hashes)
+            ],
+            batch_size=batch_size
+        )
+
+        if not connection.features.can_return_rows_from_bulk_insert:
+            user_ids = {}
+            for index in range(0, len(records), batch_size):
+                user_ids.update(User.objects.filter(username__in=[
+                    record['username']
+                    for record in records[index:index + batch_size]
+                ]).values_list('username', 'id'))
+            for user in users:
+                user.pk = user_ids[user.username]
+
+        watchlists = WatchList.objects.bulk_create(
+            [
+                WatchList(user_id=user.pk, symbols=record['symbols'])
+                for user, record in zip(users, records)
+            ],
+            batch_size=batch_size
+        )
+
+        if not connection.features.can_return_rows_from_bulk_insert:
+            watchlist_ids = {}
+            for index in range(0, len(watchlists), batch_size):
+                watchlist_ids.update(WatchList.objects.filter(user_id__in=[
+                    watchlist.user_id
+                    for watchlist in watchlists[index:index + batch_size]
+                ]).values_list('user_id', 'id'))
+            for watchlist in watchlists:
+                watchlist.pk = watchlist_ids[watchlist.user_id]
+
+        WatchListSymbol.objects.bulk_create(
+            [
+                WatchListSymbol(watchlist_id=watchlist.pk, symbol=symbol)
+                for watchlist in watchlists
+                for symbol in get_symbols_set(watchlist.symbols)
+            ],
+            batch_size=batch_size
+        )
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.1 on 2026-10-19 00:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_watchlist_symbols(apps, schema_editor):
+    """Fills `WatchListSymbol` reverse index from symbols of existing
+    watchlists.
+    """
+
+    WatchList = apps.get_model('users', 'WatchList')
+    WatchListSymbol = apps.get_model('users', 'WatchListSymbol')
+
+    memberships = []
+    for watchlist_id, symbols in WatchList.objects.values_list(
+        'id', 'symbols'
+    ).iterator(chunk_size=2000):
+        memberships.extend(
+            WatchListSymbol(watchlist_id=watchlist_id, symbol=symbol)
+            for symbol in {
+                symbol.strip().upper() for symbol in symbols or []
+                if isinstance(symbol, str) and 0 < len(symbol.strip()) <= 32
+            }
+        )
+        if len(memberships) >= 2000:
+            WatchListSymbol.objects.bulk_create(memberships)
+            memberships = []
+    WatchListSymbol.objects.bulk_create(memberships)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WatchListSymbol',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('symbol', models.CharField(max_length=32)),
+                ('watchlist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='users.watchlist')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='watchlistsymbol',
+            constraint=models.UniqueConstraint(fields=('symbol', 'watchlist'), name='unique_watchlist_symbol'),
+        ),
+        migrations.RunPython(
+            backfill_watchlist_symbols, migrations.RunPython.noop
+        ),
+    ]
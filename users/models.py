@@ -11,15 +11,34 @@ Models:
                 with which it is in one-to-one relation.
             symbols: Field which stores the names of user's
                 chosen stock symbols. Like MSFT, GOOG and etc.
-                Note: Currently the max length of symbols field is 5
-                because of aplha_avantage's free api limitation.
+                Note: Max length of symbols field is set by
+                `WATCHLIST_MAX_SYMBOLS` setting.
+
+    - WatchListSymbol model: Model which stores one row per symbol of
+        every watchlist, kept in sync with `WatchList.symbols`. It is an
+        indexed reverse index of watchlists, so "which users watch MSFT"
+        and symbols popularity are answered without decoding every
+        watchlist's symbols.
+
+        Attributes:
+            watchlist: Field which points to the watchlist having symbol.
+            symbol: Field which stores the upper cased symbol.
 
 """
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count
 from django.db.models.signals import post_save
 from django.contrib.auth.models import User
-from django.dispatch import receiver
+from django.dispatch import receiver, Signal
+
+import copy
+
+
+# Signal sent after symbols of many watchlists are written with
+# `bulk_update`, which doesn't send `post_save` signals. It is sent with
+# `watchlists` argument containing the written watchlists.
+watchlist_symbols_bulk_updated = Signal()
 
 
 class WatchList(models.Model):
@@ -33,14 +52,109 @@ class WatchList(models.Model):
             with which it is in one-to-one relation.
         symbols: Field which stores the names of user's
             chosen stock symbols. Like MSFT, GOOG and etc.
-            Note: Currently the max length of symbols field is 5
-            because of aplha_avantage's free api limitation.
+            Note: Max length of symbols field is set by
+            `WATCHLIST_MAX_SYMBOLS` setting.
     """
 
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     symbols = models.JSONField(default=list)
 
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Method which builds a model instance from a DB row and remembers
+        the loaded symbols, so that later writes can be skipped when the
+        symbols did not change.
+
+        Args:
+            db (str): Alias of the DB from which row is loaded.
+            field_names (List[str]): Names of the loaded fields.
+            values (List[Any]): Values of the loaded fields.
+
+        Returns:
+            WatchList: A model instance built from the DB row.
+        """
+
+        instance = super().from_db(db, field_names, values)
+        instance._remember_loaded_symbols()
+        return instance
+
+
+    def save(self, *args, **kwargs):
+        """Method which saves the model and remembers the saved symbols as
+        the symbols currently stored in DB.
+
+        Args:
+            *args: Additional named arguments.
+            **kwargs: Additional keyword arguments.
+        """
+
+        super().save(*args, **kwargs)
+        self._remember_loaded_symbols()
+
+
+    def _remember_loaded_symbols(self):
+        """Method to take a snapshot of the symbols stored in DB. Deferred
+        symbols field is not loaded, so no snapshot is taken for it.
+        """
+
+        if 'symbols' in self.__dict__:
+            self._loaded_symbols = copy.deepcopy(self.symbols)
+
+
+    def symbols_changed(self):
+        """Method to check whether symbols differ from the symbols stored
+        in DB. Unsaved instances are always considered as changed.
+
+        Returns:
+            bool: True if symbols needs to be written to DB.
+        """
+
+        if not hasattr(self, '_loaded_symbols'):
+            return True
+        return self.symbols != self._loaded_symbols
+
+
+    def get_stored_symbols(self):
+        """Method to get the symbols stored in DB, from the snapshot taken
+        when the watchlist was loaded or saved. When there is no snapshot,
+        like for a watchlist of token cache which another process may have
+        written since, symbols are read from DB and remembered.
+
+        Returns:
+            Optional[List[str]]: Stored symbols, or None if watchlist is not
+            stored.
+        """
+
+        if not hasattr(self, '_loaded_symbols'):
+            if self.pk is None:
+                return None
+            self._loaded_symbols = WatchList.objects.filter(
+                pk=self.pk
+            ).values_list('symbols', flat=True).first()
+        return self._loaded_symbols
+
+
+    def update_symbols(self, symbols):
+        """Method to update the symbols of watchlist. Only `symbols` column
+        is written to DB, and nothing is written when symbols are same as
+        the symbols stored in DB.
+
+        Args:
+            symbols (List[str]): New symbols of the watchlist.
+
+        Returns:
+            bool: True if symbols were written to DB.
+        """
+
+        self.symbols = symbols
+        if symbols == self.get_stored_symbols():
+            return False
+        with transaction.atomic():
+            self.save(update_fields=['symbols'])
+        return True
+
+
     def __str__(self):
         """Method representing the model's string representation.
 
@@ -51,6 +165,197 @@ class WatchList(models.Model):
         return self.user.username + "\'s " + "watchList"
 
 
+def normalize_symbol(symbol):
+    """Function to normalize a symbol for `WatchListSymbol` model.
+
+    Args:
+        symbol (str): A symbol like `msft`.
+
+    Returns:
+        str: Normalized symbol like `MSFT`.
+    """
+
+    return symbol.strip().upper()
+
+
+SYMBOL_MAX_LENGTH = 32
+
+
+def get_symbols_set(symbols):
+    """Function to get the set of normalized symbols of a watchlist, values
+    which are not string or are too long to be a symbol are ignored.
+
+    Args:
+        symbols (List[Any]): Symbols of a watchlist.
+
+    Returns:
+        Set[str]: Normalized symbols.
+    """
+
+    return {
+        normalize_symbol(symbol) for symbol in symbols
+        if isinstance(symbol, str) and
+        0 < len(symbol.strip()) <= SYMBOL_MAX_LENGTH
+    }
+
+
+class WatchListSymbolQuerySet(models.QuerySet):
+    """
+    QuerySet of `WatchListSymbol` model, defining the reverse index queries
+    and the syncing of reverse index with watchlists.
+
+    Methods:
+        popularity: Returns symbols along with their watchers count.
+        watcher_counts: Returns watchers count of given symbols.
+        watchers_of: Returns users watching a symbol.
+        sync: Syncs the reverse index with symbols of watchlists.
+    """
+
+    def popularity(self, limit=None):
+        """Method to get symbols ordered by their number of watchers.
+
+        Args:
+            limit optional(int): Max number of symbols.
+
+        Returns:
+            List[Tuple[str, int]]: Symbols along with their watchers count.
+        """
+
+        queryset = self.values_list('symbol').annotate(
+            watchers=Count('watchlist_id')
+        ).order_by('-watchers', 'symbol')
+        if limit is not None:
+            queryset = queryset[:limit]
+        return list(queryset)
+
+
+    def watcher_counts(self, symbols):
+        """Method to get watchers count of given symbols.
+
+        Args:
+            symbols (Iterable[str]): Symbols to count watchers of.
+
+        Returns:
+            Dict[str, int]: Watchers count of each symbol, symbols without
+            watchers are not included.
+        """
+
+        return dict(
+            self.filter(symbol__in=get_symbols_set(symbols)).values_list(
+                'symbol'
+            ).annotate(watchers=Count('watchlist_id')).order_by()
+        )
+
+
+    def watchers_of(self, symbol):
+        """Method to get users watching a symbol.
+
+        Args:
+            symbol (str): Symbol being watched.
+
+        Returns:
+            QuerySet[User]: Users watching the symbol.
+        """
+
+        return User.objects.filter(
+            watchlist__memberships__symbol=normalize_symbol(symbol)
+        )
+
+
+    def sync(self, watchlists):
+        """Method to sync the reverse index with symbols of watchlists. Only
+        the added and removed symbols are written. Stored symbols are the
+        given ones, like of a newly created watchlist, or else queried.
+
+        Args:
+            watchlists (Iterable[Tuple[WatchList, Optional[List[str]]]]):
+                Watchlists along with their previously stored symbols, if
+                known.
+        """
+
+        stored = {}
+        unknown_ids = []
+        for watchlist, stored_symbols in watchlists:
+            if stored_symbols is None:
+                unknown_ids.append(watchlist.pk)
+                stored[watchlist.pk] = (watchlist, set())
+            else:
+                stored[watchlist.pk] = (
+                    watchlist, get_symbols_set(stored_symbols)
+                )
+
+        if unknown_ids:
+            for watchlist_id, symbol in self.filter(
+                watchlist_id__in=unknown_ids
+            ).values_list('watchlist_id', 'symbol'):
+                stored[watchlist_id][1].add(symbol)
+
+        removed = models.Q()
+        added = []
+        for watchlist_id, (watchlist, stored_symbols) in stored.items():
+            symbols = get_symbols_set(watchlist.symbols)
+            if stored_symbols - symbols:
+                removed |= models.Q(
+                    watchlist_id=watchlist_id,
+                    symbol__in=stored_symbols - symbols
+                )
+            added.extend(
+                self.model(watchlist_id=watchlist_id, symbol=symbol)
+                for symbol in symbols - stored_symbols
+            )
+
+        if removed:
+            self.filter(removed).delete()
+        if added:
+            self.bulk_create(added, ignore_conflicts=True)
+
+
+class WatchListSymbol(models.Model):
+    """
+    WatchListSymbol Model stores one row per symbol of every watchlist, and
+    is kept in sync with `WatchList.symbols` whenever a watchlist is saved
+    or bulk updated. Rows are indexed by symbol, so watchers of a symbol
+    and symbols popularity are answered with indexed queries.
+
+    Attributes:
+        watchlist: Field which points to the watchlist having symbol.
+        symbol: Field which stores the upper cased symbol.
+    """
+
+    watchlist = models.ForeignKey(
+        WatchList, on_delete=models.CASCADE, related_name='memberships'
+    )
+    symbol = models.CharField(max_length=SYMBOL_MAX_LENGTH)
+
+    objects = WatchListSymbolQuerySet.as_manager()
+
+
+    class Meta:
+        """
+        Class represents the meta information about WatchListSymbol model.
+
+        Attributes:
+            constraints: Unique symbol per watchlist, its index serves the
+                lookups by symbol.
+        """
+        constraints = [
+            models.UniqueConstraint(
+                fields=['symbol', 'watchlist'],
+                name='unique_watchlist_symbol'
+            ),
+        ]
+
+
+    def __str__(self):
+        """Method representing the model's string representation.
+
+        Returns:
+            str. String representation of model.
+        """
+
+        return self.symbol
+
+
 @receiver(post_save, sender=User)
 def create_user_watchlist(sender, instance, created, **kwargs):
     """Function to generate WatchList object whenever a user
@@ -67,13 +372,63 @@ def create_user_watchlist(sender, instance, created, **kwargs):
 
 
 @receiver(post_save, sender=User)
-def save_user_watchlist(sender, instance, **kwargs):
+def save_user_watchlist(sender, instance, created, **kwargs):
     """Function to update the WatchList object whenever a user
-    object is updated.
+    object is updated. WatchList is only written when it is already
+    loaded on the user object and its symbols are changed, so saving a
+    user doesn't rewrite (or even load) the watchlist row.
 
     Args:
         sender (Type[Model]): A model from which update signal is generated.
         instance (Model): A model instance which needs to be store.
+        created (bool): Wether instance is created or not.
+    """
+
+    # Newly created watchlist is already saved by `create_user_watchlist`.
+    if created or kwargs.get('raw'):
+        return
+
+    watchlist = User.watchlist.related.get_cached_value(instance, default=None)
+    if watchlist is not None and watchlist.symbols_changed():
+        with transaction.atomic():
+            watchlist.save(update_fields=['symbols'])
+
+
+@receiver(post_save, sender=WatchList)
+def sync_watchlist_symbols(sender, instance, created, **kwargs):
+    """Function to sync the `WatchListSymbol` reverse index whenever
+    symbols of a watchlist are saved.
+
+    Args:
+        sender (Type[Model]): A model from which save signal is generated.
+        instance (Model): A saved model instance.
+        created (bool): Wether instance is created or not.
+    """
+
+    update_fields = kwargs.get('update_fields')
+    if kwargs.get('raw') or (
+        update_fields is not None and 'symbols' not in update_fields
+    ):
+        return
+    if created and not instance.symbols:
+        return
+
+    # Stored rows are read within the save transaction, as the snapshot of
+    # symbols may be older than the rows, like when it comes from another
+    # process through token cache.
+    WatchListSymbol.objects.sync([(instance, [] if created else None)])
+
+
+@receiver(watchlist_symbols_bulk_updated)
+def sync_bulk_updated_watchlists_symbols(sender, watchlists, **kwargs):
+    """Function to sync the `WatchListSymbol` reverse index whenever
+    symbols of watchlists are bulk updated.
+
+    Args:
+        sender (Type[Model]): A model from which signal is generated.
+        watchlists (List[WatchList]): Changed watchlists.
     """
 
-    instance.watchlist.save()
+    WatchListSymbol.objects.sync(
+        [(watchlist, None) for watchlist in watchlists]
+    )
@@ -2,15 +2,41 @@
 Module for testing user register/login journeys through test cases.
 """
 
-from django.test import TestCase
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import OperationalError
+from django.db.utils import ConnectionHandler
+from django.test import SimpleTestCase, TestCase, override_settings
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework.authtoken.models import Token
 from django.contrib.auth.models import User
 
+from .authentication import token_cache
+from .models import WatchList, WatchListSymbol
+
 import copy
+import importlib
+import io
+import json
+import os
+import sys
+import tempfile
+from unittest import mock
+
+
+# Versions of users of token cache are kept in process, instead of the file
+# based cache shared by every process of the host.
+TEST_TOKEN_AUTH_CACHE = {'CACHE_ALIAS': 'default'}
 
+# Environment variables required by production settings.
+PRODUCTION_ENVIRON = {
+    'DJANGO_SECRET_KEY': 'production-secret',
+    'DJANGO_ALLOWED_HOSTS': 'example.com',
+}
 
+
+@override_settings(TOKEN_AUTH_CACHE=TEST_TOKEN_AUTH_CACHE)
 class UserRegistrationTestCase(TestCase):
 
     SAMPLE_USER_DATA = {
@@ -122,6 +148,7 @@ class UserRegistrationTestCase(TestCase):
         )
 
 
+@override_settings(TOKEN_AUTH_CACHE=TEST_TOKEN_AUTH_CACHE)
 class UserLoginTestCase(TestCase):
 
     SAMPLE_USER_DATA = {
@@ -261,3 +288,301 @@ class UserLoginTestCase(TestCase):
             }
         )
         self.assertEqual(response.status_code, 400)
+
+
+@override_settings(TOKEN_AUTH_CACHE=TEST_TOKEN_AUTH_CACHE)
+class UserLoginPathTestCase(TestCase):
+
+    SAMPLE_USER_DATA = {
+        "username": "abc",
+        "email": "abc@gmail.com",
+        "password": "qwert@123",
+        "password2": "qwert@123",
+        "first_name": "a",
+        "last_name": "b"
+    }
+
+    LOGIN_DATA = {
+        "username": "abc",
+        "password": 'qwert@123'
+    }
+
+    def setUp(self):
+        self.api_client = APIClient()
+        self.api_client.post(reverse('register_user'), self.SAMPLE_USER_DATA)
+        token_cache.clear()
+
+    def test_login_loads_user_token_and_watch_list_in_single_query(self):
+        self.api_client.post(reverse('login_user'), self.LOGIN_DATA)
+
+        with self.assertNumQueries(1):
+            response = self.api_client.post(
+                reverse('login_user'), self.LOGIN_DATA
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([], response.json()['watch_list_symbols'])
+
+    def test_login_caches_issued_token(self):
+        response = self.api_client.post(reverse('login_user'), self.LOGIN_DATA)
+
+        cached_user = token_cache.get(response.json()['token'])
+        self.assertEqual("abc", cached_user.username)
+        with self.assertNumQueries(0):
+            self.assertEqual([], cached_user.watchlist.symbols)
+
+    @override_settings(PASSWORD_HASH_ITERATIONS=1000)
+    def test_password_is_rehashed_on_login_when_work_factor_changes(self):
+        response = self.api_client.post(reverse('login_user'), self.LOGIN_DATA)
+        self.assertEqual(response.status_code, 200)
+
+        user_object = User.objects.get(username="abc")
+        self.assertTrue(user_object.password.startswith('pbkdf2_sha256$1000$'))
+
+        # Login keeps on working with the rehashed password.
+        response = self.api_client.post(reverse('login_user'), self.LOGIN_DATA)
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(TOKEN_AUTH_CACHE=TEST_TOKEN_AUTH_CACHE)
+class ImportUsersCommandTestCase(TestCase):
+
+    def setUp(self):
+        self.api_client = APIClient()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def write_file(self, name, content):
+        path = os.path.join(self.temp_dir.name, name)
+        with open(path, 'w') as records_file:
+            records_file.write(content)
+        return path
+
+    def import_users(self, path):
+        stdout = io.StringIO()
+        call_command(
+            'import_users', path, workers=1, hash_iterations=1000,
+            stdout=stdout
+        )
+        return stdout.getvalue()
+
+    def test_users_and_watch_lists_are_imported_from_csv(self):
+        path = self.write_file('users.csv', (
+            "username,email,password,first_name,last_name,symbols\n"
+            "abc,abc@gmail.com,qwert@123,a,b,MSFT GOOG MSFT\n"
+            "xyz,xyz@gmail.com,qwert@456,x,y,\n"
+        ))
+        self.import_users(path)
+
+        self.assertEqual(
+            ['MSFT', 'GOOG'],
+            WatchList.objects.get(user__username="abc").symbols
+        )
+        self.assertEqual(
+            [], WatchList.objects.get(user__username="xyz").symbols
+        )
+        self.assertEqual(
+            [("GOOG", 1), ("MSFT", 1)], WatchListSymbol.objects.popularity()
+        )
+        response = self.api_client.post(
+            reverse('login_user'), {"username": "abc", "password": 'qwert@123'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            ['MSFT', 'GOOG'], response.json()['watch_list_symbols']
+        )
+
+    def test_users_are_imported_from_jsonl_with_password_hashes(self):
+        records = [
+            {
+                "username": "abc", "email": "abc@gmail.com",
+                "password_hash": "pbkdf2_sha256$1000$salt$hash",
+                "symbols": ["IBM"]
+            },
+        ]
+        path = self.write_file(
+            'users.jsonl', '\n'.join(json.dumps(r) for r in records)
+        )
+        self.import_users(path)
+
+        user_object = User.objects.get(username="abc")
+        self.assertEqual("pbkdf2_sha256$1000$salt$hash", user_object.password)
+        self.assertEqual(['IBM'], user_object.watchlist.symbols)
+
+    def test_existing_and_duplicate_users_are_skipped(self):
+        User.objects.create_user(username="abc", email="abc@gmail.com")
+        path = self.write_file('users.csv', (
+            "username,email,password\n"
+            "abc,new@gmail.com,qwert@123\n"
+            "new,abc@gmail.com,qwert@123\n"
+            "xyz,xyz@gmail.com,qwert@123\n"
+            "xyz,other@gmail.com,qwert@123\n"
+        ))
+        output = self.import_users(path)
+
+        self.assertIn('Imported 1 users, skipped 3', output)
+        self.assertEqual(2, User.objects.count())
+        self.assertEqual(2, WatchList.objects.count())
+
+
+@override_settings(TOKEN_AUTH_CACHE=TEST_TOKEN_AUTH_CACHE)
+class WatchListSymbolTestCase(TestCase):
+
+    def setUp(self):
+        self.user1 = User.objects.create_user(username="abc")
+        self.user2 = User.objects.create_user(username="xyz")
+
+    def set_symbols(self, user, symbols):
+        watchlist = WatchList.objects.get(user=user)
+        watchlist.update_symbols(symbols)
+
+    def test_reverse_index_follows_watch_list_symbols(self):
+        self.set_symbols(self.user1, ['MSFT', 'goog'])
+        self.set_symbols(self.user2, ['MSFT'])
+        self.assertEqual(
+            [("MSFT", 2), ("GOOG", 1)],
+            WatchListSymbol.objects.popularity()
+        )
+
+        self.set_symbols(self.user1, ['IBM'])
+        self.assertEqual(
+            [("IBM", 1), ("MSFT", 1)],
+            WatchListSymbol.objects.popularity()
+        )
+        self.assertEqual(
+            ["xyz"],
+            list(WatchListSymbol.objects.watchers_of('msft').values_list(
+                'username', flat=True
+            ))
+        )
+
+    def test_watcher_counts_of_symbols(self):
+        self.set_symbols(self.user1, ['MSFT', 'GOOG'])
+        self.set_symbols(self.user2, ['MSFT'])
+        self.assertEqual(
+            {"MSFT": 2, "GOOG": 1},
+            WatchListSymbol.objects.watcher_counts(['MSFT', 'GOOG', 'IBM'])
+        )
+
+    def test_reverse_index_follows_user_save(self):
+        user = User.objects.select_related('watchlist').get(pk=self.user1.pk)
+        user.watchlist.symbols = ['TSLA']
+        user.save()
+        self.assertEqual(
+            [("TSLA", 1)], WatchListSymbol.objects.popularity()
+        )
+
+    def test_reverse_index_is_removed_with_user(self):
+        self.set_symbols(self.user1, ['MSFT'])
+        self.user1.delete()
+        self.assertEqual(0, WatchListSymbol.objects.count())
+
+    def test_migration_backfills_reverse_index(self):
+        WatchList.objects.filter(user=self.user1).update(
+            symbols=['MSFT', 'IBM', 5]
+        )
+        WatchList.objects.filter(user=self.user2).update(symbols=['MSFT'])
+
+        migration = importlib.import_module(
+            'users.migrations.0002_watchlistsymbol'
+        )
+        from django.apps import apps
+        migration.backfill_watchlist_symbols(apps, None)
+
+        self.assertEqual(
+            [("MSFT", 2), ("IBM", 1)],
+            WatchListSymbol.objects.popularity()
+        )
+
+
+class DatabaseTuningTestCase(SimpleTestCase):
+
+    def setUp(self):
+        db_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(db_dir.cleanup)
+        self.db_path = os.path.join(db_dir.name, 'db.sqlite3')
+
+    def connect(self, **options):
+        connection = ConnectionHandler({'default': {
+            'ENGINE': 'stockmonitor.sqlite3',
+            'NAME': self.db_path,
+            'OPTIONS': options,
+        }})['default']
+        self.addCleanup(connection.close)
+        return connection
+
+    def query(self, connection, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+            return cursor.fetchone()[0] if cursor.description else None
+
+    @override_settings(SQLITE_PRAGMAS={
+        'journal_mode': 'wal', 'synchronous': 'normal', 'busy_timeout': 1234
+    })
+    def test_pragmas_are_applied_to_new_connections(self):
+        connection = self.connect()
+        self.assertEqual('wal', self.query(connection, 'PRAGMA journal_mode'))
+        self.assertEqual(1, self.query(connection, 'PRAGMA synchronous'))
+        self.assertEqual(1234, self.query(connection, 'PRAGMA busy_timeout'))
+
+    @override_settings(SQLITE_PRAGMAS={'journal_mode': 'wal; DROP TABLE x'})
+    def test_invalid_pragmas_are_rejected(self):
+        with self.assertRaises(ValueError):
+            self.connect().ensure_connection()
+
+    @override_settings(SQLITE_PRAGMAS={'journal_mode': 'wal'})
+    def test_immediate_transactions_take_write_lock_when_they_begin(self):
+        self.query(self.connect(), 'CREATE TABLE t (id integer)')
+        other_connection = self.connect(timeout=0.01)
+
+        for transaction_mode, locked in (
+            (None, False), ('IMMEDIATE', True)
+        ):
+            options = {}
+            if transaction_mode:
+                options['transaction_mode'] = transaction_mode
+            insert = 'INSERT INTO t VALUES (1)'
+            connection = self.connect(**options)
+            connection.set_autocommit(
+                False, force_begin_transaction_with_broken_autocommit=True
+            )
+            try:
+                if locked:
+                    with self.assertRaises(OperationalError):
+                        self.query(other_connection, insert)
+                else:
+                    self.query(other_connection, insert)
+            finally:
+                connection.rollback()
+                connection.set_autocommit(True)
+
+    def test_production_settings_switch_to_postgres(self):
+        with mock.patch.dict(os.environ, {
+            **PRODUCTION_ENVIRON,
+            'POSTGRES_DB': 'stockmonitor', 'POSTGRES_POOLER': 'pgbouncer'
+        }):
+            production_settings = importlib.reload(
+                importlib.import_module('stockmonitor.settings_production')
+            )
+        database = production_settings.DATABASES['default']
+        self.assertEqual('django.db.backends.postgresql', database['ENGINE'])
+        self.assertTrue(database['CONN_HEALTH_CHECKS'])
+        self.assertTrue(database['DISABLE_SERVER_SIDE_CURSORS'])
+
+        with mock.patch.dict(os.environ, PRODUCTION_ENVIRON):
+            os.environ.pop('POSTGRES_DB', None)
+            production_settings = importlib.reload(production_settings)
+        database = production_settings.DATABASES['default']
+        self.assertEqual('stockmonitor.sqlite3', database['ENGINE'])
+        self.assertEqual(600, database['CONN_MAX_AGE'])
+        self.assertEqual('wal', production_settings.SQLITE_PRAGMAS[
+            'journal_mode'
+        ])
+        self.assertEqual(['example.com'], production_settings.ALLOWED_HOSTS)
+
+    def test_production_settings_require_secret_key_and_hosts(self):
+        for variable in PRODUCTION_ENVIRON:
+            with mock.patch.dict(os.environ, PRODUCTION_ENVIRON):
+                os.environ.pop(variable)
+                sys.modules.pop('stockmonitor.settings_production', None)
+                with self.assertRaises(ImproperlyConfigured):
+                    importlib.import_module('stockmonitor.settings_production')
@@ -12,6 +12,7 @@ from rest_framework.authtoken.models import Token
 from rest_framework.settings import api_settings
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from .authentication import token_cache
 
 
 class RegisterUserAPIView(generics.CreateAPIView):
@@ -50,7 +51,8 @@ class LoginView(ObtainAuthToken):
         """Handles the POST request for logging int the user. Also, validates
         the provided credentials, generates a token for the authenticated user,
         and returns a response containing the token along with additional
-        user information.
+        user information. Issued token is cached in `token_cache`, so the
+        following authenticated requests don't need to look it up in DB.
 
         Args:
             request (Request): A Django request object.
@@ -64,7 +66,8 @@ class LoginView(ObtainAuthToken):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = serializer.validated_data['user']
-        token, created = Token.objects.get_or_create(user=user)
+        token = get_user_token(user)
+        token_cache.set(token.key, user)
         response = {
             'token': token.key,
             "user_email": user.email,
@@ -74,3 +77,21 @@ class LoginView(ObtainAuthToken):
             "watch_list_symbols": user.watchlist.symbols
         }
         return Response(response)
+
+
+def get_user_token(user):
+    """Returns the auth token of a user, and creates it if user doesn't have
+    one. Token already loaded along with the user is used without a query.
+
+    Args:
+        user (User): A user model instance.
+
+    Returns:
+        Token: Auth token of the user.
+    """
+
+    try:
+        return user.auth_token
+    except Token.DoesNotExist:
+        token, created = Token.objects.get_or_create(user=user)
+        return token
@@ -0,0 +1,219 @@
+"""
+Module that defines the write path for watchlist symbols updates.
+
+Watchlist symbols are updated on every `watchList/symbols-data` request, and
+most of the time the symbols are same as the stored ones. So, this module
+skips no-op updates, writes only the `symbols` column, and (when enabled via
+`WATCHLIST_WRITE_BUFFER` setting) defers and batches the writes of many
+requests into a single transaction, which keeps the DB lock free for
+longer under concurrent load.
+
+Settings:
+    WATCHLIST_WRITE_BUFFER (Dict[str, Any]): Configuration of the deferred
+        writes. Like below:
+        - ENABLED (bool): Whether writes are deferred (default: False).
+        - MAX_PENDING (int): Number of pending watchlists after which
+            buffer is flushed (default: 500).
+        - FLUSH_INTERVAL (float): Max seconds a write can stay
+            pending (default: 2.0).
+"""
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .models import WatchList, watchlist_symbols_bulk_updated
+
+import atexit
+import threading
+
+
+DEFAULT_WRITE_BUFFER_SETTINGS = {
+    'ENABLED': False,
+    'MAX_PENDING': 500,
+    'FLUSH_INTERVAL': 2.0,
+}
+
+
+def get_write_buffer_settings():
+    """Returns the watchlist write buffer settings merged over defaults.
+
+    Returns:
+        Dict[str, Any]: Write buffer settings.
+    """
+
+    return {
+        **DEFAULT_WRITE_BUFFER_SETTINGS,
+        **getattr(settings, 'WATCHLIST_WRITE_BUFFER', {})
+    }
+
+
+class WatchListWriteBuffer:
+    """
+    Class which collects pending watchlist symbols writes and flushes them
+    in a single `bulk_update` call. Pending writes are coalesced per
+    watchlist, so only the latest symbols of a watchlist are written.
+
+    Attributes:
+        max_pending: Number of pending watchlists after which buffer is
+            flushed.
+        flush_interval: Max seconds a write can stay pending.
+
+    Methods:
+        add: Adds a pending write, and flushes the buffer when it is full.
+        flush: Writes all pending writes to DB.
+        pending_count: Returns the number of pending watchlists.
+    """
+
+    def __init__(self, max_pending=500, flush_interval=2.0):
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._timer = None
+
+
+    def add(self, watchlist_id, user_id, symbols, stored_symbols=None):
+        """Adds a pending symbols write of a watchlist. Write is skipped
+        when symbols are same as the pending (or else stored) symbols of
+        the watchlist. Buffer is flushed right away when it is full,
+        otherwise a flush is scheduled after `flush_interval` seconds.
+
+        Args:
+            watchlist_id (int): Primary key of the watchlist.
+            user_id (int): Primary key of the watchlist's user.
+            symbols (List[str]): Symbols to write.
+            stored_symbols optional(List[str]): Symbols currently stored
+                in DB, if known.
+
+        Returns:
+            bool: True if the write is added to the buffer.
+        """
+
+        with self._lock:
+            pending = self._pending.get(watchlist_id)
+            if pending is not None:
+                stored_symbols = pending[1]
+            if symbols == stored_symbols:
+                return False
+            self._pending[watchlist_id] = (user_id, list(symbols))
+            is_full = len(self._pending) >= self.max_pending
+            if not is_full and self._timer is None:
+                self._timer = threading.Timer(
+                    self.flush_interval, self._flush_from_timer
+                )
+                self._timer.daemon = True
+                self._timer.start()
+
+        if is_full:
+            self.flush()
+        return True
+
+
+    def flush(self):
+        """Writes all pending watchlist symbols to DB in one transaction,
+        and sends `watchlist_symbols_bulk_updated` signal for them.
+
+        Returns:
+            int: Number of watchlists written.
+        """
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        if not pending:
+            return 0
+
+        watchlists = [
+            WatchList(pk=watchlist_id, user_id=user_id, symbols=symbols)
+            for watchlist_id, (user_id, symbols) in pending.items()
+        ]
+        with transaction.atomic():
+            WatchList.objects.bulk_update(
+                watchlists, ['symbols'], batch_size=self.max_pending
+            )
+        watchlist_symbols_bulk_updated.send(
+            sender=WatchList, watchlists=watchlists
+        )
+        return len(watchlists)
+
+
+    def pending_count(self):
+        """Returns the number of watchlists with pending writes.
+
+        Returns:
+            int: Number of pending watchlists.
+        """
+
+        with self._lock:
+            return len(self._pending)
+
+
+    def _flush_from_timer(self):
+        """Flushes the buffer from timer thread, and releases the DB
+        connection used by the timer thread.
+        """
+
+        try:
+            self.flush()
+        finally:
+            close_old_connections()
+
+
+_write_buffer = None
+_write_buffer_lock = threading.Lock()
+
+
+def get_write_buffer():
+    """Returns the process wide watchlist write buffer, creating it on
+    first use.
+
+    Returns:
+        WatchListWriteBuffer: Process wide write buffer.
+    """
+
+    global _write_buffer
+    with _write_buffer_lock:
+        if _write_buffer is None:
+            buffer_settings = get_write_buffer_settings()
+            _write_buffer = WatchListWriteBuffer(
+                max_pending=buffer_settings['MAX_PENDING'],
+                flush_interval=buffer_settings['FLUSH_INTERVAL']
+            )
+        return _write_buffer
+
+
+def update_watchlist_symbols(watchlist, symbols):
+    """Updates the symbols of a watchlist. Nothing is written when symbols
+    are same as the stored ones, otherwise only `symbols` column is written,
+    either right away or through the write buffer when deferred writes are
+    enabled.
+
+    Args:
+        watchlist (WatchList): A watchlist model instance.
+        symbols (List[str]): New symbols of the watchlist.
+
+    Returns:
+        bool: True if a write was made or scheduled.
+    """
+
+    if not get_write_buffer_settings()['ENABLED']:
+        return watchlist.update_symbols(symbols)
+
+    watchlist.symbols = symbols
+    return get_write_buffer().add(
+        watchlist.pk, watchlist.user_id, symbols,
+        watchlist.get_stored_symbols()
+    )
+
+
+@atexit.register
+def _flush_write_buffer_on_exit():
+    """Flushes pending writes when the process exits, so that deferred
+    writes are not lost on a graceful worker shutdown.
+    """
+
+    if _write_buffer is not None:
+        _write_buffer.flush()
@@ -0,0 +1,284 @@
+"""
+Module that defines the admission control of requests of views, which
+sheds load early when the process is overloaded.
+
+At most `MAX_CONCURRENT` requests are served at a time, and the next ones
+wait in order of arrival. A request is rejected right away with a 503
+error and a `Retry-After` header when `MAX_QUEUE` requests are already
+waiting, or when its estimated wait is more than `MAX_WAIT` seconds, so
+under a spike requests fail fast instead of all of them timing out. A
+request which is still waiting after `MAX_WAIT` seconds is rejected too.
+Wait is estimated from the mean duration of recently served requests.
+
+Settings:
+    ADMISSION_CONTROL (Dict[str, Any]): Configuration of admission control.
+        Like below:
+        - ENABLED (bool): Whether requests are admission controlled
+            (default: True).
+        - MAX_CONCURRENT (int): Max number of requests served at a time
+            (default: 16).
+        - MAX_QUEUE (int): Max number of waiting requests (default: 64).
+        - MAX_WAIT (float): Max seconds a request waits (default: 5).
+"""
+
+from contextlib import contextmanager, nullcontext
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework import exceptions, status
+
+from collections import deque
+import functools
+import math
+import threading
+import time
+
+
+DEFAULT_ADMISSION_CONTROL_SETTINGS = {
+    'ENABLED': True,
+    'MAX_CONCURRENT': 16,
+    'MAX_QUEUE': 64,
+    'MAX_WAIT': 5.0,
+}
+
+# Weight of the latest request in mean duration of served requests.
+SERVICE_TIME_WEIGHT = 0.2
+
+
+def get_admission_control_settings():
+    """Returns the admission control settings merged over defaults.
+
+    Returns:
+        Dict[str, Any]: Admission control settings.
+    """
+
+    return {
+        **DEFAULT_ADMISSION_CONTROL_SETTINGS,
+        **getattr(settings, 'ADMISSION_CONTROL', {})
+    }
+
+
+class Overloaded(exceptions.APIException):
+    """
+    Exception raised when a request is not admitted, which is a 503 error
+    with a `Retry-After` header of the estimated wait.
+    """
+
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Server is overloaded, please try again later.'
+    default_code = 'overloaded'
+
+    def __init__(self, wait):
+        self.wait = max(1, math.ceil(wait))
+        super().__init__()
+
+
+class AdmissionController:
+    """
+    Class defining the admission control of requests, shared by the threads
+    of the process. Use it as `with controller.admit():` around a request.
+
+    Attributes:
+        max_concurrent: Max number of requests served at a time.
+        max_queue: Max number of waiting requests.
+        max_wait: Max seconds a request waits.
+        in_flight: Number of requests being served.
+        admitted: Number of admitted requests.
+        rejected: Number of requests rejected right away.
+        timed_out: Number of requests rejected after waiting `max_wait`.
+        service_time: Mean duration of served requests in seconds.
+
+    Methods:
+        admit: Context manager which serves a request once admitted.
+        estimated_wait: Returns the estimated wait of a request.
+        metrics: Returns the gauges of admission control.
+    """
+
+    def __init__(self, max_concurrent, max_queue, max_wait,
+                 clock=time.monotonic):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.service_time = 0.0
+        self._clock = clock
+        self._total_wait = 0.0
+        # Tokens of waiting requests, in order of arrival.
+        self._waiters = deque()
+        self._condition = threading.Condition()
+
+
+    def estimated_wait(self, position):
+        """Returns the estimated wait of a request, lock must be held by
+        caller.
+
+        Args:
+            position (int): Number of requests waiting ahead of it.
+
+        Returns:
+            float: Estimated seconds until request is served.
+        """
+
+        return (position + 1) * self.service_time / self.max_concurrent
+
+
+    @contextmanager
+    def admit(self):
+        """Context manager which waits until the request is admitted, and
+        frees its slot when it is served.
+
+        Raises:
+            Overloaded: When the request is not admitted.
+        """
+
+        started = self._clock()
+        with self._condition:
+            if self.in_flight >= self.max_concurrent or self._waiters:
+                self._wait(started)
+            self.in_flight += 1
+            self.admitted += 1
+            self._total_wait += self._clock() - started
+
+        admitted_at = self._clock()
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.in_flight -= 1
+                duration = self._clock() - admitted_at
+                self.service_time = duration if not self.service_time else (
+                    SERVICE_TIME_WEIGHT * duration +
+                    (1 - SERVICE_TIME_WEIGHT) * self.service_time
+                )
+                self._condition.notify_all()
+
+
+    def _wait(self, started):
+        """Waits for the turn of a request, lock must be held by caller.
+
+        Args:
+            started (float): Time of clock when request arrived.
+
+        Raises:
+            Overloaded: When queue is full, estimated wait is too long or
+                request waited for `max_wait` seconds.
+        """
+
+        wait = self.estimated_wait(len(self._waiters))
+        if len(self._waiters) >= self.max_queue or wait > self.max_wait:
+            self.rejected += 1
+            raise Overloaded(wait)
+
+        token = object()
+        self._waiters.append(token)
+        try:
+            while (
+                self._waiters[0] is not token or
+                self.in_flight >= self.max_concurrent
+            ):
+                remaining = started + self.max_wait - self._clock()
+                if remaining <= 0:
+                    self.timed_out += 1
+                    raise Overloaded(self.estimated_wait(
+                        self._waiters.index(token)
+                    ))
+                self._condition.wait(remaining)
+        finally:
+            self._waiters.remove(token)
+            # Next request may be the head now.
+            self._condition.notify_all()
+
+
+    def metrics(self):
+        """Returns the gauges of admission control.
+
+        Returns:
+            Dict[str, Any]: Limits, requests being served and waiting,
+            counts of admitted and rejected requests, mean wait of admitted
+            requests, mean duration of served requests and estimated wait
+            of a new request, in seconds.
+        """
+
+        with self._condition:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'max_wait': self.max_wait,
+                'in_flight': self.in_flight,
+                'waiting': len(self._waiters),
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'mean_wait': round(
+                    self._total_wait / self.admitted, 4
+                ) if self.admitted else 0.0,
+                'service_time': round(self.service_time, 4),
+                'estimated_wait': round(
+                    self.estimated_wait(len(self._waiters)), 4
+                ),
+            }
+
+
+_admission_controller = None
+_admission_controller_lock = threading.Lock()
+
+
+def get_admission_controller():
+    """Returns the process wide admission controller.
+
+    Returns:
+        Optional[AdmissionController]: Admission controller, or None if
+        admission control is disabled.
+    """
+
+    global _admission_controller
+    admission_settings = get_admission_control_settings()
+    if not admission_settings['ENABLED']:
+        return None
+    with _admission_controller_lock:
+        if _admission_controller is None:
+            _admission_controller = AdmissionController(
+                admission_settings['MAX_CONCURRENT'],
+                admission_settings['MAX_QUEUE'],
+                admission_settings['MAX_WAIT']
+            )
+        return _admission_controller
+
+
+def admission_controlled(view_method):
+    """Decorator of a view method, which serves the request only once it is
+    admitted. Not admitted requests get a 503 error.
+
+    Args:
+        view_method (Callable): Method of a view handling a request.
+
+    Returns:
+        Callable: Admission controlled method.
+    """
+
+    @functools.wraps(view_method)
+    def wrapper(view, request, *args, **kwargs):
+        controller = get_admission_controller()
+        with controller.admit() if controller else nullcontext():
+            return view_method(view, request, *args, **kwargs)
+
+    return wrapper
+
+
+@receiver(setting_changed)
+def reset_admission_controller_on_setting_change(sender, setting, **kwargs):
+    """Function to drop the admission controller when its settings are
+    changed, like in tests.
+
+    Args:
+        sender (Type): A sender of setting changed signal.
+        setting (str): Name of the changed setting.
+    """
+
+    global _admission_controller
+    if setting == 'ADMISSION_CONTROL':
+        with _admission_controller_lock:
+            _admission_controller = None
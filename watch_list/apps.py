@@ -12,7 +12,20 @@ class WatchListConfig(AppConfig):
     Attributes:
         default_auto_field: Defining the default auto field in django db.
         name: Name of the app.
+
+    Methods:
+        ready: Connects price alerts to ingested symbols data, and refresh
+            scheduler to requested and ingested symbols data.
     """
 
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'watch_list'
+
+
+    def ready(self):
+        """Method to connect the receivers of price alerts and of refresh
+        scheduler, once apps are ready.
+        """
+
+        from . import price_alerts  # noqa: F401
+        from . import refresh_scheduler  # noqa: F401
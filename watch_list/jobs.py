@@ -0,0 +1,254 @@
+"""
+Module that defines the in-process queue of symbols fetch jobs.
+
+Jobs are persisted as `FetchJob` rows and run by a pool of worker threads
+of the process which created them. A job fetches its symbols through the
+symbols data pipeline, waiting for the upstream quota when needed, until
+every symbol is served or `TIMEOUT` seconds are passed. Symbols of a job
+are owned by its user, so jobs share upstream calls fairly like requests.
+Identical pending jobs of a user are deduplicated, and results expire after
+`RESULT_TTL` seconds. Symbols found invalid by a done job are dropped from
+the watchlist of its user.
+
+A running job updates its row every `HEARTBEAT` seconds while it waits. A
+pending or running job whose row wasn't updated for `STALE_AFTER` seconds
+was left behind by a process which stopped (like on a restart), it is
+submitted again in place of a new identical job.
+
+Settings:
+    FETCH_JOBS (Dict[str, Any]): Configuration of fetch jobs. Like below:
+        - WORKERS (int): Number of worker threads (default: 4).
+        - TIMEOUT (float): Max seconds a job waits for upstream quota
+            (default: 300).
+        - RESULT_TTL (float): Seconds for which a job and its result are
+            kept (default: 900).
+        - HEARTBEAT (float): Seconds between updates of row of a running
+            job (default: 30).
+        - STALE_AFTER (float): Seconds without update after which a job is
+            submitted again (default: 120).
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import FetchJob
+from .wrapper import symbols_data_fetcher
+from users.models import WatchList
+from users.watchlist_buffer import update_watchlist_symbols
+
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FETCH_JOBS_SETTINGS = {
+    'WORKERS': 4,
+    'TIMEOUT': 300,
+    'RESULT_TTL': 900,
+    'HEARTBEAT': 30,
+    'STALE_AFTER': 120,
+}
+
+
+def get_fetch_jobs_settings():
+    """Returns the fetch jobs settings merged over defaults.
+
+    Returns:
+        Dict[str, Any]: Fetch jobs settings.
+    """
+
+    return {
+        **DEFAULT_FETCH_JOBS_SETTINGS,
+        **getattr(settings, 'FETCH_JOBS', {})
+    }
+
+
+def run_fetch_job(job_pk, sleep=time.sleep, clock=time.monotonic):
+    """Runs a fetch job. Symbols left pending due to the upstream quota are
+    asked again after their estimated wait, until every symbol is served or
+    job times out. A job timed out with some data is done with the remaining
+    symbols left pending in its result, otherwise it is failed. Row of job
+    is updated every `HEARTBEAT` seconds of a wait, so the job isn't taken
+    as stale.
+
+    Args:
+        job_pk (int): Primary key of the job.
+        sleep optional(Callable[[float], None]): Function used to wait.
+        clock optional(Callable[[], float]): Function returning current time.
+    """
+
+    updated = FetchJob.objects.filter(
+        pk=job_pk, status=FetchJob.PENDING
+    ).update(status=FetchJob.RUNNING, updated_at=timezone.now())
+    if not updated:
+        return
+    job = FetchJob.objects.get(pk=job_pk)
+
+    jobs_settings = get_fetch_jobs_settings()
+    deadline = clock() + jobs_settings['TIMEOUT']
+    try:
+        while True:
+            result = symbols_data_fetcher.get_symbols_latest_and_graph_data(
+                job.symbols, job.interval, owner=job.user_id
+            )
+            if 'Note' in result:
+                wait = symbols_data_fetcher.call_budget.eta(0)
+            elif result['pending_symbols']:
+                wait = max(result['pending_symbols_eta'].values())
+            else:
+                break
+            if clock() + wait >= deadline:
+                break
+            wake_at = clock() + max(1.0, wait)
+            while clock() < wake_at:
+                sleep(min(wake_at - clock(), jobs_settings['HEARTBEAT']))
+                FetchJob.objects.filter(pk=job.pk).update(
+                    updated_at=timezone.now()
+                )
+    except Exception as exc:
+        logger.exception('Fetch job %s failed', job.job_id)
+        job.status = FetchJob.FAILED
+        job.error = str(exc)
+    else:
+        if 'Note' in result:
+            job.status = FetchJob.FAILED
+            job.error = result['Note']
+        else:
+            job.status = FetchJob.DONE
+            job.result = result
+    job.expires_at = timezone.now() + timedelta(
+        seconds=jobs_settings['RESULT_TTL']
+    )
+    job.save(update_fields=[
+        'status', 'result', 'error', 'updated_at', 'expires_at'
+    ])
+
+    if job.status == FetchJob.DONE and job.user_id is not None:
+        drop_invalid_watchlist_symbols(
+            job.user_id,
+            set(job.symbols) - set(job.result['symbols'])
+            - set(job.result['pending_symbols'])
+        )
+
+
+def drop_invalid_watchlist_symbols(user_id, invalid_symbols):
+    """Drops symbols found invalid from the watchlist of a user.
+
+    Args:
+        user_id (int): Primary key of the user.
+        invalid_symbols (Set[str]): Invalid symbols.
+    """
+
+    if not invalid_symbols:
+        return
+    watchlist = WatchList.objects.filter(user_id=user_id).first()
+    if watchlist is None:
+        return
+    update_watchlist_symbols(watchlist, [
+        symbol for symbol in watchlist.symbols
+        if symbol not in invalid_symbols
+    ])
+
+
+class FetchJobQueue:
+    """
+    Class defining an in-process queue of fetch jobs, run by a pool of
+    worker threads created on first use.
+
+    Attributes:
+        workers: Number of worker threads.
+
+    Methods:
+        submit: Runs a job in a worker thread.
+    """
+
+    def __init__(self, workers=4):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+
+    def submit(self, job_pk):
+        """Runs a job in a worker thread.
+
+        Args:
+            job_pk (int): Primary key of the job.
+        """
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix='fetch-job'
+                )
+        self._executor.submit(self._run, job_pk)
+
+
+    def _run(self, job_pk):
+        """Runs a job, and releases the DB connection of worker thread.
+
+        Args:
+            job_pk (int): Primary key of the job.
+        """
+
+        try:
+            run_fetch_job(job_pk)
+        except Exception:
+            logger.exception('Unable to run fetch job %s', job_pk)
+        finally:
+            close_old_connections()
+
+
+job_queue = FetchJobQueue(workers=get_fetch_jobs_settings()['WORKERS'])
+
+
+def enqueue_fetch_job(symbols, interval, user):
+    """Returns an identical pending (or running) job of user if there is
+    one, otherwise creates a job and runs it once the current transaction is
+    committed. An identical job left behind by a stopped process is pending
+    again and submitted again. Expired jobs are deleted along the way.
+
+    Args:
+        symbols (List[str]): Symbols to fetch.
+        interval (str): Time interval of the data.
+        user (User): User who owns the job.
+
+    Returns:
+        Tuple[FetchJob, bool]: Job, and whether it was created.
+    """
+
+    jobs_settings = get_fetch_jobs_settings()
+    now = timezone.now()
+    FetchJob.objects.filter(expires_at__lte=now).delete()
+
+    key = FetchJob.get_key(symbols, interval)
+    job = FetchJob.objects.filter(
+        user=user, key=key,
+        status__in=[FetchJob.PENDING, FetchJob.RUNNING],
+        created_at__gte=now - timedelta(seconds=jobs_settings['TIMEOUT'])
+    ).order_by('-created_at').first()
+    if job is not None:
+        if job.updated_at <= now - timedelta(
+            seconds=jobs_settings['STALE_AFTER']
+        ) and FetchJob.objects.filter(
+            pk=job.pk, updated_at=job.updated_at
+        ).update(status=FetchJob.PENDING, updated_at=now):
+            job.status, job.updated_at = FetchJob.PENDING, now
+            transaction.on_commit(lambda: job_queue.submit(job.pk))
+        return job, False
+
+    job = FetchJob.objects.create(
+        user=user,
+        key=key,
+        symbols=list(dict.fromkeys(symbols)),
+        interval=interval,
+        expires_at=now + timedelta(
+            seconds=jobs_settings['TIMEOUT'] + jobs_settings['RESULT_TTL']
+        )
+    )
+    transaction.on_commit(lambda: job_queue.submit(job.pk))
+    return job, True
@@ -0,0 +1,145 @@
+"""
+Module that defines `bench_admission` management command, which compares a
+spike of concurrent requests served with and without admission control.
+
+Requests share a limited capacity, like the upstream connections of a
+process, and every request takes `--service` seconds of it. Clients give up
+after `--client-timeout` seconds, but a request served after its client gave
+up still takes capacity. Without admission control every request waits
+for capacity; with it, requests over the queue or the wait budget are
+rejected right away (503), so the admitted ones are served in time.
+
+Usage:
+    python manage.py bench_admission --requests 1000 --capacity 16
+"""
+
+from django.core.management.base import BaseCommand
+
+from watch_list.admission import AdmissionController, Overloaded
+
+from contextlib import nullcontext
+import threading
+import time
+
+
+class Command(BaseCommand):
+    """
+    Class defining `bench_admission` management command.
+
+    Attributes:
+        help: Help text of the command.
+    """
+
+    help = 'Compares a spike of requests with and without admission control.'
+
+
+    def add_arguments(self, parser):
+        """Method to define arguments of the command.
+
+        Args:
+            parser (ArgumentParser): Parser of command arguments.
+        """
+
+        parser.add_argument(
+            '--requests', type=int, default=1000,
+            help='Number of requests arriving at once.'
+        )
+        parser.add_argument(
+            '--capacity', type=int, default=16,
+            help='Number of requests which can be served at a time.'
+        )
+        parser.add_argument(
+            '--service', type=float, default=0.05,
+            help='Seconds of capacity taken by a request.'
+        )
+        parser.add_argument(
+            '--client-timeout', type=float, default=1.0,
+            help='Seconds after which clients give up.'
+        )
+        parser.add_argument(
+            '--max-queue', type=int, default=64,
+            help='Max number of waiting requests of admission control.'
+        )
+
+
+    def handle(self, *args, **options):
+        """Method which runs the benchmark and prints its results.
+
+        Args:
+            *args: Additional named arguments.
+            **options: Parsed command arguments.
+        """
+
+        self.stdout.write(
+            '{} requests at once, capacity {}, {} s per request, clients '
+            'give up after {} s'.format(
+                options['requests'], options['capacity'], options['service'],
+                options['client_timeout']
+            )
+        )
+        self.run('no admission control', None, options)
+        self.run('admission control', AdmissionController(
+            options['capacity'], options['max_queue'],
+            options['client_timeout'] / 2
+        ), options)
+
+
+    def run(self, name, controller, options):
+        """Method which runs a spike of requests and prints their outcome.
+
+        Args:
+            name (str): Name of the run.
+            controller (Optional[AdmissionController]): Admission control of
+                requests, or None.
+            options (Dict[str, Any]): Parsed command arguments.
+        """
+
+        capacity = threading.BoundedSemaphore(options['capacity'])
+        outcomes = []
+        start = threading.Event()
+
+        def request():
+            start.wait()
+            started = time.perf_counter()
+            try:
+                with controller.admit() if controller else nullcontext():
+                    with capacity:
+                        time.sleep(options['service'])
+            except Overloaded:
+                outcomes.append(('rejected', time.perf_counter() - started))
+                return
+            outcomes.append(('served', time.perf_counter() - started))
+
+        threads = [
+            threading.Thread(target=request)
+            for _ in range(options['requests'])
+        ]
+        for thread in threads:
+            thread.start()
+        began = time.perf_counter()
+        start.set()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - began
+
+        served = sorted(
+            latency for outcome, latency in outcomes if outcome == 'served'
+        )
+        in_time = [
+            latency for latency in served
+            if latency <= options['client_timeout']
+        ]
+        rejected = sorted(
+            latency for outcome, latency in outcomes if outcome == 'rejected'
+        )
+        self.stdout.write(name)
+        self.stdout.write(
+            '  {} served in time (p99 {:.2f} s), {} served after client gave '
+            'up, {} rejected (p99 {:.1f} ms), busy for {:.2f} s'.format(
+                len(in_time),
+                in_time[int(len(in_time) * 0.99)] if in_time else 0,
+                len(served) - len(in_time), len(rejected),
+                rejected[int(len(rejected) * 0.99)] * 1e3 if rejected else 0,
+                seconds
+            )
+        )
@@ -0,0 +1,122 @@
+"""
+Module that defines `bench_candle_memory` management command, which
+compares the memory of candles held as `CandleSeries` with candles held as
+lists of lists of strings (the api response rows). Memory is measured with
+`tracemalloc` for a sample of symbols and scaled to the asked number of
+symbols, as the rows of every symbol would need gigabytes.
+
+Usage:
+    python manage.py bench_candle_memory --symbols 500 --bars 10000
+"""
+
+from django.core.management.base import BaseCommand
+
+from watch_list.wrapper import symbols_data_fetcher
+
+from .bench_series_cache import build_payload
+
+import gc
+import time
+import tracemalloc
+
+
+def measure(build):
+    """Returns the memory held by the result of a function.
+
+    Args:
+        build (Callable[[], Any]): Function building the measured objects.
+
+    Returns:
+        Tuple[Any, int]: Result of function and bytes held by it.
+    """
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return result, size
+
+
+class Command(BaseCommand):
+    """
+    Class defining `bench_candle_memory` management command.
+
+    Attributes:
+        help: Help text of the command.
+    """
+
+    help = 'Compares memory of CandleSeries with candle rows of strings.'
+
+
+    def add_arguments(self, parser):
+        """Method to define arguments of the command.
+
+        Args:
+            parser (ArgumentParser): Parser of command arguments.
+        """
+
+        parser.add_argument(
+            '--symbols', type=int, default=500,
+            help='Number of symbols to report memory for.'
+        )
+        parser.add_argument(
+            '--bars', type=int, default=10000,
+            help='Number of bars of each symbol.'
+        )
+        parser.add_argument(
+            '--sample', type=int, default=10,
+            help='Number of symbols actually built and measured.'
+        )
+
+
+    def handle(self, *args, **options):
+        """Method which runs the benchmark and prints its results.
+
+        Args:
+            *args: Additional named arguments.
+            **options: Parsed command arguments.
+        """
+
+        interval = symbols_data_fetcher.DEFAULT_INTERVAL
+        sample = min(options['sample'], options['symbols'])
+        payloads = [
+            build_payload('BENCH{}'.format(index), interval, options['bars'])
+            for index in range(sample)
+        ]
+        scale = options['symbols'] / sample
+
+        start = time.perf_counter()
+        series, series_size = measure(lambda: [
+            symbols_data_fetcher.parse_symbol_data(payload, interval)
+            for payload in payloads
+        ])
+        parse_ms = (time.perf_counter() - start) / sample * 1e3
+
+        start = time.perf_counter()
+        rows, rows_size = measure(
+            lambda: [symbol_series.to_rows() for symbol_series in series]
+        )
+        rows_ms = (time.perf_counter() - start) / sample * 1e3
+        del rows
+
+        self.stdout.write('symbols: {} (measured {}), bars: {}'.format(
+            options['symbols'], sample, options['bars']
+        ))
+        self.stdout.write(
+            'CandleSeries: {:.1f} MB ({:.0f} bytes/bar), '
+            'parsed in {:.1f} ms/symbol'.format(
+                series_size * scale / 1e6,
+                series_size / (sample * options['bars']), parse_ms
+            )
+        )
+        self.stdout.write(
+            'rows of strings: {:.1f} MB ({:.0f} bytes/bar), '
+            'built in {:.1f} ms/symbol'.format(
+                rows_size * scale / 1e6,
+                rows_size / (sample * options['bars']), rows_ms
+            )
+        )
+        self.stdout.write('ratio: {:.1f}x'.format(rows_size / series_size))
@@ -0,0 +1,141 @@
+"""
+Module that defines `bench_intraday_decoder` management command, which
+compares decoding a large intraday payload with `json.loads` (the whole
+body, then a dict of dicts of strings) with feeding it chunk by chunk to
+`IntradayDecoder`. Every run is done in a new process which reads the
+payload from a temporary file, so that growth of its peak RSS is the memory
+of that run alone.
+
+Usage:
+    python manage.py bench_intraday_decoder --bars 100000
+"""
+
+from django.core.management.base import BaseCommand
+
+from watch_list.wrapper import symbols_data_fetcher
+from watch_list.wrapper.intraday_decoder import decode_intraday_payload
+from watch_list.wrapper.parse_pool import parse_symbol_response
+
+from .bench_series_cache import build_payload
+
+from multiprocessing import get_context
+import json
+import resource
+import tempfile
+import time
+
+
+def get_peak_rss():
+    """Returns the peak RSS of the process. `VmHWM` of linux is used when
+    available, as `ru_maxrss` is inherited from the parent process by a
+    spawned process.
+
+    Returns:
+        int: Bytes of peak RSS.
+    """
+
+    try:
+        with open('/proc/self/status') as status_file:
+            for line in status_file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def run_decoder(method, path, interval, chunk_size):
+    """Decodes a payload and returns time and growth of peak RSS of the
+    process, runs in a new process.
+
+    Args:
+        method (str): 'json' or 'stream'.
+        path (str): Path of the file of raw payload.
+        interval (str): Time interval of the data.
+        chunk_size (int): Size of chunks fed to stream decoder.
+
+    Returns:
+        Tuple[float, int, int]: Milliseconds, bytes of peak RSS growth and
+        number of decoded candles.
+    """
+
+    with open(path, 'rb') as payload_file:
+        raw_payload = payload_file.read()
+
+    peak_rss = get_peak_rss()
+    start = time.perf_counter()
+    if method == 'json':
+        _, series = parse_symbol_response(json.loads(raw_payload), interval)
+    else:
+        _, series = decode_intraday_payload(
+            raw_payload, interval, chunk_size=chunk_size
+        )
+    elapsed_ms = (time.perf_counter() - start) * 1e3
+    return elapsed_ms, get_peak_rss() - peak_rss, len(series)
+
+
+class Command(BaseCommand):
+    """
+    Class defining `bench_intraday_decoder` management command.
+
+    Attributes:
+        help: Help text of the command.
+    """
+
+    help = 'Compares json.loads with streaming decoding of large payloads.'
+
+
+    def add_arguments(self, parser):
+        """Method to define arguments of the command.
+
+        Args:
+            parser (ArgumentParser): Parser of command arguments.
+        """
+
+        parser.add_argument(
+            '--bars', type=int, default=100000,
+            help='Number of bars of the payload.'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=64 * 1024,
+            help='Size of chunks fed to stream decoder.'
+        )
+
+
+    def handle(self, *args, **options):
+        """Method which runs the benchmark and prints its results.
+
+        Args:
+            *args: Additional named arguments.
+            **options: Parsed command arguments.
+        """
+
+        interval = symbols_data_fetcher.DEFAULT_INTERVAL
+        # Indented like the bodies sent by alpha avantage.
+        raw_payload = json.dumps(
+            build_payload('BENCH', interval, options['bars']), indent=4
+        ).encode('utf-8')
+        self.stdout.write('bars: {}, payload: {:.1f} MB'.format(
+            options['bars'], len(raw_payload) / 1e6
+        ))
+
+        context = get_context('spawn')
+        with tempfile.NamedTemporaryFile(suffix='.json') as payload_file:
+            payload_file.write(raw_payload)
+            payload_file.flush()
+            del raw_payload
+            for method in ('json', 'stream'):
+                with context.Pool(1) as pool:
+                    elapsed_ms, peak_rss_growth, count = pool.apply(
+                        run_decoder, (
+                            method, payload_file.name, interval,
+                            options['chunk_size']
+                        )
+                    )
+                self.stdout.write(
+                    '{:<7} {:8.1f} ms  peak rss +{:.1f} MB  '
+                    '({} candles)'.format(
+                        method, elapsed_ms, peak_rss_growth / 1e6, count
+                    )
+                )
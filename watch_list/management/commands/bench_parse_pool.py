@@ -0,0 +1,95 @@
+"""
+Module that defines `bench_parse_pool` management command, which compares
+the wall time of parsing a batch of raw upstream payloads inline with
+parsing it in parse pools of different sizes.
+
+Usage:
+    python manage.py bench_parse_pool --symbols 64 --bars 2000 --workers 1 2 4
+"""
+
+from django.core.management.base import BaseCommand
+
+from watch_list.wrapper import symbols_data_fetcher
+from watch_list.wrapper.parse_pool import ParsePool, parse_symbol_response
+
+from .bench_series_cache import build_payload
+
+import json
+import time
+
+
+class Command(BaseCommand):
+    """
+    Class defining `bench_parse_pool` management command.
+
+    Attributes:
+        help: Help text of the command.
+    """
+
+    help = 'Compares inline parsing of payloads with parse pools.'
+
+
+    def add_arguments(self, parser):
+        """Method to define arguments of the command.
+
+        Args:
+            parser (ArgumentParser): Parser of command arguments.
+        """
+
+        parser.add_argument(
+            '--symbols', type=int, default=64,
+            help='Number of payloads of the batch.'
+        )
+        parser.add_argument(
+            '--bars', type=int, default=2000,
+            help='Number of bars of each payload.'
+        )
+        parser.add_argument(
+            '--workers', type=int, nargs='+', default=[1, 2, 4, 8],
+            help='Sizes of measured parse pools.'
+        )
+
+
+    def handle(self, *args, **options):
+        """Method which runs the benchmark and prints its results.
+
+        Args:
+            *args: Additional named arguments.
+            **options: Parsed command arguments.
+        """
+
+        interval = symbols_data_fetcher.DEFAULT_INTERVAL
+        raw_payloads = [
+            json.dumps(build_payload(
+                'BENCH{}'.format(index), interval, options['bars']
+            )).encode('utf-8')
+            for index in range(options['symbols'])
+        ]
+
+        self.stdout.write('symbols: {}, bars: {}, batch: {:.1f} MB'.format(
+            options['symbols'], options['bars'],
+            sum(len(payload) for payload in raw_payloads) / 1e6
+        ))
+
+        start = time.perf_counter()
+        for raw_payload in raw_payloads:
+            parse_symbol_response(json.loads(raw_payload), interval)
+        inline_ms = (time.perf_counter() - start) * 1e3
+        self.stdout.write('inline: {:.1f} ms'.format(inline_ms))
+
+        for workers in options['workers']:
+            parse_pool = ParsePool(workers)
+            try:
+                # Workers are spawned by the first batch, which isn't
+                # measured.
+                parse_pool.parse(raw_payloads[:workers], interval)
+                start = time.perf_counter()
+                parse_pool.parse(raw_payloads, interval)
+                pool_ms = (time.perf_counter() - start) * 1e3
+            finally:
+                parse_pool.shutdown()
+            self.stdout.write(
+                '{} workers: {:.1f} ms ({:.2f}x inline)'.format(
+                    workers, pool_ms, inline_ms / pool_ms
+                )
+            )
@@ -0,0 +1,222 @@
+"""
+Module that defines `bench_price_alerts` management command, which compares
+evaluating price ticks against the sorted thresholds of `PriceAlertIndex`
+with scanning alerts, for a large number of alerts across many symbols.
+
+Each tick moves the price of a random symbol a little, like a new candle,
+and finds the alerts crossed by its low and high. Crossed alerts are armed
+again around the new price, so the number of alerts stays the same.
+
+Usage:
+    python manage.py bench_price_alerts --alerts 1000000 --symbols 3000
+"""
+
+from django.core.management.base import BaseCommand
+
+from watch_list.models import PriceAlert
+from watch_list.price_alerts import PriceAlertIndex
+
+from .bench_candle_memory import measure
+
+import random
+import time
+
+
+def arm(rng, price):
+    """Returns the direction and threshold of a random alert around a
+    price, which is not crossed by it.
+
+    Args:
+        rng (Random): Random number generator.
+        price (float): Current price of the symbol.
+
+    Returns:
+        Tuple[str, float]: Direction and threshold of the alert.
+    """
+
+    direction = rng.choice((PriceAlert.ABOVE, PriceAlert.BELOW))
+    offset = rng.uniform(0.002, 0.2) * price
+    if direction == PriceAlert.ABOVE:
+        return direction, price + offset
+    return direction, price - offset
+
+
+def is_crossed(direction, threshold, low, high):
+    """Returns whether an alert is crossed by a price range, like
+    `PriceAlertIndex.pop_crossed` but for a single alert.
+
+    Args:
+        direction (str): `PriceAlert.ABOVE` or `PriceAlert.BELOW`.
+        threshold (float): Price threshold of the alert.
+        low (float): Lowest price.
+        high (float): Highest price.
+
+    Returns:
+        bool: Whether alert is crossed.
+    """
+
+    if direction == PriceAlert.ABOVE:
+        return threshold <= high
+    return threshold >= low
+
+
+class Command(BaseCommand):
+    """
+    Class defining `bench_price_alerts` management command.
+
+    Attributes:
+        help: Help text of the command.
+    """
+
+    help = 'Compares sorted threshold index of price alerts with scanning.'
+
+
+    def add_arguments(self, parser):
+        """Method to define arguments of the command.
+
+        Args:
+            parser (ArgumentParser): Parser of command arguments.
+        """
+
+        parser.add_argument(
+            '--alerts', type=int, default=1000000,
+            help='Number of alerts.'
+        )
+        parser.add_argument(
+            '--symbols', type=int, default=3000,
+            help='Number of symbols of alerts.'
+        )
+        parser.add_argument(
+            '--ticks', type=int, default=100000,
+            help='Number of ticks evaluated by the index.'
+        )
+        parser.add_argument(
+            '--scan-ticks', type=int, default=20,
+            help='Number of ticks evaluated by scanning every alert.'
+        )
+
+
+    def handle(self, *args, **options):
+        """Method which runs the benchmark and prints its results.
+
+        Args:
+            *args: Additional named arguments.
+            **options: Parsed command arguments.
+        """
+
+        rng = random.Random(0)
+        symbols = [
+            'SYM{}'.format(index) for index in range(options['symbols'])
+        ]
+        prices = {symbol: rng.uniform(10, 500) for symbol in symbols}
+        alerts = [
+            (alert_id, symbol) + arm(rng, prices[symbol])
+            for alert_id, symbol in enumerate(
+                rng.choice(symbols) for _ in range(options['alerts'])
+            )
+        ]
+
+        start = time.perf_counter()
+        index = build_index(alerts)
+        build_seconds = time.perf_counter() - start
+        index_size = measure(lambda: build_index(alerts))[1]
+        self.stdout.write(
+            '{} alerts, {} symbols, index built in {:.2f} s, '
+            '{:.1f} MB'.format(
+                len(index), len(symbols), build_seconds, index_size / 1e6
+            )
+        )
+
+        ticks = []
+        for _ in range(max(options['ticks'], options['scan_ticks'])):
+            symbol = rng.choice(symbols)
+            prices[symbol] *= 1 + rng.gauss(0, 0.002)
+            ticks.append(
+                (symbol, prices[symbol] * 0.999, prices[symbol] * 1.001)
+            )
+
+        # Every run arms crossed alerts again with same random thresholds.
+        rng = random.Random(1)
+        crossed_count = 0
+        start = time.perf_counter()
+        for symbol, low, high in ticks[:options['ticks']]:
+            crossed = index.pop_crossed(symbol, low, high)
+            crossed_count += len(crossed)
+            for alert_id, direction, threshold in crossed:
+                index.add(alert_id, symbol, *arm(rng, (low + high) / 2))
+        self.report(
+            'sorted threshold index', time.perf_counter() - start,
+            options['ticks'], crossed_count
+        )
+
+        rng = random.Random(1)
+        alerts_by_symbol = {}
+        for alert in alerts:
+            alerts_by_symbol.setdefault(alert[1], []).append(alert)
+        crossed_count = 0
+        start = time.perf_counter()
+        for symbol, low, high in ticks[:options['ticks']]:
+            symbol_alerts = alerts_by_symbol.get(symbol, [])
+            crossed = [
+                alert for alert in symbol_alerts
+                if is_crossed(alert[2], alert[3], low, high)
+            ]
+            if crossed:
+                crossed_count += len(crossed)
+                symbol_alerts[:] = [
+                    alert for alert in symbol_alerts
+                    if not is_crossed(alert[2], alert[3], low, high)
+                ] + [
+                    (alert[0], symbol) + arm(rng, (low + high) / 2)
+                    for alert in crossed
+                ]
+        self.report(
+            'scan of alerts of symbol', time.perf_counter() - start,
+            options['ticks'], crossed_count
+        )
+
+        crossed_count = 0
+        start = time.perf_counter()
+        for tick_symbol, low, high in ticks[:options['scan_ticks']]:
+            crossed_count += sum(
+                symbol == tick_symbol and
+                is_crossed(direction, threshold, low, high)
+                for alert_id, symbol, direction, threshold in alerts
+            )
+        self.report(
+            'scan of all alerts', time.perf_counter() - start,
+            options['scan_ticks'], crossed_count
+        )
+
+
+    def report(self, name, seconds, ticks, crossed_count):
+        """Method which prints the results of a run.
+
+        Args:
+            name (str): Name of the run.
+            seconds (float): Duration of the run.
+            ticks (int): Number of evaluated ticks.
+            crossed_count (int): Number of crossed alerts.
+        """
+
+        self.stdout.write(
+            '{}: {:.2f} us/tick, {} ticks, {} crossed alerts'.format(
+                name, seconds / max(ticks, 1) * 1e6, ticks, crossed_count
+            )
+        )
+
+
+def build_index(alerts):
+    """Builds the index of alerts.
+
+    Args:
+        alerts (List[Tuple[int, str, str, float]]): Id, symbol, direction
+            and threshold of each alert.
+
+    Returns:
+        PriceAlertIndex: Index of alerts.
+    """
+
+    index = PriceAlertIndex()
+    index.add_many(alerts)
+    return index
@@ -0,0 +1,143 @@
+"""
+Module that defines `bench_response_compression` management command,
+which measures CPU per request and bytes on the wire of a symbols data
+response, uncompressed and with every available encoding, with and without
+the LRU of compressed bodies.
+
+Usage:
+    python manage.py bench_response_compression --symbols 20 --bars 100
+"""
+
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+
+from stockmonitor.middleware import (
+    COMPRESSORS, CompressedBodyCache, CompressionMiddleware
+)
+from watch_list.wrapper import symbols_data_fetcher
+from watch_list.wrapper.candle_series import CANDLE_VALUES
+
+from .bench_series_cache import build_payload
+
+from unittest import mock
+import time
+
+
+class Command(BaseCommand):
+    """
+    Class defining `bench_response_compression` management command.
+
+    Attributes:
+        help: Help text of the command.
+    """
+
+    help = 'Measures CPU and bytes of compressed symbols data responses.'
+
+
+    def add_arguments(self, parser):
+        """Method to define arguments of the command.
+
+        Args:
+            parser (ArgumentParser): Parser of command arguments.
+        """
+
+        parser.add_argument(
+            '--symbols', type=int, default=20,
+            help='Number of symbols in the response.'
+        )
+        parser.add_argument(
+            '--bars', type=int, default=100,
+            help='Number of bars of each symbol.'
+        )
+        parser.add_argument(
+            '--requests', type=int, default=200,
+            help='Number of requests of each run.'
+        )
+
+
+    def handle(self, *args, **options):
+        """Method which runs the benchmark and prints its results.
+
+        Args:
+            *args: Additional named arguments.
+            **options: Parsed command arguments.
+        """
+
+        interval = symbols_data_fetcher.DEFAULT_INTERVAL
+        series = [
+            symbols_data_fetcher.parse_symbol_data(
+                build_payload('BENCH{}'.format(index), interval,
+                              options['bars']),
+                interval
+            )
+            for index in range(options['symbols'])
+        ]
+        data = {
+            'symbols': [symbol_series.symbol for symbol_series in series],
+            'values': CANDLE_VALUES,
+            'latest_prices': {
+                symbol_series.symbol: symbol_series.latest_row()
+                for symbol_series in series
+            },
+            'candle_stick_graph_data': {
+                symbol_series.symbol: symbol_series.to_rows()
+                for symbol_series in series
+            },
+        }
+        body = JSONRenderer().render(data)
+        middleware = CompressionMiddleware(
+            lambda request: HttpResponse(
+                body, content_type='application/json'
+            )
+        )
+        factory = RequestFactory()
+
+        self.stdout.write('symbols: {}, bars: {}, requests: {}'.format(
+            options['symbols'], options['bars'], options['requests']
+        ))
+        self.stdout.write(
+            'render json: {:.3f} ms/request'.format(self.measure(
+                options['requests'], lambda: JSONRenderer().render(data)
+            ))
+        )
+
+        runs = [('identity', None, 0)]
+        for encoding in COMPRESSORS:
+            runs.append((encoding, encoding, 0))
+            runs.append((encoding + ' + lru', encoding, 64 * 1024 * 1024))
+        for name, encoding, cache_max_bytes in runs:
+            request = factory.get(
+                '/', HTTP_ACCEPT_ENCODING=encoding or 'identity'
+            )
+            with mock.patch(
+                'stockmonitor.middleware.compressed_body_cache',
+                CompressedBodyCache(cache_max_bytes)
+            ):
+                response = middleware(request)
+                cpu_ms = self.measure(
+                    options['requests'], lambda: middleware(request)
+                )
+            self.stdout.write(
+                '{:<12} {:>9} bytes  {:.3f} ms cpu/request'.format(
+                    name, len(response.content), cpu_ms
+                )
+            )
+
+
+    def measure(self, count, run):
+        """Method which returns the CPU time per call of a function.
+
+        Args:
+            count (int): Number of calls.
+            run (Callable[[], Any]): Measured function.
+
+        Returns:
+            float: Milliseconds of CPU time per call.
+        """
+
+        start = time.process_time()
+        for _ in range(count):
+            run()
+        return (time.process_time() - start) / count * 1e3
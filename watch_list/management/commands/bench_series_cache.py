@@ -0,0 +1,157 @@
+"""
+Module that defines `bench_series_cache` management command, which
+benchmarks a hit of the shared series cache against recomputing the parsed
+data of a symbol from an upstream payload. Benchmark entries are deleted
+from the cache at the end.
+
+Usage:
+    python manage.py bench_series_cache --symbols 50 --bars 100
+"""
+
+from django.core.management.base import BaseCommand
+
+from watch_list.wrapper import symbols_data_fetcher
+from watch_list.wrapper.candle_series import CandleSeries
+
+from datetime import datetime, timedelta
+import pickle
+import time
+
+
+def build_payload(symbol, interval, bars):
+    """Builds an alpha avantage like intraday payload, with bars ordered
+    from newest to oldest like the real api.
+
+    Args:
+        symbol (str): Symbol of the payload.
+        interval (str): Time interval of the data.
+        bars (int): Number of bars.
+
+    Returns:
+        dict: Intraday payload.
+    """
+
+    newest = datetime(2023, 5, 19, 19, 55)
+    time_series = {}
+    for index in range(bars):
+        price = 100 + (index % 50) * 0.25
+        time_series[
+            (newest - timedelta(minutes=5 * index)).strftime(
+                '%Y-%m-%d %H:%M:%S'
+            )
+        ] = {
+            '1. open': '{:.4f}'.format(price),
+            '2. high': '{:.4f}'.format(price + 1),
+            '3. low': '{:.4f}'.format(price - 1),
+            '4. close': '{:.4f}'.format(price + 0.5),
+            '5. volume': str(1000 + index),
+        }
+    return {
+        'Meta Data': {'2. Symbol': symbol},
+        'Time Series ({})'.format(interval): time_series,
+    }
+
+
+class Command(BaseCommand):
+    """
+    Class defining `bench_series_cache` management command.
+
+    Attributes:
+        help: Help text of the command.
+    """
+
+    help = 'Benchmarks series cache hits against recomputing parsed data.'
+
+
+    def add_arguments(self, parser):
+        """Method to define arguments of the command.
+
+        Args:
+            parser (ArgumentParser): Parser of command arguments.
+        """
+
+        parser.add_argument(
+            '--symbols', type=int, default=50,
+            help='Number of symbols to cache.'
+        )
+        parser.add_argument(
+            '--bars', type=int, default=100,
+            help='Number of bars of each symbol.'
+        )
+        parser.add_argument(
+            '--rounds', type=int, default=5,
+            help='Number of times every symbol is read.'
+        )
+
+
+    def handle(self, *args, **options):
+        """Method which runs the benchmark and prints its results.
+
+        Args:
+            *args: Additional named arguments.
+            **options: Parsed command arguments.
+        """
+
+        interval = symbols_data_fetcher.DEFAULT_INTERVAL
+        symbols = [
+            'BENCH{}'.format(index) for index in range(options['symbols'])
+        ]
+        payloads = [
+            build_payload(symbol, interval, options['bars'])
+            for symbol in symbols
+        ]
+        keys = [
+            'bench-' + symbols_data_fetcher.get_symbol_cache_key(
+                symbol, interval
+            )
+            for symbol in symbols
+        ]
+        series_cache = symbols_data_fetcher.get_series_cache()
+        reads = options['symbols'] * options['rounds']
+
+        start = time.perf_counter()
+        for _ in range(options['rounds']):
+            parsed = [
+                symbols_data_fetcher.parse_symbol_data(payload, interval)
+                for payload in payloads
+            ]
+        recompute_us = (time.perf_counter() - start) / reads * 1e6
+
+        encoded = [series.to_bytes() for series in parsed]
+        series_cache.set_many(dict(zip(keys, encoded)), 300)
+        try:
+            start = time.perf_counter()
+            for _ in range(options['rounds']):
+                for key in keys:
+                    CandleSeries.from_bytes(series_cache.get(key))
+            hit_us = (time.perf_counter() - start) / reads * 1e6
+
+            start = time.perf_counter()
+            for _ in range(options['rounds']):
+                for data in encoded:
+                    CandleSeries.from_bytes(data)
+            decode_us = (time.perf_counter() - start) / reads * 1e6
+        finally:
+            series_cache.delete_many(keys)
+
+        pickled_size = sum(
+            len(pickle.dumps(series.to_rows(), pickle.HIGHEST_PROTOCOL))
+            for series in parsed
+        ) / len(parsed)
+        encoded_size = sum(len(data) for data in encoded) / len(encoded)
+
+        self.stdout.write('backend: {}'.format(
+            type(series_cache).__name__
+        ))
+        self.stdout.write('symbols: {}, bars: {}, reads: {}'.format(
+            options['symbols'], options['bars'], reads
+        ))
+        self.stdout.write('recompute: {:.1f} us/symbol'.format(recompute_us))
+        self.stdout.write('cache hit: {:.1f} us/symbol'.format(hit_us))
+        self.stdout.write('  of which decode: {:.1f} us/symbol'.format(
+            decode_us
+        ))
+        self.stdout.write(
+            'entry size: {:.0f} bytes (pickled candle rows: {:.0f} '
+            'bytes)'.format(encoded_size, pickled_size)
+        )
@@ -0,0 +1,157 @@
+"""
+Module that defines `measure_import_time` management command, which
+measures the time and memory of importing modules in a new interpreter,
+like a web worker booting `stockmonitor.wsgi`, and reports the slowest
+imports and heavy dependencies which got imported.
+
+Usage:
+    python manage.py measure_import_time stockmonitor.wsgi stockmonitor.urls
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+import json
+import os
+import subprocess
+import sys
+
+
+# Dependencies which should only be imported on first use.
+HEAVY_MODULES = ('numpy', 'pandas', 'aiohttp')
+
+# Runs in the new interpreter, `modules` and `heavy_modules` are formatted
+# in.
+MEASURE_CODE = '''
+import json, sys, time
+
+def read_rss(field):
+    try:
+        with open('/proc/self/status') as status_file:
+            for line in status_file:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+rss = read_rss('VmRSS')
+start = time.perf_counter()
+for module in {modules!r}:
+    __import__(module)
+print(json.dumps({{
+    'seconds': time.perf_counter() - start,
+    'rss_growth': read_rss('VmHWM') - rss,
+    'heavy_modules': [
+        module for module in {heavy_modules!r} if module in sys.modules
+    ],
+}}))
+'''
+
+
+def measure_imports(modules):
+    """Imports modules in a new interpreter with current settings, and
+    returns what it took.
+
+    Args:
+        modules (List[str]): Names of imported modules, in order.
+
+    Returns:
+        Dict[str, Any]: 'seconds' of imports, 'rss_growth' bytes of peak
+        RSS over the RSS of bare interpreter, 'heavy_modules' of
+        `HEAVY_MODULES` which got imported and 'slowest' list of
+        (module, cumulative microseconds) of `-X importtime`, slowest first.
+
+    Raises:
+        RuntimeError: If a module can't be imported.
+    """
+
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+    completed = subprocess.run(
+        [
+            sys.executable, '-X', 'importtime', '-c',
+            MEASURE_CODE.format(modules=modules, heavy_modules=HEAVY_MODULES)
+        ],
+        capture_output=True, text=True, env=env,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(
+            sys.modules[settings.SETTINGS_MODULE].__file__
+        )))
+    )
+    if completed.returncode:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    slowest = []
+    for line in completed.stderr.splitlines():
+        # Lines are like 'import time:   self |   cumulative | module'.
+        parts = line.split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        slowest.append((parts[2].strip(), int(parts[1])))
+    result['slowest'] = sorted(slowest, key=lambda item: -item[1])
+    return result
+
+
+class Command(BaseCommand):
+    """
+    Class defining `measure_import_time` management command.
+
+    Attributes:
+        help: Help text of the command.
+    """
+
+    help = 'Measures time and memory of importing modules in a new process.'
+
+
+    def add_arguments(self, parser):
+        """Method to define arguments of the command.
+
+        Args:
+            parser (ArgumentParser): Parser of command arguments.
+        """
+
+        parser.add_argument(
+            'modules', nargs='*',
+            default=['stockmonitor.wsgi', 'stockmonitor.urls'],
+            help='Modules to import, in order.'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=3,
+            help='Number of measures, the fastest one is reported.'
+        )
+        parser.add_argument(
+            '--top', type=int, default=15,
+            help='Number of slowest imports to report.'
+        )
+
+
+    def handle(self, *args, **options):
+        """Method which measures the imports and prints the results.
+
+        Args:
+            *args: Additional named arguments.
+            **options: Parsed command arguments.
+        """
+
+        try:
+            results = [
+                measure_imports(options['modules'])
+                for _ in range(max(1, options['repeat']))
+            ]
+        except RuntimeError as exc:
+            raise CommandError(str(exc))
+        result = min(results, key=lambda result: result['seconds'])
+
+        self.stdout.write('modules: {}'.format(', '.join(options['modules'])))
+        self.stdout.write('import time: {:.1f} ms, rss: +{:.1f} MB'.format(
+            result['seconds'] * 1e3, result['rss_growth'] / 1e6
+        ))
+        self.stdout.write('heavy modules imported: {}'.format(
+            ', '.join(result['heavy_modules']) or 'none'
+        ))
+        self.stdout.write('slowest imports (cumulative):')
+        for module, microseconds in result['slowest'][:options['top']]:
+            self.stdout.write('  {:8.1f} ms  {}'.format(
+                microseconds / 1e3, module
+            ))
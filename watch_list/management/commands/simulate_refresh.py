@@ -0,0 +1,298 @@
+"""
+Module that defines `simulate_refresh` management command, which compares
+the upstream calls spent refreshing watched symbols over a synthetic week
+by fixed polling and by the refresh scheduler.
+
+Watchers of symbols follow a Zipf law, and user requests arrive as a
+Poisson process, mostly while the US market is open, for symbols picked by
+popularity. A request serves its symbol fresh, for every strategy. Every
+strategy refreshes the watched symbols:
+    - `fixed 24/7` polls every symbol every `--poll-interval` seconds.
+    - `fixed market hours` does the same only while the exchange of the
+      symbol is open.
+    - `adaptive` is the refresh scheduler, by market hours and demand.
+
+Staleness is the age of the candles of watched symbols while their
+exchange is open, sampled every minute and weighted by watchers.
+
+Usage:
+    python manage.py simulate_refresh --symbols 500 --start 2026-11-23
+"""
+
+from django.core.management.base import BaseCommand
+
+from watch_list.refresh_scheduler import (
+    RefreshScheduler, get_refresh_scheduler_settings
+)
+from watch_list.wrapper.market_calendar import get_market_calendar
+
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+import math
+import random
+import time
+
+
+# Seconds between steps of the simulation.
+STEP = 60
+
+
+class Command(BaseCommand):
+    """
+    Class defining `simulate_refresh` management command.
+
+    Attributes:
+        help: Help text of the command.
+    """
+
+    help = 'Compares upstream calls of fixed polling and adaptive refresh.'
+
+
+    def add_arguments(self, parser):
+        """Method to define arguments of the command.
+
+        Args:
+            parser (ArgumentParser): Parser of command arguments.
+        """
+
+        parser.add_argument(
+            '--symbols', type=int, default=500,
+            help='Number of symbols, every fifth one trades in London.'
+        )
+        parser.add_argument(
+            '--max-watchers', type=int, default=200,
+            help='Watchers of the most watched symbol.'
+        )
+        parser.add_argument(
+            '--requests', type=int, default=5000,
+            help='Number of requests per day.'
+        )
+        parser.add_argument(
+            '--start', type=date.fromisoformat, default=date(2026, 11, 23),
+            help='First day of the week, in New York time.'
+        )
+        parser.add_argument(
+            '--days', type=int, default=7, help='Number of simulated days.'
+        )
+        parser.add_argument(
+            '--poll-interval', type=int, default=300,
+            help='Seconds between polls of fixed polling.'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0, help='Seed of random requests.'
+        )
+
+
+    def handle(self, *args, **options):
+        """Method which runs the simulation and prints its results.
+
+        Args:
+            *args: Additional named arguments.
+            **options: Parsed command arguments.
+        """
+
+        self.calendar = get_market_calendar()
+        symbols = [
+            'S{:04d}{}'.format(rank, '.LON' if rank % 5 == 4 else '')
+            for rank in range(options['symbols'])
+        ]
+        self.watchers = {}
+        for rank, symbol in enumerate(symbols):
+            watchers = int(options['max_watchers'] / (rank + 1) ** 1.1)
+            if watchers:
+                self.watchers[symbol] = watchers
+        self.start = datetime.combine(
+            options['start'], datetime.min.time(),
+            ZoneInfo('America/New_York')
+        ).timestamp()
+        self.steps = options['days'] * 86400 // STEP
+        self.requests = self.build_requests(symbols, options)
+
+        self.stdout.write(
+            '{} symbols ({} watched, {} watchers), {} requests over {} days '
+            'from {}'.format(
+                len(symbols), len(self.watchers), sum(self.watchers.values()),
+                sum(len(step) for step in self.requests.values()),
+                options['days'], options['start']
+            )
+        )
+        poll_interval = options['poll_interval']
+        baseline = self.run('fixed 24/7', self.poll_fixed(poll_interval))
+        self.run(
+            'fixed market hours',
+            self.poll_fixed(poll_interval, market_hours=True), baseline
+        )
+        self.run('adaptive', self.poll_adaptive(), baseline)
+
+
+    def build_requests(self, symbols, options):
+        """Method which draws the requests of each step, most of them while
+        the US market is open.
+
+        Args:
+            symbols (List[str]): Symbols, most popular first.
+            options (Dict[str, Any]): Parsed command arguments.
+
+        Returns:
+            Dict[int, List[str]]: Requested symbols of each step.
+        """
+
+        rng = random.Random(options['seed'])
+        weights = [1 / (rank + 1) for rank in range(len(symbols))]
+        us = self.calendar.for_symbol('')
+        # 90% of the requests of a day arrive in the 390 minutes of session.
+        open_rate = 0.9 * options['requests'] * STEP / (390 * 60)
+        closed_rate = 0.1 * options['requests'] * STEP / ((1440 - 390) * 60)
+        requests = {}
+        for step in range(self.steps):
+            rate = open_rate if us.is_open(self.start + step * STEP) else (
+                closed_rate
+            )
+            count = self.poisson(rng, rate)
+            if count:
+                requests[step] = rng.choices(symbols, weights, k=count)
+        return requests
+
+
+    @staticmethod
+    def poisson(rng, rate):
+        """Returns a Poisson distributed count.
+
+        Args:
+            rng (Random): Random generator.
+            rate (float): Mean count.
+
+        Returns:
+            int: Count.
+        """
+
+        limit, count, product = math.exp(-rate), 0, rng.random()
+        while product > limit:
+            count += 1
+            product *= rng.random()
+        return count
+
+
+    def poll_fixed(self, poll_interval, market_hours=False):
+        """Method which returns a strategy polling every watched symbol at a
+        fixed interval.
+
+        Args:
+            poll_interval (int): Seconds between polls.
+            market_hours optional(bool): Whether symbols are polled only
+                while their exchange is open (default: False).
+
+        Returns:
+            Callable[[float, List[str], Dict[str, bool]], List[str]]:
+            Strategy, returning the symbols refreshed at a time.
+        """
+
+        def poll(now, requested, is_open):
+            if (now - self.start) % poll_interval:
+                return []
+            return [
+                symbol for symbol in self.watchers
+                if not market_hours or is_open[symbol]
+            ]
+
+        return poll
+
+
+    def poll_adaptive(self):
+        """Method which returns the strategy of the refresh scheduler.
+
+        Returns:
+            Callable[[float, List[str], Dict[str, bool]], List[str]]:
+            Strategy, returning the symbols refreshed at a time.
+        """
+
+        clock = [self.start]
+        refreshed = []
+        scheduler_settings = get_refresh_scheduler_settings()
+        scheduler = RefreshScheduler(
+            self.calendar, refreshed.extend,
+            min_interval=scheduler_settings['MIN_INTERVAL'],
+            max_interval=scheduler_settings['MAX_INTERVAL'],
+            hot_score=scheduler_settings['HOT_SCORE'],
+            request_weight=scheduler_settings['REQUEST_WEIGHT'],
+            rate_half_life=scheduler_settings['RATE_HALF_LIFE'],
+            close_delay=scheduler_settings['CLOSE_DELAY'],
+            clock=lambda: clock[0], autostart=False
+        )
+        scheduler.set_watchers(self.watchers)
+
+        def poll(now, requested, is_open):
+            clock[0] = now
+            if requested:
+                # Requests are served fresh, like fetched.
+                scheduler.record_requests(requested)
+                scheduler.record_refreshes(requested)
+            refreshed.clear()
+            scheduler.run_once()
+            return refreshed
+
+        return poll
+
+
+    def run(self, name, poll, baseline=None):
+        """Method which simulates a strategy and prints its upstream calls
+        and the staleness of watched symbols.
+
+        Args:
+            name (str): Name of the strategy.
+            poll (Callable): Strategy, returning refreshed symbols.
+            baseline optional(int): Upstream calls of the baseline strategy
+                (default: None).
+
+        Returns:
+            int: Upstream calls of the strategy.
+        """
+
+        exchanges = {
+            symbol: self.calendar.for_symbol(symbol)
+            for symbol in self.watchers
+        }
+        refreshed_at = {}
+        calls = 0
+        weighted_age = weight = max_age = 0
+        seconds = 0.0
+        for step in range(self.steps):
+            now = self.start + step * STEP
+            open_exchanges = {
+                exchange.name: exchange.is_open(now)
+                for exchange in self.calendar.exchanges.values()
+            }
+            is_open = {
+                symbol: open_exchanges[exchange.name]
+                for symbol, exchange in exchanges.items()
+            }
+            requested = self.requests.get(step, [])
+            for symbol in requested:
+                refreshed_at[symbol] = now
+
+            started = time.perf_counter()
+            refreshed = poll(now, requested, is_open)
+            seconds += time.perf_counter() - started
+            calls += len(refreshed)
+            for symbol in refreshed:
+                refreshed_at[symbol] = now
+
+            for symbol, watchers in self.watchers.items():
+                if is_open[symbol] and symbol in refreshed_at:
+                    age = now - refreshed_at[symbol]
+                    weighted_age += watchers * age
+                    weight += watchers
+                    max_age = max(max_age, age)
+
+        self.stdout.write(name)
+        self.stdout.write(
+            '  {} upstream calls{}, mean age while open {:.0f} s, max age '
+            '{:.0f} s, {:.1f} us of strategy per step'.format(
+                calls,
+                ' ({:.0%} fewer)'.format(1 - calls / baseline)
+                if baseline else '',
+                weighted_age / weight if weight else 0, max_age,
+                seconds / self.steps * 1e6
+            )
+        )
+        return calls
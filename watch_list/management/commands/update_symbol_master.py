@@ -0,0 +1,93 @@
+"""
+Module that defines `update_symbol_master` management command, which
+downloads the listing of all active symbols from alpha avantage and saves
+it as the symbol master's listing file (`SYMBOL_MASTER_FILE`).
+
+Usage:
+    python manage.py update_symbol_master --api-key demo
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from watch_list.symbol_master import SymbolMaster, reset_symbol_master
+
+import os
+import tempfile
+import urllib.request
+
+
+LISTING_STATUS_URL = (
+    'https://www.alphavantage.co/query?function=LISTING_STATUS&apikey={}'
+)
+
+
+class Command(BaseCommand):
+    """
+    Class defining `update_symbol_master` management command.
+
+    Attributes:
+        help: Help text of the command.
+    """
+
+    help = 'Downloads the listing file used by the symbol master.'
+
+
+    def add_arguments(self, parser):
+        """Method to define arguments of the command.
+
+        Args:
+            parser (ArgumentParser): Parser of command arguments.
+        """
+
+        parser.add_argument(
+            '--api-key', default='demo',
+            help='Alpha avantage api key (listing is served for `demo` too).'
+        )
+
+
+    def handle(self, *args, **options):
+        """Method which downloads the listing file and replaces the current
+        one only when the downloaded file is a valid listing.
+
+        Args:
+            *args: Additional named arguments.
+            **options: Parsed command arguments.
+
+        Raises:
+            CommandError: If listing file can't be downloaded or is empty.
+        """
+
+        path = settings.SYMBOL_MASTER_FILE
+        if not path:
+            raise CommandError('SYMBOL_MASTER_FILE setting is not set.')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        file_descriptor, temp_path = tempfile.mkstemp(
+            dir=os.path.dirname(path), suffix='.csv'
+        )
+        try:
+            with os.fdopen(file_descriptor, 'wb') as listing_file:
+                with urllib.request.urlopen(
+                    LISTING_STATUS_URL.format(options['api_key']), timeout=60
+                ) as response:
+                    listing_file.write(response.read())
+
+            try:
+                symbol_master = SymbolMaster.from_file(temp_path)
+            except (KeyError, ValueError) as exc:
+                raise CommandError('Invalid listing file: {}'.format(exc))
+            if not len(symbol_master):
+                raise CommandError('Downloaded listing file has no symbols.')
+
+            os.replace(temp_path, path)
+        except OSError as exc:
+            raise CommandError('Unable to download listing: {}'.format(exc))
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        reset_symbol_master()
+        self.stdout.write(
+            'Saved {} symbols to {}.'.format(len(symbol_master), path)
+        )
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.1 on 2026-10-19 01:46
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('watch_list', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('symbol', models.CharField(max_length=32)),
+                ('direction', models.CharField(choices=[('above', 'Above'), ('below', 'Below')], max_length=8)),
+                ('threshold', models.FloatField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('triggered_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_alerts', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AlertNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('symbol', models.CharField(max_length=32)),
+                ('direction', models.CharField(choices=[('above', 'Above'), ('below', 'Below')], max_length=8)),
+                ('threshold', models.FloatField()),
+                ('price', models.FloatField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('delivered_at', models.DateTimeField(blank=True, null=True)),
+                ('alert', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='watch_list.pricealert')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alert_notifications', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='pricealert',
+            index=models.Index(fields=['triggered_at', 'id'], name='price_alert_untriggered'),
+        ),
+        migrations.AddIndex(
+            model_name='alertnotification',
+            index=models.Index(fields=['user', 'delivered_at'], name='alert_notification_user'),
+        ),
+    ]
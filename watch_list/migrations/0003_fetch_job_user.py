@@ -0,0 +1,21 @@
+# Generated by Django 4.2.1 on 2026-10-19 02:42
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('watch_list', '0002_price_alerts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fetchjob',
+            name='user',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='fetch_jobs', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.1 on 2026-10-19 02:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watch_list', '0003_fetch_job_user'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pricealert',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,260 @@
+"""
+Module for defining watch_list app's models.
+
+Models:
+    - FetchJob model: Model which stores a background fetch of symbols data,
+        its status and its result, so that clients can poll for the result
+        instead of holding a request open.
+
+        Attributes:
+            job_id: Public id of the job.
+            user: User who owns the job, only owner can poll it.
+            key: Hash of job's symbols and interval, used to find identical
+                pending jobs of a user.
+            symbols: Symbols to fetch.
+            interval: Time interval of the data.
+            status: Status of the job, pending, running, done or failed.
+            result: Symbols data, when job is done.
+            error: Reason of failure, when job is failed.
+            created_at: Time at which job is created.
+            updated_at: Time at which job is last updated, a running job
+                updates it while it waits.
+            expires_at: Time after which job's result is not served.
+
+    - PriceAlert model: Model which stores a user defined price threshold of
+        a symbol, which is triggered once when an ingested price crosses it.
+
+        Attributes:
+            user: User who owns the alert.
+            symbol: Symbol of the alert.
+            direction: Whether alert is triggered at or above, or at or
+                below the threshold.
+            threshold: Price threshold of the alert.
+            created_at: Time at which alert is created.
+            triggered_at: Time at which alert is triggered, if it is.
+
+    - AlertNotification model: Model which stores the delivery record of a
+        triggered price alert, until its user reads it.
+
+        Attributes:
+            alert: Triggered price alert.
+            user: User who owns the alert.
+            symbol: Symbol of the alert.
+            direction: Direction of the alert.
+            threshold: Price threshold of the alert.
+            price: Price which crossed the threshold.
+            created_at: Time at which alert is triggered.
+            delivered_at: Time at which notification is read by its user.
+"""
+
+from django.contrib.auth.models import User
+from django.db import models
+
+import hashlib
+import uuid
+
+
+class FetchJob(models.Model):
+    """
+    FetchJob Model stores a background fetch of symbols data. Jobs are
+    persisted, so that any worker process can serve the status and result of
+    a job to its owner, and identical pending jobs are found by their `key`.
+
+    Attributes:
+        job_id: Public id of the job.
+        user: User who owns the job, only owner can poll it.
+        key: Hash of job's symbols and interval, used to find identical
+            pending jobs of a user.
+        symbols: Symbols to fetch.
+        interval: Time interval of the data.
+        status: Status of the job, pending, running, done or failed.
+        result: Symbols data, when job is done.
+        error: Reason of failure, when job is failed.
+        created_at: Time at which job is created.
+        updated_at: Time at which job is last updated, a running job
+            updates it while it waits.
+        expires_at: Time after which job's result is not served.
+    """
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    job_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='fetch_jobs', null=True
+    )
+    key = models.CharField(max_length=64)
+    symbols = models.JSONField(default=list)
+    interval = models.CharField(max_length=16)
+    status = models.CharField(
+        max_length=16, choices=STATUS_CHOICES, default=PENDING
+    )
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+
+    class Meta:
+        """
+        Class represents the meta information about FetchJob model.
+
+        Attributes:
+            indexes: Index used to find identical jobs by their status.
+        """
+        indexes = [
+            models.Index(fields=['key', 'status'], name='fetch_job_key_status'),
+        ]
+
+
+    @staticmethod
+    def get_key(symbols, interval):
+        """Method to get the key of a job, which is same for jobs of same
+        symbols (in any order) and interval.
+
+        Args:
+            symbols (List[str]): Symbols to fetch.
+            interval (str): Time interval of the data.
+
+        Returns:
+            str: Key of the job.
+        """
+
+        key = '{}:{}'.format(interval, ','.join(sorted(set(symbols))))
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+    def __str__(self):
+        """Method representing the model's string representation.
+
+        Returns:
+            str. String representation of model.
+        """
+
+        return '{} ({})'.format(self.job_id, self.status)
+
+
+class PriceAlert(models.Model):
+    """
+    PriceAlert Model stores a price threshold of a symbol. Untriggered
+    alerts are kept in the in-memory index of `price_alerts`, which
+    evaluates them whenever new candles of their symbol are ingested.
+
+    Attributes:
+        user: User who owns the alert.
+        symbol: Symbol of the alert.
+        direction: Whether alert is triggered at or above, or at or below
+            the threshold.
+        threshold: Price threshold of the alert.
+        created_at: Time at which alert is created.
+        triggered_at: Time at which alert is triggered, if it is.
+    """
+
+    ABOVE = 'above'
+    BELOW = 'below'
+    DIRECTION_CHOICES = [
+        (ABOVE, 'Above'),
+        (BELOW, 'Below'),
+    ]
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='price_alerts'
+    )
+    symbol = models.CharField(max_length=32)
+    direction = models.CharField(max_length=8, choices=DIRECTION_CHOICES)
+    threshold = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    triggered_at = models.DateTimeField(null=True, blank=True)
+
+
+    class Meta:
+        """
+        Class represents the meta information about PriceAlert model.
+
+        Attributes:
+            indexes: Index used to load untriggered alerts.
+        """
+        indexes = [
+            models.Index(
+                fields=['triggered_at', 'id'], name='price_alert_untriggered'
+            ),
+        ]
+
+
+    def __str__(self):
+        """Method representing the model's string representation.
+
+        Returns:
+            str. String representation of model.
+        """
+
+        return '{} {} {}'.format(self.symbol, self.direction, self.threshold)
+
+
+class AlertNotification(models.Model):
+    """
+    AlertNotification Model stores the delivery record of a triggered price
+    alert. Records of alerts triggered by an ingest are created in batches,
+    and are marked as delivered once their user reads them.
+
+    Attributes:
+        alert: Triggered price alert.
+        user: User who owns the alert.
+        symbol: Symbol of the alert.
+        direction: Direction of the alert.
+        threshold: Price threshold of the alert.
+        price: Price which crossed the threshold.
+        created_at: Time at which alert is triggered.
+        delivered_at: Time at which notification is read by its user.
+    """
+
+    alert = models.ForeignKey(
+        PriceAlert, on_delete=models.CASCADE, related_name='notifications'
+    )
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='alert_notifications'
+    )
+    symbol = models.CharField(max_length=32)
+    direction = models.CharField(
+        max_length=8, choices=PriceAlert.DIRECTION_CHOICES
+    )
+    threshold = models.FloatField()
+    price = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+
+    class Meta:
+        """
+        Class represents the meta information about AlertNotification model.
+
+        Attributes:
+            indexes: Index used to find undelivered notifications of a user.
+        """
+        indexes = [
+            models.Index(
+                fields=['user', 'delivered_at'],
+                name='alert_notification_user'
+            ),
+        ]
+
+
+    def __str__(self):
+        """Method representing the model's string representation.
+
+        Returns:
+            str. String representation of model.
+        """
+
+        return '{} {} {} at {}'.format(
+            self.symbol, self.direction, self.threshold, self.price
+        )
@@ -0,0 +1,544 @@
+"""
+Module that defines the evaluation of price alerts on ingested candles.
+
+Untriggered alerts are kept in an in-memory `PriceAlertIndex`, where the
+thresholds of each symbol and direction are kept sorted. Whenever new
+candles of a symbol are ingested by the symbols data pipeline, the alerts
+crossed by their highest and lowest prices are found with a binary search,
+so evaluating a symbol costs O(log n + k) for k crossed alerts out of n,
+instead of scanning every alert. Crossed alerts are marked as triggered and
+their notifications are created in a single transaction per ingest.
+
+Alerts created by any process bump a version in the shared series cache,
+after which every process loads the alerts created since its last load.
+Alerts created up to `SYNC_OVERLAP` seconds before the last load are loaded
+again (skipping the ones already loaded), as an alert committed late (by a
+long transaction) may have been created before the last load. Alerts
+deleted by other processes stay in the index until they are crossed, and
+are dropped then, as only untriggered alerts of the database are triggered.
+
+Settings:
+    PRICE_ALERTS (Dict[str, Any]): Configuration of price alerts. Like
+        below:
+        - ENABLED (bool): Whether alerts are evaluated on ingest (default:
+            True).
+        - MAX_PER_USER (int): Max number of untriggered alerts of a user
+            (default: 100).
+        - SYNC_INTERVAL (float): Max seconds between loads of alerts of
+            other processes, even when the shared version is not changed,
+            like after the cache is cleared (default: 60).
+        - SYNC_OVERLAP (float): Seconds before the last load from which
+            alerts are loaded again (default: 300).
+"""
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import DatabaseError, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import AlertNotification, PriceAlert
+from .wrapper.symbols_data_fetcher import (
+    get_series_cache, symbols_data_ingested
+)
+
+from bisect import bisect_left
+from datetime import timedelta
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRICE_ALERTS_SETTINGS = {
+    'ENABLED': True,
+    'MAX_PER_USER': 100,
+    'SYNC_INTERVAL': 60,
+    'SYNC_OVERLAP': 300,
+}
+
+# Shared cache key of the version of alerts, bumped when alerts are
+# created.
+ALERTS_VERSION_KEY = 'price-alerts:version'
+
+# Max number of alerts triggered per query, to stay below the max number
+# of query parameters of SQLite.
+TRIGGER_BATCH_SIZE = 500
+
+
+def get_price_alerts_settings():
+    """Returns the price alerts settings merged over defaults.
+
+    Returns:
+        Dict[str, Any]: Price alerts settings.
+    """
+
+    return {
+        **DEFAULT_PRICE_ALERTS_SETTINGS,
+        **getattr(settings, 'PRICE_ALERTS', {})
+    }
+
+
+class PriceAlertIndex:
+    """
+    Class defining an in-memory index of price alerts by symbol. For each
+    symbol, thresholds of each direction are kept in a sorted list along
+    with a parallel list of alert ids. Keys are ordered so that crossed
+    alerts are always at the end of their lists: `above` alerts are keyed
+    by their negated threshold and `below` alerts by their threshold, so a
+    price crosses the alerts from a bisected position to the end, which are
+    removed without moving any other entry.
+
+    Methods:
+        add: Adds an alert.
+        add_many: Adds many alerts, sorting each touched list once.
+        remove: Removes an alert.
+        pop_crossed: Removes and returns the alerts crossed by a price range.
+    """
+
+    def __init__(self):
+        # Symbol to {direction: (keys, alert ids)}.
+        self._symbols = {}
+        self._size = 0
+
+
+    def __len__(self):
+        return self._size
+
+
+    @staticmethod
+    def get_key(direction, threshold):
+        """Returns the sort key of a threshold.
+
+        Args:
+            direction (str): `PriceAlert.ABOVE` or `PriceAlert.BELOW`.
+            threshold (float): Price threshold.
+
+        Returns:
+            float: Sort key, crossed alerts have the largest keys.
+        """
+
+        return -threshold if direction == PriceAlert.ABOVE else threshold
+
+
+    def _get_lists(self, symbol, direction):
+        directions = self._symbols.setdefault(symbol, {})
+        if direction not in directions:
+            directions[direction] = ([], [])
+        return directions[direction]
+
+
+    def add(self, alert_id, symbol, direction, threshold):
+        """Adds an alert.
+
+        Args:
+            alert_id (int): Id of the alert.
+            symbol (str): Symbol of the alert.
+            direction (str): `PriceAlert.ABOVE` or `PriceAlert.BELOW`.
+            threshold (float): Price threshold of the alert.
+        """
+
+        keys, alert_ids = self._get_lists(symbol, direction)
+        key = self.get_key(direction, threshold)
+        position = bisect_left(keys, key)
+        keys.insert(position, key)
+        alert_ids.insert(position, alert_id)
+        self._size += 1
+
+
+    def add_many(self, alerts):
+        """Adds many alerts, like when alerts are loaded. Each touched list
+        is sorted once, instead of inserting alerts one by one.
+
+        Args:
+            alerts (Iterable[Tuple[int, str, str, float]]): Id, symbol,
+                direction and threshold of each alert.
+        """
+
+        touched = set()
+        for alert_id, symbol, direction, threshold in alerts:
+            keys, alert_ids = self._get_lists(symbol, direction)
+            keys.append(self.get_key(direction, threshold))
+            alert_ids.append(alert_id)
+            touched.add((symbol, direction))
+            self._size += 1
+
+        for symbol, direction in touched:
+            keys, alert_ids = self._symbols[symbol][direction]
+            entries = sorted(zip(keys, alert_ids))
+            keys[:] = [key for key, alert_id in entries]
+            alert_ids[:] = [alert_id for key, alert_id in entries]
+
+
+    def remove(self, alert_id, symbol, direction, threshold):
+        """Removes an alert, when it is in the index.
+
+        Args:
+            alert_id (int): Id of the alert.
+            symbol (str): Symbol of the alert.
+            direction (str): `PriceAlert.ABOVE` or `PriceAlert.BELOW`.
+            threshold (float): Price threshold of the alert.
+
+        Returns:
+            bool: Whether alert was in the index.
+        """
+
+        lists = self._symbols.get(symbol, {}).get(direction)
+        if lists is None:
+            return False
+        keys, alert_ids = lists
+        key = self.get_key(direction, threshold)
+        position = bisect_left(keys, key)
+        while position < len(keys) and keys[position] == key:
+            if alert_ids[position] == alert_id:
+                del keys[position]
+                del alert_ids[position]
+                self._size -= 1
+                return True
+            position += 1
+        return False
+
+
+    def pop_crossed(self, symbol, low, high):
+        """Removes and returns the alerts of a symbol crossed by a price
+        range, i.e. `above` alerts with threshold at or below the high and
+        `below` alerts with threshold at or above the low.
+
+        Args:
+            symbol (str): Symbol of the prices.
+            low (float): Lowest price.
+            high (float): Highest price.
+
+        Returns:
+            List[Tuple[int, str, float]]: Id, direction and threshold of
+            each crossed alert.
+        """
+
+        crossed = []
+        directions = self._symbols.get(symbol)
+        if not directions:
+            return crossed
+
+        for direction, price in (
+            (PriceAlert.ABOVE, high), (PriceAlert.BELOW, low)
+        ):
+            lists = directions.get(direction)
+            if lists is None:
+                continue
+            keys, alert_ids = lists
+            position = bisect_left(keys, self.get_key(direction, price))
+            for key, alert_id in zip(keys[position:], alert_ids[position:]):
+                crossed.append(
+                    (alert_id, direction, self.get_key(direction, key))
+                )
+            del keys[position:]
+            del alert_ids[position:]
+        self._size -= len(crossed)
+        return crossed
+
+
+class PriceAlertEngine:
+    """
+    Class defining the evaluation of price alerts of a process. Alerts are
+    loaded into its index incrementally (by creation time, with an overlap
+    of `sync_overlap` seconds), whenever the shared version of alerts is
+    changed or `sync_interval` seconds are passed.
+
+    Attributes:
+        index: Index of untriggered alerts.
+        sync_interval: Max seconds between loads of new alerts.
+        sync_overlap: Seconds before the last load from which alerts are
+            loaded again.
+
+    Methods:
+        sync: Loads the alerts which are not loaded yet.
+        discard: Removes an alert from the index.
+        evaluate: Triggers the alerts crossed by new candles of symbols.
+    """
+
+    def __init__(self, sync_interval=60, sync_overlap=300):
+        self.index = PriceAlertIndex()
+        self.sync_interval = sync_interval
+        self.sync_overlap = sync_overlap
+        self._lock = threading.Lock()
+        # Time of the last load, and creation time of each alert loaded
+        # which can be loaded again.
+        self._loaded_at = None
+        self._overlap_ids = {}
+        self._synced_version = None
+        self._synced_at = time.monotonic()
+        # (symbol, interval) to timestamp of the newest evaluated candle.
+        self._evaluated_until = {}
+
+
+    def sync(self, force=False):
+        """Loads the untriggered alerts created since the last load (with
+        an overlap) which are not loaded yet, when the shared version of
+        alerts is changed or `sync_interval` seconds are passed since last
+        load.
+
+        Args:
+            force optional(bool): Whether to load regardless of the version
+                (default: False).
+        """
+
+        version = get_series_cache().get(ALERTS_VERSION_KEY)
+        with self._lock:
+            if (
+                not force and version == self._synced_version and
+                time.monotonic() - self._synced_at < self.sync_interval
+            ):
+                return
+            loaded_at = timezone.now()
+            alerts = PriceAlert.objects.filter(triggered_at__isnull=True)
+            if self._loaded_at is not None:
+                alerts = alerts.filter(created_at__gte=self._loaded_at - (
+                    timedelta(seconds=self.sync_overlap)
+                ))
+            loaded = [
+                alert for alert in alerts.values_list(
+                    'id', 'symbol', 'direction', 'threshold', 'created_at'
+                ).iterator(chunk_size=10000)
+                if alert[0] not in self._overlap_ids
+            ]
+            self.index.add_many(alert[:4] for alert in loaded)
+
+            # Only alerts which the next load can return again are kept.
+            overlap_start = loaded_at - timedelta(seconds=self.sync_overlap)
+            self._overlap_ids = {
+                alert_id: created_at
+                for alert_id, created_at in self._overlap_ids.items()
+                if created_at >= overlap_start
+            }
+            self._overlap_ids.update(
+                (alert[0], alert[4]) for alert in loaded
+                if alert[4] >= overlap_start
+            )
+            self._loaded_at = loaded_at
+            self._synced_version = version
+            self._synced_at = time.monotonic()
+
+
+    def discard(self, alert):
+        """Removes an alert from the index, like when it is deleted.
+
+        Args:
+            alert (PriceAlert): The alert.
+        """
+
+        with self._lock:
+            self.index.remove(
+                alert.pk, alert.symbol, alert.direction, alert.threshold
+            )
+
+
+    def evaluate(self, symbols_data, interval):
+        """Triggers the alerts crossed by candles of symbols which are newer
+        than the already evaluated ones, along with the newest evaluated
+        candle, which may have been revised since (like a candle of the
+        current period). Only the newest candle is evaluated for a symbol
+        seen for the first time.
+
+        Args:
+            symbols_data (Dict[str, CandleSeries]): Ingested candles of each
+                symbol.
+            interval (str): Time interval of the candles.
+
+        Returns:
+            List[AlertNotification]: Notifications of triggered alerts.
+        """
+
+        self.sync()
+        crossed = []
+        with self._lock:
+            for symbol, series in symbols_data.items():
+                if not len(series):
+                    continue
+                evaluated_until = self._evaluated_until.get((symbol, interval))
+                if evaluated_until is None:
+                    series = series[-1:]
+                else:
+                    series = series[int(series.timestamps.searchsorted(
+                        evaluated_until, side='left'
+                    )):]
+                    if not len(series):
+                        continue
+                self._evaluated_until[(symbol, interval)] = int(
+                    series.timestamps[-1]
+                )
+                low = float(series.lows.min())
+                high = float(series.highs.max())
+                crossed.extend(
+                    (symbol, alert_id, direction, threshold, low, high)
+                    for alert_id, direction, threshold in
+                    self.index.pop_crossed(symbol, low, high)
+                )
+
+        if not crossed:
+            return []
+        try:
+            return trigger_alerts(crossed)
+        except DatabaseError:
+            # Alerts are kept for the next ingest.
+            with self._lock:
+                self.index.add_many(
+                    (alert_id, symbol, direction, threshold)
+                    for symbol, alert_id, direction, threshold, low, high
+                    in crossed
+                )
+            raise
+
+
+def trigger_alerts(crossed):
+    """Marks crossed alerts as triggered and creates their notifications,
+    in batches. Alerts which are deleted or already triggered (like by
+    another process) are skipped.
+
+    Args:
+        crossed (List[Tuple[str, int, str, float, float, float]]): Symbol,
+            id, direction and threshold of each crossed alert, along with
+            the lowest and highest price of the candles.
+
+    Returns:
+        List[AlertNotification]: Created notifications.
+    """
+
+    prices = {
+        alert_id: high if direction == PriceAlert.ABOVE else low
+        for symbol, alert_id, direction, threshold, low, high in crossed
+    }
+    alert_ids = list(prices)
+    now = timezone.now()
+    notifications = []
+    with transaction.atomic():
+        for start in range(0, len(alert_ids), TRIGGER_BATCH_SIZE):
+            alerts = list(PriceAlert.objects.select_for_update().filter(
+                id__in=alert_ids[start:start + TRIGGER_BATCH_SIZE],
+                triggered_at__isnull=True
+            ))
+            if not alerts:
+                continue
+            PriceAlert.objects.filter(
+                id__in=[alert.pk for alert in alerts]
+            ).update(triggered_at=now)
+            notifications.extend(AlertNotification.objects.bulk_create([
+                AlertNotification(
+                    alert=alert, user_id=alert.user_id, symbol=alert.symbol,
+                    direction=alert.direction, threshold=alert.threshold,
+                    price=prices[alert.pk]
+                )
+                for alert in alerts
+            ]))
+    return notifications
+
+
+def bump_alerts_version():
+    """Bumps the shared version of alerts, so that every process loads the
+    new alerts.
+    """
+
+    cache = get_series_cache()
+    try:
+        cache.incr(ALERTS_VERSION_KEY)
+    except ValueError:
+        cache.set(ALERTS_VERSION_KEY, 1, None)
+
+
+_price_alert_engine = None
+_price_alert_engine_lock = threading.Lock()
+
+
+def get_price_alert_engine():
+    """Returns the process wide price alert engine.
+
+    Returns:
+        Optional[PriceAlertEngine]: Price alert engine, or None if price
+        alerts are disabled.
+    """
+
+    global _price_alert_engine
+    alerts_settings = get_price_alerts_settings()
+    if not alerts_settings['ENABLED']:
+        return None
+    with _price_alert_engine_lock:
+        if _price_alert_engine is None:
+            _price_alert_engine = PriceAlertEngine(
+                alerts_settings['SYNC_INTERVAL'],
+                alerts_settings['SYNC_OVERLAP']
+            )
+        return _price_alert_engine
+
+
+def reset_price_alert_engine():
+    """Drops the process wide price alert engine, so that it is created
+    again (and loads every alert) on next use.
+    """
+
+    global _price_alert_engine
+    with _price_alert_engine_lock:
+        _price_alert_engine = None
+
+
+@receiver(symbols_data_ingested)
+def evaluate_ingested_symbols(sender, symbols_data, interval, **kwargs):
+    """Function to evaluate price alerts on ingested candles. Failures are
+    logged, as alerts are not needed to serve the data.
+
+    Args:
+        sender (Type): A sender of symbols data ingested signal.
+        symbols_data (Dict[str, CandleSeries]): Ingested candles of each
+            symbol.
+        interval (str): Time interval of the candles.
+    """
+
+    engine = get_price_alert_engine()
+    if engine is None or not symbols_data:
+        return
+    try:
+        engine.evaluate(symbols_data, interval)
+    except DatabaseError:
+        logger.exception('Unable to evaluate price alerts')
+
+
+@receiver(post_save, sender=PriceAlert)
+def price_alert_saved(sender, instance, created, **kwargs):
+    """Function to make new alerts known to every process.
+
+    Args:
+        sender (Type): PriceAlert model.
+        instance (PriceAlert): Saved alert.
+        created (bool): Whether alert is created.
+    """
+
+    if created:
+        transaction.on_commit(bump_alerts_version)
+
+
+@receiver(post_delete, sender=PriceAlert)
+def price_alert_deleted(sender, instance, **kwargs):
+    """Function to remove deleted alerts from the index of this process.
+
+    Args:
+        sender (Type): PriceAlert model.
+        instance (PriceAlert): Deleted alert.
+    """
+
+    engine = _price_alert_engine
+    if engine is not None:
+        engine.discard(instance)
+
+
+@receiver(setting_changed)
+def reset_price_alert_engine_on_setting_change(sender, setting, **kwargs):
+    """Function to recreate price alert engine when its settings are
+    changed, like in tests.
+
+    Args:
+        sender (Type): A sender of setting changed signal.
+        setting (str): Name of the changed setting.
+    """
+
+    if setting == 'PRICE_ALERTS':
+        reset_price_alert_engine()
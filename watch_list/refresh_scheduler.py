@@ -0,0 +1,761 @@
+"""
+Module that defines the background refresh of candles of watched and
+requested symbols, scheduled by market hours and by demand.
+
+Symbols are kept in a heap ordered by the time their next refresh is due,
+so finding the due symbols costs O(log n) each. The refresh interval of a
+symbol shrinks as its demand grows, where demand is its number of watchers
+(synced from `WatchListSymbol`) plus its recent requests, which decay by
+half every `RATE_HALF_LIFE` seconds:
+
+    interval = MIN_INTERVAL * HOT_SCORE / demand
+
+bounded to [`MIN_INTERVAL`, `MAX_INTERVAL`]. A symbol counts as refreshed
+once its candles are fetched (and cached), whoever fetched them, and a
+requested symbol which was never refreshed is fetched (or queued) by the
+request itself, so it is not due right away. Symbols whose exchange is closed
+are refreshed once `CLOSE_DELAY` seconds after the close (for the last
+candles of the session) and then not before the next session opens, as
+known by the market calendar. Symbols without watchers are dropped once
+their requests decayed.
+
+Due symbols are queued in `fetch_pipeline` as an owner of their own, so
+refreshes take their turn along with the symbols of users.
+
+Scheduler runs in a single worker process of the host, the leader, which
+holds the lock file of `STATE_DIR`. Other processes hand their requested
+and refreshed symbols over to the leader through a state file, which the
+leader takes over every `HAND_OVER_INTERVAL` seconds, so refreshes don't
+scale with the number of worker processes. When a leader exits, the next
+process recording symbols takes the lead.
+
+Settings:
+    REFRESH_SCHEDULER (Dict[str, Any]): Configuration of the scheduler.
+        Like below:
+        - ENABLED (bool): Whether symbols are refreshed (default: True).
+        - INTERVAL (str): Time interval of refreshed candles (default:
+            '5min').
+        - MIN_INTERVAL (float): Seconds between refreshes of the most
+            demanded symbols (default: 300).
+        - MAX_INTERVAL (float): Max seconds between refreshes (default:
+            3600).
+        - HOT_SCORE (float): Demand from which a symbol is refreshed every
+            `MIN_INTERVAL` seconds (default: 10).
+        - REQUEST_WEIGHT (float): Demand of a recent request, a watcher is
+            a demand of 1 (default: 1).
+        - RATE_HALF_LIFE (float): Seconds in which demand of requests
+            decays by half (default: 3600).
+        - CLOSE_DELAY (float): Seconds after close of a session at which
+            its last candles are refreshed (default: 60).
+        - SYNC_INTERVAL (float): Seconds between syncs of watcher counts
+            (default: 300).
+        - MAX_SYMBOLS (int): Max number of watched symbols refreshed, most
+            watched first (default: 5000).
+        - STATE_DIR (Optional[str]): Directory of lock file of leader and
+            of symbols handed over to it. When not set, every process runs
+            its own scheduler (default: None).
+        - HAND_OVER_INTERVAL (float): Seconds between take overs of symbols
+            handed over to leader (default: 10).
+"""
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections
+from django.dispatch import receiver
+
+from users.models import WatchListSymbol
+from .wrapper import symbols_data_fetcher
+from .wrapper.market_calendar import get_market_calendar
+from .wrapper.quota import SharedWindowState
+
+from collections import Counter
+import heapq
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    # No file locks, like on Windows, every process leads.
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REFRESH_SCHEDULER_SETTINGS = {
+    'ENABLED': True,
+    'INTERVAL': '5min',
+    'MIN_INTERVAL': 300,
+    'MAX_INTERVAL': 3600,
+    'HOT_SCORE': 10,
+    'REQUEST_WEIGHT': 1.0,
+    'RATE_HALF_LIFE': 3600,
+    'CLOSE_DELAY': 60,
+    'SYNC_INTERVAL': 300,
+    'MAX_SYMBOLS': 5000,
+    'STATE_DIR': None,
+    'HAND_OVER_INTERVAL': 10,
+}
+
+# Demand below which a symbol is not refreshed anymore.
+MIN_DEMAND = 0.1
+
+# Owner of refreshes in `fetch_pipeline`.
+REFRESH_OWNER = 'refresh-scheduler'
+
+
+def get_refresh_scheduler_settings():
+    """Returns the refresh scheduler settings merged over defaults.
+
+    Returns:
+        Dict[str, Any]: Refresh scheduler settings.
+    """
+
+    return {
+        **DEFAULT_REFRESH_SCHEDULER_SETTINGS,
+        **getattr(settings, 'REFRESH_SCHEDULER', {})
+    }
+
+
+class SchedulerLeadership:
+    """
+    Class defining the leadership of refresh scheduler among the worker
+    processes of the host. The process holding the lock file leads, and
+    other processes hand requested and refreshed symbols over to it through
+    a state file.
+
+    Attributes:
+        state_dir: Directory of lock file and of state file.
+
+    Methods:
+        is_leader: Returns whether this process leads.
+        hand_over: Hands requested and refreshed symbols over to leader.
+        take_over: Returns the symbols handed over to leader.
+    """
+
+    def __init__(self, state_dir):
+        self.state_dir = state_dir
+        self._state = SharedWindowState(
+            os.path.join(state_dir, 'handed-over.json')
+        )
+        self._lock_file = None
+        self._lock = threading.Lock()
+
+
+    def is_leader(self):
+        """Returns whether this process leads, lead is taken when no
+        process holds it. Lead is held until the process exits.
+
+        Returns:
+            bool: Whether this process leads.
+        """
+
+        with self._lock:
+            if self._lock_file is None:
+                os.makedirs(self.state_dir, exist_ok=True)
+                lock_file = open(
+                    os.path.join(self.state_dir, 'leader.lock'), 'a'
+                )
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    lock_file.close()
+                    return False
+                self._lock_file = lock_file
+            return True
+
+
+    def hand_over(self, requests, refreshes):
+        """Hands requested and refreshed symbols over to leader.
+
+        Args:
+            requests (Dict[str, int]): Requests count of each symbol.
+            refreshes (Dict[str, float]): Refresh time of each symbol.
+        """
+
+        with self._state.locked() as state:
+            handed_requests = state.setdefault('requests', {})
+            for symbol, count in requests.items():
+                handed_requests[symbol] = handed_requests.get(symbol, 0) + (
+                    count
+                )
+            handed_refreshes = state.setdefault('refreshes', {})
+            for symbol, refreshed in refreshes.items():
+                handed_refreshes[symbol] = max(
+                    refreshed, handed_refreshes.get(symbol, refreshed)
+                )
+
+
+    def take_over(self):
+        """Returns the symbols handed over to leader, which are forgotten.
+
+        Returns:
+            Tuple[Dict[str, int], Dict[str, float]]: Requests count and
+            refresh time of each handed over symbol.
+        """
+
+        with self._state.locked() as state:
+            requests = state.pop('requests', {})
+            refreshes = state.pop('refreshes', {})
+        return requests, refreshes
+
+
+class RefreshScheduler:
+    """
+    Class defining a scheduler of symbol refreshes, with a heap of symbols
+    keyed by the time their next refresh is due. A worker thread refreshes
+    due symbols and syncs watcher counts, it is started on demand and stops
+    when no symbol is scheduled (or keeps taking over symbols of other
+    processes when it leads).
+
+    Attributes:
+        calendar: `MarketCalendar` of exchanges of symbols.
+        refresh: Callable which refreshes symbols, called as
+            `refresh(symbols)`.
+        watcher_counts: Callable returning watchers count of each watched
+            symbol, or None.
+        min_interval: Seconds between refreshes of most demanded symbols.
+        max_interval: Max seconds between refreshes.
+        hot_score: Demand from which a symbol is refreshed every
+            `min_interval` seconds.
+        request_weight: Demand of a recent request.
+        rate_half_life: Seconds in which demand of requests decays by half.
+        close_delay: Seconds after close at which last candles are
+            refreshed.
+        sync_interval: Seconds between syncs of watcher counts.
+        leadership: `SchedulerLeadership` among worker processes, or None
+            if the scheduler runs in every process.
+        hand_over_interval: Seconds between take overs of symbols handed
+            over to leader.
+
+    Methods:
+        from_settings: Builds the scheduler of `REFRESH_SCHEDULER` setting.
+        record_requests: Counts requests of symbols.
+        record_refreshes: Marks symbols as refreshed.
+        set_watchers: Sets watchers count of symbols.
+        get_demand: Returns the demand of a symbol.
+        get_refresh_interval: Returns seconds between refreshes of a demand.
+        next_due: Returns the time at which next refresh is due.
+        pop_due: Returns due symbols and schedules their next refresh.
+        run_once: Refreshes due symbols.
+        scheduled_count: Returns the number of scheduled symbols.
+    """
+
+    def __init__(self, calendar, refresh, watcher_counts=None,
+                 min_interval=300, max_interval=3600, hot_score=10,
+                 request_weight=1.0, rate_half_life=3600, close_delay=60,
+                 sync_interval=300, leadership=None, hand_over_interval=10,
+                 clock=time.time, autostart=True):
+        self.calendar = calendar
+        self.refresh = refresh
+        self.watcher_counts = watcher_counts
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.hot_score = hot_score
+        self.request_weight = request_weight
+        self.rate_half_life = rate_half_life
+        self.close_delay = close_delay
+        self.sync_interval = sync_interval
+        self.leadership = leadership
+        self.hand_over_interval = hand_over_interval
+        self.autostart = autostart
+        self._clock = clock
+        self._watchers = {}
+        # (decayed count, time of count) of recent requests of symbols.
+        self._requests = {}
+        self._refreshed = {}
+        # (due time, symbol) entries, entries not matching `_due` are stale.
+        self._heap = []
+        self._due = {}
+        self._next_sync = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker = None
+
+
+    @classmethod
+    def from_settings(cls, refresh, watcher_counts=None):
+        """Builds the scheduler of `REFRESH_SCHEDULER` setting.
+
+        Args:
+            refresh (Callable[[List[str]], None]): Refreshes symbols.
+            watcher_counts optional(Callable[[], Dict[str, int]]): Returns
+                watchers count of each watched symbol.
+
+        Returns:
+            RefreshScheduler: Scheduler.
+        """
+
+        scheduler_settings = get_refresh_scheduler_settings()
+        state_dir = scheduler_settings['STATE_DIR']
+        return cls(
+            get_market_calendar(), refresh, watcher_counts,
+            min_interval=scheduler_settings['MIN_INTERVAL'],
+            max_interval=scheduler_settings['MAX_INTERVAL'],
+            hot_score=scheduler_settings['HOT_SCORE'],
+            request_weight=scheduler_settings['REQUEST_WEIGHT'],
+            rate_half_life=scheduler_settings['RATE_HALF_LIFE'],
+            close_delay=scheduler_settings['CLOSE_DELAY'],
+            sync_interval=scheduler_settings['SYNC_INTERVAL'],
+            leadership=SchedulerLeadership(state_dir)
+            if state_dir and fcntl is not None else None,
+            hand_over_interval=scheduler_settings['HAND_OVER_INTERVAL']
+        )
+
+
+    def record_requests(self, symbols):
+        """Counts a request of each symbol, and schedules their next refresh
+        by their new demand. Symbols are handed over to the leader when
+        this process doesn't lead.
+
+        Args:
+            symbols (Iterable[str]): Requested symbols.
+        """
+
+        self._record(Counter(symbols), {})
+
+
+    def record_refreshes(self, symbols):
+        """Marks symbols as refreshed, like when their candles are fetched,
+        and schedules their next refresh. Symbols are handed over to the
+        leader when this process doesn't lead.
+
+        Args:
+            symbols (Iterable[str]): Refreshed symbols.
+        """
+
+        now = self._clock()
+        self._record({}, {symbol: now for symbol in symbols})
+
+
+    def _record(self, requests, refreshes, handed_over=False):
+        """Records requests and refreshes of symbols, or hands them over to
+        the leader.
+
+        Args:
+            requests (Dict[str, int]): Requests count of each symbol.
+            refreshes (Dict[str, float]): Refresh time of each symbol.
+            handed_over optional(bool): Whether symbols were handed over by
+                other processes (default: False).
+        """
+
+        if not handed_over and self.leadership is not None and (
+            not self.leadership.is_leader()
+        ):
+            self.leadership.hand_over(requests, refreshes)
+            return
+
+        now = self._clock()
+        with self._lock:
+            head = self._heap[0][0] if self._heap else None
+            for symbol, requests_count in requests.items():
+                count, counted_at = self._requests.get(symbol, (0.0, now))
+                self._requests[symbol] = (
+                    self._decay(count, now - counted_at) + requests_count, now
+                )
+                # The request fetches (or queues) a symbol which was never
+                # refreshed, its first refresh is due after an interval.
+                self._refreshed.setdefault(symbol, now)
+            for symbol, refreshed in refreshes.items():
+                # Only scheduled symbols are followed.
+                if symbol in self._refreshed or symbol in self._due:
+                    self._refreshed[symbol] = max(
+                        refreshed, self._refreshed.get(symbol, refreshed)
+                    )
+            for symbol in set(requests) | set(refreshes):
+                if symbol in self._refreshed or symbol in self._due:
+                    self._schedule(symbol, now)
+            earlier = self._heap and (head is None or self._heap[0][0] < head)
+            if self.autostart and requests:
+                self._start_worker()
+        if earlier:
+            self._wakeup.set()
+
+
+    def set_watchers(self, watcher_counts):
+        """Sets watchers count of symbols, symbols which are not in counts
+        have no watchers. Symbols are scheduled again by their new demand.
+
+        Args:
+            watcher_counts (Dict[str, int]): Watchers count of each watched
+                symbol.
+        """
+
+        now = self._clock()
+        with self._lock:
+            symbols = set(self._watchers) | set(watcher_counts)
+            self._watchers = dict(watcher_counts)
+            for symbol in symbols:
+                self._schedule(symbol, now)
+            # Rescheduled symbols leave stale entries behind.
+            if len(self._heap) > 2 * len(self._due) + 64:
+                self._heap = [
+                    (due, symbol) for symbol, due in self._due.items()
+                ]
+                heapq.heapify(self._heap)
+            if self.autostart and self._due:
+                self._start_worker()
+        self._wakeup.set()
+
+
+    def _decay(self, count, seconds):
+        """Returns a count of requests decayed over time.
+
+        Args:
+            count (float): Count of requests.
+            seconds (float): Seconds since count.
+
+        Returns:
+            float: Decayed count.
+        """
+
+        return count * 0.5 ** (seconds / self.rate_half_life)
+
+
+    def get_demand(self, symbol, now):
+        """Returns the demand of a symbol, lock must be held by caller.
+
+        Args:
+            symbol (str): Symbol.
+            now (float): Current time.
+
+        Returns:
+            float: Watchers count plus weighted decayed count of requests.
+        """
+
+        count, counted_at = self._requests.get(symbol, (0.0, now))
+        return self._watchers.get(symbol, 0) + self.request_weight * (
+            self._decay(count, now - counted_at)
+        )
+
+
+    def get_refresh_interval(self, demand):
+        """Returns the seconds between refreshes of a symbol with a demand.
+
+        Args:
+            demand (float): Demand of symbol.
+
+        Returns:
+            Optional[float]: Seconds between refreshes, or None if symbol
+            is not refreshed.
+        """
+
+        if demand < MIN_DEMAND:
+            return None
+        return min(
+            self.max_interval,
+            max(self.min_interval, self.min_interval * self.hot_score / demand)
+        )
+
+
+    def _get_due(self, symbol, now):
+        """Returns the time at which next refresh of a symbol is due, lock
+        must be held by caller.
+
+        Args:
+            symbol (str): Symbol.
+            now (float): Current time.
+
+        Returns:
+            Optional[float]: Due time, or None if symbol is not refreshed.
+        """
+
+        interval = self.get_refresh_interval(self.get_demand(symbol, now))
+        if interval is None:
+            return None
+        refreshed = self._refreshed.get(symbol)
+        due = now if refreshed is None else max(now, refreshed + interval)
+
+        calendar = self.calendar.for_symbol(symbol)
+        if calendar.is_open(due):
+            return due
+        last_close = calendar.last_close(due)
+        if last_close is not None and (
+            refreshed is None or refreshed < last_close + self.close_delay
+        ):
+            # Last candles of the session are refreshed once after close.
+            return max(now, last_close + self.close_delay)
+        return calendar.next_open(due)
+
+
+    def _schedule(self, symbol, now):
+        """Schedules the next refresh of a symbol, or drops it if it is not
+        refreshed anymore. Lock must be held by caller.
+
+        Args:
+            symbol (str): Symbol.
+            now (float): Current time.
+        """
+
+        due = self._get_due(symbol, now)
+        if due is None:
+            self._due.pop(symbol, None)
+            if symbol not in self._watchers:
+                self._requests.pop(symbol, None)
+                self._refreshed.pop(symbol, None)
+            return
+        if self._due.get(symbol) != due:
+            self._due[symbol] = due
+            heapq.heappush(self._heap, (due, symbol))
+
+
+    def next_due(self):
+        """Returns the time at which next refresh is due.
+
+        Returns:
+            Optional[float]: Due time, or None if no symbol is scheduled.
+        """
+
+        with self._lock:
+            return self._peek_due()
+
+
+    def _peek_due(self):
+        """Returns the time of next due refresh, dropping stale entries of
+        heap. Lock must be held by caller.
+
+        Returns:
+            Optional[float]: Due time, or None if no symbol is scheduled.
+        """
+
+        while self._heap and (
+            self._due.get(self._heap[0][1]) != self._heap[0][0]
+        ):
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+
+    def pop_due(self):
+        """Returns the symbols whose refresh is due, and schedules their
+        next refresh. Symbols whose demand decayed are dropped instead.
+
+        Returns:
+            List[str]: Due symbols.
+        """
+
+        now = self._clock()
+        symbols = []
+        with self._lock:
+            while self._peek_due() is not None and self._heap[0][0] <= now:
+                due, symbol = heapq.heappop(self._heap)
+                del self._due[symbol]
+                if self.get_refresh_interval(
+                    self.get_demand(symbol, now)
+                ) is None:
+                    self._schedule(symbol, now)
+                    continue
+                symbols.append(symbol)
+            for symbol in symbols:
+                self._refreshed[symbol] = now
+                self._schedule(symbol, now)
+        return symbols
+
+
+    def run_once(self):
+        """Refreshes the due symbols.
+
+        Returns:
+            int: Number of refreshed symbols.
+        """
+
+        symbols = self.pop_due()
+        if symbols:
+            try:
+                self.refresh(symbols)
+            except Exception:
+                logger.exception('Unable to refresh symbols %s', symbols)
+        return len(symbols)
+
+
+    def scheduled_count(self):
+        """Returns the number of scheduled symbols.
+
+        Returns:
+            int: Number of scheduled symbols.
+        """
+
+        with self._lock:
+            return len(self._due)
+
+
+    def _sync_watchers(self):
+        """Syncs watcher counts when sync is due."""
+
+        if self.watcher_counts is None:
+            return
+        now = self._clock()
+        if self._next_sync is not None and now < self._next_sync:
+            return
+        self._next_sync = now + self.sync_interval
+        try:
+            watcher_counts = self.watcher_counts()
+        except Exception:
+            logger.exception('Unable to sync watcher counts')
+            return
+        self.set_watchers(watcher_counts)
+
+
+    def _start_worker(self):
+        """Starts the worker thread when it is not running, lock must be
+        held by caller.
+        """
+
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(
+                target=self._work, name='refresh-scheduler', daemon=True
+            )
+            self._worker.start()
+
+
+    def _take_over(self):
+        """Records the symbols handed over by other processes, when this
+        process leads.
+        """
+
+        try:
+            requests, refreshes = self.leadership.take_over()
+        except Exception:
+            logger.exception('Unable to take over handed over symbols')
+            return
+        if requests or refreshes:
+            self._record(requests, refreshes, handed_over=True)
+
+
+    def _work(self):
+        """Loop of worker thread, which refreshes due symbols, syncs
+        watcher counts and takes over symbols handed over by other
+        processes, and sleeps until next of them is due in between.
+        """
+
+        while True:
+            self._wakeup.clear()
+            if self.leadership is not None:
+                self._take_over()
+            self._sync_watchers()
+            self.run_once()
+            with self._lock:
+                next_due = self._peek_due()
+                if next_due is None and self.leadership is None:
+                    self._worker = None
+                    return
+            if self.leadership is not None:
+                next_due = min(
+                    next_due or float('inf'),
+                    self._clock() + self.hand_over_interval
+                )
+            if self._next_sync is not None:
+                next_due = min(next_due, self._next_sync)
+            self._wakeup.wait(max(1.0, next_due - self._clock()))
+
+
+def refresh_symbols(symbols):
+    """Refreshes symbols, by queueing the ones which are not cached in
+    `fetch_pipeline`.
+
+    Args:
+        symbols (List[str]): Symbols to refresh.
+    """
+
+    interval = get_refresh_scheduler_settings()['INTERVAL']
+    cached_symbols_data, missing_symbols = (
+        symbols_data_fetcher.get_cached_symbols_data(symbols, interval, last=1)
+    )
+    if missing_symbols:
+        symbols_data_fetcher.fetch_pipeline.schedule(
+            missing_symbols, interval, REFRESH_OWNER
+        )
+
+
+def load_watcher_counts():
+    """Returns the watchers count of most watched symbols, runs in worker
+    thread of scheduler, whose DB connection is released afterwards.
+
+    Returns:
+        Dict[str, int]: Watchers count of each symbol.
+    """
+
+    try:
+        return dict(WatchListSymbol.objects.popularity(
+            limit=get_refresh_scheduler_settings()['MAX_SYMBOLS']
+        ))
+    finally:
+        close_old_connections()
+
+
+_refresh_scheduler = None
+_refresh_scheduler_lock = threading.Lock()
+
+
+def get_refresh_scheduler():
+    """Returns the process wide refresh scheduler.
+
+    Returns:
+        Optional[RefreshScheduler]: Refresh scheduler, or None if refreshes
+        are disabled.
+    """
+
+    global _refresh_scheduler
+    if not get_refresh_scheduler_settings()['ENABLED']:
+        return None
+    with _refresh_scheduler_lock:
+        if _refresh_scheduler is None:
+            _refresh_scheduler = RefreshScheduler.from_settings(
+                refresh_symbols, load_watcher_counts
+            )
+        return _refresh_scheduler
+
+
+@receiver(symbols_data_fetcher.symbols_data_requested)
+def record_requested_symbols(sender, symbols, interval, **kwargs):
+    """Function to count requests of symbols, which also starts the
+    refreshes on first request.
+
+    Args:
+        sender (Type): A sender of symbols data requested signal.
+        symbols (List[str]): Requested symbols.
+        interval (str): Time interval of the data.
+    """
+
+    scheduler = get_refresh_scheduler()
+    if scheduler is None or (
+        interval != get_refresh_scheduler_settings()['INTERVAL']
+    ):
+        return
+    scheduler.record_requests(symbols)
+
+
+@receiver(symbols_data_fetcher.symbols_data_ingested)
+def record_refreshed_symbols(sender, symbols_data, interval, **kwargs):
+    """Function to mark fetched symbols as refreshed.
+
+    Args:
+        sender (Type): A sender of symbols data ingested signal.
+        symbols_data (Dict[str, CandleSeries]): Candles of each fetched
+            symbol.
+        interval (str): Time interval of the data.
+    """
+
+    scheduler = get_refresh_scheduler()
+    if scheduler is None or not symbols_data or (
+        interval != get_refresh_scheduler_settings()['INTERVAL']
+    ):
+        return
+    scheduler.record_refreshes(list(symbols_data))
+
+
+@receiver(setting_changed)
+def reset_refresh_scheduler_on_setting_change(sender, setting, **kwargs):
+    """Function to recreate refresh scheduler when its settings are
+    changed, like in tests.
+
+    Args:
+        sender (Type): A sender of setting changed signal.
+        setting (str): Name of the changed setting.
+    """
+
+    global _refresh_scheduler
+    if setting in ('REFRESH_SCHEDULER', 'MARKET_CALENDAR'):
+        with _refresh_scheduler_lock:
+            _refresh_scheduler = None
@@ -2,8 +2,15 @@
 Module for defining the watch_list app's serializers.
 """
 
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
 from rest_framework import serializers
 
+from .models import AlertNotification, PriceAlert
+from .price_alerts import get_price_alerts_settings
+from .symbol_master import get_symbol_master
+from .wrapper.symbols_data_fetcher import SYMBOLS_DATA_FIELDS
+
 
 class WatchListSymbolSerializer(serializers.Serializer):
     """
@@ -11,24 +18,36 @@ class WatchListSymbolSerializer(serializers.Serializer):
 
     This serializer is used to validate the symbols provided for a watch list.
     It ensures that the symbols meet the specified criteria. Like below:
-        1. Length of symbols must be less or equals to 5.
-            Note: This restriction is due to the free api usage
-                  of alpha avantage. Alpha avantage can only serve
-                  5 calls per minute and due to this we can only allow
-                  max 5 calls in a minute per user.
+        1. Length of symbols must be less or equals to
+            `WATCHLIST_MAX_SYMBOLS` setting.
+            Note: Alpha avantage can only serve 5 calls per minute, so
+                  symbols that can't be fetched within the quota are
+                  fetched in the background and returned as pending.
         2. All values of symbols list must be string.
+    Also, when symbol master is available, symbols which are not listed in
+    it are excluded before any data is fetched for them.
 
     Attributes:
         symbols: A list of watch list symbols.
+        asynchronous: Whether symbols that are not cached are fetched by a
+            background job, instead of within the request.
+        fields: Parts of symbols data to return, out of `latest_prices`,
+            `candles` and `values` (default: all of them).
+        start: Time of the first candle to return, like
+            `2023-05-19 19:00:00` in the time zone of the data.
+        end: Time of the last candle to return.
+        limit: Max number of newest candles to return of each symbol.
 
     Methods:
+        validate_start: Parses the time of the first candle.
+        validate_end: Parses the time of the last candle.
         validate: Validates the symbols list for their length and
             values type.
 
     This serializer raises:
-        ValidationError: Only limit of 5 symbols is allowed due to free
-                         subscription of `alpha avantage`
-            - If length of symbols list is more than 5.
+        ValidationError: Only limit of `WATCHLIST_MAX_SYMBOLS` symbols is
+                         allowed in a watch list.
+            - If length of symbols list is more than `WATCHLIST_MAX_SYMBOLS`.
         ValidationError: symbols must be a string value.
             - If any of the symbol is not of python string type.
     """
@@ -36,13 +55,94 @@ class WatchListSymbolSerializer(serializers.Serializer):
     symbols = serializers.ListField(
         label='Watch List Symbols', write_only=True
     )
+    asynchronous = serializers.BooleanField(
+        label='Fetch Asynchronously', default=False, write_only=True
+    )
+    fields = serializers.ListField(
+        label='Symbols Data Fields',
+        child=serializers.ChoiceField(choices=SYMBOLS_DATA_FIELDS),
+        default=list(SYMBOLS_DATA_FIELDS), allow_empty=False, write_only=True
+    )
+    start = serializers.CharField(
+        label='Start Time', default=None, write_only=True
+    )
+    end = serializers.CharField(
+        label='End Time', default=None, write_only=True
+    )
+    limit = serializers.IntegerField(
+        label='Limit', min_value=1, default=None, write_only=True
+    )
+
+
+    def validate_start(self, value):
+        """Parses the time of the first candle.
+
+        Args:
+            value (Optional[str]): Date time like `2023-05-19 19:00:00`.
+
+        Returns:
+            Optional[datetime]: Parsed date time.
+
+        Raises:
+            ValidationError: If value is not a date time without time zone.
+        """
+
+        return self.parse_candle_time(value)
+
+
+    def validate_end(self, value):
+        """Parses the time of the last candle.
+
+        Args:
+            value (Optional[str]): Date time like `2023-05-19 19:55:00`.
+
+        Returns:
+            Optional[datetime]: Parsed date time.
+
+        Raises:
+            ValidationError: If value is not a date time without time zone.
+        """
+
+        return self.parse_candle_time(value)
+
+
+    @staticmethod
+    def parse_candle_time(value):
+        """Parses a candle time, which has no time zone as times of candles
+        are in the time zone of the data.
+
+        Args:
+            value (Optional[str]): Date time like `2023-05-19 19:55:00`.
+
+        Returns:
+            Optional[datetime]: Parsed date time.
+
+        Raises:
+            ValidationError: If value is not a date time without time zone.
+        """
+
+        if value is None:
+            return None
+        try:
+            date_time = parse_datetime(value)
+        except ValueError:
+            date_time = None
+        if date_time is None or date_time.tzinfo is not None:
+            raise serializers.ValidationError(
+                "Date time must be like 2023-05-19 19:55:00, without time "
+                "zone."
+            )
+        return date_time
 
 
     def validate(self, attrs):
         """This method validates the watch list symbols based on the
         following criteria:
-        - The number of symbols should not exceed 5.
+        - `start` should not be after `end`.
+        - The number of symbols should not exceed `WATCHLIST_MAX_SYMBOLS`.
         - Each symbol should be a string.
+        And then excludes the symbols that are not listed in symbol master,
+        which are kept as `unknown_symbols`.
 
         Args:
             attrs (Dict[str, Any]): A key-value pairs of received inputs.
@@ -51,17 +151,24 @@ class WatchListSymbolSerializer(serializers.Serializer):
             Dict[str, Any]: A validated key-value pairs of received inputs.
 
         Raises:
-            ValidationError: Only limit of 5 symbols is allowed due to
-                free subscription of `alpha avantage`.
+            ValidationError: start must not be after end.
+            ValidationError: Only limit of `WATCHLIST_MAX_SYMBOLS` symbols
+                is allowed in a watch list.
             ValidationError: symbols must be a string value.
         """
 
         symbols = attrs.get('symbols')
 
-        if len(symbols) > 5:
-            msg = (
-                "Only limit of 5 symbols is allowed due to " +
-                "free subscription of `alpha avantage`."
+        if (
+            attrs.get('start') is not None and attrs.get('end') is not None
+            and attrs['start'] > attrs['end']
+        ):
+            raise serializers.ValidationError("start must not be after end.")
+
+        max_symbols = getattr(settings, 'WATCHLIST_MAX_SYMBOLS', 500)
+        if len(symbols) > max_symbols:
+            msg = "Only limit of {} symbols is allowed in a watch list.".format(
+                max_symbols
             )
             raise serializers.ValidationError(msg)
 
@@ -70,4 +177,168 @@ class WatchListSymbolSerializer(serializers.Serializer):
                 msg = "symbols must be a string value."
                 raise serializers.ValidationError(msg)
 
+        # Unknown symbols are excluded here, so that no upstream api call
+        # is spent on them, and are kept to tell the client about them.
+        symbol_master = get_symbol_master()
+        if symbol_master is not None:
+            attrs['symbols'], attrs['unknown_symbols'] = (
+                symbol_master.filter_known(symbols)
+            )
+
+        return attrs
+
+
+class SymbolSearchSerializer(serializers.Serializer):
+    """
+    Serializer class for validating symbol search queries.
+
+    Attributes:
+        q: Search query, start of a symbol or of a word of its name.
+        limit: Max number of matching symbols to return.
+    """
+
+    q = serializers.CharField(label='Search Query', max_length=64)
+    limit = serializers.IntegerField(
+        label='Limit', min_value=1, max_value=50, default=10
+    )
+
+
+class CorrelationSerializer(serializers.Serializer):
+    """
+    Serializer class for validating options of watchlist correlation.
+
+    Attributes:
+        window: Number of returns of rolling volatility.
+        limit: Max number of newest aligned candles to use.
+    """
+
+    window = serializers.IntegerField(
+        label='Volatility Window', min_value=2, max_value=1000, default=20
+    )
+    limit = serializers.IntegerField(
+        label='Limit', min_value=2, default=None
+    )
+
+
+class PriceAlertSerializer(serializers.ModelSerializer):
+    """
+    Serializer class for creating and listing price alerts of a user.
+
+    Attributes:
+        symbol: Symbol of the alert, which must be listed in symbol master
+            when it is available.
+        direction: `above` or `below`.
+        threshold: Positive price threshold.
+
+    Meta:
+        model: The PriceAlert model associated with the serializer.
+        fields: The fields to include in the serialized representation.
+        read_only_fields: Fields which are not accepted as input.
+
+    Methods:
+        validate_symbol: Normalizes the symbol and checks that it is listed.
+        validate: Checks the number of untriggered alerts of the user.
+
+    This serializer raises:
+        ValidationError: Unknown symbol.
+            - If symbol is not listed in symbol master.
+        ValidationError: Only limit of `MAX_PER_USER` untriggered alerts is
+                         allowed.
+            - If user already has that many untriggered alerts.
+    """
+
+    threshold = serializers.FloatField(min_value=0)
+
+
+    class Meta:
+        """
+        Class represents the meta information about PriceAlertSerializer.
+
+        Attributes:
+            model: The PriceAlert model associated with the serializer.
+            fields: The fields to include in the serialized representation.
+            read_only_fields: Fields which are not accepted as input.
+        """
+        model = PriceAlert
+        fields = (
+            'id', 'symbol', 'direction', 'threshold', 'created_at',
+            'triggered_at'
+        )
+        read_only_fields = ('id', 'created_at', 'triggered_at')
+
+
+    def validate_symbol(self, value):
+        """Normalizes the symbol and checks that it is listed in symbol
+        master, when it is available.
+
+        Args:
+            value (str): Symbol like msft.
+
+        Returns:
+            str: Upper case symbol.
+
+        Raises:
+            ValidationError: If symbol is not listed.
+        """
+
+        symbol = value.strip().upper()
+        symbol_master = get_symbol_master()
+        if symbol_master is not None and symbol not in symbol_master.listings:
+            raise serializers.ValidationError(
+                "Unknown symbol {}.".format(symbol)
+            )
+        return symbol
+
+
+    def validate(self, attrs):
+        """Checks that the user has less than `MAX_PER_USER` untriggered
+        alerts.
+
+        Args:
+            attrs (Dict[str, Any]): A key-value pairs of received inputs.
+
+        Returns:
+            Dict[str, Any]: A validated key-value pairs of received inputs.
+
+        Raises:
+            ValidationError: Only limit of `MAX_PER_USER` untriggered
+                alerts is allowed.
+        """
+
+        max_alerts = get_price_alerts_settings()['MAX_PER_USER']
+        if PriceAlert.objects.filter(
+            user=self.context['request'].user, triggered_at__isnull=True
+        ).count() >= max_alerts:
+            raise serializers.ValidationError(
+                "Only limit of {} untriggered alerts is allowed.".format(
+                    max_alerts
+                )
+            )
         return attrs
+
+
+class AlertNotificationSerializer(serializers.ModelSerializer):
+    """
+    Serializer class for listing notifications of triggered price alerts.
+
+    Meta:
+        model: The AlertNotification model associated with the serializer.
+        fields: The fields to include in the serialized representation.
+    """
+
+
+    class Meta:
+        """
+        Class represents the meta information about
+        AlertNotificationSerializer.
+
+        Attributes:
+            model: The AlertNotification model associated with the
+                serializer.
+            fields: The fields to include in the serialized representation.
+        """
+        model = AlertNotification
+        fields = (
+            'id', 'alert', 'symbol', 'direction', 'threshold', 'price',
+            'created_at'
+        )
@@ -0,0 +1,279 @@
+"""
+Module that defines the symbol master, an in-memory index of all listed
+symbols loaded from a local listing file.
+
+Symbol master is used to reject unknown symbols before spending upstream
+api calls on them, and to serve symbol autocomplete, which tolerates a
+typo in the query. Listing file is a CSV
+in alpha avantage's `LISTING_STATUS` format (with `symbol`, `name`,
+`exchange` and `assetType` columns), and can be downloaded with
+`python manage.py update_symbol_master`.
+
+Settings:
+    SYMBOL_MASTER_FILE (Optional[Path]): Path of the listing file. When it
+        is not set or the file doesn't exist, symbols are not validated.
+"""
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from bisect import bisect_left
+import csv
+import os
+import threading
+
+
+class SymbolMaster:
+    """
+    Class defining an in-memory index of listed symbols. Symbols are kept
+    in a sorted tuple, so membership and prefix lookups are binary searches.
+    Words of symbol names are kept in a separate sorted tuple, so symbols can
+    also be searched by the start of any word of their names. Queries with a
+    typo are matched by the prefix lookups of every query one edit away.
+
+    Attributes:
+        listings: Mapping of symbol to its listing (name, exchange and
+            asset type).
+
+    Methods:
+        from_file: Builds symbol master from a listing file.
+        filter_known: Splits symbols into known and unknown symbols.
+        search: Returns listings matching a search query.
+    """
+
+    # Min length of queries which are matched with a typo, shorter queries
+    # are one edit away from most symbols.
+    MIN_FUZZY_QUERY = 3
+
+    def __init__(self, listings):
+        """Builds the index from listings.
+
+        Args:
+            listings (Iterable[Dict[str, str]]): Listings with `symbol`,
+                `name`, `exchange` and `assetType` keys.
+        """
+
+        self.listings = {}
+        for listing in listings:
+            symbol = listing['symbol'].strip().upper()
+            if symbol:
+                self.listings[symbol] = {
+                    'symbol': symbol,
+                    'name': listing.get('name') or '',
+                    'exchange': listing.get('exchange') or '',
+                    'asset_type': listing.get('assetType') or '',
+                }
+
+        self._symbols = tuple(sorted(self.listings))
+        self._name_words = tuple(sorted(
+            (word, symbol)
+            for symbol, listing in self.listings.items()
+            for word in set(listing['name'].upper().split())
+        ))
+        self._alphabet = ''.join(sorted(
+            set(''.join(self._symbols)) |
+            set(''.join(word for word, _ in self._name_words))
+        ))
+
+
+    @classmethod
+    def from_file(cls, path):
+        """Builds symbol master from a listing file.
+
+        Args:
+            path (Path): Path of the CSV listing file.
+
+        Returns:
+            SymbolMaster: Symbol master with all listings of file.
+        """
+
+        with open(path, newline='', encoding='utf-8') as listing_file:
+            return cls(csv.DictReader(listing_file))
+
+
+    def __contains__(self, symbol):
+        """Checks whether a symbol is listed.
+
+        Args:
+            symbol (str): Symbol to check, case insensitive.
+
+        Returns:
+            bool: True if symbol is listed.
+        """
+
+        symbol = symbol.upper()
+        index = bisect_left(self._symbols, symbol)
+        return index < len(self._symbols) and self._symbols[index] == symbol
+
+
+    def __len__(self):
+        return len(self._symbols)
+
+
+    def filter_known(self, symbols):
+        """Splits symbols into known and unknown symbols, keeping their
+        order.
+
+        Args:
+            symbols (List[str]): Symbols to check.
+
+        Returns:
+            Tuple[List[str], List[str]]: Known and unknown symbols.
+        """
+
+        known = []
+        unknown = []
+        for symbol in symbols:
+            (known if symbol in self else unknown).append(symbol)
+        return known, unknown
+
+
+    def search(self, query, limit=10):
+        """Returns listings matching a search query. Symbols starting with
+        the query come first, followed by symbols having a name word
+        starting with the query. When there are less than `limit` of them,
+        symbols and name words starting with a query one edit (insertion,
+        deletion, substitution or transposition) away follow.
+
+        Args:
+            query (str): Search query, case insensitive.
+            limit optional(int): Max number of listings (default: 10).
+
+        Returns:
+            List[Dict[str, str]]: Matching listings.
+        """
+
+        query = query.strip().upper()
+        if not query or limit <= 0:
+            return []
+
+        symbol_matches, word_matches = self._prefix_matches(query, limit)
+        matches = list(dict.fromkeys(symbol_matches + word_matches))
+
+        if len(matches) < limit and len(query) >= self.MIN_FUZZY_QUERY:
+            fuzzy_symbol_matches = set()
+            fuzzy_word_matches = set()
+            for edited_query in get_single_edits(query, self._alphabet):
+                symbol_matches, word_matches = self._prefix_matches(
+                    edited_query, limit
+                )
+                fuzzy_symbol_matches.update(symbol_matches)
+                fuzzy_word_matches.update(word_matches)
+            matches = list(dict.fromkeys(
+                matches + sorted(fuzzy_symbol_matches) +
+                sorted(fuzzy_word_matches)
+            ))
+
+        return [self.listings[symbol] for symbol in matches[:limit]]
+
+
+    def _prefix_matches(self, prefix, limit):
+        """Returns symbols starting with a prefix, and symbols having a name
+        word starting with it.
+
+        Args:
+            prefix (str): Upper case prefix.
+            limit (int): Max number of symbols of each kind of match.
+
+        Returns:
+            Tuple[List[str], List[str]]: Symbols starting with the prefix,
+            and symbols having a name word starting with it.
+        """
+
+        symbol_matches = []
+        index = bisect_left(self._symbols, prefix)
+        while (
+            index < len(self._symbols) and len(symbol_matches) < limit and
+            self._symbols[index].startswith(prefix)
+        ):
+            symbol_matches.append(self._symbols[index])
+            index += 1
+
+        word_matches = []
+        index = bisect_left(self._name_words, (prefix,))
+        while (
+            index < len(self._name_words) and len(word_matches) < limit and
+            self._name_words[index][0].startswith(prefix)
+        ):
+            word_matches.append(self._name_words[index][1])
+            index += 1
+        return symbol_matches, word_matches
+
+
+def get_single_edits(query, alphabet):
+    """Returns the queries one edit (insertion, deletion, substitution or
+    transposition of adjacent characters) away from a query.
+
+    Args:
+        query (str): Upper case query.
+        alphabet (str): Characters which can be inserted or substituted.
+
+    Returns:
+        Set[str]: Edited queries, without the query itself.
+    """
+
+    splits = [(query[:index], query[index:]) for index in range(
+        len(query) + 1
+    )]
+    edits = set()
+    for head, tail in splits:
+        if tail:
+            edits.add(head + tail[1:])
+            edits.update(head + char + tail[1:] for char in alphabet)
+        if len(tail) > 1:
+            edits.add(head + tail[1] + tail[0] + tail[2:])
+        edits.update(head + char + tail for char in alphabet)
+    edits.discard(query)
+    edits.discard('')
+    return edits
+
+
+_symbol_master = None
+_symbol_master_loaded = False
+_symbol_master_lock = threading.Lock()
+
+
+def get_symbol_master():
+    """Returns the process wide symbol master, loading it from
+    `SYMBOL_MASTER_FILE` on first use.
+
+    Returns:
+        Optional[SymbolMaster]: Symbol master, or None if listing file is
+        not configured or doesn't exist.
+    """
+
+    global _symbol_master, _symbol_master_loaded
+    with _symbol_master_lock:
+        if not _symbol_master_loaded:
+            path = getattr(settings, 'SYMBOL_MASTER_FILE', None)
+            if path and os.path.exists(path):
+                _symbol_master = SymbolMaster.from_file(path)
+            else:
+                _symbol_master = None
+            _symbol_master_loaded = True
+        return _symbol_master
+
+
+def reset_symbol_master():
+    """Drops the loaded symbol master, so that it is reloaded on next use.
+    """
+
+    global _symbol_master, _symbol_master_loaded
+    with _symbol_master_lock:
+        _symbol_master = None
+        _symbol_master_loaded = False
+
+
+@receiver(setting_changed)
+def reset_symbol_master_on_setting_change(sender, setting, **kwargs):
+    """Function to reload symbol master when listing file setting is
+    changed, like in tests.
+
+    Args:
+        sender (Type): A sender of setting changed signal.
+        setting (str): Name of the changed setting.
+    """
+
+    if setting == 'SYMBOL_MASTER_FILE':
+        reset_symbol_master()
@@ -2,15 +2,162 @@
 Module for testing user watch_list journeys through test cases.
 """
 
-from django.test import TestCase
+from datetime import datetime, timedelta
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from django.test import SimpleTestCase, TestCase, override_settings
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework.authtoken.models import Token
 from django.contrib.auth.models import User
+from unittest import mock
+from aiohttp import web
 
+from stockmonitor.middleware import choose_encoding, compressed_body_cache
+from users.authentication import TokenCache, token_cache
+from users.models import WatchList, WatchListSymbol
+from users.watchlist_buffer import WatchListWriteBuffer
+
+from . import admission
+from .admission import AdmissionController, Overloaded
+from .jobs import enqueue_fetch_job, run_fetch_job
+from .management.commands.measure_import_time import measure_imports
+from .models import AlertNotification, FetchJob, PriceAlert
+from .price_alerts import (
+    PriceAlertEngine, PriceAlertIndex, reset_price_alert_engine
+)
+from .refresh_scheduler import (
+    REFRESH_OWNER, RefreshScheduler, SchedulerLeadership,
+    get_refresh_scheduler, refresh_symbols
+)
+from .symbol_master import SymbolMaster
+from .throttling import (
+    PRUNE_BATCH, CacheSlidingWindowCounter, SlidingWindowCounter,
+    SymbolsDataRateThrottle, get_sliding_window_wait,
+    reset_symbols_data_counter
+)
+from .wrapper import correlation, symbols_data_fetcher
+from .wrapper.candle_series import CandleSeries
+from .wrapper.candle_store import CandleStore
+from .wrapper.concurrency import ConcurrencyLimiter, get_outbound_metrics
+from .wrapper.cassette import Cassette
+from .wrapper.fetch_pipeline import BatchFetchPipeline
+from .wrapper.intraday_decoder import IntradayDecoder, decode_intraday_payload
+from .wrapper.key_pool import ApiKeyPool
+from .wrapper.market_calendar import get_market_calendar
+from .wrapper.parse_pool import QUOTA_REACHED
+from .wrapper.utils import fetch_urls_raw_data
+
+import asyncio
 import copy
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+
+def build_intraday_payload(symbol, interval='5min', bars=3,
+                           price_format='{:.4f}'):
+    """Builds an alpha avantage like intraday payload for a symbol, with
+    bars ordered from newest to oldest like the real api.
+    """
+
+    time_series = {}
+    for index in range(bars):
+        minutes = 55 - (index * 5)
+        price = 100 + bars - index
+        time_series['2023-05-19 19:{:02d}:00'.format(minutes)] = {
+            '1. open': price_format.format(price),
+            '2. high': price_format.format(price + 1),
+            '3. low': price_format.format(price - 1),
+            '4. close': price_format.format(price + 0.5),
+            '5. volume': str(1000 + index)
+        }
+    return {
+        'Meta Data': {
+            '1. Information': 'Intraday ({}) open, high, low, close prices '
+                              'and volume'.format(interval),
+            '2. Symbol': symbol,
+            '3. Last Refreshed': '2023-05-19 19:55:00',
+            '4. Interval': interval,
+            '5. Output Size': 'Compact',
+            '6. Time Zone': 'US/Eastern'
+        },
+        'Time Series ({})'.format(interval): time_series
+    }
+
 
+def fake_intraday_data(symbols, interval):
+    """Stands in for upstream api calls, `BLAHBLAHBLAH` is an invalid
+    symbol for which api returns an error message.
+    """
+
+    payloads = []
+    for symbol in symbols:
+        if symbol == 'BLAHBLAHBLAH':
+            payloads.append({'Error Message': 'Invalid API call.'})
+        else:
+            payloads.append(build_intraday_payload(symbol, interval))
+    return payloads
+
+
+def decode_payloads(payloads, interval):
+    """Decodes payloads like responses of upstream api, in small chunks so
+    that values are split over chunks.
+    """
+
+    return [
+        decode_intraday_payload(
+            json.dumps(payload).encode('utf-8'), interval, chunk_size=64
+        )
+        for payload in payloads
+    ]
+
+
+def patch_upstream():
+    return mock.patch(
+        'watch_list.wrapper.symbols_data_fetcher.'
+        'fetch_symbols_intraday_series',
+        side_effect=lambda symbols, interval, api_keys: decode_payloads(
+            fake_intraday_data(symbols, interval), interval
+        )
+    )
 
+
+# Upstream responses of `WatchListTestCase`, served without network.
+UPSTREAM_CASSETTE_FIXTURE = os.path.join(
+    os.path.dirname(__file__), 'cassettes', 'upstream.jsonl'
+)
+
+
+# Caches of tests are in process, as the file based series cache of settings
+# is shared by every process of the host.
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'series': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'test-series',
+    },
+}
+
+
+@override_settings(
+    CACHES=TEST_CACHES,
+    UPSTREAM_CASSETTE={
+        'MODE': 'replay', 'PATH': UPSTREAM_CASSETTE_FIXTURE,
+        'REPLAY_TIMING': 'fast',
+    },
+    CANDLE_STORE={'ENABLED': False},
+    REFRESH_SCHEDULER={'ENABLED': False},
+)
 class WatchListTestCase(TestCase):
 
     SAMPLE_USER_DATA1 = {
@@ -36,6 +183,18 @@ class WatchListTestCase(TestCase):
         self.registered_user = self.api_client.post(
             reverse('register_user'), self.SAMPLE_USER_DATA2
         )
+        symbols_data_fetcher.get_series_cache().clear()
+        # Budget of this process, cassette doesn't check the key.
+        call_budget = ApiKeyPool(['TESTKEY'], 5, period=60)
+        for name, value in (
+            ('call_budget', call_budget),
+            ('fetch_pipeline', BatchFetchPipeline(
+                call_budget, symbols_data_fetcher.fetch_pipeline_batch
+            )),
+        ):
+            patcher = mock.patch.object(symbols_data_fetcher, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
 
     def test_on_first_login_watch_list_is_empty(self):
         response = self.api_client.post(
@@ -68,6 +227,7 @@ class WatchListTestCase(TestCase):
             response.json()['detail']
         )
 
+    @override_settings(WATCHLIST_MAX_SYMBOLS=5)
     def test_more_than_5_symbols_not_allowed_in_watch_list(
         self
     ):
@@ -92,7 +252,7 @@ class WatchListTestCase(TestCase):
         )
         self.assertEqual(response.status_code, 400)
         self.assertEqual(
-            ["Only limit of 5 symbols is allowed due to free subscription of `alpha avantage`."],
+            ["Only limit of 5 symbols is allowed in a watch list."],
             response.json()['non_field_errors']
         )
         self.api_client.credentials()
@@ -156,3 +316,2005 @@ class WatchListTestCase(TestCase):
         )
         self.assertEqual(response.status_code, 200)
         self.assertEqual(['MSFT'], response.json()['symbols'])
+
+
+class AuthenticatedUserTestCase(TestCase):
+
+    SAMPLE_USER_DATA = {
+        "username": "test_user",
+        "email": "test@gmail.com",
+        "password": "abcde@123",
+        "password2": "abcde@123",
+        "first_name": "hi",
+        "last_name": "bye"
+    }
+
+    def setUp(self):
+        cache_settings = override_settings(CACHES=TEST_CACHES)
+        cache_settings.enable()
+        self.addCleanup(cache_settings.disable)
+
+        self.api_client = APIClient()
+        self.api_client.post(reverse('register_user'), self.SAMPLE_USER_DATA)
+        self.user = User.objects.get(username="test_user")
+        self.token, created = Token.objects.get_or_create(user=self.user)
+        self.api_client.credentials(
+            HTTP_AUTHORIZATION='Token ' + self.token.key
+        )
+        token_cache.clear()
+        symbols_data_fetcher.get_series_cache().clear()
+        reset_symbols_data_counter()
+
+        candle_store_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(candle_store_dir.cleanup)
+        candle_store_settings = override_settings(CANDLE_STORE={
+            'DIR': candle_store_dir.name, 'COMPACT_AFTER': 1024
+        })
+        candle_store_settings.enable()
+        self.addCleanup(candle_store_settings.disable)
+        # Refreshes are scheduled by tests, not by a worker thread.
+        refresh_settings = override_settings(
+            REFRESH_SCHEDULER={'ENABLED': False}
+        )
+        refresh_settings.enable()
+        self.addCleanup(refresh_settings.disable)
+
+        # Budget and pipeline with a fake clock, pipeline is run by tests.
+        self.now = 0.0
+        self.call_budget = ApiKeyPool(
+            ['TESTKEY'], 5, period=60, clock=lambda: self.now
+        )
+        self.fetch_pipeline = BatchFetchPipeline(
+            self.call_budget, symbols_data_fetcher.fetch_pipeline_batch,
+            autostart=False
+        )
+        for name, value in (
+            ('call_budget', self.call_budget),
+            ('fetch_pipeline', self.fetch_pipeline),
+        ):
+            patcher = mock.patch.object(symbols_data_fetcher, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def post_symbols(self, symbols):
+        with patch_upstream():
+            return self.api_client.post(
+                reverse('fetch_symbols_data'), {'symbols': symbols},
+                format='json'
+            )
+
+
+class WatchListWriteTestCase(AuthenticatedUserTestCase):
+
+    def test_changed_symbols_are_written_with_single_update(self):
+        # Token with user and watchlist lookup, then a single update along
+        # with its reverse index read and insert within a savepoint.
+        with self.assertNumQueries(6):
+            response = self.post_symbols(['MSFT'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            ['MSFT'], WatchList.objects.get(user=self.user).symbols
+        )
+
+    def test_unchanged_symbols_are_not_written(self):
+        self.post_symbols(['MSFT'])
+
+        # Only token with user and watchlist lookup, no writes.
+        with self.assertNumQueries(1):
+            response = self.post_symbols(['MSFT'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_user_save_does_not_rewrite_unchanged_watchlist(self):
+        user = User.objects.select_related('watchlist').get(pk=self.user.pk)
+        with self.assertNumQueries(1):
+            user.save()
+
+        # User update, then watchlist update along with its reverse index
+        # read and insert within a savepoint.
+        user.watchlist.symbols = ['GOOG']
+        with self.assertNumQueries(6):
+            user.save()
+        self.assertEqual(
+            ['GOOG'], WatchList.objects.get(user=self.user).symbols
+        )
+
+    @override_settings(WATCHLIST_WRITE_BUFFER={'ENABLED': True})
+    def test_deferred_writes_are_written_on_flush(self):
+        write_buffer = WatchListWriteBuffer(flush_interval=60)
+        with mock.patch(
+            'users.watchlist_buffer.get_write_buffer',
+            return_value=write_buffer
+        ):
+            with self.assertNumQueries(1):
+                self.post_symbols(['MSFT'])
+            self.post_symbols(['GOOG'])
+
+        self.assertEqual(1, write_buffer.pending_count())
+        self.assertEqual([], WatchList.objects.get(user=self.user).symbols)
+
+        self.assertEqual(1, write_buffer.flush())
+        self.assertEqual(
+            ['GOOG'], WatchList.objects.get(user=self.user).symbols
+        )
+        self.assertEqual(
+            [("GOOG", 1)], WatchListSymbol.objects.popularity()
+        )
+
+
+class CachedTokenAuthenticationTestCase(AuthenticatedUserTestCase):
+
+    def test_cached_token_is_authenticated_without_token_query(self):
+        self.post_symbols(['MSFT'])
+        self.post_symbols(['MSFT'])
+
+        # Only stored symbols are read, to skip the unchanged write.
+        with self.assertNumQueries(1):
+            response = self.post_symbols(['MSFT'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_symbols_written_by_other_process_are_not_overlooked(self):
+        self.post_symbols(['MSFT'])
+        self.post_symbols(['MSFT'])
+
+        # Written without signals, like by another process.
+        WatchList.objects.filter(user=self.user).update(symbols=['GOOG'])
+        self.post_symbols(['MSFT'])
+        self.assertEqual(
+            ['MSFT'], WatchList.objects.get(user=self.user).symbols
+        )
+
+    def test_reverse_index_is_synced_with_stored_rows(self):
+        self.post_symbols(['MSFT'])
+        watchlist = WatchList.objects.get(user=self.user)
+
+        # Written by another process, so snapshot of watchlist is stale.
+        other_watchlist = WatchList.objects.get(user=self.user)
+        other_watchlist.update_symbols(['GOOG'])
+        watchlist.update_symbols(['IBM'])
+        self.assertEqual(
+            [('IBM', 1)], WatchListSymbol.objects.popularity()
+        )
+
+    def test_user_changed_by_other_process_is_not_authenticated(self):
+        self.post_symbols(['MSFT'])
+        self.post_symbols(['MSFT'])
+        self.assertIsNotNone(token_cache.get(self.token.key))
+
+        # Other process has its own token cache, sharing versions of users.
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        TokenCache(cache_alias='series').invalidate_user(self.user.pk)
+        self.assertIsNone(token_cache.get(self.token.key))
+        response = self.post_symbols(['MSFT'])
+        self.assertEqual(response.status_code, 401)
+
+    def test_cached_user_gets_changed_watchlist(self):
+        self.post_symbols(['MSFT'])
+        self.post_symbols(['MSFT'])
+
+        self.post_symbols(['GOOG'])
+        self.assertEqual(
+            ['GOOG'], WatchList.objects.get(user=self.user).symbols
+        )
+        self.post_symbols(['MSFT'])
+        self.assertEqual(
+            ['MSFT'], WatchList.objects.get(user=self.user).symbols
+        )
+
+    def test_deleted_token_is_not_authenticated(self):
+        self.post_symbols(['MSFT'])
+        self.post_symbols(['MSFT'])
+        self.assertEqual(1, len(token_cache))
+
+        self.token.delete()
+        self.assertEqual(0, len(token_cache))
+        response = self.post_symbols(['MSFT'])
+        self.assertEqual(response.status_code, 401)
+
+    def test_deactivated_user_is_not_authenticated(self):
+        self.post_symbols(['MSFT'])
+        self.post_symbols(['MSFT'])
+        self.assertEqual(1, len(token_cache))
+
+        self.user.is_active = False
+        self.user.save()
+        response = self.post_symbols(['MSFT'])
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(WATCHLIST_WRITE_BUFFER={'ENABLED': True})
+    def test_cached_user_gets_bulk_updated_watchlist(self):
+        write_buffer = WatchListWriteBuffer(flush_interval=60)
+        with mock.patch(
+            'users.watchlist_buffer.get_write_buffer',
+            return_value=write_buffer
+        ):
+            self.post_symbols(['MSFT'])
+            write_buffer.flush()
+            self.post_symbols([])
+            write_buffer.flush()
+
+        self.assertEqual([], WatchList.objects.get(user=self.user).symbols)
+
+
+class SymbolMasterTestCase(AuthenticatedUserTestCase):
+
+    LISTING = (
+        "symbol,name,exchange,assetType,ipoDate,delistingDate,status\n"
+        "MSFT,Microsoft Corporation,NASDAQ,Stock,1986-03-13,null,Active\n"
+        "MSI,Motorola Solutions Inc,NYSE,Stock,1977-01-03,null,Active\n"
+        "GOOG,Alphabet Inc - Class C,NASDAQ,Stock,2014-03-27,null,Active\n"
+        "IBM,International Business Machines Corp,NYSE,Stock,1962-01-02,"
+        "null,Active\n"
+    )
+
+    def setUp(self):
+        super().setUp()
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.listing_path = os.path.join(temp_dir.name, 'listing_status.csv')
+        with open(self.listing_path, 'w') as listing_file:
+            listing_file.write(self.LISTING)
+        settings_override = override_settings(
+            SYMBOL_MASTER_FILE=self.listing_path
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_unknown_symbols_are_not_fetched(self):
+        with patch_upstream() as fetch:
+            response = self.api_client.post(
+                reverse('fetch_symbols_data'),
+                {'symbols': ['MSFT', 'BLAHBLAHBLAH']}, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(['MSFT'], response.json()['symbols'])
+        self.assertEqual(['MSFT'], fetch.call_args[0][0])
+        self.assertEqual(
+            ['BLAHBLAHBLAH'], response.json()['unknown_symbols']
+        )
+
+    def test_symbols_are_searched_by_symbol_prefix_and_name(self):
+        response = self.api_client.get(
+            reverse('search_symbols'), {'q': 'ms'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            ['MSFT', 'MSI'],
+            [result['symbol'] for result in response.json()['results']]
+        )
+
+        response = self.api_client.get(
+            reverse('search_symbols'), {'q': 'alpha'}
+        )
+        self.assertEqual(
+            [{
+                'symbol': 'GOOG', 'name': 'Alphabet Inc - Class C',
+                'exchange': 'NASDAQ', 'asset_type': 'Stock'
+            }],
+            response.json()['results']
+        )
+
+    def test_symbols_are_searched_with_a_typo(self):
+        symbol_master = SymbolMaster.from_file(self.listing_path)
+        for query, symbols in (
+            ('microsfot', ['MSFT']),
+            ('motorla', ['MSI']),
+            ('xyzzy', []),
+        ):
+            with self.subTest(query=query):
+                self.assertEqual(symbols, [
+                    listing['symbol']
+                    for listing in symbol_master.search(query)
+                ])
+        # Symbols one edit away come before matching name words.
+        self.assertEqual('IBM', symbol_master.search('ibn')[0]['symbol'])
+        # Short queries are only matched by prefix.
+        self.assertEqual(
+            ['MSFT', 'MSI'],
+            [listing['symbol'] for listing in symbol_master.search('ms')]
+        )
+
+    def test_search_results_are_limited(self):
+        symbol_master = SymbolMaster.from_file(self.listing_path)
+        self.assertEqual(1, len(symbol_master.search('M', limit=1)))
+        self.assertIn('ibm', symbol_master)
+        self.assertNotIn('IB', symbol_master)
+
+    def test_search_requires_query(self):
+        response = self.api_client.get(reverse('search_symbols'))
+        self.assertEqual(response.status_code, 400)
+
+
+class ProgressiveFetchTestCase(AuthenticatedUserTestCase):
+
+    SYMBOLS = ['MSFT', 'GOOG', 'TSLA', 'IBM', 'AAPL', 'AMZN', 'NFLX']
+
+    def test_symbols_beyond_quota_are_pending_with_eta(self):
+        response = self.post_symbols(self.SYMBOLS)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.SYMBOLS[:5], response.json()['symbols'])
+        self.assertEqual(
+            self.SYMBOLS[5:], response.json()['pending_symbols']
+        )
+        self.assertEqual(
+            {'AMZN': 60.0, 'NFLX': 60.0},
+            response.json()['pending_symbols_eta']
+        )
+        self.assertEqual(
+            self.SYMBOLS, WatchList.objects.get(user=self.user).symbols
+        )
+
+    def test_pending_symbols_are_fetched_when_budget_refills(self):
+        self.post_symbols(self.SYMBOLS)
+
+        with patch_upstream() as fetch:
+            self.assertEqual(0, self.fetch_pipeline.run_once())
+            self.now = 60.0
+            self.assertEqual(2, self.fetch_pipeline.run_once())
+        self.assertEqual(['AMZN', 'NFLX'], fetch.call_args[0][0])
+
+        # Every symbol is served from cache now.
+        response = self.post_symbols(self.SYMBOLS)
+        self.assertEqual(self.SYMBOLS, response.json()['symbols'])
+        self.assertEqual([], response.json()['pending_symbols'])
+        self.assertEqual(3, self.call_budget.available())
+
+    def test_invalid_symbols_are_not_fetched_again(self):
+        self.post_symbols(['MSFT', 'BLAHBLAHBLAH'])
+
+        with patch_upstream() as fetch:
+            response = self.api_client.post(
+                reverse('fetch_symbols_data'),
+                {'symbols': ['MSFT', 'BLAHBLAHBLAH']}, format='json'
+            )
+        self.assertEqual(['MSFT'], response.json()['symbols'])
+        self.assertEqual(
+            ['MSFT'], WatchList.objects.get(user=self.user).symbols
+        )
+        fetch.assert_not_called()
+
+    def test_quota_note_without_any_data_returns_429(self):
+        note = {'Note': 'Thank you for using Alpha Vantage!'}
+        with mock.patch(
+            'watch_list.wrapper.symbols_data_fetcher.'
+            'fetch_symbols_intraday_series',
+            side_effect=lambda symbols, interval, api_keys: decode_payloads(
+                [note] * len(symbols), interval
+            )
+        ):
+            response = self.api_client.post(
+                reverse('fetch_symbols_data'),
+                {'symbols': ['MSFT']}, format='json'
+            )
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(0, self.call_budget.available())
+        self.assertEqual(1, self.fetch_pipeline.pending_count())
+
+
+class FetchJobTestCase(AuthenticatedUserTestCase):
+
+    def post_async(self, symbols):
+        with patch_upstream():
+            return self.api_client.post(
+                reverse('fetch_symbols_data'),
+                {'symbols': symbols, 'asynchronous': True}, format='json'
+            )
+
+    def test_uncached_symbols_are_fetched_by_a_job(self):
+        with mock.patch('watch_list.jobs.job_queue.submit') as submit:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.api_client.post(
+                    reverse('fetch_symbols_data'),
+                    {'symbols': ['MSFT', 'GOOG'], 'asynchronous': True},
+                    format='json'
+                )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual('pending', response.json()['status'])
+        self.assertEqual(
+            ['MSFT', 'GOOG'], WatchList.objects.get(user=self.user).symbols
+        )
+
+        job = FetchJob.objects.get(job_id=response.json()['job_id'])
+        submit.assert_called_once_with(job.pk)
+        with patch_upstream():
+            run_fetch_job(job.pk)
+
+        response = self.api_client.get(response.json()['status_url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual('done', response.json()['status'])
+        self.assertEqual(
+            ['MSFT', 'GOOG'], response.json()['result']['symbols']
+        )
+
+    def test_identical_pending_jobs_are_deduplicated(self):
+        with mock.patch('watch_list.jobs.job_queue.submit'):
+            first_response = self.api_client.post(
+                reverse('fetch_symbols_data'),
+                {'symbols': ['MSFT', 'GOOG'], 'asynchronous': True},
+                format='json'
+            )
+            second_response = self.api_client.post(
+                reverse('fetch_symbols_data'),
+                {'symbols': ['GOOG', 'MSFT'], 'asynchronous': True},
+                format='json'
+            )
+        self.assertEqual(
+            first_response.json()['job_id'], second_response.json()['job_id']
+        )
+        self.assertEqual(1, FetchJob.objects.count())
+
+    def test_cached_symbols_are_served_without_a_job(self):
+        self.post_symbols(['MSFT'])
+
+        response = self.post_async(['MSFT'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(['MSFT'], response.json()['symbols'])
+        self.assertEqual(0, FetchJob.objects.count())
+
+    def test_job_waits_for_quota_of_pending_symbols(self):
+        self.call_budget.keys[0].budget.calls = 1
+        with mock.patch('watch_list.jobs.job_queue.submit'):
+            response = self.post_async(['MSFT', 'GOOG'])
+        self.assertEqual(response.status_code, 202)
+        job = FetchJob.objects.get(job_id=response.json()['job_id'])
+
+        def sleep(seconds):
+            self.now += seconds
+            self.fetch_pipeline.run_once()
+
+        with patch_upstream():
+            run_fetch_job(job.pk, sleep=sleep, clock=lambda: self.now)
+        job.refresh_from_db()
+        self.assertEqual('done', job.status)
+        self.assertEqual(['MSFT', 'GOOG'], job.result['symbols'])
+
+    @override_settings(FETCH_JOBS={'TIMEOUT': 0})
+    def test_jobs_of_users_take_turns(self):
+        other_user = User.objects.create_user('other', password='other@123')
+        self.call_budget.exhaust()
+        with mock.patch('watch_list.jobs.job_queue.submit'):
+            jobs = [
+                enqueue_fetch_job(symbols, '5min', user)[0]
+                for symbols, user in (
+                    (['MSFT', 'GOOG', 'TSLA'], self.user),
+                    (['IBM', 'AMZN', 'NFLX'], other_user),
+                )
+            ]
+        # Jobs can't fetch anything, so their symbols are queued.
+        for job in jobs:
+            run_fetch_job(job.pk, clock=lambda: self.now)
+
+        self.now += 60
+        self.call_budget.keys[0].budget.calls = 2
+        with patch_upstream() as fetch:
+            self.fetch_pipeline.run_once()
+        # Symbols of both users are fetched, in turn.
+        self.assertEqual(['MSFT', 'IBM'], fetch.call_args[0][0])
+
+    def test_job_is_only_served_to_its_owner(self):
+        with mock.patch('watch_list.jobs.job_queue.submit'):
+            response = self.post_async(['MSFT'])
+        other_user = User.objects.create_user('other', password='other@123')
+        api_client = APIClient()
+        api_client.credentials(
+            HTTP_AUTHORIZATION='Token ' + Token.objects.create(
+                user=other_user
+            ).key
+        )
+        self.assertEqual(
+            404, api_client.get(response.json()['status_url']).status_code
+        )
+        self.assertEqual(
+            200, self.api_client.get(response.json()['status_url']).status_code
+        )
+
+    def test_job_left_by_stopped_process_is_submitted_again(self):
+        with mock.patch('watch_list.jobs.job_queue.submit'):
+            first_response = self.post_async(['MSFT'])
+        # Process running the job stopped, so job isn't updated anymore.
+        FetchJob.objects.update(
+            status=FetchJob.RUNNING,
+            updated_at=timezone.now() - timedelta(seconds=121)
+        )
+
+        with mock.patch('watch_list.jobs.job_queue.submit') as submit:
+            with self.captureOnCommitCallbacks(execute=True):
+                second_response = self.post_async(['MSFT'])
+        self.assertEqual(
+            first_response.json()['job_id'], second_response.json()['job_id']
+        )
+        self.assertEqual('pending', second_response.json()['status'])
+        job = FetchJob.objects.get()
+        submit.assert_called_once_with(job.pk)
+        with patch_upstream():
+            run_fetch_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual('done', job.status)
+
+    def test_only_valid_symbols_are_written_to_watchlist(self):
+        with mock.patch('watch_list.jobs.job_queue.submit'):
+            response = self.post_async(['MSFT', 'BLAHBLAHBLAH'])
+        self.assertEqual(
+            ['MSFT', 'BLAHBLAHBLAH'],
+            WatchList.objects.get(user=self.user).symbols
+        )
+        # Job drops the symbols it finds invalid.
+        with patch_upstream():
+            run_fetch_job(
+                FetchJob.objects.get(job_id=response.json()['job_id']).pk
+            )
+        self.assertEqual(
+            ['MSFT'], WatchList.objects.get(user=self.user).symbols
+        )
+
+        # Symbols cached as invalid are not written.
+        with mock.patch('watch_list.jobs.job_queue.submit'):
+            self.post_async(['GOOG', 'BLAHBLAHBLAH'])
+        self.assertEqual(
+            ['GOOG'], WatchList.objects.get(user=self.user).symbols
+        )
+
+    def test_expired_job_is_gone(self):
+        with mock.patch('watch_list.jobs.job_queue.submit'):
+            response = self.api_client.post(
+                reverse('fetch_symbols_data'),
+                {'symbols': ['MSFT'], 'asynchronous': True}, format='json'
+            )
+        FetchJob.objects.update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        response = self.api_client.get(response.json()['status_url'])
+        self.assertEqual(response.status_code, 410)
+
+
+class SeriesCacheTestCase(AuthenticatedUserTestCase):
+
+    def test_cached_series_is_compact_binary(self):
+        response = self.post_symbols(['MSFT'])
+        cached = symbols_data_fetcher.get_series_cache().get(
+            symbols_data_fetcher.get_symbol_cache_key('MSFT', '5min')
+        )
+        self.assertIsInstance(cached, bytes)
+        self.assertTrue(cached.startswith(b'CSR2'))
+
+        # Served from cache as the same data as fetched.
+        with patch_upstream() as fetch:
+            cached_response = self.api_client.post(
+                reverse('fetch_symbols_data'), {'symbols': ['MSFT']},
+                format='json'
+            )
+        fetch.assert_not_called()
+        self.assertEqual(response.json(), cached_response.json())
+
+    def test_series_round_trips_exactly(self):
+        series = symbols_data_fetcher.parse_symbol_data(
+            build_intraday_payload('MSFT', bars=12), '5min'
+        )
+        data = series.to_bytes()
+        self.assertTrue(data.startswith(b'CSR2'))
+        self.assertEqual(series, CandleSeries.from_bytes(data))
+
+    def test_series_rows_match_upstream_payload(self):
+        payload = build_intraday_payload('MSFT')
+        series = symbols_data_fetcher.parse_symbol_data(payload, '5min')
+        rows = [
+            [
+                candle['1. open'], candle['4. close'], candle['3. low'],
+                candle['2. high'], candle['5. volume'], date_time
+            ]
+            for date_time, candle in payload['Time Series (5min)'].items()
+        ]
+        self.assertEqual(rows, series.to_rows())
+        self.assertEqual(rows[0], series.latest_row())
+
+    def test_series_rows_keep_upstream_price_strings(self):
+        for price_format in ('{:.2f}', '{:.4f}', '{:.6f}', '{:.0f}'):
+            payload = build_intraday_payload(
+                'MSFT', price_format=price_format
+            )
+            newest = payload['Time Series (5min)']['2023-05-19 19:55:00']
+            row = [
+                newest['1. open'], newest['4. close'], newest['3. low'],
+                newest['2. high'], '1000', '2023-05-19 19:55:00'
+            ]
+            parsed = symbols_data_fetcher.parse_symbol_data(payload, '5min')
+            _, decoded = decode_intraday_payload(
+                json.dumps(payload).encode(), '5min'
+            )
+            for series in (
+                parsed, decoded, CandleSeries.from_bytes(parsed.to_bytes())
+            ):
+                with self.subTest(price_format=price_format):
+                    self.assertEqual(row, series.latest_row())
+
+    def test_series_slices_share_arrays(self):
+        series = symbols_data_fetcher.parse_symbol_data(
+            build_intraday_payload('MSFT', bars=12), '5min'
+        )
+        latest = series[-2:]
+        self.assertEqual(2, len(latest))
+        self.assertTrue(np.shares_memory(latest.closes, series.closes))
+        self.assertEqual(series.latest_row(), latest.latest_row())
+
+    def test_fetched_candles_are_stored(self):
+        self.post_symbols(['MSFT'])
+        series = symbols_data_fetcher.read_symbol_candles(
+            'MSFT', '5min', start='2023-05-19 19:50:00'
+        )
+        self.assertEqual([102.0, 103.0], series.opens.tolist())
+
+
+class CandleStoreTestCase(SimpleTestCase):
+
+    def setUp(self):
+        store_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(store_dir.cleanup)
+        self.store = CandleStore(store_dir.name, compact_after=4)
+
+    def append(self, timestamps, price=100.0):
+        count = len(timestamps)
+        return self.store.append('MSFT', '5min', {
+            'timestamp': np.array(timestamps, dtype=np.int64),
+            'open': np.full(count, price),
+            'high': np.full(count, price + 1),
+            'low': np.full(count, price - 1),
+            'close': np.full(count, price + 0.5),
+            'volume': np.full(count, 1000, dtype=np.int64),
+        })
+
+    def test_candles_are_read_by_time_range(self):
+        self.append([300, 100, 200])
+        candles = self.store.read('MSFT', '5min', start=150, end=300)
+        self.assertEqual([200, 300], candles['timestamp'].tolist())
+        self.assertEqual(
+            [], self.store.read('AAPL', '5min')['timestamp'].tolist()
+        )
+
+    def test_overlapping_candles_are_not_logged_again(self):
+        self.assertEqual(3, self.append([100, 200, 300]))
+        # Unchanged candles are not logged again.
+        self.assertEqual(0, self.append([200, 300], price=100.0))
+        # Changed candle replaces the stored one.
+        self.assertEqual(2, self.append([300, 400], price=110.0))
+        # Older history is logged too.
+        self.assertEqual(1, self.append([50]))
+
+        candles = self.store.read('MSFT', '5min')
+        self.assertEqual(
+            [50, 100, 200, 300, 400], candles['timestamp'].tolist()
+        )
+        self.assertEqual(110.0, candles['open'][3])
+
+    def test_compacted_candles_are_memory_mapped(self):
+        self.append([100, 200, 300, 400, 500])
+        candles = self.store.read('MSFT', '5min', start=200, end=400)
+        self.assertIsInstance(candles['close'], np.memmap)
+        self.assertEqual([200, 300, 400], candles['timestamp'].tolist())
+
+        # New store on same directory, like after a restart.
+        store = CandleStore(self.store.directory)
+        self.assertEqual(
+            [100, 200, 300, 400, 500],
+            store.read('MSFT', '5min')['timestamp'].tolist()
+        )
+
+    def test_only_logged_candles_in_range_are_merged(self):
+        self.append([100, 200, 300, 400])
+        self.append([500])
+        # Log has no candle in the range, so base is read without a copy.
+        candles = self.store.read('MSFT', '5min', start=100, end=300)
+        self.assertIsInstance(candles['close'], np.memmap)
+        self.assertEqual([100, 200, 300], candles['timestamp'].tolist())
+
+        self.assertEqual(1, self.append([200], price=110.0))
+        candles = self.store.read('MSFT', '5min', start=200)
+        self.assertEqual([200, 300, 400, 500], candles['timestamp'].tolist())
+        self.assertEqual(
+            [110.0, 100.0, 100.0, 100.0], candles['open'].tolist()
+        )
+
+    def test_reads_retry_when_generation_is_removed(self):
+        generation_path = os.path.join(
+            self.store.directory, '5min', 'MSFT', '1.timestamp'
+        )
+        self.append([100, 200, 300, 400])
+        self.append([500, 600, 700, 800])
+        # Previous generation is kept for readers until next compaction.
+        self.assertTrue(os.path.exists(generation_path))
+        self.append([900, 1000, 1100, 1200])
+        self.assertFalse(os.path.exists(generation_path))
+
+        # Reader which found the removed generation in the manifest.
+        read_manifest = CandleStore._read_manifest
+        manifests = iter([(1, 4)])
+        with mock.patch.object(
+            CandleStore, '_read_manifest', autospec=True,
+            side_effect=lambda store, path: next(manifests, None) or (
+                read_manifest(store, path)
+            )
+        ):
+            candles = CandleStore(self.store.directory).read('MSFT', '5min')
+        self.assertEqual(
+            list(range(100, 1300, 100)), candles['timestamp'].tolist()
+        )
+
+    def test_invalid_symbol_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.store.read('../MSFT', '5min')
+
+
+@override_settings(RESPONSE_COMPRESSION={
+    'ENCODINGS': ['zstd', 'br', 'gzip'],
+    'MIN_SIZE': 0,
+    'CACHE_MAX_BYTES': 1024 * 1024,
+})
+class ResponseCompressionTestCase(AuthenticatedUserTestCase):
+
+    def post_symbols(self, symbols, **extra):
+        with patch_upstream():
+            return self.api_client.post(
+                reverse('fetch_symbols_data'), {'symbols': symbols},
+                format='json', **extra
+            )
+
+    def test_response_is_compressed_when_accepted(self):
+        response = self.post_symbols(
+            ['MSFT'], HTTP_ACCEPT_ENCODING='gzip, deflate'
+        )
+        self.assertEqual('gzip', response['Content-Encoding'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(
+            ['MSFT'], json.loads(gzip.decompress(response.content))['symbols']
+        )
+
+        response = self.post_symbols(['MSFT'])
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(['MSFT'], response.json()['symbols'])
+
+    def test_identical_payloads_are_compressed_once(self):
+        self.post_symbols(['MSFT'], HTTP_ACCEPT_ENCODING='gzip')
+        self.post_symbols(['MSFT'], HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(1, compressed_body_cache.misses)
+        self.assertEqual(1, compressed_body_cache.hits)
+
+    def test_only_json_responses_are_compressed(self):
+        response = self.client.get(
+            reverse('admin:login'), HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertEqual(200, response.status_code)
+        self.assertGreater(len(response.content), 1024)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_encoding_is_chosen_by_quality_and_preference(self):
+        encodings = ['br', 'gzip']
+        self.assertEqual('gzip', choose_encoding('gzip', encodings))
+        self.assertEqual('br', choose_encoding('gzip, br', encodings))
+        self.assertEqual('gzip', choose_encoding('gzip, br;q=0.5', encodings))
+        self.assertEqual('br', choose_encoding('*', encodings))
+        self.assertIsNone(choose_encoding('gzip;q=0, identity', encodings))
+
+
+class FieldSelectionTestCase(AuthenticatedUserTestCase):
+
+    def post_fields(self, fields):
+        with patch_upstream():
+            return self.api_client.post(
+                reverse('fetch_symbols_data'),
+                {'symbols': ['MSFT', 'GOOG'], 'fields': fields},
+                format='json'
+            )
+
+    def test_only_asked_fields_are_returned(self):
+        full_response = self.post_fields(
+            ['latest_prices', 'candles', 'values']
+        ).json()
+
+        response = self.post_fields(['latest_prices'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({
+            'symbols': ['MSFT', 'GOOG'],
+            'latest_prices': full_response['latest_prices'],
+            'pending_symbols': [],
+            'pending_symbols_eta': {},
+        }, response.json())
+
+        response = self.post_fields(['candles'])
+        self.assertEqual(
+            full_response['candle_stick_graph_data'],
+            response.json()['candle_stick_graph_data']
+        )
+        self.assertNotIn('latest_prices', response.json())
+
+    def test_latest_prices_of_cached_symbols_decode_newest_candle(self):
+        self.post_fields(['latest_prices'])
+        with mock.patch.object(
+            CandleSeries, 'to_rows', autospec=True,
+            side_effect=CandleSeries.to_rows
+        ) as to_rows:
+            response = self.post_fields(['latest_prices'])
+        # Only the newest candle of each symbol is formatted.
+        self.assertEqual(
+            [1, 1], [len(call[0][0]) for call in to_rows.call_args_list]
+        )
+        self.assertEqual(
+            ['103.0000', '103.5000', '102.0000', '104.0000', '1000',
+             '2023-05-19 19:55:00'],
+            response.json()['latest_prices']['MSFT']
+        )
+
+    def test_unknown_field_is_rejected(self):
+        response = self.post_fields(['volume'])
+        self.assertEqual(response.status_code, 400)
+
+
+class CandleWindowTestCase(AuthenticatedUserTestCase):
+
+    def post_window(self, **window):
+        with patch_upstream():
+            return self.api_client.post(
+                reverse('fetch_symbols_data'),
+                {'symbols': ['MSFT'], 'fields': ['candles'], **window},
+                format='json'
+            )
+
+    def get_times(self, response):
+        return [
+            candle[-1]
+            for candle in response.json()['candle_stick_graph_data']['MSFT']
+        ]
+
+    def test_candles_are_limited_to_newest(self):
+        # Fetched from upstream, then served from cache.
+        for _ in range(2):
+            response = self.post_window(limit=2)
+            self.assertEqual(
+                ['2023-05-19 19:55:00', '2023-05-19 19:50:00'],
+                self.get_times(response)
+            )
+
+    def test_candles_are_limited_to_time_range(self):
+        self.post_window()
+        response = self.post_window(
+            start='2023-05-19 19:46:00', end='2023-05-19 19:50:00'
+        )
+        self.assertEqual(['2023-05-19 19:50:00'], self.get_times(response))
+
+        response = self.post_window(start='2023-05-19 19:45:00', limit=1)
+        self.assertEqual(['2023-05-19 19:55:00'], self.get_times(response))
+
+    def test_history_before_cached_candles_is_read_from_store(self):
+        self.post_window()
+        symbols_data_fetcher.get_candle_store().append(
+            'MSFT', '5min', {
+                'timestamp': np.array(
+                    ['2023-05-19 19:40:00'], dtype='datetime64[s]'
+                ),
+                'open': [99.0], 'high': [100.0], 'low': [98.0],
+                'close': [99.5], 'volume': [999],
+            }
+        )
+        response = self.post_window(
+            start='2023-05-19 19:40:00', end='2023-05-19 19:45:00'
+        )
+        self.assertEqual(
+            ['2023-05-19 19:45:00', '2023-05-19 19:40:00'],
+            self.get_times(response)
+        )
+
+    def test_invalid_window_is_rejected(self):
+        for window in (
+            {'start': 'yesterday'},
+            {'start': '2023-05-19T19:45:00+00:00'},
+            {'start': '2023-05-19 19:50:00', 'end': '2023-05-19 19:45:00'},
+            {'limit': 0},
+        ):
+            self.assertEqual(400, self.post_window(**window).status_code)
+
+
+@override_settings(PARSE_POOL={'ENABLED': True, 'WORKERS': 1, 'MIN_BATCH': 3})
+class ParsePoolTestCase(AuthenticatedUserTestCase):
+
+    def fetch_raw(self, symbols, interval, api_keys):
+        return [
+            json.dumps(payload).encode('utf-8')
+            for payload in fake_intraday_data(symbols, interval)
+        ]
+
+    def test_large_batches_are_parsed_in_worker_processes(self):
+        with mock.patch.object(
+            symbols_data_fetcher, 'fetch_symbols_raw_intraday_data',
+            side_effect=self.fetch_raw
+        ) as fetch_raw, patch_upstream() as fetch:
+            response = self.api_client.post(
+                reverse('fetch_symbols_data'),
+                {'symbols': ['MSFT', 'BLAHBLAHBLAH', 'GOOG']}, format='json'
+            )
+        fetch_raw.assert_called_once()
+        fetch.assert_not_called()
+        self.assertEqual(['MSFT', 'GOOG'], response.json()['symbols'])
+
+        inline_series = symbols_data_fetcher.parse_symbol_data(
+            build_intraday_payload('MSFT'), '5min'
+        )
+        self.assertEqual(
+            inline_series.to_rows(),
+            response.json()['candle_stick_graph_data']['MSFT']
+        )
+
+    def test_unparsable_payload_fails_alone(self):
+        def fetch_raw(symbols, interval, api_keys):
+            raw_payloads = self.fetch_raw(symbols, interval, api_keys)
+            raw_payloads[1] = b'{"Meta Data": '
+            return raw_payloads
+
+        with mock.patch.object(
+            symbols_data_fetcher, 'fetch_symbols_raw_intraday_data',
+            side_effect=fetch_raw
+        ), self.assertLogs(
+            'watch_list.wrapper.parse_pool', level='WARNING'
+        ):
+            response = self.post_symbols(['MSFT', 'AAPL', 'GOOG'])
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(['MSFT', 'GOOG'], response.json()['symbols'])
+        self.assertEqual(
+            1, symbols_data_fetcher.call_budget.metrics()[0]['errors']
+        )
+        # Symbol isn't cached, so it is fetched again on next request.
+        self.assertIsNone(symbols_data_fetcher.get_series_cache().get(
+            symbols_data_fetcher.get_symbol_cache_key('AAPL', '5min')
+        ))
+
+    def test_small_batches_are_parsed_inline(self):
+        with mock.patch.object(
+            symbols_data_fetcher, 'fetch_symbols_raw_intraday_data'
+        ) as fetch_raw:
+            response = self.post_symbols(['MSFT', 'GOOG'])
+        fetch_raw.assert_not_called()
+        self.assertEqual(['MSFT', 'GOOG'], response.json()['symbols'])
+
+
+class PriceAlertTestCase(AuthenticatedUserTestCase):
+
+    def setUp(self):
+        super().setUp()
+        reset_price_alert_engine()
+        self.addCleanup(reset_price_alert_engine)
+
+    def create_alert(self, symbol, direction, threshold):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.api_client.post(
+                reverse('price_alerts'),
+                {'symbol': symbol, 'direction': direction,
+                 'threshold': threshold},
+                format='json'
+            )
+
+    def test_index_pops_only_crossed_alerts(self):
+        index = PriceAlertIndex()
+        index.add_many([
+            (1, 'MSFT', PriceAlert.ABOVE, 110.0),
+            (2, 'MSFT', PriceAlert.ABOVE, 105.0),
+            (3, 'MSFT', PriceAlert.BELOW, 95.0),
+            (4, 'MSFT', PriceAlert.BELOW, 90.0),
+            (5, 'GOOG', PriceAlert.ABOVE, 100.0),
+        ])
+        index.add(6, 'MSFT', PriceAlert.ABOVE, 106.0)
+        self.assertTrue(index.remove(6, 'MSFT', PriceAlert.ABOVE, 106.0))
+        self.assertFalse(index.remove(6, 'MSFT', PriceAlert.ABOVE, 106.0))
+
+        self.assertEqual([], index.pop_crossed('MSFT', 96.0, 104.0))
+        self.assertEqual(
+            [(2, PriceAlert.ABOVE, 105.0), (3, PriceAlert.BELOW, 95.0)],
+            index.pop_crossed('MSFT', 95.0, 105.0)
+        )
+        self.assertEqual([], index.pop_crossed('MSFT', 95.0, 105.0))
+        self.assertEqual(3, len(index))
+
+    def test_ingested_candles_trigger_crossed_alerts(self):
+        # Newest candle of MSFT has low 102 and high 104.
+        for direction, threshold in (
+            ('above', 103.5), ('above', 110), ('below', 102.5), ('below', 90)
+        ):
+            response = self.create_alert('msft', direction, threshold)
+            self.assertEqual(201, response.status_code)
+            self.assertEqual('MSFT', response.json()['symbol'])
+
+        self.post_symbols(['MSFT'])
+
+        self.assertEqual(
+            [103.5, 102.5],
+            list(PriceAlert.objects.filter(
+                triggered_at__isnull=False
+            ).order_by('id').values_list('threshold', flat=True))
+        )
+        notifications = self.api_client.get(
+            reverse('alert_notifications')
+        ).json()['notifications']
+        self.assertEqual(
+            [('above', 103.5, 104.0), ('below', 102.5, 102.0)],
+            [
+                (notification['direction'], notification['threshold'],
+                 notification['price'])
+                for notification in notifications
+            ]
+        )
+        # Notifications are delivered once.
+        self.assertEqual([], self.api_client.get(
+            reverse('alert_notifications')
+        ).json()['notifications'])
+
+        # Newest alert first.
+        alerts = self.api_client.get(reverse('price_alerts')).json()['alerts']
+        self.assertEqual(
+            [True, False, True, False],
+            [alert['triggered_at'] is None for alert in alerts]
+        )
+
+    def test_deleted_and_already_triggered_alerts_are_not_triggered(self):
+        deleted_alert_id = self.create_alert('MSFT', 'above', 100).json()['id']
+        triggered_alert_id = self.create_alert(
+            'MSFT', 'below', 105
+        ).json()['id']
+        self.post_symbols(['GOOG'])
+        self.assertEqual(0, AlertNotification.objects.count())
+
+        response = self.api_client.delete(
+            reverse('price_alert_detail', args=[deleted_alert_id])
+        )
+        self.assertEqual(204, response.status_code)
+        # Like triggered by another process.
+        PriceAlert.objects.filter(pk=triggered_alert_id).update(
+            triggered_at=timezone.now()
+        )
+        self.post_symbols(['MSFT'])
+        self.assertEqual(0, AlertNotification.objects.count())
+
+    @override_settings(PRICE_ALERTS={'MAX_PER_USER': 1})
+    def test_alerts_per_user_are_limited(self):
+        self.assertEqual(
+            201, self.create_alert('MSFT', 'above', 200).status_code
+        )
+        self.assertEqual(
+            400, self.create_alert('MSFT', 'above', 300).status_code
+        )
+
+    def test_candles_are_evaluated_once(self):
+        self.post_symbols(['MSFT'])
+        # Only older candles have a low of 101 or below.
+        self.create_alert('MSFT', 'below', 101.5)
+        symbols_data_fetcher.get_series_cache().delete(
+            symbols_data_fetcher.get_symbol_cache_key('MSFT', '5min')
+        )
+        self.post_symbols(['MSFT'])
+        self.assertEqual(0, AlertNotification.objects.count())
+
+    def test_revised_newest_candle_is_evaluated_again(self):
+        self.create_alert('MSFT', 'above', 105)
+        engine = PriceAlertEngine()
+        for high in (104.0, 106.0):
+            series = CandleSeries(
+                'MSFT', [1, 2], [100.0, 103.0], [101.0, high], [99.0, 102.0],
+                [100.5, 103.5], [10, 10]
+            )
+            notifications = engine.evaluate({'MSFT': series}, '5min')
+        self.assertEqual([106.0], [
+            notification.price for notification in notifications
+        ])
+
+    def test_alerts_committed_late_are_loaded(self):
+        engine = PriceAlertEngine()
+        late_alert_id = self.create_alert('MSFT', 'above', 110).json()['id']
+        # Alert isn't visible to other processes until it is committed.
+        PriceAlert.objects.filter(pk=late_alert_id).update(
+            triggered_at=timezone.now()
+        )
+        self.create_alert('MSFT', 'above', 120)
+        engine.sync(force=True)
+        self.assertEqual(1, len(engine.index))
+
+        PriceAlert.objects.filter(pk=late_alert_id).update(triggered_at=None)
+        engine.sync(force=True)
+        engine.sync(force=True)
+        self.assertEqual(2, len(engine.index))
+
+
+class CorrelationTestCase(AuthenticatedUserTestCase):
+
+    def build_series(self, symbol, timestamps, closes):
+        return CandleSeries(
+            symbol, timestamps, closes, closes, closes, closes,
+            [0] * len(closes)
+        )
+
+    def test_series_are_aligned_on_common_timestamps(self):
+        timestamps, closes = correlation.align_closes([
+            self.build_series('A', [1, 2, 3, 5], [1.0, 2.0, 3.0, 5.0]),
+            self.build_series('B', [2, 3, 4, 5], [20.0, 30.0, 40.0, 50.0]),
+            self.build_series('C', [0, 2, 5, 6], [0.5, 200.0, 500.0, 600.0]),
+        ])
+        self.assertEqual([2, 5], timestamps.tolist())
+        self.assertEqual(
+            [[2.0, 5.0], [20.0, 50.0], [200.0, 500.0]], closes.tolist()
+        )
+
+    def test_statistics_match_direct_computation(self):
+        rng = np.random.default_rng(0)
+        returns = rng.normal(0, 0.01, size=(3, 50))
+
+        volatility = correlation.rolling_volatility(returns, 10)
+        self.assertTrue(np.isnan(volatility[:, :9]).all())
+        for end in range(10, 51):
+            np.testing.assert_allclose(
+                returns[:, end - 10:end].std(axis=1, ddof=1),
+                volatility[:, end - 1]
+            )
+        np.testing.assert_allclose(
+            np.corrcoef(returns), correlation.correlation_matrix(returns)
+        )
+
+    def test_correlation_of_watchlist_symbols(self):
+        self.post_symbols(['MSFT', 'GOOG'])
+        with mock.patch.object(
+            correlation, 'compute_correlation',
+            wraps=correlation.compute_correlation
+        ) as compute:
+            response = self.api_client.get(
+                reverse('watchlist_correlation'), {'window': 2}
+            )
+            cached_response = self.api_client.get(
+                reverse('watchlist_correlation'), {'window': 2}
+            )
+        self.assertEqual(200, response.status_code)
+        compute.assert_called_once()
+        self.assertEqual(response.json(), cached_response.json())
+
+        data = response.json()
+        self.assertEqual(['MSFT', 'GOOG'], data['symbols'])
+        self.assertEqual(
+            ['2023-05-19 19:50:00', '2023-05-19 19:55:00'], data['timestamps']
+        )
+        np.testing.assert_allclose(
+            [np.log(102.5 / 101.5), np.log(103.5 / 102.5)],
+            data['returns']['MSFT']
+        )
+        self.assertIsNone(data['volatility']['MSFT'][0])
+        np.testing.assert_allclose([[1, 1], [1, 1]], data['correlation'])
+        self.assertEqual([], data['pending_symbols'])
+
+    def test_cache_key_changes_when_newest_candle_is_revised(self):
+        keys = {
+            correlation.get_correlation_cache_key(
+                [self.build_series('A', [1, 2], [1.0, close])], '5min', 2, None
+            )
+            for close in (2.0, 2.5, 2.5)
+        }
+        self.assertEqual(2, len(keys))
+
+    def test_correlation_of_stored_watchlist_symbols(self):
+        self.post_symbols(['MSFT', 'GOOG'])
+        # Written by another process, while the token is cached.
+        WatchList.objects.filter(user=self.user).update(symbols=['MSFT'])
+        response = self.api_client.get(
+            reverse('watchlist_correlation'), {'window': 2}
+        )
+        self.assertEqual(['MSFT'], response.json()['symbols'])
+
+    def test_correlation_requests_are_admission_controlled(self):
+        controller = AdmissionController(1, 1, 5.0)
+        patcher = mock.patch.object(
+            admission, '_admission_controller', controller
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        def wait():
+            with controller.admit():
+                pass
+
+        done, holder = hold_admission(controller)
+        waiter = threading.Thread(target=wait)
+        waiter.start()
+        while controller.metrics()['waiting'] < 1:
+            time.sleep(0.001)
+
+        response = self.api_client.get(
+            reverse('watchlist_correlation'), {'window': 2}
+        )
+        done.set()
+        holder.join()
+        waiter.join()
+        self.assertEqual(503, response.status_code)
+
+
+class IntradayDecoderTestCase(SimpleTestCase):
+
+    def test_chunked_payload_is_decoded_like_whole_payload(self):
+        payload = build_intraday_payload('MSFT', bars=12)
+        raw_payload = json.dumps(payload, indent=4).encode('utf-8')
+        expected_series = CandleSeries.from_payload(payload, '5min')
+
+        for chunk_size in (1, 7, len(raw_payload)):
+            status, series = decode_intraday_payload(
+                raw_payload, '5min', chunk_size=chunk_size
+            )
+            self.assertEqual('parsed', status)
+            self.assertEqual(expected_series, series)
+
+        # Blocks smaller than the payload are converted as they fill.
+        decoder = IntradayDecoder('5min', block_size=5)
+        decoder.feed(raw_payload)
+        self.assertEqual(expected_series, decoder.close()[1])
+
+    def test_quota_note_and_error_message_are_recognised(self):
+        for payload, expected_status in (
+            ({'Note': 'Thank you for using Alpha Vantage!'}, 'quota_reached'),
+            ({'Error Message': 'Invalid API call.'}, 'invalid'),
+        ):
+            self.assertEqual(
+                (expected_status, None), decode_payloads([payload], '5min')[0]
+            )
+
+    def test_invalid_payloads_are_rejected(self):
+        raw_payload = json.dumps(build_intraday_payload('MSFT')).encode()
+        missing_volume = build_intraday_payload('MSFT')
+        del missing_volume['Time Series (5min)'][
+            '2023-05-19 19:55:00'
+        ]['5. volume']
+
+        for invalid_payload in (
+            raw_payload[:-10], raw_payload + b'{}', b'[]',
+            json.dumps(missing_volume).encode(),
+            json.dumps({'Meta Data': {'2. Symbol': 'MSFT'}}).encode(),
+        ):
+            with self.assertRaises(ValueError):
+                decode_intraday_payload(invalid_payload, '5min', chunk_size=16)
+
+
+class CassetteTestCase(SimpleTestCase):
+
+    def setUp(self):
+        cassette_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cassette_dir.cleanup)
+        self.path = os.path.join(cassette_dir.name, 'upstream.jsonl.gz')
+
+    def fetch_from_local_server(self, paths):
+        """Fetches paths of a local http server with `fetch_urls_raw_data`,
+        returns the urls and their bodies. Server is stopped afterwards.
+        """
+
+        async def handle(request):
+            return web.Response(body=request.query['symbol'].encode())
+
+        async def fetch():
+            app = web.Application()
+            app.router.add_get('/query', handle)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            urls = [
+                'http://127.0.0.1:{}{}'.format(port, path) for path in paths
+            ]
+            try:
+                return urls, await fetch_urls_raw_data(urls)
+            finally:
+                await runner.cleanup()
+
+        return asyncio.run(fetch())
+
+    def test_recorded_responses_are_replayed_without_network(self):
+        with override_settings(UPSTREAM_CASSETTE={
+            'MODE': 'record', 'PATH': self.path
+        }):
+            urls, bodies = self.fetch_from_local_server(
+                ['/query?symbol=MSFT&apikey=KEY1', '/query?symbol=GOOG']
+            )
+        self.assertEqual([b'MSFT', b'GOOG'], bodies)
+
+        with gzip.open(self.path, 'rt') as cassette_file:
+            self.assertNotIn('KEY1', cassette_file.read())
+
+        with override_settings(UPSTREAM_CASSETTE={
+            'MODE': 'replay', 'PATH': self.path, 'REPLAY_TIMING': 'fast'
+        }):
+            # Server is down, and keys don't have to match.
+            self.assertEqual([b'GOOG', b'MSFT'], asyncio.run(
+                fetch_urls_raw_data([
+                    urls[1], urls[0].replace('KEY1', 'KEY2')
+                ])
+            ))
+
+    def test_responses_are_replayed_in_order_of_recording(self):
+        cassette = Cassette(self.path, 'record')
+        cassette.record('http://api/query?symbol=MSFT', 200, b'first', 0.5)
+        cassette.record('http://api/query?symbol=MSFT', 200, b'second', 0.5)
+
+        cassette = Cassette(self.path, 'replay')
+        url = 'http://api/query?symbol=MSFT'
+        self.assertEqual((b'first', 0.5), cassette.replay(url))
+        self.assertEqual((b'second', 0.5), cassette.replay(url))
+        # Last response is replayed again.
+        self.assertEqual((b'second', 0.5), cassette.replay(url))
+        self.assertEqual(
+            (b'first', 0.0),
+            Cassette(self.path, 'replay', 'fast').replay(url)
+        )
+        with self.assertRaises(LookupError):
+            cassette.replay('http://api/query?symbol=GOOG')
+
+
+class FakeProvider:
+    """Local alpha avantage like provider, served by a thread while in a
+    `with` block. Calls with keys of `exhausted_keys` get a quota note, and
+    responses take `delay` seconds. Calls for `failing_symbols` get an html
+    error page.
+    """
+
+    def __init__(self, exhausted_keys=(), delay=0.0, failing_symbols=()):
+        self.exhausted_keys = set(exhausted_keys)
+        self.failing_symbols = set(failing_symbols)
+        self.delay = delay
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.url = None
+        self._ready = threading.Event()
+
+    async def handle(self, request):
+        symbol, api_key = request.query['symbol'], request.query['apikey']
+        self.calls.append((symbol, api_key))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        if symbol in self.failing_symbols:
+            return web.Response(
+                text='<html><body>502 Bad Gateway</body></html>',
+                content_type='text/html'
+            )
+        if api_key in self.exhausted_keys:
+            payload = {'Note': 'Thank you for using Alpha Vantage!'}
+        else:
+            payload = build_intraday_payload(symbol)
+        return web.json_response(payload)
+
+    def __enter__(self):
+        self._loop = asyncio.new_event_loop()
+
+        async def start():
+            app = web.Application()
+            app.router.add_get('/query', self.handle)
+            self._runner = web.AppRunner(app)
+            await self._runner.setup()
+            site = web.TCPSite(self._runner, '127.0.0.1', 0)
+            await site.start()
+            self.url = 'http://127.0.0.1:{}/query'.format(
+                site._server.sockets[0].getsockname()[1]
+            )
+            self._ready.set()
+
+        def serve():
+            self._loop.run_until_complete(start())
+            self._loop.run_forever()
+            self._loop.run_until_complete(self._runner.cleanup())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=serve, daemon=True)
+        self._thread.start()
+        self._ready.wait(5)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+
+
+@override_settings(UPSTREAM_CASSETTE={'MODE': None})
+class ApiKeyPoolTestCase(AuthenticatedUserTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.key_pool = ApiKeyPool(
+            ['KEY1', 'KEY2'], 2, period=60, quarantine=120,
+            clock=lambda: self.now
+        )
+        patcher = mock.patch.object(
+            symbols_data_fetcher, 'call_budget', self.key_pool
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fetch(self, provider, symbols):
+        granted = self.key_pool.acquire(len(symbols))
+        with override_settings(ALPHA_AVANTAGE_API_URL=provider.url):
+            return symbols_data_fetcher.fetch_symbols_into_cache(
+                symbols[:granted], '5min'
+            )
+
+    def test_calls_are_spread_over_least_loaded_keys(self):
+        self.assertEqual(4, self.key_pool.available())
+        with FakeProvider() as provider:
+            parsed_symbols_data, limited_symbols = self.fetch(
+                provider, ['MSFT', 'GOOG', 'TSLA', 'AMZN', 'NFLX']
+            )
+        self.assertEqual(
+            ['MSFT', 'GOOG', 'TSLA', 'AMZN'], list(parsed_symbols_data)
+        )
+        self.assertEqual(
+            ['KEY1', 'KEY2', 'KEY1', 'KEY2'],
+            [api_key for symbol, api_key in provider.calls]
+        )
+        self.assertEqual(0, self.key_pool.available())
+        self.assertEqual(0.0, self.key_pool.eta(0) - 60)
+
+    def test_key_with_quota_note_is_quarantined(self):
+        with FakeProvider(exhausted_keys={'KEY2'}) as provider:
+            parsed_symbols_data, limited_symbols = self.fetch(
+                provider, ['MSFT', 'GOOG']
+            )
+            self.assertEqual(['MSFT'], list(parsed_symbols_data))
+            self.assertEqual(['GOOG'], limited_symbols)
+
+            # Only the healthy key is used, until quarantine is over.
+            self.assertEqual(1, self.key_pool.available())
+            self.now = 60.0
+            self.fetch(provider, ['GOOG', 'TSLA', 'AMZN'])
+        self.assertEqual(
+            ['KEY1', 'KEY1'],
+            [api_key for symbol, api_key in provider.calls[2:]]
+        )
+        self.now = 119.0
+        self.assertEqual(0, self.key_pool.available())
+        self.now = 120.0
+        self.assertEqual(4, self.key_pool.available())
+
+        metrics = {
+            key_metrics['key']: key_metrics
+            for key_metrics in self.key_pool.metrics()
+        }
+        self.assertEqual(3, metrics['KEY1***']['calls'])
+        self.assertEqual(1, metrics['KEY2***']['quota_notes'])
+
+    def test_undecodable_response_fails_alone(self):
+        with FakeProvider(failing_symbols={'BAD'}) as provider:
+            with self.assertLogs(symbols_data_fetcher.logger, 'WARNING'):
+                parsed_symbols_data, limited_symbols = self.fetch(
+                    provider, ['MSFT', 'BAD', 'IBM']
+                )
+        self.assertEqual(['MSFT', 'IBM'], list(parsed_symbols_data))
+        self.assertEqual([], limited_symbols)
+        self.assertEqual(3, len(provider.calls))
+        self.assertEqual(1, sum(
+            key_metrics['errors'] for key_metrics in self.key_pool.metrics()
+        ))
+        # Symbol isn't cached, so it is fetched again on next request.
+        self.assertIsNone(symbols_data_fetcher.get_series_cache().get(
+            symbols_data_fetcher.get_symbol_cache_key('BAD', '5min')
+        ))
+
+    def test_windows_and_quarantines_are_shared_by_processes(self):
+        state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(state_dir.cleanup)
+        # Pools of two worker processes of the host.
+        key_pools = [
+            ApiKeyPool(
+                ['KEY1', 'KEY2'], 2, period=60, quarantine=120,
+                clock=lambda: self.now, state_dir=state_dir.name
+            )
+            for _ in range(2)
+        ]
+
+        self.assertEqual(1, key_pools[0].acquire(1))
+        self.assertEqual(3, key_pools[1].available())
+        key_pools[0].report('KEY2', QUOTA_REACHED)
+        self.assertEqual(1, key_pools[1].available())
+        self.assertEqual(['KEY1'], key_pools[1].take_keys(1))
+        self.now = 120.0
+        self.assertEqual(4, key_pools[1].available())
+
+    def test_pool_without_keys_is_improperly_configured(self):
+        key_pool = ApiKeyPool([], 5)
+        with self.assertRaises(ImproperlyConfigured):
+            key_pool.available()
+        with self.assertRaises(ImproperlyConfigured):
+            key_pool.acquire(1)
+
+    def test_metrics_are_only_served_to_staff(self):
+        response = self.api_client.get(reverse('upstream_key_metrics'))
+        self.assertEqual(403, response.status_code)
+
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        token_cache.clear()
+        response = self.api_client.get(reverse('upstream_key_metrics'))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            ['KEY1***', 'KEY2***'],
+            [key_metrics['key'] for key_metrics in response.json()['keys']]
+        )
+
+
+def hold_admission(controller):
+    """Holds a slot of an admission controller in a thread, until the
+    returned event is set. Returns the event and the thread.
+    """
+
+    admitted, done = threading.Event(), threading.Event()
+
+    def hold():
+        with controller.admit():
+            admitted.set()
+            done.wait(5)
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    admitted.wait(5)
+    return done, thread
+
+
+@override_settings(UPSTREAM_CASSETTE={'MODE': None})
+class LoadControlTestCase(AuthenticatedUserTestCase):
+
+    def test_outbound_requests_are_bounded_per_provider(self):
+        with FakeProvider(delay=0.05) as provider, override_settings(
+            UPSTREAM_CONCURRENCY={'MAX_CONCURRENT': 2}
+        ):
+            urls = [
+                '{}?symbol=SYM{}&apikey=KEY'.format(provider.url, index)
+                for index in range(6)
+            ]
+            # Every thread runs its own event loop, like requests do.
+            threads = [
+                threading.Thread(
+                    target=asyncio.run, args=(fetch_urls_raw_data(urls),)
+                )
+                for _ in range(2)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            metrics = get_outbound_metrics()
+
+        self.assertEqual(12, len(provider.calls))
+        self.assertEqual(2, provider.max_in_flight)
+        host_metrics = metrics[provider.url.split('/')[2]]
+        self.assertEqual(2, host_metrics['limit'])
+        self.assertEqual(12, host_metrics['acquired'])
+        self.assertEqual(0, host_metrics['in_flight'])
+        self.assertEqual(0, host_metrics['waiting'])
+        self.assertGreaterEqual(host_metrics['max_waiting'], 4)
+
+    def test_cancelled_waiter_gives_up_its_turn(self):
+        limiter = ConcurrencyLimiter(1)
+
+        async def run():
+            await limiter.acquire()
+            waiter = asyncio.ensure_future(limiter.acquire())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiter
+            limiter.release()
+            await asyncio.wait_for(limiter.acquire(), 1)
+            limiter.release()
+
+        asyncio.run(run())
+        self.assertEqual(0, limiter.in_flight)
+        self.assertEqual(0, limiter.metrics()['waiting'])
+
+    def test_requests_over_queue_are_shed_with_retry_after(self):
+        controller = AdmissionController(1, 1, 5.0)
+        patcher = mock.patch.object(
+            admission, '_admission_controller', controller
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        def wait():
+            with controller.admit():
+                pass
+
+        done, holder = hold_admission(controller)
+        waiter = threading.Thread(target=wait)
+        waiter.start()
+        while controller.metrics()['waiting'] < 1:
+            time.sleep(0.001)
+
+        response = self.post_symbols(['MSFT'])
+        self.assertEqual(503, response.status_code)
+        self.assertEqual('1', response['Retry-After'])
+        done.set()
+        holder.join()
+        waiter.join()
+
+        metrics = controller.metrics()
+        self.assertEqual(1, metrics['rejected'])
+        self.assertEqual(2, metrics['admitted'])
+
+    def test_long_estimated_wait_is_shed_before_queue_is_full(self):
+        controller = AdmissionController(1, 10, 1.0)
+        controller.service_time = 3.0
+        done, holder = hold_admission(controller)
+        with self.assertRaises(Overloaded) as raised:
+            with controller.admit():
+                pass
+        done.set()
+        holder.join()
+        self.assertEqual(3, raised.exception.wait)
+        self.assertEqual(1, controller.metrics()['rejected'])
+
+    def test_waiting_request_times_out(self):
+        controller = AdmissionController(1, 10, 0.05)
+        done, holder = hold_admission(controller)
+        with self.assertRaises(Overloaded):
+            with controller.admit():
+                pass
+        done.set()
+        holder.join()
+
+        metrics = controller.metrics()
+        self.assertEqual(1, metrics['timed_out'])
+        self.assertEqual(0, metrics['waiting'])
+        with controller.admit():
+            self.assertEqual(1, controller.metrics()['in_flight'])
+
+    def test_symbols_data_is_served_when_admitted(self):
+        response = self.post_symbols(['MSFT'])
+        self.assertEqual(200, response.status_code)
+        metrics = admission.get_admission_controller().metrics()
+        self.assertEqual(0, metrics['in_flight'])
+        self.assertGreater(metrics['service_time'], 0)
+
+    def test_load_metrics_are_only_served_to_staff(self):
+        response = self.api_client.get(reverse('load_metrics'))
+        self.assertEqual(403, response.status_code)
+
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        token_cache.clear()
+        with override_settings(ADMISSION_CONTROL={'MAX_CONCURRENT': 4}):
+            response = self.api_client.get(reverse('load_metrics'))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(4, response.json()['admission']['max_concurrent'])
+        self.assertIn('outbound', response.json())
+
+
+class FairShareTestCase(AuthenticatedUserTestCase):
+
+    def test_sliding_window_counts_previous_window_by_overlap(self):
+        now = [0.0]
+        counter = SlidingWindowCounter(3, 60, clock=lambda: now[0])
+        self.assertEqual([0, 0, 0], [counter.hit('user') for _ in range(3)])
+        self.assertEqual(60.0, counter.hit('user'))
+        self.assertEqual(0, counter.hit('other'))
+
+        # Requests of previous window still fill the sliding window.
+        now[0] = 60.0
+        self.assertGreater(counter.hit('user'), 0)
+        now[0] = 61.0
+        self.assertEqual(0, counter.hit('user'))
+        now[0] = 70.0
+        self.assertAlmostEqual(10.0, counter.hit('user'))
+
+        # Idle counters are dropped.
+        now[0] = 200.0
+        counter.hit('user')
+        self.assertEqual(['user'], list(counter._counters))
+
+    def test_idle_counters_are_dropped_a_few_per_request(self):
+        now = [0.0]
+        counter = SlidingWindowCounter(3, 60, clock=lambda: now[0])
+        for user in range(20):
+            counter.hit(user)
+
+        now[0] = 130.0
+        counter.hit('user')
+        # Only a few idle counters are dropped by a single request.
+        self.assertEqual(21 - PRUNE_BATCH, len(counter._counters))
+        counter.hit('user')
+        counter.hit('user')
+        self.assertEqual(['user'], list(counter._counters))
+
+    def test_wait_until_requests_leave_sliding_window(self):
+        self.assertEqual(0.0, get_sliding_window_wait(10, 60, 30, 4, 10))
+        self.assertAlmostEqual(
+            6.0, get_sliding_window_wait(10, 60, 30, 6, 10)
+        )
+        self.assertAlmostEqual(
+            60.0, get_sliding_window_wait(10, 60, 30, 20, 0)
+        )
+
+    def test_cache_counter_is_shared_by_counters(self):
+        now = [120.0]
+        cache = caches['default']
+        cache.clear()
+        self.addCleanup(cache.clear)
+        counters = [
+            CacheSlidingWindowCounter(2, 60, cache, clock=lambda: now[0])
+            for _ in range(2)
+        ]
+        self.assertEqual(0, counters[0].hit(7))
+        self.assertEqual(0, counters[1].hit(7))
+        self.assertEqual(60.0, counters[0].hit(7))
+        now[0] = 210.0
+        self.assertEqual(0, counters[1].hit(7))
+        self.assertGreater(counters[0].hit(7), 0)
+
+    @override_settings(SYMBOLS_DATA_THROTTLE={'RATE': '2/m'})
+    def test_requests_beyond_rate_of_user_are_throttled(self):
+        self.assertEqual(200, self.post_symbols(['MSFT']).status_code)
+        self.assertEqual(200, self.post_symbols(['MSFT']).status_code)
+        response = self.post_symbols(['MSFT'])
+        self.assertEqual(429, response.status_code)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+
+        # Other users have their own rate.
+        other_client = APIClient()
+        other_client.post(reverse('register_user'), {
+            **self.SAMPLE_USER_DATA,
+            'username': 'other_user', 'email': 'other@gmail.com'
+        })
+        other_user = User.objects.get(username='other_user')
+        other_client.credentials(HTTP_AUTHORIZATION='Token ' + (
+            Token.objects.get_or_create(user=other_user)[0].key
+        ))
+        with patch_upstream():
+            response = other_client.post(
+                reverse('fetch_symbols_data'), {'symbols': ['MSFT']},
+                format='json'
+            )
+        self.assertEqual(200, response.status_code)
+
+    @override_settings(SYMBOLS_DATA_THROTTLE={'RATE': '2/m'})
+    def test_correlation_requests_share_rate_of_user(self):
+        self.assertEqual(200, self.post_symbols(['MSFT']).status_code)
+        response = self.api_client.get(
+            reverse('watchlist_correlation'), {'window': 2}
+        )
+        self.assertEqual(200, response.status_code)
+        response = self.api_client.get(
+            reverse('watchlist_correlation'), {'window': 2}
+        )
+        self.assertEqual(429, response.status_code)
+
+    def test_throttle_check_makes_no_query(self):
+        throttle = SymbolsDataRateThrottle()
+        request = mock.Mock(user=self.user)
+        with self.assertNumQueries(0):
+            self.assertTrue(throttle.allow_request(request, None))
+
+    def test_queued_symbols_of_owners_are_fetched_in_turns(self):
+        self.call_budget.acquire(5)
+        etas = self.fetch_pipeline.schedule(
+            ['A1', 'A2', 'A3', 'A4', 'A5', 'A6', 'A7'], '5min', owner=1
+        )
+        self.assertEqual(120.0, etas['A7'])
+        # Symbols of other owner don't wait for every symbol of first one.
+        etas = self.fetch_pipeline.schedule(['B1', 'B2'], '5min', owner=2)
+        self.assertEqual({'B1': 60.0, 'B2': 60.0}, etas)
+        self.assertEqual(1, self.fetch_pipeline.other_owners_count(1))
+
+        self.now = 60.0
+        with mock.patch.object(
+            self.fetch_pipeline, 'fetch_batch', return_value=['B2']
+        ) as fetch_batch:
+            self.assertEqual(5, self.fetch_pipeline.run_once())
+        self.assertEqual(
+            ['A1', 'B1', 'A2', 'B2', 'A3'], fetch_batch.call_args[0][0]
+        )
+
+        # Symbol fetched again is queued again, after the other owner's turn.
+        self.now = 120.0
+        with mock.patch.object(
+            self.fetch_pipeline, 'fetch_batch', return_value=[]
+        ) as fetch_batch:
+            self.fetch_pipeline.run_once()
+        self.assertEqual(
+            ['A4', 'B2', 'A5', 'A6', 'A7'], fetch_batch.call_args[0][0]
+        )
+        self.assertEqual(0, self.fetch_pipeline.pending_count())
+
+    def test_request_takes_fair_share_while_others_are_queued(self):
+        self.fetch_pipeline.schedule(['AAPL'], '5min', owner='other')
+
+        response = self.post_symbols(['MSFT', 'GOOG', 'TSLA', 'IBM', 'AMZN'])
+        self.assertEqual(['MSFT', 'GOOG', 'TSLA'], response.json()['symbols'])
+        self.assertEqual(['IBM', 'AMZN'], response.json()['pending_symbols'])
+
+        with patch_upstream() as fetch:
+            self.assertEqual(2, self.fetch_pipeline.run_once())
+        self.assertEqual(['AAPL', 'IBM'], fetch.call_args[0][0])
+
+
+def market_time(text, time_zone='America/New_York'):
+    """Returns the timestamp of a local time of an exchange."""
+
+    return datetime.fromisoformat(text).replace(
+        tzinfo=ZoneInfo(time_zone)
+    ).timestamp()
+
+
+class RefreshSchedulerTestCase(AuthenticatedUserTestCase):
+
+    def build_scheduler(self):
+        self.refresh = mock.Mock()
+        return RefreshScheduler(
+            get_market_calendar(), self.refresh, clock=lambda: self.now,
+            autostart=False
+        )
+
+    def refreshed_symbols(self):
+        return [call[0][0] for call in self.refresh.call_args_list]
+
+    def test_calendar_knows_weekends_holidays_and_early_closes(self):
+        calendar = get_market_calendar()
+        us = calendar.for_symbol('MSFT')
+        self.assertEqual('US', us.name)
+        self.assertEqual('US', calendar.for_symbol('BRK.B').name)
+        self.assertTrue(us.is_open(market_time('2026-11-23 09:30')))
+        self.assertFalse(us.is_open(market_time('2026-11-23 09:29')))
+        self.assertFalse(us.is_open(market_time('2026-11-23 16:00')))
+        # Thanksgiving is closed, and next day closes early.
+        self.assertFalse(us.is_open(market_time('2026-11-26 12:00')))
+        self.assertTrue(us.is_open(market_time('2026-11-27 12:59')))
+        self.assertFalse(us.is_open(market_time('2026-11-27 13:00')))
+        self.assertFalse(us.is_open(market_time('2026-11-28 12:00')))
+        self.assertEqual(
+            market_time('2026-11-27 09:30'),
+            us.next_open(market_time('2026-11-25 17:00'))
+        )
+        self.assertEqual(
+            market_time('2026-11-27 13:00'),
+            us.last_close(market_time('2026-11-29 12:00'))
+        )
+
+        lse = calendar.for_symbol('TSCO.LON')
+        self.assertEqual('LSE', lse.name)
+        self.assertTrue(
+            lse.is_open(market_time('2026-11-26 08:00', 'Europe/London'))
+        )
+
+    def test_closed_market_defers_refresh_to_next_open(self):
+        scheduler = self.build_scheduler()
+        self.now = market_time('2026-11-28 12:00')
+        scheduler.set_watchers({'MSFT': 20, 'TSCO.LON': 20})
+        # Candles of the last session are refreshed once.
+        self.assertEqual(2, scheduler.run_once())
+        self.assertEqual(
+            market_time('2026-11-30 08:00', 'Europe/London'),
+            scheduler.next_due()
+        )
+
+        self.now = market_time('2026-11-30 08:00', 'Europe/London')
+        self.assertEqual(1, scheduler.run_once())
+        self.assertEqual(
+            market_time('2026-11-30 08:05', 'Europe/London'),
+            scheduler.next_due()
+        )
+        self.assertEqual(
+            [['MSFT', 'TSCO.LON'], ['TSCO.LON']], self.refreshed_symbols()
+        )
+
+    def test_symbols_are_refreshed_once_after_close(self):
+        scheduler = self.build_scheduler()
+        self.now = market_time('2026-11-27 12:55')
+        scheduler.set_watchers({'MSFT': 20})
+        self.assertEqual(1, scheduler.run_once())
+        self.assertEqual(
+            market_time('2026-11-27 13:01'), scheduler.next_due()
+        )
+        self.now = market_time('2026-11-27 13:01')
+        self.assertEqual(1, scheduler.run_once())
+        self.assertEqual(
+            market_time('2026-11-30 09:30'), scheduler.next_due()
+        )
+
+    def test_symbols_in_demand_are_refreshed_more_often(self):
+        scheduler = self.build_scheduler()
+        self.assertEqual(300, scheduler.get_refresh_interval(20))
+        self.assertEqual(1500, scheduler.get_refresh_interval(2))
+        self.assertEqual(3600, scheduler.get_refresh_interval(0.5))
+        self.assertIsNone(scheduler.get_refresh_interval(0))
+
+        start = market_time('2026-11-23 10:00')
+        self.now = start
+        scheduler.set_watchers({'HOT': 20, 'COLD': 2})
+        while self.now <= start + 3600:
+            scheduler.run_once()
+            self.now += 60
+        refreshed = sum(self.refreshed_symbols(), [])
+        self.assertEqual(13, refreshed.count('HOT'))
+        self.assertEqual(3, refreshed.count('COLD'))
+
+    def test_requested_symbols_are_dropped_once_demand_decays(self):
+        scheduler = self.build_scheduler()
+        self.now = market_time('2026-11-23 10:00')
+        scheduler.record_requests(['IBM'])
+        # Request served the symbol, so it is not due right away.
+        self.assertEqual(0, scheduler.run_once())
+        self.assertEqual(
+            market_time('2026-11-23 10:50'), scheduler.next_due()
+        )
+
+        self.now = market_time('2026-11-24 09:30')
+        self.assertEqual(0, scheduler.run_once())
+        self.assertEqual(0, scheduler.scheduled_count())
+        self.assertIsNone(scheduler.next_due())
+        self.refresh.assert_not_called()
+
+    def test_only_fetched_symbols_count_as_refreshed(self):
+        scheduler = self.build_scheduler()
+        self.now = market_time('2026-11-23 10:00')
+        scheduler.set_watchers({'COLD': 2})
+        self.assertEqual(1, scheduler.run_once())
+
+        # Request may be served from cache, it doesn't delay the refresh.
+        self.now = market_time('2026-11-23 10:20')
+        scheduler.record_requests(['COLD'])
+        self.assertEqual(self.now, scheduler.next_due())
+        scheduler.record_refreshes(['COLD', 'UNKNOWN'])
+        self.assertEqual(self.now + 1000, scheduler.next_due())
+        self.assertEqual(1, scheduler.scheduled_count())
+
+    def test_scheduler_runs_in_leader_process(self):
+        state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(state_dir.cleanup)
+        self.refresh = mock.Mock()
+        # Schedulers of two worker processes of the host.
+        schedulers = [
+            RefreshScheduler(
+                get_market_calendar(), self.refresh, clock=lambda: self.now,
+                leadership=SchedulerLeadership(state_dir.name),
+                autostart=False
+            )
+            for _ in range(2)
+        ]
+        self.now = market_time('2026-11-23 10:00')
+        schedulers[0].record_requests(['IBM'])
+        self.addCleanup(schedulers[0].leadership._lock_file.close)
+        schedulers[1].record_requests(['MSFT', 'MSFT'])
+        self.assertFalse(schedulers[1].leadership.is_leader())
+        self.assertEqual(0, schedulers[1].scheduled_count())
+
+        schedulers[0]._take_over()
+        self.assertEqual(2, schedulers[0].scheduled_count())
+        self.assertEqual(2, schedulers[0].get_demand('MSFT', self.now))
+        self.assertEqual(({}, {}), schedulers[0].leadership.take_over())
+
+    @override_settings(REFRESH_SCHEDULER={'ENABLED': True})
+    def test_requests_are_recorded_without_queries(self):
+        with mock.patch.object(RefreshScheduler, '_start_worker'):
+            scheduler = get_refresh_scheduler()
+            self.assertEqual(200, self.post_symbols(['MSFT']).status_code)
+            with self.assertNumQueries(0):
+                symbols_data_fetcher.symbols_data_requested.send(
+                    sender=CandleSeries, symbols=['GOOG'], interval='5min'
+                )
+            symbols_data_fetcher.symbols_data_requested.send(
+                sender=CandleSeries, symbols=['TSLA'], interval='1min'
+            )
+        self.assertEqual(['GOOG', 'MSFT'], sorted(scheduler._due))
+
+    def test_only_uncached_symbols_are_queued_for_refresh(self):
+        self.post_symbols(['MSFT'])
+        refresh_symbols(['MSFT', 'GOOG'])
+        self.assertEqual(1, self.fetch_pipeline.pending_count())
+        # Refreshes are queued as an owner of their own.
+        self.assertEqual(
+            0, self.fetch_pipeline.other_owners_count(REFRESH_OWNER)
+        )
+
+
+class ImportBudgetTestCase(SimpleTestCase):
+
+    # Budget of a web worker boot, well above what it takes without heavy
+    # dependencies (about 0.5 s and 45 MB), numpy alone adds 20 MB.
+    MAX_SECONDS = 2.0
+    MAX_RSS_GROWTH = 56 * 1024 * 1024
+
+    def test_wsgi_boot_is_within_budget(self):
+        result = measure_imports(['stockmonitor.wsgi', 'stockmonitor.urls'])
+        self.assertEqual([], result['heavy_modules'])
+        self.assertLess(result['seconds'], self.MAX_SECONDS)
+        self.assertLess(result['rss_growth'], self.MAX_RSS_GROWTH)
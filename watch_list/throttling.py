@@ -0,0 +1,306 @@
+"""
+Module that defines the per user throttle of `watchList/symbols-data` and
+`watchList/correlation` requests, with a sliding window counter.
+
+A sliding window counter keeps only the number of requests of the current
+fixed window and of the previous one for each user, and estimates the
+number of requests of the last `window` seconds as the current count plus
+the previous count weighted by how much of the previous window is still in
+the sliding window. So the memory per user and the time of a check are
+constant, unlike keeping the time of every request (like DRF's
+`SimpleRateThrottle` does), and a check costs microseconds and no query.
+
+Counts are kept in process, or in a cache backend shared by worker
+processes when `CACHE_ALIAS` is set.
+
+Settings:
+    SYMBOLS_DATA_THROTTLE (Dict[str, Any]): Configuration of the throttle.
+        Like below:
+        - ENABLED (bool): Whether requests are throttled (default: True).
+        - RATE (str): Max requests of a user, as `<count>/<period>` where
+            period is `s`, `m`, `h` or `d` (default: '60/m').
+        - CACHE_ALIAS (Optional[str]): Cache backend of counts, counts are
+            kept in process when not set (default: None).
+"""
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework.throttling import BaseThrottle
+
+from collections import OrderedDict
+import threading
+import time
+
+
+DEFAULT_SYMBOLS_DATA_THROTTLE_SETTINGS = {
+    'ENABLED': True,
+    'RATE': '60/m',
+    'CACHE_ALIAS': None,
+}
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Seconds to wait of a request which is not allowed.
+MIN_WAIT = 0.001
+
+# Max number of expired counters dropped by a request.
+PRUNE_BATCH = 8
+
+
+def get_symbols_data_throttle_settings():
+    """Returns the symbols data throttle settings merged over defaults.
+
+    Returns:
+        Dict[str, Any]: Symbols data throttle settings.
+    """
+
+    return {
+        **DEFAULT_SYMBOLS_DATA_THROTTLE_SETTINGS,
+        **getattr(settings, 'SYMBOLS_DATA_THROTTLE', {})
+    }
+
+
+def parse_rate(rate):
+    """Parses a rate like '60/m'.
+
+    Args:
+        rate (str): Rate as `<count>/<period>`.
+
+    Returns:
+        Tuple[int, int]: Max number of requests, and seconds of window.
+    """
+
+    count, period = rate.split('/')
+    return int(count), PERIODS[period[0]]
+
+
+def get_sliding_window_wait(limit, window, elapsed, current, previous):
+    """Returns seconds to wait before one more request fits in the sliding
+    window.
+
+    Args:
+        limit (int): Max number of requests in a window.
+        window (float): Seconds of window.
+        elapsed (float): Seconds elapsed of current fixed window.
+        current (int): Number of requests of current fixed window.
+        previous (int): Number of requests of previous fixed window.
+
+    Returns:
+        float: Seconds to wait, 0 when request is allowed now.
+    """
+
+    overlap = 1 - elapsed / window
+    if previous * overlap + current < limit:
+        return 0.0
+    if current < limit:
+        # Requests of previous window leave the sliding window.
+        wait = (overlap - (limit - current) / previous) * window
+    else:
+        # Requests of current window have to leave it too.
+        wait = (overlap + 1 - limit / current) * window
+    # Request isn't allowed now, even at the edge of a window.
+    return max(wait, MIN_WAIT)
+
+
+class SlidingWindowCounter:
+    """
+    Class defining in-process sliding window counters of requests.
+    Counters are ordered by their fixed window, so every request drops a
+    few expired counters from the front, instead of a request scanning all
+    of them.
+
+    Attributes:
+        limit: Max number of requests in a window.
+        window: Seconds of window.
+
+    Methods:
+        hit: Counts a request when it is allowed.
+    """
+
+    def __init__(self, limit, window, clock=time.time):
+        self.limit = limit
+        self.window = window
+        self._clock = clock
+        # [index of fixed window, current count, previous count] by key,
+        # ordered by index of fixed window.
+        self._counters = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def hit(self, key):
+        """Counts a request of a key when it is allowed.
+
+        Args:
+            key (Hashable): Key of the counter, like id of user.
+
+        Returns:
+            float: 0 when request is allowed, otherwise seconds to wait.
+        """
+
+        now = self._clock()
+        index, elapsed = divmod(now, self.window)
+        with self._lock:
+            # A request adds at most one counter and drops up to
+            # `PRUNE_BATCH` expired ones, so counters don't pile up.
+            for _ in range(PRUNE_BATCH):
+                oldest = next(iter(self._counters.values()), None)
+                if oldest is None or oldest[0] >= index - 1:
+                    break
+                self._counters.popitem(last=False)
+
+            counter = self._counters.get(key)
+            if counter is None:
+                counter = self._counters[key] = [index, 0, 0]
+            elif counter[0] != index:
+                counter[2] = counter[1] if counter[0] == index - 1 else 0
+                counter[0], counter[1] = index, 0
+                self._counters.move_to_end(key)
+
+            wait = get_sliding_window_wait(
+                self.limit, self.window, elapsed, counter[1], counter[2]
+            )
+            if not wait:
+                counter[1] += 1
+        return wait
+
+
+class CacheSlidingWindowCounter:
+    """
+    Class defining sliding window counters of requests kept in a cache
+    backend, shared by worker processes. Concurrent requests of a key can
+    pass the limit by a few requests, as counts are read before counting.
+
+    Attributes:
+        limit: Max number of requests in a window.
+        window: Seconds of window.
+        cache: Cache backend of counts.
+
+    Methods:
+        hit: Counts a request when it is allowed.
+    """
+
+    def __init__(self, limit, window, cache, clock=time.time):
+        self.limit = limit
+        self.window = window
+        self.cache = cache
+        self._clock = clock
+
+
+    def hit(self, key):
+        """Counts a request of a key when it is allowed.
+
+        Args:
+            key (Hashable): Key of the counter, like id of user.
+
+        Returns:
+            float: 0 when request is allowed, otherwise seconds to wait.
+        """
+
+        index, elapsed = divmod(self._clock(), self.window)
+        current_key = 'throttle:{}:{}'.format(key, int(index))
+        previous_key = 'throttle:{}:{}'.format(key, int(index) - 1)
+        counts = self.cache.get_many([current_key, previous_key])
+
+        wait = get_sliding_window_wait(
+            self.limit, self.window, elapsed, counts.get(current_key, 0),
+            counts.get(previous_key, 0)
+        )
+        if not wait:
+            # Counts expire once they can't be a previous window anymore.
+            if not self.cache.add(current_key, 1, 2 * self.window):
+                try:
+                    self.cache.incr(current_key)
+                except ValueError:
+                    self.cache.add(current_key, 1, 2 * self.window)
+        return wait
+
+
+_counter = None
+_counter_lock = threading.Lock()
+
+
+def get_symbols_data_counter():
+    """Returns the process wide counter of symbols data requests.
+
+    Returns:
+        Optional[Union[SlidingWindowCounter, CacheSlidingWindowCounter]]:
+        Counter, or None if requests are not throttled.
+    """
+
+    global _counter
+    throttle_settings = get_symbols_data_throttle_settings()
+    if not throttle_settings['ENABLED']:
+        return None
+    with _counter_lock:
+        if _counter is None:
+            limit, window = parse_rate(throttle_settings['RATE'])
+            if throttle_settings['CACHE_ALIAS']:
+                _counter = CacheSlidingWindowCounter(
+                    limit, window, caches[throttle_settings['CACHE_ALIAS']]
+                )
+            else:
+                _counter = SlidingWindowCounter(limit, window)
+        return _counter
+
+
+def reset_symbols_data_counter():
+    """Drops the counter, so that it is built again on next use."""
+
+    global _counter
+    with _counter_lock:
+        _counter = None
+
+
+class SymbolsDataRateThrottle(BaseThrottle):
+    """
+    Throttle of symbols data requests of each user, with a sliding window
+    counter of `SYMBOLS_DATA_THROTTLE` rate. Throttled requests get a 429
+    error with a `Retry-After` header.
+
+    Methods:
+        allow_request: Returns whether request is allowed.
+        wait: Returns seconds to wait before next request is allowed.
+    """
+
+    def allow_request(self, request, view):
+        """Returns whether request is allowed, and counts it when it is.
+
+        Args:
+            request (Request): A Django request object.
+            view (APIView): View of the request.
+
+        Returns:
+            bool: Whether request is allowed.
+        """
+
+        counter = get_symbols_data_counter()
+        if counter is None or not request.user.is_authenticated:
+            return True
+        self._wait = counter.hit(request.user.pk)
+        return not self._wait
+
+
+    def wait(self):
+        """Returns seconds to wait before next request is allowed.
+
+        Returns:
+            float: Seconds to wait.
+        """
+
+        return self._wait
+
+
+@receiver(setting_changed)
+def reset_symbols_data_counter_on_setting_change(sender, setting, **kwargs):
+    """Function to drop the counter when throttle settings are changed,
+    like in tests.
+
+    Args:
+        sender (Type): A sender of setting changed signal.
+        setting (str): Name of the changed setting.
+    """
+
+    if setting == 'SYMBOLS_DATA_THROTTLE':
+        reset_symbols_data_counter()
@@ -3,9 +3,33 @@ Module to define the mapping of routes with their corresponding views.
 """
 
 from django.urls import path
-from .views import FetchSymbolsData
+from .views import (
+    AlertNotifications, FetchSymbolsData, FetchJobStatus, LoadMetrics,
+    PriceAlertDetail, PriceAlerts, SearchSymbols, UpstreamKeyMetrics,
+    WatchListCorrelation
+)
 
 
 urlpatterns = [
     path('symbols-data', FetchSymbolsData.as_view(), name='fetch_symbols_data'),
+    path('symbols-search', SearchSymbols.as_view(), name='search_symbols'),
+    path('jobs/<uuid:job_id>', FetchJobStatus.as_view(), name='fetch_job_status'),
+    path(
+        'correlation', WatchListCorrelation.as_view(),
+        name='watchlist_correlation'
+    ),
+    path(
+        'upstream-keys', UpstreamKeyMetrics.as_view(),
+        name='upstream_key_metrics'
+    ),
+    path('load', LoadMetrics.as_view(), name='load_metrics'),
+    path('alerts', PriceAlerts.as_view(), name='price_alerts'),
+    path(
+        'alerts/<int:alert_id>', PriceAlertDetail.as_view(),
+        name='price_alert_detail'
+    ),
+    path(
+        'alerts/notifications', AlertNotifications.as_view(),
+        name='alert_notifications'
+    ),
 ]
@@ -3,12 +3,27 @@ Module for defining views of watch_list app. It can be
 function based or class based.
 """
 
-from rest_framework import generics, permissions, authentication
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import generics, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from .serializers import WatchListSymbolSerializer
+from .admission import admission_controlled, get_admission_controller
+from .jobs import enqueue_fetch_job
+from .models import AlertNotification, FetchJob, PriceAlert
+from .serializers import (
+    AlertNotificationSerializer, CorrelationSerializer, PriceAlertSerializer,
+    SymbolSearchSerializer, WatchListSymbolSerializer
+)
+from .symbol_master import get_symbol_master
+from .throttling import SymbolsDataRateThrottle
+from users.authentication import CachedTokenAuthentication
+from users.watchlist_buffer import update_watchlist_symbols
 
 from .wrapper import symbols_data_fetcher
+from .wrapper.concurrency import get_outbound_metrics
+from .wrapper.correlation import get_symbols_correlation
 
 
 class FetchSymbolsData(APIView):
@@ -22,23 +37,47 @@ class FetchSymbolsData(APIView):
         1. If any of the symbols is not a valid symbol or the data is not
             available for that symbol from alpha avantage, then that symbol
             is excluded from response and response only include those
-            symbols that has data.
-        2. If 6th request is made in a single minute then function immediately
-            throws an error with status code 429 without any response.
+            symbols that has data. Symbols which are not listed in symbol
+            master are returned as `unknown_symbols`, when symbol master is
+            available.
+        2. Symbols that can't be fetched within alpha avantage's quota are
+            fetched in the background, and are returned as pending along
+            with their estimated wait. Client can ask again for them later.
+        3. If alpha avantage reports that its quota is reached and no symbol
+            could be served, then function throws an error with status code
+            429 without any response.
+        4. If request is asynchronous and some symbols are not cached, then
+            function returns with status code 202 and a fetch job, whose
+            status and result can be polled from `watchList/jobs/<job_id>`.
+            Result of a job has every field.
+        5. Only the asked `fields` (`latest_prices`, `candles`, `values`)
+            are built, e.g. a latest prices only request doesn't build any
+            candle stick graph data. Candles can be limited to a window of
+            `start` and `end` times and to `limit` newest candles of it.
+        6. Requests are admission controlled, when too many requests are
+            waiting or the estimated wait is too long then function throws
+            an error with status code 503 and a `Retry-After` header.
+        7. Requests of a user are throttled, beyond `SYMBOLS_DATA_THROTTLE`
+            rate function throws an error with status code 429 and a
+            `Retry-After` header. Upstream calls are shared fairly by users.
 
     Attributes:
         permission_classes: Specifies the permission for users, currently
             it is set to `(permissions.IsAuthenticated,)`, requiring the
             user to be authenticated.
         authentication_classes: The authentication class used for authenticating
-            the user. Currently, it is set to `(authentication.TokenAuthentication,)`,
-            using token-based authentication.
+            the user. Currently, it is set to `(CachedTokenAuthentication,)`,
+            using token-based authentication with in-memory token cache.
+        throttle_classes: Throttles of requests, currently it is set to
+            `(SymbolsDataRateThrottle,)`, a sliding window rate of each user.
     """
 
     permission_classes = (permissions.IsAuthenticated,)
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
+    throttle_classes = (SymbolsDataRateThrottle,)
 
 
+    @admission_controlled
     def post(self, request, *args, **kwargs):
         """Handles the POST request for retrieving data for a list of symbols.
         Also, validates the input data, retrieves the data for the symbols,
@@ -62,15 +101,437 @@ class FetchSymbolsData(APIView):
         symbols = serializer.validated_data['symbols']
         user = request.user
 
-        response = (
-            symbols_data_fetcher.get_symbols_latest_and_graph_data(symbols)
+        if serializer.validated_data['asynchronous']:
+            interval = symbols_data_fetcher.DEFAULT_INTERVAL
+            cached_symbols_data, missing_symbols = (
+                symbols_data_fetcher.get_cached_symbols_data(
+                    symbols, interval, last=1
+                )
+            )
+            if missing_symbols:
+                job, created = enqueue_fetch_job(symbols, interval, user)
+                # Symbols cached as invalid are not written, missing ones
+                # are kept until the job finds them invalid.
+                update_watchlist_symbols(user.watchlist, [
+                    symbol for symbol in dict.fromkeys(symbols)
+                    if symbol in cached_symbols_data
+                    or symbol in missing_symbols
+                ])
+                response = get_fetch_job_response(request, job)
+                add_unknown_symbols(response, serializer.validated_data)
+                return Response(response, status=202)
+
+        response = symbols_data_fetcher.get_symbols_latest_and_graph_data(
+            symbols, fields=serializer.validated_data['fields'],
+            start=serializer.validated_data['start'],
+            end=serializer.validated_data['end'],
+            limit=serializer.validated_data['limit'], owner=user.pk
         )
 
         # Throwing error when we have reached the 5 calls per minute limit.
         if 'Note' in response and 'reached the limit' in response['Note']:
             return Response(response, status=429)
 
-        user.watchlist.symbols = response['symbols']
-        user.save()
+        # Only watchlist's symbols are written (and only when they are
+        # changed), user row is not touched. Pending symbols are kept in
+        # watchlist until they are known to be invalid.
+        update_watchlist_symbols(
+            user.watchlist, response['symbols'] + response['pending_symbols']
+        )
+
+        add_unknown_symbols(response, serializer.validated_data)
+        return Response(response)
+
+
+class WatchListCorrelation(APIView):
+    """
+    API view for the aligned returns, rolling volatility and pairwise
+    correlation matrix of the symbols of user's watchlist. Candles of
+    symbols are served like `watchList/symbols-data`, so symbols which can't
+    be fetched within alpha avantage's quota are returned as pending and
+    are left out of the result, and when the quota is reached and no symbol
+    could be served, then it throws an error with status code 429. Symbols
+    are read from DB, as the watchlist of token cache may be stale. Requests
+    are admission controlled and throttled like `watchList/symbols-data`,
+    sharing its rate of each user.
+
+    Attributes:
+        permission_classes: Specifies the permission for users, currently
+            it is set to `(permissions.IsAuthenticated,)`, requiring the
+            user to be authenticated.
+        authentication_classes: The authentication class used for authenticating
+            the user. Currently, it is set to `(CachedTokenAuthentication,)`.
+        throttle_classes: Throttles of requests, currently it is set to
+            `(SymbolsDataRateThrottle,)`, a sliding window rate of each user.
+    """
+
+    permission_classes = (permissions.IsAuthenticated,)
+    authentication_classes = (CachedTokenAuthentication,)
+    throttle_classes = (SymbolsDataRateThrottle,)
+
+
+    @admission_controlled
+    def get(self, request, *args, **kwargs):
+        """Handles the GET request for the correlation of watchlist's
+        symbols.
+
+        Args:
+            request (Request): A Django request object.
+            *args: Additional named arguments.
+            **kwargs: Additional keyword arguments.
+
+        Returns:
+            Response: Response object containing the timestamps of aligned
+            candles, returns and rolling volatility of each symbol, the
+            correlation matrix in order of symbols, and pending symbols.
+        """
+
+        serializer = CorrelationSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
 
+        response = get_symbols_correlation(
+            request.user.watchlist.get_stored_symbols() or [],
+            serializer.validated_data['window'],
+            limit=serializer.validated_data['limit'], owner=request.user.pk
+        )
+        if 'Note' in response:
+            return Response(response, status=429)
         return Response(response)
+
+
+class SearchSymbols(APIView):
+    """
+    API view for autocompleting symbols from the symbol master. Symbols
+    starting with the query come first, followed by symbols whose name has
+    a word starting with the query, and then the matches of a query with
+    one typo. When symbol master is not available, no symbols are returned.
+
+    Attributes:
+        permission_classes: Specifies the permission for users, currently
+            it is set to `(permissions.IsAuthenticated,)`, requiring the
+            user to be authenticated.
+        authentication_classes: The authentication class used for authenticating
+            the user. Currently, it is set to `(CachedTokenAuthentication,)`.
+    """
+
+    permission_classes = (permissions.IsAuthenticated,)
+    authentication_classes = (CachedTokenAuthentication,)
+
+
+    def get(self, request, *args, **kwargs):
+        """Handles the GET request for searching symbols.
+
+        Args:
+            request (Request): A Django request object.
+            *args: Additional named arguments.
+            **kwargs: Additional keyword arguments.
+
+        Returns:
+            Response: Response object containing the matching symbols along
+            with their name, exchange and asset type.
+        """
+
+        serializer = SymbolSearchSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+
+        symbol_master = get_symbol_master()
+        results = []
+        if symbol_master is not None:
+            results = symbol_master.search(
+                serializer.validated_data['q'],
+                serializer.validated_data['limit']
+            )
+        return Response({'results': results})
+
+
+class FetchJobStatus(APIView):
+    """
+    API view for polling the status and result of a symbols fetch job.
+    Only the owner of a job can poll it, jobs of other users are not found.
+    Expired jobs are answered with status code 410.
+
+    Attributes:
+        permission_classes: Specifies the permission for users, currently
+            it is set to `(permissions.IsAuthenticated,)`, requiring the
+            user to be authenticated.
+        authentication_classes: The authentication class used for authenticating
+            the user. Currently, it is set to `(CachedTokenAuthentication,)`.
+    """
+
+    permission_classes = (permissions.IsAuthenticated,)
+    authentication_classes = (CachedTokenAuthentication,)
+
+
+    def get(self, request, job_id, *args, **kwargs):
+        """Handles the GET request for polling a fetch job.
+
+        Args:
+            request (Request): A Django request object.
+            job_id (UUID): Public id of the job.
+            *args: Additional named arguments.
+            **kwargs: Additional keyword arguments.
+
+        Returns:
+            Response: Response object containing the status of job, and its
+            result when job is done.
+        """
+
+        job = get_object_or_404(FetchJob, job_id=job_id, user=request.user)
+        if job.expires_at <= timezone.now():
+            return Response({'detail': 'Fetch job has expired.'}, status=410)
+        return Response(get_fetch_job_response(request, job))
+
+
+class PriceAlerts(APIView):
+    """
+    API view for listing and creating price alerts of the user. Alerts are
+    evaluated whenever new candles of their symbol are ingested, and each
+    alert is triggered once.
+
+    Attributes:
+        permission_classes: Specifies the permission for users, currently
+            it is set to `(permissions.IsAuthenticated,)`, requiring the
+            user to be authenticated.
+        authentication_classes: The authentication class used for authenticating
+            the user. Currently, it is set to `(CachedTokenAuthentication,)`.
+    """
+
+    permission_classes = (permissions.IsAuthenticated,)
+    authentication_classes = (CachedTokenAuthentication,)
+
+
+    def get(self, request, *args, **kwargs):
+        """Handles the GET request for listing price alerts of the user.
+
+        Args:
+            request (Request): A Django request object.
+            *args: Additional named arguments.
+            **kwargs: Additional keyword arguments.
+
+        Returns:
+            Response: Response object containing the alerts of the user,
+            newest first.
+        """
+
+        alerts = PriceAlert.objects.filter(user=request.user).order_by('-id')
+        return Response({
+            'alerts': PriceAlertSerializer(alerts, many=True).data
+        })
+
+
+    def post(self, request, *args, **kwargs):
+        """Handles the POST request for creating a price alert.
+
+        Args:
+            request (Request): A Django request object.
+            *args: Additional named arguments.
+            **kwargs: Additional keyword arguments.
+
+        Returns:
+            Response: Response object containing the created alert, with
+            status code 201.
+        """
+
+        serializer = PriceAlertSerializer(
+            data=request.data, context={'request': request}
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save(user=request.user)
+        return Response(serializer.data, status=201)
+
+
+class PriceAlertDetail(APIView):
+    """
+    API view for deleting a price alert of the user.
+
+    Attributes:
+        permission_classes: Specifies the permission for users, currently
+            it is set to `(permissions.IsAuthenticated,)`, requiring the
+            user to be authenticated.
+        authentication_classes: The authentication class used for authenticating
+            the user. Currently, it is set to `(CachedTokenAuthentication,)`.
+    """
+
+    permission_classes = (permissions.IsAuthenticated,)
+    authentication_classes = (CachedTokenAuthentication,)
+
+
+    def delete(self, request, alert_id, *args, **kwargs):
+        """Handles the DELETE request for deleting a price alert.
+
+        Args:
+            request (Request): A Django request object.
+            alert_id (int): Id of the alert.
+            *args: Additional named arguments.
+            **kwargs: Additional keyword arguments.
+
+        Returns:
+            Response: Empty response with status code 204.
+        """
+
+        alert = get_object_or_404(PriceAlert, pk=alert_id, user=request.user)
+        alert.delete()
+        return Response(status=204)
+
+
+class AlertNotifications(APIView):
+    """
+    API view for delivering notifications of triggered price alerts of the
+    user. Delivered notifications are not returned again.
+
+    Attributes:
+        permission_classes: Specifies the permission for users, currently
+            it is set to `(permissions.IsAuthenticated,)`, requiring the
+            user to be authenticated.
+        authentication_classes: The authentication class used for authenticating
+            the user. Currently, it is set to `(CachedTokenAuthentication,)`.
+    """
+
+    permission_classes = (permissions.IsAuthenticated,)
+    authentication_classes = (CachedTokenAuthentication,)
+
+    # Max number of notifications delivered per request.
+    MAX_NOTIFICATIONS = 100
+
+
+    def get(self, request, *args, **kwargs):
+        """Handles the GET request for delivering notifications, oldest
+        first. Returned notifications are marked as delivered with a single
+        update.
+
+        Args:
+            request (Request): A Django request object.
+            *args: Additional named arguments.
+            **kwargs: Additional keyword arguments.
+
+        Returns:
+            Response: Response object containing the undelivered
+            notifications of the user.
+        """
+
+        notifications = list(AlertNotification.objects.filter(
+            user=request.user, delivered_at__isnull=True
+        ).order_by('id')[:self.MAX_NOTIFICATIONS])
+        if notifications:
+            AlertNotification.objects.filter(
+                id__in=[notification.pk for notification in notifications]
+            ).update(delivered_at=timezone.now())
+        return Response({
+            'notifications': AlertNotificationSerializer(
+                notifications, many=True
+            ).data
+        })
+
+
+class UpstreamKeyMetrics(APIView):
+    """
+    API view for the metrics of each upstream api key of this process, like
+    number of calls, quota notes and errors, and whether it is quarantined.
+    Only staff users can see them, and keys are masked.
+
+    Attributes:
+        permission_classes: Specifies the permission for users, currently
+            it is set to `(permissions.IsAdminUser,)`, requiring the user to
+            be a staff user.
+        authentication_classes: The authentication class used for authenticating
+            the user. Currently, it is set to `(CachedTokenAuthentication,)`.
+    """
+
+    permission_classes = (permissions.IsAdminUser,)
+    authentication_classes = (CachedTokenAuthentication,)
+
+
+    def get(self, request, *args, **kwargs):
+        """Handles the GET request for metrics of upstream api keys.
+
+        Args:
+            request (Request): A Django request object.
+            *args: Additional named arguments.
+            **kwargs: Additional keyword arguments.
+
+        Returns:
+            Response: Response object containing the metrics of each key.
+        """
+
+        return Response({
+            'keys': symbols_data_fetcher.call_budget.metrics()
+        })
+
+
+class LoadMetrics(APIView):
+    """
+    API view for the load gauges of this process, which are the admission
+    control of requests and the outbound requests in flight and waiting for
+    each upstream provider. Only staff users can see them.
+
+    Attributes:
+        permission_classes: Specifies the permission for users, currently
+            it is set to `(permissions.IsAdminUser,)`, requiring the user to
+            be a staff user.
+        authentication_classes: The authentication class used for authenticating
+            the user. Currently, it is set to `(CachedTokenAuthentication,)`.
+    """
+
+    permission_classes = (permissions.IsAdminUser,)
+    authentication_classes = (CachedTokenAuthentication,)
+
+
+    def get(self, request, *args, **kwargs):
+        """Handles the GET request for load gauges.
+
+        Args:
+            request (Request): A Django request object.
+            *args: Additional named arguments.
+            **kwargs: Additional keyword arguments.
+
+        Returns:
+            Response: Response object containing gauges of admission control
+            (null when disabled) and of outbound requests by provider host.
+        """
+
+        controller = get_admission_controller()
+        return Response({
+            'admission': controller.metrics() if controller else None,
+            'outbound': get_outbound_metrics(),
+        })
+
+
+def add_unknown_symbols(response, validated_data):
+    """Adds the symbols which are not listed in symbol master to response
+    data, when symbol master is available.
+
+    Args:
+        response (Dict[str, Any]): Response data.
+        validated_data (Dict[str, Any]): Validated data of
+            `WatchListSymbolSerializer`.
+    """
+
+    if 'unknown_symbols' in validated_data:
+        response['unknown_symbols'] = validated_data['unknown_symbols']
+
+
+def get_fetch_job_response(request, job):
+    """Returns the response data of a fetch job.
+
+    Args:
+        request (Request): A Django request object.
+        job (FetchJob): A fetch job.
+
+    Returns:
+        Dict[str, Any]: Id, status and url of the job, along with its result
+        when job is done, or its error when job is failed.
+    """
+
+    response = {
+        'job_id': str(job.job_id),
+        'status': job.status,
+        'symbols': job.symbols,
+        'status_url': request.build_absolute_uri(
+            reverse('fetch_job_status', args=[job.job_id])
+        ),
+    }
+    if job.status == FetchJob.DONE:
+        response['result'] = job.result
+    elif job.status == FetchJob.FAILED:
+        response['error'] = job.error
+    return response
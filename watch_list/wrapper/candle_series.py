@@ -0,0 +1,414 @@
+"""
+Module that defines the typed in-memory representation of a symbol's
+candles.
+
+A `CandleSeries` keeps every value of its candles in a numpy array, int64
+timestamps, float64 prices and int64 volumes, ordered from oldest to newest
+candle. Compared with lists of lists of strings, a candle takes 48 bytes
+instead of several hundreds, and slices of a series are views of the same
+arrays. Rows of the api response (strings, newest candle first, like alpha
+avantage sends them) are only built for the candles a response returns,
+when the response is built. Upstream writes every price of a payload with
+the same number of decimals, which series keeps, so prices of rows are the
+strings upstream sent.
+"""
+
+from .lazy_imports import LazyModule
+
+import struct
+
+np = LazyModule('numpy')
+
+
+# Names of values of each candle row, in the order of api response.
+CANDLE_VALUES = ['open', 'close', 'low', 'high', 'volume', 'date_time']
+
+SERIES_FORMAT = b'CSR2'
+
+# Format, symbol length, number of candles and decimals of prices.
+HEADER = struct.Struct('<4sHIB')
+
+# Decimals of prices of series whose payload is unknown, like alpha
+# avantage's intraday prices.
+DEFAULT_DECIMALS = 4
+
+# Types of timestamps, opens, highs, lows, closes and volumes in binary
+# encoding.
+COLUMN_DTYPES = ('<i8', '<f8', '<f8', '<f8', '<f8', '<i8')
+
+
+def get_decimals(price):
+    """Returns the number of decimals of a price sent by alpha avantage.
+
+    Args:
+        price (str): Price like '130.2500'.
+
+    Returns:
+        int: Number of decimals.
+    """
+
+    price = str(price)
+    point = price.find('.')
+    return 0 if point == -1 else len(price) - point - 1
+
+
+def format_prices(prices, decimals=DEFAULT_DECIMALS):
+    """Formats prices with the decimals alpha avantage sends them with.
+
+    Args:
+        prices (np.ndarray): Prices.
+        decimals optional(int): Number of decimals (default: 4).
+
+    Returns:
+        List[str]: Formatted prices.
+    """
+
+    price_format = '{{:.{}f}}'.format(decimals)
+    return [price_format.format(price) for price in prices.tolist()]
+
+
+def format_timestamps(timestamps):
+    """Formats timestamps like the date times sent by alpha avantage.
+
+    Args:
+        timestamps (np.ndarray): Seconds since epoch.
+
+    Returns:
+        List[str]: Date times like '2023-05-19 19:55:00'.
+    """
+
+    return [
+        date_time.replace('T', ' ') for date_time in np.datetime_as_string(
+            timestamps.astype('datetime64[s]'), unit='s'
+        ).tolist()
+    ]
+
+
+def to_timestamp(value):
+    """Converts a date time to seconds since epoch, like the timestamps of
+    series.
+
+    Args:
+        value (Union[str, datetime, int]): Date time like
+            '2023-05-19 19:55:00', or seconds since epoch.
+
+    Returns:
+        int: Seconds since epoch.
+    """
+
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    return int(np.datetime64(value, 's').astype('<i8'))
+
+
+def get_candle_decimals(candle):
+    """Returns the number of decimals of prices of a candle sent by alpha
+    avantage.
+
+    Args:
+        candle (dict): Values of the candle.
+
+    Returns:
+        int: Number of decimals.
+    """
+
+    return max(
+        get_decimals(candle[key])
+        for key in ('1. open', '2. high', '3. low', '4. close')
+    )
+
+
+class CandleSeries:
+    """
+    Class defining the candles of a symbol over typed arrays, ordered from
+    oldest to newest candle.
+
+    Attributes:
+        symbol: Symbol like MSFT.
+        timestamps: Seconds since epoch of candles (int64).
+        opens: Open prices (float64).
+        highs: High prices (float64).
+        lows: Low prices (float64).
+        closes: Close prices (float64).
+        volumes: Volumes (int64).
+        decimals: Number of decimals of prices sent by api.
+
+    Methods:
+        from_payload: Builds series from an intraday payload of api.
+        from_columns: Builds series from arrays of candle store.
+        from_bytes: Builds series from its binary encoding.
+        window: Returns the candles in a time range.
+        columns: Returns arrays of candle store.
+        latest_row: Returns the newest candle as a response row.
+        to_rows: Returns candles as response rows.
+        to_bytes: Returns the binary encoding of series.
+    """
+
+    __slots__ = (
+        'symbol', 'timestamps', 'opens', 'highs', 'lows', 'closes',
+        'volumes', 'decimals'
+    )
+
+    # Names of the arrays of series.
+    ARRAYS = __slots__[1:-1]
+
+    def __init__(self, symbol, timestamps, opens, highs, lows, closes,
+                 volumes, decimals=DEFAULT_DECIMALS):
+        self.symbol = symbol
+        self.timestamps = np.asarray(timestamps, dtype=np.int64)
+        self.opens = np.asarray(opens, dtype=np.float64)
+        self.highs = np.asarray(highs, dtype=np.float64)
+        self.lows = np.asarray(lows, dtype=np.float64)
+        self.closes = np.asarray(closes, dtype=np.float64)
+        self.volumes = np.asarray(volumes, dtype=np.int64)
+        self.decimals = decimals
+
+
+    @classmethod
+    def from_payload(cls, symbol_data, interval):
+        """Builds series from an intraday time series payload of api.
+
+        Args:
+            symbol_data (dict): JSON response of api for a symbol.
+            interval (str): Time interval of the data.
+
+        Returns:
+            CandleSeries: Series of the payload.
+        """
+
+        time_series = symbol_data['Time Series ({})'.format(interval)]
+        count = len(time_series)
+        timestamps = np.array(
+            list(time_series), dtype='datetime64[s]'
+        ).astype(np.int64)
+        values = np.empty((4, count), dtype=np.float64)
+        volumes = np.empty(count, dtype=np.int64)
+        decimals = DEFAULT_DECIMALS
+        for index, candle in enumerate(time_series.values()):
+            if not index:
+                decimals = get_candle_decimals(candle)
+            values[0, index] = candle['1. open']
+            values[1, index] = candle['2. high']
+            values[2, index] = candle['3. low']
+            values[3, index] = candle['4. close']
+            volumes[index] = candle['5. volume']
+
+        order = np.argsort(timestamps, kind='stable')
+        return cls(
+            symbol_data['Meta Data']['2. Symbol'], timestamps[order],
+            values[0, order], values[1, order], values[2, order],
+            values[3, order], volumes[order], decimals
+        )
+
+
+    @classmethod
+    def from_columns(cls, symbol, columns, decimals=DEFAULT_DECIMALS):
+        """Builds series from arrays of candle store, without copying them.
+
+        Args:
+            symbol (str): Symbol like MSFT.
+            columns (Dict[str, np.ndarray]): Timestamp, open, high, low,
+                close and volume arrays ordered by timestamp.
+            decimals optional(int): Number of decimals of prices sent by api
+                (default: 4).
+
+        Returns:
+            CandleSeries: Series of the arrays.
+        """
+
+        return cls(
+            symbol, columns['timestamp'], columns['open'], columns['high'],
+            columns['low'], columns['close'], columns['volume'], decimals
+        )
+
+
+    @classmethod
+    def from_bytes(cls, data, last=None):
+        """Builds series from its binary encoding. Arrays are read-only
+        views of `data`, and only the asked newest candles are read.
+
+        Args:
+            data (bytes): Binary encoding of series.
+            last optional(int): Number of newest candles to read (default:
+                all candles).
+
+        Returns:
+            CandleSeries: Decoded series.
+
+        Raises:
+            ValueError: If data is not a binary encoding of series.
+        """
+
+        series_format, symbol_length, count, decimals = HEADER.unpack_from(
+            data
+        )
+        if series_format != SERIES_FORMAT:
+            raise ValueError(
+                'Unknown series format {!r}.'.format(series_format)
+            )
+        offset = HEADER.size
+        symbol = data[offset:offset + symbol_length].decode('utf-8')
+        offset += symbol_length
+
+        read_count = count if last is None else max(0, min(last, count))
+        skipped = count - read_count
+
+        # Every column has 8 bytes per candle, in the order of `__init__`.
+        columns = [
+            np.frombuffer(
+                data, dtype=dtype, count=read_count,
+                offset=offset + (index * count + skipped) * 8
+            )
+            for index, dtype in enumerate(COLUMN_DTYPES)
+        ]
+        return cls(symbol, *columns, decimals=decimals)
+
+
+    def __len__(self):
+        return len(self.timestamps)
+
+
+    def __getitem__(self, index):
+        """Returns a slice of series, sharing the arrays of series.
+
+        Args:
+            index (slice): Slice of candles, ordered from oldest candle.
+
+        Returns:
+            CandleSeries: Sliced series.
+
+        Raises:
+            TypeError: If index is not a slice.
+        """
+
+        if not isinstance(index, slice):
+            raise TypeError('CandleSeries can only be sliced.')
+        return CandleSeries(
+            self.symbol, self.timestamps[index], self.opens[index],
+            self.highs[index], self.lows[index], self.closes[index],
+            self.volumes[index], self.decimals
+        )
+
+
+    def __eq__(self, other):
+        if not isinstance(other, CandleSeries):
+            return NotImplemented
+        return (
+            self.symbol == other.symbol and self.decimals == other.decimals
+            and all(
+                np.array_equal(getattr(self, name), getattr(other, name))
+                for name in self.ARRAYS
+            )
+        )
+
+
+    def window(self, start=None, end=None, limit=None):
+        """Returns the candles in a time range, found by binary search of
+        timestamps. Returned series shares the arrays of series.
+
+        Args:
+            start optional(Union[str, datetime, int]): Time of the first
+                candle, inclusive.
+            end optional(Union[str, datetime, int]): Time of the last candle,
+                inclusive.
+            limit optional(int): Max number of newest candles of the range.
+
+        Returns:
+            CandleSeries: Candles in the range.
+        """
+
+        first = 0 if start is None else int(np.searchsorted(
+            self.timestamps, to_timestamp(start), side='left'
+        ))
+        last = len(self) if end is None else int(np.searchsorted(
+            self.timestamps, to_timestamp(end), side='right'
+        ))
+        if limit is not None:
+            first = max(first, last - limit)
+        return self[first:max(first, last)]
+
+
+    @property
+    def nbytes(self):
+        """Returns the number of bytes of the arrays of series.
+
+        Returns:
+            int: Number of bytes.
+        """
+
+        return sum(getattr(self, name).nbytes for name in self.ARRAYS)
+
+
+    def columns(self):
+        """Returns the arrays of series like candle store columns.
+
+        Returns:
+            Dict[str, np.ndarray]: Timestamp, open, high, low, close and
+            volume arrays.
+        """
+
+        return {
+            'timestamp': self.timestamps,
+            'open': self.opens,
+            'high': self.highs,
+            'low': self.lows,
+            'close': self.closes,
+            'volume': self.volumes,
+        }
+
+
+    def latest_row(self):
+        """Returns the newest candle as a response row.
+
+        Returns:
+            List[str]: Values of `CANDLE_VALUES`, or an empty list if series
+            has no candles.
+        """
+
+        if not len(self):
+            return []
+        return self[-1:].to_rows()[0]
+
+
+    def to_rows(self):
+        """Returns the candles as response rows, newest candle first like
+        alpha avantage sends them.
+
+        Returns:
+            List[List[str]]: Values of `CANDLE_VALUES` of every candle.
+        """
+
+        newest_first = slice(None, None, -1)
+        volumes = self.volumes[newest_first]
+        return [
+            list(row) for row in zip(
+                format_prices(self.opens[newest_first], self.decimals),
+                format_prices(self.closes[newest_first], self.decimals),
+                format_prices(self.lows[newest_first], self.decimals),
+                format_prices(self.highs[newest_first], self.decimals),
+                [str(volume) for volume in volumes.tolist()],
+                format_timestamps(self.timestamps[newest_first])
+            )
+        ]
+
+
+    def to_bytes(self):
+        """Returns the binary encoding of series, little-endian arrays after
+        a small header.
+
+        Returns:
+            bytes: Binary encoding of series.
+        """
+
+        symbol = self.symbol.encode('utf-8')
+        return b''.join([
+            HEADER.pack(
+                SERIES_FORMAT, len(symbol), len(self), self.decimals
+            ),
+            symbol,
+            self.timestamps.astype('<i8', copy=False).tobytes(),
+            np.stack([
+                self.opens, self.highs, self.lows, self.closes
+            ]).astype('<f8', copy=False).tobytes(),
+            self.volumes.astype('<i8', copy=False).tobytes(),
+        ])
@@ -0,0 +1,542 @@
+"""
+Module that defines the on-disk columnar store of candles, which keeps the
+OHLCV history of every (symbol, interval) in memory-mapped numpy files.
+
+Every (symbol, interval) has a directory with a compacted base of one file
+per column, sorted by timestamp, and an append log of new candles. Reads
+memory-map the base files, so worker processes of a host share the history
+through the page cache, a time range is sliced with a binary search on the
+timestamps without copying, and the history is available right after a
+restart without any parsing. Only the logged candles within the range are
+merged into a read, and appends compare new candles with the stored ones of
+their own range, so neither reads nor appends go through the whole history.
+The log is compacted into a new generation of base files once it has
+`COMPACT_AFTER` candles. Files of the previous generation are only removed
+by the next compaction, and a reader which still misses them reads the
+current generation instead.
+
+Settings:
+    CANDLE_STORE (Dict[str, Any]): Configuration of candle store. Like below:
+        - ENABLED (bool): Whether fetched candles are stored (default: True).
+        - DIR (str): Directory of the store.
+        - COMPACT_AFTER (int): Number of logged candles after which the log
+            is compacted (default: 1024).
+"""
+
+from collections import OrderedDict
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .candle_series import to_timestamp
+from .lazy_imports import LazyModule
+
+import json
+import os
+import re
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+np = LazyModule('numpy')
+
+
+# Columns of the store, timestamps are seconds since epoch of the (naive)
+# date times sent by upstream api.
+CANDLE_COLUMNS = ('timestamp', 'open', 'high', 'low', 'close', 'volume')
+
+# Fields of a logged candle record, numpy dtypes are only built on use.
+RECORD_DTYPE = [
+    ('timestamp', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<i8'),
+]
+COLUMN_DTYPES = dict(RECORD_DTYPE)
+RECORD_SIZE = 8 * len(RECORD_DTYPE)
+
+DEFAULT_CANDLE_STORE_SETTINGS = {
+    'ENABLED': True,
+    'DIR': os.path.join(tempfile.gettempdir(), 'stockmonitor-candles'),
+    'COMPACT_AFTER': 1024,
+}
+
+VALID_NAME = re.compile(r'^[A-Za-z0-9][A-Za-z0-9.\-_^=]*$')
+
+
+def get_candle_store_settings():
+    """Returns the candle store settings merged over defaults.
+
+    Returns:
+        Dict[str, Any]: Candle store settings.
+    """
+
+    return {
+        **DEFAULT_CANDLE_STORE_SETTINGS,
+        **getattr(settings, 'CANDLE_STORE', {})
+    }
+
+
+class CandleStore:
+    """
+    Class defining an on-disk columnar store of candles.
+
+    Attributes:
+        directory: Directory of the store.
+        compact_after: Number of logged candles after which the log of a
+            (symbol, interval) is compacted.
+
+    Methods:
+        append: Appends candles of a (symbol, interval).
+        read: Returns the candles of a (symbol, interval) in a time range.
+        compact: Merges the log of a (symbol, interval) into its base.
+    """
+
+    # Number of memory-mapped bases kept open per process.
+    MAX_OPEN_BASES = 256
+
+    def __init__(self, directory, compact_after=1024):
+        self.directory = str(directory)
+        self.compact_after = compact_after
+        self._bases = OrderedDict()
+        self._bases_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+
+    def append(self, symbol, interval, columns):
+        """Appends candles of a (symbol, interval). Candles which are
+        already stored unchanged are not logged again, so overlapping
+        responses of upstream api only log their new or changed candles.
+
+        Args:
+            symbol (str): Symbol like MSFT.
+            interval (str): Time interval of the candles.
+            columns (Dict[str, np.ndarray]): Arrays of `CANDLE_COLUMNS`.
+
+        Returns:
+            int: Number of logged candles.
+        """
+
+        records = np.zeros(len(columns['timestamp']), dtype=RECORD_DTYPE)
+        for column in CANDLE_COLUMNS:
+            records[column] = columns[column]
+        records = records[np.argsort(records['timestamp'], kind='stable')]
+
+        path = self._get_path(symbol, interval)
+        with self._lock(path):
+            # Only the stored candles in the range of new candles, like the
+            # newest candles of base, are compared with them.
+            stored = self._read_range(
+                path, records['timestamp'][0], records['timestamp'][-1],
+                locked=True
+            ) if len(records) else None
+            if stored is not None and len(stored['timestamp']):
+                indexes = np.minimum(
+                    np.searchsorted(stored['timestamp'], records['timestamp']),
+                    len(stored['timestamp']) - 1
+                )
+                unchanged = np.ones(len(records), dtype=bool)
+                for column in CANDLE_COLUMNS:
+                    unchanged &= stored[column][indexes] == records[column]
+                records = records[~unchanged]
+
+            if len(records):
+                with open(os.path.join(path, 'log'), 'ab') as log_file:
+                    log_file.write(records.tobytes())
+                if self._log_size(path) >= self.compact_after:
+                    self._compact(path)
+        return len(records)
+
+
+    def read(self, symbol, interval, start=None, end=None):
+        """Returns the candles of a (symbol, interval) in a time range,
+        ordered by timestamp. Columns are read-only views of the memory
+        mapped base files, unless the log has candles in the range.
+
+        Args:
+            symbol (str): Symbol like MSFT.
+            interval (str): Time interval of the candles.
+            start optional(Union[str, datetime, int]): Time of the first
+                candle, inclusive.
+            end optional(Union[str, datetime, int]): Time of the last
+                candle, inclusive.
+
+        Returns:
+            Dict[str, np.ndarray]: Arrays of `CANDLE_COLUMNS`.
+        """
+
+        path = self._get_path(symbol, interval, create=False)
+        return self._read_range(
+            path, None if start is None else to_timestamp(start),
+            None if end is None else to_timestamp(end)
+        )
+
+
+    def compact(self, symbol, interval):
+        """Merges the log of a (symbol, interval) into a new generation of
+        its base files.
+
+        Args:
+            symbol (str): Symbol like MSFT.
+            interval (str): Time interval of the candles.
+        """
+
+        path = self._get_path(symbol, interval)
+        with self._lock(path):
+            self._compact(path)
+
+
+    def _get_path(self, symbol, interval, create=True):
+        """Returns the directory of a (symbol, interval).
+
+        Args:
+            symbol (str): Symbol like MSFT.
+            interval (str): Time interval of the candles.
+            create optional(bool): Whether directory is created.
+
+        Returns:
+            str: Directory of the (symbol, interval).
+
+        Raises:
+            ValueError: If symbol or interval can't be used as a file name.
+        """
+
+        for name in (symbol, interval):
+            if not VALID_NAME.match(name):
+                raise ValueError('Invalid name {!r} in candle store.'.format(
+                    name
+                ))
+        path = os.path.join(self.directory, interval, symbol)
+        if create:
+            os.makedirs(path, exist_ok=True)
+        return path
+
+
+    def _lock(self, path):
+        """Returns a lock of a (symbol, interval) directory, which is held
+        by writers across processes.
+
+        Args:
+            path (str): Directory of the (symbol, interval).
+
+        Returns:
+            ContextManager: Lock.
+        """
+
+        return _FileLock(os.path.join(path, 'lock'), self._write_lock)
+
+
+    def _read_manifest(self, path):
+        """Returns the generation and size of the base files.
+
+        Args:
+            path (str): Directory of the (symbol, interval).
+
+        Returns:
+            Tuple[int, int]: Generation and number of candles of base.
+        """
+
+        try:
+            with open(os.path.join(path, 'manifest.json')) as manifest_file:
+                manifest = json.load(manifest_file)
+        except FileNotFoundError:
+            return 0, 0
+        return manifest['generation'], manifest['count']
+
+
+    def _open_base(self, path, generation, count):
+        """Returns the memory-mapped base files of a generation, kept open
+        for next reads.
+
+        Args:
+            path (str): Directory of the (symbol, interval).
+            generation (int): Generation of base files.
+            count (int): Number of candles of base.
+
+        Returns:
+            Dict[str, np.ndarray]: Arrays of `CANDLE_COLUMNS`.
+        """
+
+        key = (path, generation)
+        with self._bases_lock:
+            if key in self._bases:
+                self._bases.move_to_end(key)
+                return self._bases[key]
+
+        if count:
+            base = {
+                column: np.memmap(
+                    os.path.join(path, '{}.{}'.format(generation, column)),
+                    dtype=COLUMN_DTYPES[column], mode='r', shape=(count,)
+                )
+                for column in CANDLE_COLUMNS
+            }
+        else:
+            base = {
+                column: np.empty(0, dtype=COLUMN_DTYPES[column])
+                for column in CANDLE_COLUMNS
+            }
+
+        with self._bases_lock:
+            for old_key in [
+                old_key for old_key in self._bases if old_key[0] == path
+            ]:
+                del self._bases[old_key]
+            self._bases[key] = base
+            while len(self._bases) > self.MAX_OPEN_BASES:
+                self._bases.popitem(last=False)
+        return base
+
+
+    def _read_log(self, path):
+        """Returns the logged candles, a partially written last candle is
+        left out.
+
+        Args:
+            path (str): Directory of the (symbol, interval).
+
+        Returns:
+            np.ndarray: Logged candles of `RECORD_DTYPE`.
+        """
+
+        try:
+            with open(os.path.join(path, 'log'), 'rb') as log_file:
+                data = log_file.read()
+        except FileNotFoundError:
+            data = b''
+        count = len(data) // RECORD_SIZE
+        return np.frombuffer(
+            data, dtype=RECORD_DTYPE, count=count
+        )
+
+
+    def _log_size(self, path):
+        """Returns the number of logged candles.
+
+        Args:
+            path (str): Directory of the (symbol, interval).
+
+        Returns:
+            int: Number of logged candles.
+        """
+
+        try:
+            size = os.path.getsize(os.path.join(path, 'log'))
+        except FileNotFoundError:
+            return 0
+        return size // RECORD_SIZE
+
+
+    def _read_range(self, path, start=None, end=None, locked=False):
+        """Returns the candles of a (symbol, interval) in a time range. The
+        range of base is found by a binary search on its timestamps, and
+        only the logged candles within the range are merged into it. Base
+        and log are read again if the log is compacted while being read.
+
+        Args:
+            path (str): Directory of the (symbol, interval).
+            start optional(int): Timestamp of the first candle, inclusive.
+            end optional(int): Timestamp of the last candle, inclusive.
+            locked optional(bool): Whether writer lock is held by caller.
+
+        Returns:
+            Dict[str, np.ndarray]: Arrays of `CANDLE_COLUMNS`, views of base
+            files when the log has no candle in the range.
+
+        Raises:
+            FileNotFoundError: If base files of current generation are
+                missing.
+        """
+
+        while True:
+            generation, count = self._read_manifest(path)
+            try:
+                base = self._open_base(path, generation, count)
+            except FileNotFoundError:
+                # Generation was removed by compactions since the manifest
+                # was read, unless its files are really missing.
+                if locked or self._read_manifest(path)[0] == generation:
+                    raise
+                continue
+            log = self._read_log(path)
+            if locked or self._read_manifest(path)[0] == generation:
+                break
+
+        timestamps = base['timestamp']
+        first = 0 if start is None else int(np.searchsorted(
+            timestamps, start, side='left'
+        ))
+        last = len(timestamps) if end is None else int(np.searchsorted(
+            timestamps, end, side='right'
+        ))
+        base = {column: values[first:last] for column, values in base.items()}
+
+        if len(log):
+            in_range = np.ones(len(log), dtype=bool)
+            if start is not None:
+                in_range &= log['timestamp'] >= start
+            if end is not None:
+                in_range &= log['timestamp'] <= end
+            log = log[in_range]
+        if not len(log):
+            return base
+        return _merge_log(base, log)
+
+
+    def _compact(self, path):
+        """Merges the log into a new generation of base files, writer lock
+        must be held by caller. Base files of a generation are never
+        changed, so readers which mapped the previous generation keep
+        reading it, and they are only removed by the next compaction, so a
+        reader which just found the previous generation in the manifest can
+        still map it.
+
+        Args:
+            path (str): Directory of the (symbol, interval).
+        """
+
+        columns = self._read_range(path, locked=True)
+        generation, _ = self._read_manifest(path)
+        new_generation = generation + 1
+        for column in CANDLE_COLUMNS:
+            column_path = os.path.join(
+                path, '{}.{}'.format(new_generation, column)
+            )
+            np.ascontiguousarray(
+                columns[column], dtype=COLUMN_DTYPES[column]
+            ).tofile(column_path + '.tmp')
+            os.replace(column_path + '.tmp', column_path)
+
+        manifest_path = os.path.join(path, 'manifest.json')
+        with open(manifest_path + '.tmp', 'w') as manifest_file:
+            json.dump({
+                'generation': new_generation,
+                'count': len(columns['timestamp']),
+            }, manifest_file)
+        os.replace(manifest_path + '.tmp', manifest_path)
+        open(os.path.join(path, 'log'), 'wb').close()
+
+        for column in CANDLE_COLUMNS:
+            try:
+                os.remove(os.path.join(
+                    path, '{}.{}'.format(generation - 1, column)
+                ))
+            except OSError:
+                pass
+
+
+def _merge_log(base, log):
+    """Merges logged candles into candles of base, without sorting base. A
+    logged candle replaces the candle of base with the same timestamp, and
+    the last written candle of a timestamp is kept.
+
+    Args:
+        base (Dict[str, np.ndarray]): Arrays of `CANDLE_COLUMNS` ordered by
+            timestamp.
+        log (np.ndarray): Logged candles of `RECORD_DTYPE`, in written
+            order.
+
+    Returns:
+        Dict[str, np.ndarray]: Merged arrays of `CANDLE_COLUMNS`.
+    """
+
+    log = log[np.argsort(log['timestamp'], kind='stable')]
+    timestamps = log['timestamp']
+    log = log[np.append(timestamps[1:] != timestamps[:-1], True)]
+    timestamps = log['timestamp']
+
+    base_timestamps = base['timestamp']
+    positions = np.searchsorted(base_timestamps, timestamps, side='left')
+    found = positions < len(base_timestamps)
+    found[found] = base_timestamps[positions[found]] == timestamps[found]
+    replaced = positions[found]
+    kept = np.ones(len(base_timestamps), dtype=bool)
+    kept[replaced] = False
+    # Positions in base without its replaced candles.
+    positions = positions - np.searchsorted(replaced, positions, side='left')
+    return {
+        column: np.insert(base[column][kept], positions, log[column])
+        for column in CANDLE_COLUMNS
+    }
+
+
+class _FileLock:
+    """
+    Class defining an exclusive lock of a file across processes, combined
+    with a lock across threads of a process. Only the thread lock is used
+    where `fcntl` is not available.
+    """
+
+    def __init__(self, path, thread_lock):
+        self.path = path
+        self.thread_lock = thread_lock
+        self._file = None
+
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        if fcntl is not None:
+            self._file = open(self.path, 'a')
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+
+    def __exit__(self, *exc_info):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self.thread_lock.release()
+
+
+_candle_store = None
+_candle_store_lock = threading.Lock()
+
+
+def get_candle_store():
+    """Returns the process wide candle store.
+
+    Returns:
+        Optional[CandleStore]: Candle store, or None if it is disabled.
+    """
+
+    global _candle_store
+    store_settings = get_candle_store_settings()
+    if not store_settings['ENABLED']:
+        return None
+    with _candle_store_lock:
+        if _candle_store is None:
+            _candle_store = CandleStore(
+                store_settings['DIR'], store_settings['COMPACT_AFTER']
+            )
+        return _candle_store
+
+
+def reset_candle_store():
+    """Drops the process wide candle store, so that it is created again
+    with current settings on next use.
+    """
+
+    global _candle_store
+    with _candle_store_lock:
+        _candle_store = None
+
+
+@receiver(setting_changed)
+def reset_candle_store_on_setting_change(sender, setting, **kwargs):
+    """Function to recreate candle store when its settings are changed, like
+    in tests.
+
+    Args:
+        sender (Type): A sender of setting changed signal.
+        setting (str): Name of the changed setting.
+    """
+
+    if setting == 'CANDLE_STORE':
+        reset_candle_store()
@@ -0,0 +1,251 @@
+"""
+Module that defines the record and replay of upstream api responses.
+
+In record mode, every response body fetched by `utils` is appended, along
+with its url and latency, to a cassette: a JSON lines file, gzip compressed
+when its path ends with '.gz'. In replay mode, responses are served from the
+cassette instead of the network, after their recorded latency or as fast as
+possible, so that production traffic can be reproduced offline for
+benchmarks, parser changes can be profiled against real payloads, and tests
+run without network or quota. Api keys are removed from recorded urls, so a
+cassette is replayed whatever keys are configured.
+
+Settings:
+    UPSTREAM_CASSETTE (Dict[str, Any]): Configuration of cassette. Like
+        below:
+        - MODE (Optional[str]): 'record', 'replay' or None to disable
+            cassette (default: None).
+        - PATH (str): Path of cassette file.
+        - REPLAY_TIMING (str): 'original' to serve responses after their
+            recorded latency, 'fast' to serve them at once (default:
+            'original').
+"""
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from collections import defaultdict
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import base64
+import gzip
+import json
+import threading
+
+
+DEFAULT_UPSTREAM_CASSETTE_SETTINGS = {
+    'MODE': None,
+    'PATH': None,
+    'REPLAY_TIMING': 'original',
+}
+
+RECORD = 'record'
+REPLAY = 'replay'
+
+# Query parameters which are not recorded.
+SECRET_PARAMETERS = ('apikey',)
+
+
+def get_upstream_cassette_settings():
+    """Returns the cassette settings merged over defaults.
+
+    Returns:
+        Dict[str, Any]: Cassette settings.
+    """
+
+    return {
+        **DEFAULT_UPSTREAM_CASSETTE_SETTINGS,
+        **getattr(settings, 'UPSTREAM_CASSETTE', {})
+    }
+
+
+def normalize_url(url):
+    """Returns the url under which a response is recorded, without secret
+    query parameters and with sorted query parameters.
+
+    Args:
+        url (str): Url of the request.
+
+    Returns:
+        str: Normalized url.
+    """
+
+    parts = urlsplit(url)
+    query = sorted(
+        (name, value) for name, value in parse_qsl(parts.query)
+        if name.lower() not in SECRET_PARAMETERS
+    )
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def open_cassette_file(path, mode):
+    """Opens a cassette file, with gzip when its path ends with '.gz'.
+
+    Args:
+        path (str): Path of cassette file.
+        mode (str): Mode like 'rt' or 'at'.
+
+    Returns:
+        IO[str]: Opened text file.
+    """
+
+    if str(path).endswith('.gz'):
+        return gzip.open(path, mode, encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+class Cassette:
+    """
+    Class defining a cassette of upstream api responses. A recorded url is
+    replayed as many times as it was recorded, in the same order, and its
+    last response is replayed again after that.
+
+    Attributes:
+        path: Path of cassette file.
+        mode: `RECORD` or `REPLAY`.
+        replay_timing: 'original' or 'fast'.
+
+    Methods:
+        record: Appends a response to the cassette.
+        replay: Returns the next recorded response of a url.
+    """
+
+    def __init__(self, path, mode, replay_timing='original'):
+        if mode not in (RECORD, REPLAY):
+            raise ImproperlyConfigured(
+                'Unknown cassette mode {!r}.'.format(mode)
+            )
+        if not path:
+            raise ImproperlyConfigured('Cassette path is not set.')
+        self.path = path
+        self.mode = mode
+        self.replay_timing = replay_timing
+        self._lock = threading.Lock()
+        self._responses = None
+        self._replayed = defaultdict(int)
+
+
+    def record(self, url, status, body, elapsed):
+        """Appends a response to the cassette.
+
+        Args:
+            url (str): Url of the request.
+            status (int): Http status of the response.
+            body (bytes): Body of the response.
+            elapsed (float): Seconds from the request to the end of body.
+        """
+
+        entry = {
+            'url': normalize_url(url),
+            'status': status,
+            'elapsed': round(elapsed, 6),
+        }
+        try:
+            entry['body'] = body.decode('utf-8')
+        except UnicodeDecodeError:
+            entry['body_base64'] = base64.b64encode(body).decode('ascii')
+
+        line = json.dumps(entry) + '\n'
+        with self._lock:
+            # Every line is a separate gzip member when compressed, which
+            # is read back as a single stream.
+            with open_cassette_file(self.path, 'at') as cassette_file:
+                cassette_file.write(line)
+
+
+    def replay(self, url):
+        """Returns the next recorded response of a url.
+
+        Args:
+            url (str): Url of the request.
+
+        Returns:
+            Tuple[bytes, float]: Body of the response, and seconds to wait
+            before serving it.
+
+        Raises:
+            LookupError: If no response of the url was recorded.
+        """
+
+        normalized_url = normalize_url(url)
+        with self._lock:
+            if self._responses is None:
+                self._responses = self._load()
+            responses = self._responses.get(normalized_url)
+            if not responses:
+                raise LookupError(
+                    'No response of {} in cassette {}.'.format(
+                        normalized_url, self.path
+                    )
+                )
+            index = min(self._replayed[normalized_url], len(responses) - 1)
+            self._replayed[normalized_url] += 1
+
+        body, elapsed = responses[index]
+        if self.replay_timing == 'fast':
+            elapsed = 0.0
+        return body, elapsed
+
+
+    def _load(self):
+        """Reads the recorded responses of cassette file.
+
+        Returns:
+            Dict[str, List[Tuple[bytes, float]]]: Body and latency of
+            recorded responses of each url, in order of recording.
+        """
+
+        responses = defaultdict(list)
+        with open_cassette_file(self.path, 'rt') as cassette_file:
+            for line in cassette_file:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if 'body' in entry:
+                    body = entry['body'].encode('utf-8')
+                else:
+                    body = base64.b64decode(entry['body_base64'])
+                responses[entry['url']].append((body, entry['elapsed']))
+        return dict(responses)
+
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette():
+    """Returns the process wide cassette, when a cassette mode is set.
+
+    Returns:
+        Optional[Cassette]: Cassette, or None if responses are neither
+        recorded nor replayed.
+    """
+
+    global _cassette
+    cassette_settings = get_upstream_cassette_settings()
+    if not cassette_settings['MODE']:
+        return None
+    with _cassette_lock:
+        if _cassette is None:
+            _cassette = Cassette(
+                cassette_settings['PATH'], cassette_settings['MODE'],
+                cassette_settings['REPLAY_TIMING']
+            )
+        return _cassette
+
+
+@receiver(setting_changed)
+def reset_cassette_on_setting_change(sender, setting, **kwargs):
+    """Function to reload the cassette when its settings are changed, like
+    in tests.
+
+    Args:
+        sender (Type): A sender of setting changed signal.
+        setting (str): Name of the changed setting.
+    """
+
+    global _cassette
+    if setting == 'UPSTREAM_CASSETTE':
+        with _cassette_lock:
+            _cassette = None
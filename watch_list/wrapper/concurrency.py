@@ -0,0 +1,205 @@
+"""
+Module that defines the limiter of concurrent outbound requests of each
+upstream provider.
+
+Every request fetching symbols runs its own event loop (`asyncio.run`), so
+limiters are shared by the threads of the process and are not bound to any
+event loop. A request over the limit waits for a free slot in order of
+arrival, and slots are handed from a finished request straight to the next
+waiting one, in whichever event loop it is waiting.
+
+Settings:
+    UPSTREAM_CONCURRENCY (Dict[str, Any]): Configuration of outbound
+        requests. Like below:
+        - MAX_CONCURRENT (int): Max number of requests in flight to each
+            provider (host) at a time (default: 8).
+"""
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from collections import deque
+from urllib.parse import urlsplit
+import asyncio
+import threading
+import time
+
+
+DEFAULT_UPSTREAM_CONCURRENCY_SETTINGS = {
+    'MAX_CONCURRENT': 8,
+}
+
+
+def get_upstream_concurrency_settings():
+    """Returns the upstream concurrency settings merged over defaults.
+
+    Returns:
+        Dict[str, Any]: Upstream concurrency settings.
+    """
+
+    return {
+        **DEFAULT_UPSTREAM_CONCURRENCY_SETTINGS,
+        **getattr(settings, 'UPSTREAM_CONCURRENCY', {})
+    }
+
+
+class ConcurrencyLimiter:
+    """
+    Class defining a limiter of concurrent requests, shared by event loops
+    of every thread. Use it as `async with limiter:` around a request.
+
+    Attributes:
+        limit: Max number of requests in flight.
+        in_flight: Number of requests in flight.
+        max_waiting: Max number of requests which waited at a time.
+        acquired: Number of requests which got a slot.
+
+    Methods:
+        acquire: Waits for a free slot.
+        release: Frees a slot, handing it to the next waiting request.
+        metrics: Returns the gauges of the limiter.
+    """
+
+    def __init__(self, limit, clock=time.monotonic):
+        self.limit = limit
+        self.in_flight = 0
+        self.max_waiting = 0
+        self.acquired = 0
+        self._clock = clock
+        self._total_wait = 0.0
+        # (loop, future, queued at) of waiting requests, in order of arrival.
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+
+    async def acquire(self):
+        """Waits for a free slot, in order of arrival."""
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.in_flight < self.limit and not self._waiters:
+                self.in_flight += 1
+                self.acquired += 1
+                return
+            waiter = (loop, loop.create_future(), self._clock())
+            self._waiters.append(waiter)
+            self.max_waiting = max(self.max_waiting, len(self._waiters))
+
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                handed = waiter not in self._waiters
+                if not handed:
+                    self._waiters.remove(waiter)
+            # Slot was handed over just before cancellation.
+            if handed:
+                self.release()
+            raise
+
+
+    def release(self):
+        """Frees a slot, handing it to the next waiting request if any."""
+
+        with self._lock:
+            if not self._waiters:
+                self.in_flight -= 1
+                return
+            loop, future, queued_at = self._waiters.popleft()
+            self.acquired += 1
+            self._total_wait += self._clock() - queued_at
+        loop.call_soon_threadsafe(_wake, future)
+
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+
+    def metrics(self):
+        """Returns the gauges of the limiter.
+
+        Returns:
+            Dict[str, Any]: Limit, requests in flight and waiting, max
+            requests which waited at a time, requests which got a slot and
+            their mean wait in seconds.
+        """
+
+        with self._lock:
+            return {
+                'limit': self.limit,
+                'in_flight': self.in_flight,
+                'waiting': len(self._waiters),
+                'max_waiting': self.max_waiting,
+                'acquired': self.acquired,
+                'mean_wait': round(
+                    self._total_wait / self.acquired, 4
+                ) if self.acquired else 0.0,
+            }
+
+
+def _wake(future):
+    """Wakes a waiting request, unless it was cancelled meanwhile.
+
+    Args:
+        future (asyncio.Future): Future awaited by the request.
+    """
+
+    if not future.done():
+        future.set_result(None)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_outbound_limiter(url):
+    """Returns the process wide limiter of the provider of a url.
+
+    Args:
+        url (str): URL of the request.
+
+    Returns:
+        ConcurrencyLimiter: Limiter of the host of url.
+    """
+
+    host = urlsplit(url).netloc
+    with _limiters_lock:
+        limiter = _limiters.get(host)
+        if limiter is None:
+            limiter = _limiters[host] = ConcurrencyLimiter(
+                get_upstream_concurrency_settings()['MAX_CONCURRENT']
+            )
+        return limiter
+
+
+def get_outbound_metrics():
+    """Returns the gauges of limiter of each provider.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: Metrics of limiter by host.
+    """
+
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {host: limiter.metrics() for host, limiter in limiters.items()}
+
+
+@receiver(setting_changed)
+def reset_outbound_limiters_on_setting_change(sender, setting, **kwargs):
+    """Function to drop the limiters when their settings are changed, like
+    in tests.
+
+    Args:
+        sender (Type): A sender of setting changed signal.
+        setting (str): Name of the changed setting.
+    """
+
+    if setting == 'UPSTREAM_CONCURRENCY':
+        with _limiters_lock:
+            _limiters.clear()
@@ -0,0 +1,228 @@
+"""
+Module that defines the returns, rolling volatility and correlation matrix
+of a set of symbols, computed over their `CandleSeries`.
+
+Series are aligned on the timestamps which all of them have, found by a
+merge join of their sorted timestamps (binary searches of one sorted array
+in another), so aligning needs neither pandas nor any python loop over
+candles. Returns are log returns of close prices of aligned candles, and
+every statistic is computed over a (symbols x candles) matrix at once.
+
+Results are cached by symbols, interval, options and the newest candle of
+each symbol, so they are recomputed only when a symbol gets a new candle.
+"""
+
+from . import symbols_data_fetcher
+from .candle_series import format_timestamps
+from .lazy_imports import LazyModule
+
+import hashlib
+
+np = LazyModule('numpy')
+
+
+# Seconds for which results are cached. Results of newer candles have a
+# different key, so ttl only bounds the size of cache.
+CORRELATION_CACHE_TTL = 600
+
+
+def align_closes(series_list):
+    """Aligns close prices of series on the timestamps which all of them
+    have, by a merge join of their sorted timestamps.
+
+    Args:
+        series_list (List[CandleSeries]): Candles of each symbol.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Common timestamps, and a (symbols x
+        timestamps) matrix of close prices.
+    """
+
+    common = series_list[0].timestamps if series_list else np.empty(0, '<i8')
+    for series in series_list[1:]:
+        if not len(series) or not len(common):
+            common = common[:0]
+            break
+        positions = np.minimum(
+            np.searchsorted(series.timestamps, common), len(series) - 1
+        )
+        common = common[series.timestamps[positions] == common]
+
+    closes = np.empty((len(series_list), len(common)))
+    for row, series in enumerate(series_list):
+        closes[row] = series.closes[np.searchsorted(series.timestamps, common)]
+    return common, closes
+
+
+def rolling_volatility(returns, window):
+    """Returns the rolling standard deviation of returns over a window of
+    candles, from running sums of returns and of squared returns.
+
+    Args:
+        returns (np.ndarray): (symbols x candles) matrix of returns.
+        window (int): Number of candles of the window, at least 2.
+
+    Returns:
+        np.ndarray: Matrix of same shape, with NaN until window is full.
+    """
+
+    volatility = np.full(returns.shape, np.nan)
+    if returns.shape[1] < window:
+        return volatility
+
+    zeros = np.zeros((returns.shape[0], 1))
+    sums = np.concatenate([zeros, np.cumsum(returns, axis=1)], axis=1)
+    squares = np.concatenate(
+        [zeros, np.cumsum(returns * returns, axis=1)], axis=1
+    )
+    window_sums = sums[:, window:] - sums[:, :-window]
+    window_squares = squares[:, window:] - squares[:, :-window]
+    variances = (window_squares - window_sums * window_sums / window) / (
+        window - 1
+    )
+    # Rounding errors of running sums can make a zero variance negative.
+    volatility[:, window - 1:] = np.sqrt(np.maximum(variances, 0))
+    return volatility
+
+
+def correlation_matrix(returns):
+    """Returns the pairwise correlation of returns of symbols.
+
+    Args:
+        returns (np.ndarray): (symbols x candles) matrix of returns.
+
+    Returns:
+        np.ndarray: (symbols x symbols) matrix, NaN for symbols whose
+        returns are constant or when there are less than 2 returns.
+    """
+
+    if returns.shape[1] < 2 or not len(returns):
+        return np.full((returns.shape[0], returns.shape[0]), np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.atleast_2d(np.corrcoef(returns))
+
+
+def to_json_values(values):
+    """Converts an array to (nested) lists of floats, with None for NaN.
+
+    Args:
+        values (np.ndarray): Array of floats.
+
+    Returns:
+        list: Values, nested like the array.
+    """
+
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+def compute_correlation(series_list, window, limit=None):
+    """Computes the aligned returns, rolling volatility and correlation
+    matrix of symbols.
+
+    Args:
+        series_list (List[CandleSeries]): Candles of each symbol.
+        window (int): Number of returns of rolling volatility, at least 2.
+        limit optional(int): Max number of newest aligned candles to use
+            (default: all of them).
+
+    Returns:
+        Dict[str, Any]: Result with `symbols`, `timestamps` of returns,
+        `returns` and `volatility` of each symbol and `correlation` matrix
+        rows, in order of symbols.
+    """
+
+    timestamps, closes = align_closes(series_list)
+    if limit is not None:
+        timestamps, closes = timestamps[-limit:], closes[:, -limit:]
+    returns = np.diff(np.log(closes), axis=1)
+    symbols = [series.symbol for series in series_list]
+    return {
+        'symbols': symbols,
+        'timestamps': format_timestamps(timestamps[1:]),
+        'returns': dict(zip(symbols, to_json_values(returns))),
+        'volatility': dict(zip(
+            symbols, to_json_values(rolling_volatility(returns, window))
+        )),
+        'correlation': to_json_values(correlation_matrix(returns)),
+    }
+
+
+def get_correlation_cache_key(series_list, interval, window, limit):
+    """Returns the cache key of a result, which changes whenever a symbol
+    gets a new candle, or its newest candle is revised (like a candle of the
+    current period whose close moves until the period is over).
+
+    Args:
+        series_list (List[CandleSeries]): Candles of each symbol.
+        interval (str): Time interval of the data.
+        window (int): Number of returns of rolling volatility.
+        limit (Optional[int]): Max number of newest aligned candles.
+
+    Returns:
+        str: Cache key.
+    """
+
+    key = '{}:{}:{}:{}'.format(interval, window, limit, ','.join(
+        '{}@{}:{}:{!r}'.format(
+            series.symbol, len(series), series.timestamps[-1],
+            float(series.closes[-1])
+        ) if len(series) else '{}@'.format(series.symbol)
+        for series in series_list
+    ))
+    return 'correlation:{}'.format(
+        hashlib.sha256(key.encode('utf-8')).hexdigest()
+    )
+
+
+def get_symbols_correlation(symbols, window,
+                            interval=symbols_data_fetcher.DEFAULT_INTERVAL,
+                            limit=None, owner=None):
+    """Returns the aligned returns, rolling volatility and correlation
+    matrix of symbols. Candles are served like symbols data, so uncached
+    symbols are fetched as far as call budget allows and the remaining ones
+    are returned as pending. When upstream api reports that its quota is
+    reached and no symbol could be served, then this function returns with
+    a note (429 error).
+
+    Args:
+        symbols (List[str]): List of symbols.
+        window (int): Number of returns of rolling volatility, at least 2.
+        interval optional(str): Time interval of the data (default: '5min').
+        limit optional(int): Max number of newest aligned candles to use
+            (default: all of them).
+        owner optional(Hashable): Owner of the request, like id of user,
+            whose share of call budget is used (default: None).
+
+    Returns:
+        dict: Result of `compute_correlation` for served symbols, along with
+        `pending_symbols` and `pending_symbols_eta` like symbols data.
+    """
+
+    symbols = list(dict.fromkeys(symbols))
+    parsed_symbols_data, pending_symbols, pending_symbols_eta, limited = (
+        symbols_data_fetcher.get_symbols_series(
+            symbols, interval, owner=owner
+        )
+    )
+    if limited and not parsed_symbols_data:
+        return {
+            "Note": "You have reached the limit of 5 calls per minute."
+        }
+
+    series_list = [
+        parsed_symbols_data[symbol] for symbol in symbols
+        if symbol in parsed_symbols_data
+    ]
+    cache = symbols_data_fetcher.get_series_cache()
+    cache_key = get_correlation_cache_key(
+        series_list, interval, window, limit
+    )
+    response = cache.get(cache_key)
+    if response is None:
+        response = compute_correlation(series_list, window, limit)
+        cache.set(cache_key, response, CORRELATION_CACHE_TTL)
+    return {
+        **response,
+        'pending_symbols': pending_symbols,
+        'pending_symbols_eta': pending_symbols_eta,
+    }
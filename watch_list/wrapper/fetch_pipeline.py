@@ -0,0 +1,249 @@
+"""
+Module that defines the batched fetch pipeline, which fetches queued
+symbols in the background as fast as the upstream quota allows.
+
+Symbols are queued per owner (like the user who asked for them), and
+batches take symbols from the queues of owners in turn (round robin), so
+an owner with many queued symbols doesn't starve the others.
+"""
+
+from collections import OrderedDict
+from django.db import close_old_connections, connections
+
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+class BatchFetchPipeline:
+    """
+    Class defining a background pipeline of symbol fetches. Symbols are
+    queued once per (symbol, interval) in a queue of their owner, and a
+    worker thread fetches them in batches of whatever the call budget
+    allows, waiting for the budget to refill in between. Batches take
+    symbols from queues of owners in turn. Worker thread is started on
+    demand and stops when the queue is empty.
+
+    Attributes:
+        budget: `CallBudget` shared with the request path.
+        fetch_batch: Callable which fetches and caches a batch of symbols of
+            an interval, called as `fetch_batch(symbols, interval)`, and
+            returns symbols to queue again (if any).
+
+    Methods:
+        schedule: Queues symbols and returns their estimated wait.
+        run_once: Fetches the next batch allowed by budget.
+        pending_count: Returns the number of queued symbols.
+        other_owners_count: Returns the number of other owners with queued
+            symbols.
+        clear: Drops all queued symbols.
+    """
+
+    def __init__(self, budget, fetch_batch, autostart=True):
+        self.budget = budget
+        self.fetch_batch = fetch_batch
+        self.autostart = autostart
+        # Queued symbols of each (owner, interval), in order of turns.
+        self._queues = OrderedDict()
+        # Owner of each queued (symbol, interval).
+        self._owners = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker = None
+
+
+    def schedule(self, symbols, interval, owner=None, first=False):
+        """Queues symbols of an interval, already queued symbols keep their
+        place in queue (and their owner).
+
+        Args:
+            symbols (List[str]): Symbols to fetch.
+            interval (str): Time interval of the data.
+            owner optional(Hashable): Owner of symbols, like id of user
+                (default: None, symbols without an owner share a queue).
+            first optional(bool): Whether symbols are queued ahead of other
+                symbols of owner, like symbols fetched again (default: False).
+
+        Returns:
+            Dict[str, float]: Estimated seconds until each symbol is fetched.
+        """
+
+        with self._lock:
+            for symbol in reversed(symbols) if first else symbols:
+                if (symbol, interval) in self._owners:
+                    continue
+                self._owners[(symbol, interval)] = owner
+                queue = self._queues.setdefault(
+                    (owner, interval), OrderedDict()
+                )
+                queue[symbol] = None
+                if first:
+                    queue.move_to_end(symbol, last=False)
+            positions = self._get_positions(symbols, interval)
+            if self.autostart:
+                self._start_worker()
+        self._wakeup.set()
+
+        return {
+            symbol: round(self.budget.eta(positions[symbol]), 1)
+            for symbol in symbols
+        }
+
+
+    def _get_positions(self, symbols, interval):
+        """Returns the number of symbols fetched ahead of each queued
+        symbol, when queues take turns. Lock must be held by caller.
+
+        Args:
+            symbols (List[str]): Queued symbols.
+            interval (str): Time interval of the data.
+
+        Returns:
+            Dict[str, int]: Position of each symbol.
+        """
+
+        indexes = {}
+        for owner in {self._owners[(symbol, interval)] for symbol in symbols}:
+            for index, symbol in enumerate(self._queues[(owner, interval)]):
+                indexes[symbol] = index
+
+        turns = {key: turn for turn, key in enumerate(self._queues)}
+        queue_sizes = [len(queue) for queue in self._queues.values()]
+        positions = {}
+        for symbol in symbols:
+            index = indexes[symbol]
+            turn = turns[(self._owners[(symbol, interval)], interval)]
+            # Queues ahead in turns get one more turn before the symbol.
+            positions[symbol] = index + sum(
+                min(size, index + (other_turn < turn))
+                for other_turn, size in enumerate(queue_sizes)
+                if other_turn != turn
+            )
+        return positions
+
+
+    def run_once(self):
+        """Fetches the next batch of queued symbols allowed by budget. All
+        symbols of a batch have same interval, and are taken from queues of
+        owners in turn, starting with the owner whose turn it is.
+
+        Returns:
+            int: Number of symbols fetched.
+        """
+
+        with self._lock:
+            if not self._queues:
+                return 0
+            interval = next(iter(self._queues))[1]
+            keys = [key for key in self._queues if key[1] == interval]
+            granted = self.budget.acquire(sum(
+                len(self._queues[key]) for key in keys
+            ))
+            batch = []
+            served_keys = []
+            while len(batch) < granted:
+                for key in keys:
+                    queue = self._queues[key]
+                    if not queue or len(batch) == granted:
+                        continue
+                    symbol = queue.popitem(last=False)[0]
+                    batch.append((symbol, key[0]))
+                    del self._owners[(symbol, interval)]
+                    served_keys.append(key)
+
+            # Owners take their next turn in order of their last turn.
+            for key in served_keys:
+                self._queues.move_to_end(key)
+            for key in set(served_keys):
+                if not self._queues[key]:
+                    del self._queues[key]
+
+        if not batch:
+            return 0
+        symbols = [symbol for symbol, owner in batch]
+        try:
+            retry_symbols = self.fetch_batch(symbols, interval) or []
+        except Exception:
+            logger.exception('Unable to fetch symbols %s', symbols)
+            return len(symbols)
+
+        owners = dict(batch)
+        for owner in dict.fromkeys(owners[symbol] for symbol in retry_symbols):
+            self.schedule([
+                symbol for symbol in retry_symbols if owners[symbol] == owner
+            ], interval, owner, first=True)
+        return len(symbols)
+
+
+    def pending_count(self):
+        """Returns the number of queued symbols.
+
+        Returns:
+            int: Number of queued symbols.
+        """
+
+        with self._lock:
+            return len(self._owners)
+
+
+    def other_owners_count(self, owner):
+        """Returns the number of owners, other than an owner, with queued
+        symbols.
+
+        Args:
+            owner (Hashable): Owner of symbols.
+
+        Returns:
+            int: Number of other owners.
+        """
+
+        with self._lock:
+            return len({
+                queue_owner for queue_owner, interval in self._queues
+                if queue_owner != owner
+            })
+
+
+    def clear(self):
+        """Drops all queued symbols."""
+
+        with self._lock:
+            self._queues.clear()
+            self._owners.clear()
+
+
+    def _start_worker(self):
+        """Starts the worker thread when it is not running, lock must be
+        held by caller.
+        """
+
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(
+                target=self._work, name='batch-fetch-pipeline', daemon=True
+            )
+            self._worker.start()
+
+
+    def _work(self):
+        """Loop of worker thread, which fetches batches until queue is empty
+        and sleeps until budget refills in between. DB connections of thread
+        are released after every batch, like of a request.
+        """
+
+        while True:
+            with self._lock:
+                if not self._queues:
+                    self._worker = None
+                    # DB connections of thread are not reused anymore.
+                    connections.close_all()
+                    return
+            try:
+                fetched = self.run_once()
+            finally:
+                # Batches use the DB, like when price alerts are triggered.
+                close_old_connections()
+            if not fetched:
+                self._wakeup.clear()
+                self._wakeup.wait(max(0.5, self.budget.eta(0)))
@@ -0,0 +1,382 @@
+"""
+Module that defines the incremental decoding of intraday payloads of
+upstream api.
+
+Decoding a whole response with `json.loads` builds a dict of dicts of
+strings, several hundreds of bytes per candle, before candles are converted
+to typed arrays. `IntradayDecoder` is fed the chunks of a response as they
+arrive instead: the top level of the payload and the time series object are
+scanned by hand, and only a single candle at a time is decoded by the json
+module. Values of candles are collected in blocks of `BLOCK_SIZE` candles,
+which are converted to typed arrays when full, so the memory held while
+decoding is the typed columns plus a block and a chunk, whatever the size of
+the payload.
+"""
+
+from .candle_series import DEFAULT_DECIMALS, CandleSeries, get_decimals
+from .lazy_imports import LazyModule
+from .parse_pool import PARSED, get_response_status
+
+import codecs
+import json
+import re
+
+np = LazyModule('numpy')
+
+
+# Number of candles collected as strings before they are converted to typed
+# arrays.
+BLOCK_SIZE = 4096
+
+# Max characters of a single value which is not complete yet, like a meta
+# data object or a candle. Larger values mean the payload isn't intraday
+# data.
+MAX_PENDING_CHARS = 1024 * 1024
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+# Date time key of a candle up to its value, after the first candle or
+# after the comma separating it from previous candle.
+FIRST_CANDLE_KEY_PATTERN = re.compile(
+    r'[ \t\n\r]*"([^"\\]*)"[ \t\n\r]*:[ \t\n\r]*'
+)
+NEXT_CANDLE_KEY_PATTERN = re.compile(
+    r'[ \t\n\r]*,[ \t\n\r]*"([^"\\]*)"[ \t\n\r]*:[ \t\n\r]*'
+)
+
+# Keys of candle values, in the order of `CandleSeries` columns.
+CANDLE_KEYS = ('1. open', '2. high', '3. low', '4. close', '5. volume')
+
+# States of the decoder, within the top level object or the time series
+# object.
+START = 'start'
+FIRST_KEY = 'first_key'
+KEY = 'key'
+COLON = 'colon'
+VALUE = 'value'
+NEXT = 'next'
+FIRST_CANDLE = 'first_candle'
+CANDLE_KEY = 'candle_key'
+CANDLE_COLON = 'candle_colon'
+CANDLE = 'candle'
+NEXT_CANDLE = 'next_candle'
+DONE = 'done'
+
+
+class IntradayDecoder:
+    """
+    Class defining an incremental decoder of an intraday payload of api,
+    which collects candles in typed columns.
+
+    Attributes:
+        interval: Time interval of the data.
+        fields: Top level values of payload other than the time series, like
+            'Meta Data', 'Note' or 'Error Message'.
+
+    Methods:
+        feed: Decodes a chunk of the payload.
+        close: Finishes decoding and returns status and candles of payload.
+    """
+
+    def __init__(self, interval, block_size=BLOCK_SIZE):
+        self.interval = interval
+        self.fields = {}
+        self._series_key = 'Time Series ({})'.format(interval)
+        self._has_series = False
+        self._block_size = block_size
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json_decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._state = START
+        self._key = None
+        self._dates = []
+        self._values = tuple([] for _ in CANDLE_KEYS)
+        self._columns = tuple([] for _ in range(len(CANDLE_KEYS) + 1))
+        self._decimals = None
+
+
+    def feed(self, chunk):
+        """Decodes a chunk of the payload. A value split over chunks is
+        decoded once its last chunk is fed.
+
+        Args:
+            chunk (bytes): Next chunk of the payload.
+
+        Raises:
+            ValueError: If payload is not a valid intraday payload.
+        """
+
+        self._buffer += self._text_decoder.decode(chunk)
+        self._decode(final=False)
+
+
+    def close(self):
+        """Finishes decoding and returns status and candles of payload.
+
+        Returns:
+            Tuple[str, Optional[CandleSeries]]: Status of the response, like
+            `parse_pool.parse_symbol_response`.
+
+        Raises:
+            ValueError: If payload is incomplete or not a valid intraday
+                payload.
+        """
+
+        self._buffer += self._text_decoder.decode(b'', final=True)
+        self._decode(final=True)
+        if self._state != DONE:
+            raise ValueError('Incomplete payload.')
+
+        status = get_response_status(self.fields)
+        if status != PARSED:
+            return status, None
+        if not self._has_series:
+            raise ValueError('Payload has no {!r}.'.format(self._series_key))
+
+        self._flush_block()
+        timestamps, opens, highs, lows, closes, volumes = [
+            np.concatenate(chunks) if chunks else np.empty(0, dtype=dtype)
+            for chunks, dtype in zip(self._columns, (
+                np.int64, np.float64, np.float64, np.float64, np.float64,
+                np.int64
+            ))
+        ]
+        order = np.argsort(timestamps, kind='stable')
+        return PARSED, CandleSeries(
+            self.fields['Meta Data']['2. Symbol'], timestamps[order],
+            opens[order], highs[order], lows[order], closes[order],
+            volumes[order],
+            DEFAULT_DECIMALS if self._decimals is None else self._decimals
+        )
+
+
+    def _decode(self, final):
+        """Decodes the buffered text as far as possible, and drops the
+        decoded part of buffer.
+
+        Args:
+            final (bool): Whether no more chunks will be fed.
+
+        Raises:
+            ValueError: If payload is not a valid intraday payload.
+        """
+
+        buffer = self._buffer
+        position = 0
+        while True:
+            if self._state in (FIRST_CANDLE, CANDLE_KEY, NEXT_CANDLE):
+                position = self._decode_candles(buffer, position)
+            position = WHITESPACE.match(buffer, position).end()
+            if position == len(buffer):
+                break
+            char = buffer[position]
+            state = self._state
+
+            if state == DONE:
+                raise ValueError('Extra data after payload.')
+
+            if state in (START, COLON, CANDLE_COLON):
+                expected = '{' if state == START else ':'
+                if char != expected:
+                    raise ValueError('Expected {!r} at {!r}.'.format(
+                        expected, buffer[position:position + 20]
+                    ))
+                self._state = {
+                    START: FIRST_KEY, COLON: VALUE, CANDLE_COLON: CANDLE
+                }[state]
+                position += 1
+                continue
+
+            if state in (NEXT, NEXT_CANDLE) or (
+                char == '}' and state in (FIRST_KEY, FIRST_CANDLE)
+            ):
+                if char == ',' and state in (NEXT, NEXT_CANDLE):
+                    self._state = KEY if state == NEXT else CANDLE_KEY
+                elif char == '}':
+                    self._state = DONE if state in (NEXT, FIRST_KEY) else NEXT
+                else:
+                    raise ValueError(
+                        "Expected ',' or '}}' at {!r}.".format(
+                            buffer[position:position + 20]
+                        )
+                    )
+                position += 1
+                continue
+
+            if state == VALUE and self._key == self._series_key:
+                if char != '{':
+                    raise ValueError('{!r} is not an object.'.format(
+                        self._series_key
+                    ))
+                self._has_series = True
+                self._state = FIRST_CANDLE
+                position += 1
+                continue
+
+            decoded = self._decode_value(buffer, position, final)
+            if decoded is None:
+                break
+            value, position = decoded
+
+            if state in (FIRST_KEY, KEY, FIRST_CANDLE, CANDLE_KEY):
+                if not isinstance(value, str):
+                    raise ValueError('Keys must be strings.')
+                self._key = value
+                self._state = (
+                    COLON if state in (FIRST_KEY, KEY) else CANDLE_COLON
+                )
+            elif state == VALUE:
+                self.fields[self._key] = value
+                self._state = NEXT
+            else:
+                self._add_candle(self._key, value)
+                self._state = NEXT_CANDLE
+
+        self._buffer = buffer[position:]
+
+
+    def _decode_candles(self, buffer, position):
+        """Decodes the candles of buffer in a tight loop, which stops at
+        anything else than complete well formed candles, like an incomplete
+        candle or the end of time series, left for `_decode`.
+
+        Args:
+            buffer (str): Buffered text.
+            position (int): Position of the next candle or separator.
+
+        Returns:
+            int: Position after the decoded candles.
+        """
+
+        scan_once = self._json_decoder.scan_once
+        dates = self._dates
+        opens, highs, lows, closes, volumes = self._values
+        state = self._state
+        last = len(buffer)
+        while True:
+            match = (
+                NEXT_CANDLE_KEY_PATTERN if state == NEXT_CANDLE
+                else FIRST_CANDLE_KEY_PATTERN
+            ).match(buffer, position)
+            if match is None:
+                break
+            try:
+                candle, end = scan_once(buffer, match.end())
+                values = (
+                    candle['1. open'], candle['2. high'], candle['3. low'],
+                    candle['4. close'], candle['5. volume']
+                )
+            except (StopIteration, json.JSONDecodeError, KeyError, TypeError):
+                # Left for `_decode`, which waits for the rest of candle or
+                # raises the error.
+                break
+            if end == last:
+                break
+            opens.append(values[0])
+            highs.append(values[1])
+            lows.append(values[2])
+            closes.append(values[3])
+            volumes.append(values[4])
+            dates.append(match.group(1))
+            if len(dates) >= self._block_size:
+                self._flush_block()
+            position = end
+            state = NEXT_CANDLE
+
+        self._state = state
+        return position
+
+
+    def _decode_value(self, buffer, position, final):
+        """Decodes a single json value of buffer.
+
+        Args:
+            buffer (str): Buffered text.
+            position (int): Position of the value.
+            final (bool): Whether no more chunks will be fed.
+
+        Returns:
+            Optional[Tuple[Any, int]]: Value and position after it, or None
+            if the value is not complete yet.
+
+        Raises:
+            ValueError: If the value is not valid json.
+        """
+
+        try:
+            value, end = self._json_decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if final:
+                raise
+            if len(buffer) - position > MAX_PENDING_CHARS:
+                raise ValueError('Value at {!r} is too large.'.format(
+                    buffer[position:position + 20]
+                ))
+            return None
+        # A number at the end of buffer may continue in next chunk.
+        if end == len(buffer) and not final:
+            return None
+        return value, end
+
+
+    def _add_candle(self, date_time, candle):
+        """Adds a candle to current block, and converts the block to typed
+        arrays when it is full.
+
+        Args:
+            date_time (str): Date time of the candle.
+            candle (dict): Values of the candle.
+
+        Raises:
+            ValueError: If candle misses a value.
+        """
+
+        try:
+            for values, key in zip(self._values, CANDLE_KEYS):
+                values.append(candle[key])
+        except (KeyError, TypeError):
+            raise ValueError('Invalid candle at {!r}.'.format(date_time))
+        self._dates.append(date_time)
+        if len(self._dates) >= self._block_size:
+            self._flush_block()
+
+
+    def _flush_block(self):
+        """Converts the candles of current block to typed arrays."""
+
+        if not self._dates:
+            return
+        if self._decimals is None:
+            # Every price of payload has the decimals of the first candle.
+            self._decimals = max(
+                get_decimals(values[0]) for values in self._values[:4]
+            )
+        self._columns[0].append(np.array(
+            self._dates, dtype='datetime64[s]'
+        ).astype(np.int64))
+        for column, values, dtype in zip(
+            self._columns[1:], self._values,
+            (np.float64, np.float64, np.float64, np.float64, np.int64)
+        ):
+            column.append(np.array(values, dtype=dtype))
+            values.clear()
+        self._dates.clear()
+
+
+def decode_intraday_payload(raw_payload, interval, chunk_size=64 * 1024):
+    """Decodes a whole intraday payload with `IntradayDecoder`, chunk by
+    chunk.
+
+    Args:
+        raw_payload (bytes): Raw body of api response for a symbol.
+        interval (str): Time interval of the data.
+        chunk_size optional(int): Size of fed chunks (default: 64 KB).
+
+    Returns:
+        Tuple[str, Optional[CandleSeries]]: Status and candles of payload.
+    """
+
+    decoder = IntradayDecoder(interval)
+    for start in range(0, len(raw_payload), chunk_size):
+        decoder.feed(raw_payload[start:start + chunk_size])
+    return decoder.close()
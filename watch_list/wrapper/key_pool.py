@@ -0,0 +1,364 @@
+"""
+Module that defines the pool of upstream api keys.
+
+Every key has its own sliding window budget (`CallBudget`), so the total
+upstream throughput is the sum of quotas of keys. Calls are taken from the
+least loaded key, i.e. the key with most calls left in its window, and a
+key for which upstream answers that its quota is reached (a 'Note') is
+quarantined, so no more calls are spent on it until quarantine is over.
+Calls, quota notes and errors are counted per key, by each process.
+
+Windows and quarantines of keys are shared by the processes of the host
+(and by their background threads) through state files of
+`ALPHA_AVANTAGE_QUOTA_DIR`, so the quota of a key is respected however many
+worker processes there are, and a quarantine found by a process is known to
+the others.
+
+Pool has the interface of `CallBudget` (`acquire`, `available`, `eta`,
+`exhaust` and `reset`), so it can be used wherever the call budget is.
+Calls granted by `acquire` are leased to keys, and `take_keys` hands out
+the leased keys when the urls of the calls are built.
+
+Settings:
+    ALPHA_AVANTAGE_API_KEYS (List[str]): Keys of the pool, using the pool
+        without any key raises `ImproperlyConfigured`.
+    ALPHA_AVANTAGE_CALLS_PER_MINUTE (int): Calls allowed per minute of each
+        key (default: 5).
+    ALPHA_AVANTAGE_KEY_QUARANTINE (float): Seconds for which a key is not
+        used after upstream reports that its quota is reached (default: 60).
+    ALPHA_AVANTAGE_QUOTA_DIR (Optional[str]): Directory of state files of
+        keys shared by processes, windows are kept in process when not set
+        (default: None).
+"""
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .parse_pool import FAILED, INVALID, QUOTA_REACHED
+from .quota import CallBudget, SharedWindowState
+
+from collections import deque
+import hashlib
+import os
+import threading
+import time
+
+
+class ApiKey:
+    """
+    Class defining an upstream api key along with its budget and metrics.
+
+    Attributes:
+        key: The api key.
+        budget: Sliding window budget of the key, which is blocked while
+            key is quarantined.
+        calls: Number of calls made with the key.
+        quota_notes: Number of responses reporting that quota is reached.
+        errors: Number of responses which are errors or can't be parsed.
+    """
+
+    def __init__(self, key, calls, period, clock, state_dir=None):
+        self.key = key
+        self.budget = CallBudget(
+            calls, period=period, clock=clock,
+            state=SharedWindowState(os.path.join(
+                state_dir,
+                hashlib.sha256(key.encode()).hexdigest()[:16] + '.json'
+            )) if state_dir else None
+        )
+        self.calls = 0
+        self.quota_notes = 0
+        self.errors = 0
+
+
+    @property
+    def quarantined_until(self):
+        """Time of clock until which key is not used, or None."""
+
+        return self.budget.blocked_until()
+
+
+    def is_quarantined(self, now):
+        """Returns whether the key is quarantined.
+
+        Args:
+            now (float): Current time of clock.
+
+        Returns:
+            bool: Whether key is quarantined.
+        """
+
+        quarantined_until = self.quarantined_until
+        return quarantined_until is not None and quarantined_until > now
+
+
+class ApiKeyPool:
+    """
+    Class defining a pool of upstream api keys with a budget per key.
+
+    Attributes:
+        keys: Keys of the pool.
+        period: Length of window of budgets in seconds.
+        quarantine: Seconds for which a key is not used after its quota is
+            reached.
+
+    Methods:
+        from_settings: Builds the pool of configured keys.
+        acquire: Takes up to the asked number of calls from least loaded
+            keys.
+        take_keys: Returns the keys of calls to make.
+        report: Records the response of a call made with a key.
+        available: Returns the number of calls that can be made now.
+        eta: Returns seconds after which a queued call can be made.
+        exhaust: Marks the budget of every key as used.
+        reset: Forgets all the made calls and quarantines.
+        metrics: Returns the metrics of each key.
+    """
+
+    def __init__(self, keys, calls, period=60.0, quarantine=60.0,
+                 clock=time.monotonic, state_dir=None):
+        self.keys = [
+            ApiKey(key, calls, period, clock, state_dir) for key in keys
+        ]
+        self.period = period
+        self.quarantine = quarantine
+        self._keys_by_key = {api_key.key: api_key for api_key in self.keys}
+        self._clock = clock
+        # (time, key) of calls granted by `acquire`, not taken yet.
+        self._leases = deque()
+        self._lock = threading.Lock()
+
+
+    @classmethod
+    def from_settings(cls):
+        """Builds the pool of `ALPHA_AVANTAGE_API_KEYS` setting, whose
+        windows are shared by processes when `ALPHA_AVANTAGE_QUOTA_DIR` is
+        set.
+
+        Returns:
+            ApiKeyPool: Pool of configured keys.
+        """
+
+        state_dir = getattr(settings, 'ALPHA_AVANTAGE_QUOTA_DIR', None)
+        return cls(
+            getattr(settings, 'ALPHA_AVANTAGE_API_KEYS', []),
+            getattr(settings, 'ALPHA_AVANTAGE_CALLS_PER_MINUTE', 5),
+            period=60,
+            quarantine=getattr(settings, 'ALPHA_AVANTAGE_KEY_QUARANTINE', 60),
+            # Every process has to read times of shared windows alike.
+            clock=time.time if state_dir else time.monotonic,
+            state_dir=state_dir
+        )
+
+
+    @property
+    def calls(self):
+        """Number of calls allowed per window by all keys."""
+
+        return sum(api_key.budget.calls for api_key in self.keys)
+
+
+    def _check_keys(self):
+        """Checks that the pool has keys.
+
+        Raises:
+            ImproperlyConfigured: When the pool has no key.
+        """
+
+        if not self.keys:
+            raise ImproperlyConfigured(
+                'ALPHA_AVANTAGE_API_KEYS setting has no api key.'
+            )
+
+
+    def _least_loaded(self, now):
+        """Returns the key with most calls left in its window, lock must be
+        held by caller.
+
+        Args:
+            now (float): Current time of clock.
+
+        Returns:
+            Optional[ApiKey]: Least loaded key which is not quarantined, or
+            None if every key is quarantined.
+        """
+
+        active_keys = [
+            api_key for api_key in self.keys
+            if not api_key.is_quarantined(now)
+        ]
+        if not active_keys:
+            return None
+        return max(
+            active_keys,
+            key=lambda api_key: (api_key.budget.available(), -api_key.calls)
+        )
+
+
+    def acquire(self, count):
+        """Takes up to `count` calls, one by one from the least loaded key.
+
+        Args:
+            count (int): Number of calls wanted.
+
+        Returns:
+            int: Number of calls granted, which can be less than `count`.
+        """
+
+        self._check_keys()
+        granted = 0
+        with self._lock:
+            now = self._clock()
+            while granted < count:
+                api_key = self._least_loaded(now)
+                if api_key is None or not api_key.budget.acquire(1):
+                    break
+                self._leases.append((now, api_key))
+                granted += 1
+        return granted
+
+
+    def take_keys(self, count):
+        """Returns the keys of calls to make, which are the keys leased by
+        `acquire`. When less calls are leased (like calls made without
+        acquiring them), least loaded keys are used for the rest.
+
+        Args:
+            count (int): Number of calls to make.
+
+        Returns:
+            List[str]: Key of each call.
+        """
+
+        self._check_keys()
+        keys = []
+        with self._lock:
+            now = self._clock()
+            # Leases which were never taken are dropped once their calls
+            # are out of the window.
+            while self._leases and self._leases[0][0] <= now - self.period:
+                self._leases.popleft()
+            while self._leases and len(keys) < count:
+                keys.append(self._leases.popleft()[1].key)
+            while len(keys) < count:
+                api_key = self._least_loaded(now) or min(
+                    self.keys, key=lambda api_key: api_key.quarantined_until
+                )
+                keys.append(api_key.key)
+        return keys
+
+
+    def report(self, key, status):
+        """Records the response of a call made with a key. Key is
+        quarantined when upstream reports that its quota is reached.
+
+        Args:
+            key (str): Key of the call.
+            status (str): Status of the response, like of
+                `parse_pool.get_response_status`.
+        """
+
+        with self._lock:
+            api_key = self._keys_by_key.get(key)
+            if api_key is None:
+                return
+            api_key.calls += 1
+            if status == QUOTA_REACHED:
+                api_key.quota_notes += 1
+                api_key.budget.exhaust(until=self._clock() + self.quarantine)
+            elif status in (INVALID, FAILED):
+                api_key.errors += 1
+
+
+    def available(self):
+        """Returns the number of calls that can be made now.
+
+        Returns:
+            int: Number of available calls of keys which are not
+            quarantined.
+        """
+
+        self._check_keys()
+        with self._lock:
+            return sum(api_key.budget.available() for api_key in self.keys)
+
+
+    def eta(self, position):
+        """Returns seconds after which a queued call can be made, assuming
+        every call ahead of it is made as soon as budget of any key allows.
+
+        Args:
+            position (int): Number of calls queued ahead of the call.
+
+        Returns:
+            float: Seconds until the call can be made.
+        """
+
+        self._check_keys()
+        with self._lock:
+            now = self._clock()
+            slot_times = sorted(
+                slot_time for api_key in self.keys
+                for slot_time in api_key.budget.slot_times()
+            )
+        windows, index = divmod(position, len(slot_times))
+        return max(0.0, slot_times[index] - now) + windows * self.period
+
+
+    def exhaust(self):
+        """Marks the budget of every key as used, like when upstream reports
+        that the quota is reached without knowing the key.
+        """
+
+        for api_key in self.keys:
+            api_key.budget.exhaust()
+
+
+    def reset(self):
+        """Forgets all the made calls and quarantines."""
+
+        with self._lock:
+            self._leases.clear()
+            for api_key in self.keys:
+                api_key.budget.reset()
+
+
+    def metrics(self):
+        """Returns the metrics of each key, keys are masked.
+
+        Returns:
+            List[Dict[str, Any]]: Masked key, number of calls, quota notes
+            and errors, available calls and seconds left of quarantine of
+            each key.
+        """
+
+        with self._lock:
+            now = self._clock()
+            return [
+                {
+                    'key': mask_key(api_key.key),
+                    'calls': api_key.calls,
+                    'quota_notes': api_key.quota_notes,
+                    'errors': api_key.errors,
+                    'available': api_key.budget.available(),
+                    'quarantined_for': round(
+                        max(0.0, quarantined_until - now), 1
+                    ) if quarantined_until is not None else 0.0,
+                }
+                for api_key in self.keys
+                for quarantined_until in (api_key.quarantined_until,)
+            ]
+
+
+def mask_key(key):
+    """Masks an api key, keeping its first characters so keys can be told
+    apart.
+
+    Args:
+        key (str): Api key.
+
+    Returns:
+        str: Masked key.
+    """
+
+    return '{}***'.format(key[:4])
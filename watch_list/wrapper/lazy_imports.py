@@ -0,0 +1,37 @@
+"""
+Module that defines the lazy import of heavy dependencies of the wrapper
+layer, like numpy and aiohttp.
+
+Web workers and management commands import the wrapper through the views,
+but most of them never touch candles or upstream api, so heavy dependencies
+are imported on first use instead of when the wrapper is imported. Modules
+of the wrapper bind them like below:
+
+    np = LazyModule('numpy')
+"""
+
+import importlib
+
+
+class LazyModule:
+    """
+    Class defining a stand-in for a module, which imports the module on
+    first attribute access. Accessed attributes are kept on the stand-in,
+    so later accesses cost the same as on the module itself.
+
+    Attributes:
+        name: Name of the module, like 'numpy'.
+    """
+
+    def __init__(self, name):
+        self.__dict__['name'] = name
+
+
+    def __getattr__(self, attribute):
+        value = getattr(importlib.import_module(self.name), attribute)
+        self.__dict__[attribute] = value
+        return value
+
+
+    def __repr__(self):
+        return '<LazyModule {!r}>'.format(self.name)
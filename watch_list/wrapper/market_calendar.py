@@ -0,0 +1,315 @@
+"""
+Module that defines the trading session calendars of exchanges, used to
+know whether the market of a symbol is open.
+
+An exchange trades on weekdays between its open and close times, in its
+own time zone, except on the holidays of the local holiday file, which
+lists closed days and days closing early. The exchange of a symbol is
+known by the suffix of the symbol (like `TSCO.LON`), and symbols without a
+known suffix trade on the default exchange.
+
+Times are seconds since epoch, like of `time.time()`.
+
+Settings:
+    MARKET_CALENDAR (Dict[str, Any]): Configuration of calendars. Like
+        below:
+        - HOLIDAYS_FILE (str): CSV file with `exchange`, `date` and `close`
+            columns, where `close` is the time of an early close, or empty
+            when exchange is closed all day (default:
+            `watch_list/calendars/holidays.csv`).
+        - EXCHANGES (Dict[str, Dict[str, Any]]): `TIME_ZONE`, `OPEN` and
+            `CLOSE` times, and `SUFFIXES` of symbols of each exchange
+            (default: US and London stock exchanges).
+        - DEFAULT_EXCHANGE (str): Exchange of symbols without a known
+            suffix (default: 'US').
+"""
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+import csv
+import os
+import threading
+
+
+DEFAULT_MARKET_CALENDAR_SETTINGS = {
+    'HOLIDAYS_FILE': os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        'calendars', 'holidays.csv'
+    ),
+    'EXCHANGES': {
+        'US': {
+            'TIME_ZONE': 'America/New_York',
+            'OPEN': '09:30',
+            'CLOSE': '16:00',
+            'SUFFIXES': [],
+        },
+        'LSE': {
+            'TIME_ZONE': 'Europe/London',
+            'OPEN': '08:00',
+            'CLOSE': '16:30',
+            'SUFFIXES': ['LON'],
+        },
+    },
+    'DEFAULT_EXCHANGE': 'US',
+}
+
+# Max number of days in a row an exchange can be closed, like a weekend
+# along with holidays.
+MAX_CLOSED_DAYS = 15
+
+
+def get_market_calendar_settings():
+    """Returns the market calendar settings merged over defaults.
+
+    Returns:
+        Dict[str, Any]: Market calendar settings.
+    """
+
+    return {
+        **DEFAULT_MARKET_CALENDAR_SETTINGS,
+        **getattr(settings, 'MARKET_CALENDAR', {})
+    }
+
+
+class ExchangeCalendar:
+    """
+    Class defining the trading sessions of an exchange.
+
+    Attributes:
+        name: Name of the exchange.
+        time_zone: Time zone of open and close times.
+        open_time: Time at which sessions open.
+        close_time: Time at which sessions close, unless closing early.
+        holidays: Time of early close of each holiday, or None when
+            exchange is closed all day.
+
+    Methods:
+        session: Returns the open and close times of the session of a day.
+        is_open: Returns whether exchange is open at a time.
+        next_open: Returns the time from which exchange is open.
+        last_close: Returns the close time of the last closed session.
+    """
+
+    def __init__(self, name, time_zone, open_time, close_time, holidays=None):
+        self.name = name
+        self.time_zone = ZoneInfo(time_zone)
+        self.open_time = open_time
+        self.close_time = close_time
+        self.holidays = holidays or {}
+
+
+    def session(self, day):
+        """Returns the open and close times of the session of a day.
+
+        Args:
+            day (date): Day in time zone of exchange.
+
+        Returns:
+            Optional[Tuple[float, float]]: Open and close times, or None if
+            exchange is closed on that day.
+        """
+
+        if day.weekday() >= 5:
+            return None
+        close_time = self.close_time
+        if day in self.holidays:
+            close_time = self.holidays[day]
+            if close_time is None:
+                return None
+        return (
+            datetime.combine(day, self.open_time, self.time_zone).timestamp(),
+            datetime.combine(day, close_time, self.time_zone).timestamp()
+        )
+
+
+    def _get_day(self, timestamp):
+        """Returns the day of a time in time zone of exchange.
+
+        Args:
+            timestamp (float): Time.
+
+        Returns:
+            date: Day of the time.
+        """
+
+        return datetime.fromtimestamp(timestamp, self.time_zone).date()
+
+
+    def is_open(self, timestamp):
+        """Returns whether exchange is open at a time.
+
+        Args:
+            timestamp (float): Time.
+
+        Returns:
+            bool: Whether exchange is open.
+        """
+
+        session = self.session(self._get_day(timestamp))
+        return session is not None and session[0] <= timestamp < session[1]
+
+
+    def next_open(self, timestamp):
+        """Returns the time from which exchange is open, which is the time
+        itself when exchange is open then.
+
+        Args:
+            timestamp (float): Time.
+
+        Returns:
+            Optional[float]: Time, or None if exchange has no session in
+            the next `MAX_CLOSED_DAYS` days.
+        """
+
+        day = self._get_day(timestamp)
+        for offset in range(MAX_CLOSED_DAYS):
+            session = self.session(day + timedelta(days=offset))
+            if session is not None and timestamp < session[1]:
+                return max(timestamp, session[0])
+        return None
+
+
+    def last_close(self, timestamp):
+        """Returns the close time of the last session closed by a time.
+
+        Args:
+            timestamp (float): Time.
+
+        Returns:
+            Optional[float]: Close time, or None if exchange had no session
+            in the last `MAX_CLOSED_DAYS` days.
+        """
+
+        day = self._get_day(timestamp)
+        for offset in range(MAX_CLOSED_DAYS):
+            session = self.session(day - timedelta(days=offset))
+            if session is not None and session[1] <= timestamp:
+                return session[1]
+        return None
+
+
+class MarketCalendar:
+    """
+    Class defining the calendars of exchanges, and the exchange of symbols.
+
+    Attributes:
+        exchanges: Calendar of each exchange.
+        suffixes: Exchange of each symbol suffix.
+        default_exchange: Exchange of symbols without a known suffix.
+
+    Methods:
+        from_settings: Builds the calendars of `MARKET_CALENDAR` setting.
+        for_symbol: Returns the calendar of exchange of a symbol.
+    """
+
+    def __init__(self, exchanges, suffixes=None, default_exchange='US'):
+        self.exchanges = exchanges
+        self.suffixes = suffixes or {}
+        self.default_exchange = default_exchange
+
+
+    @classmethod
+    def from_settings(cls):
+        """Builds the calendars of `MARKET_CALENDAR` setting, with the
+        holidays of holiday file.
+
+        Returns:
+            MarketCalendar: Calendars of configured exchanges.
+        """
+
+        calendar_settings = get_market_calendar_settings()
+        holidays = read_holidays(calendar_settings['HOLIDAYS_FILE'])
+        exchanges = {}
+        suffixes = {}
+        for name, exchange in calendar_settings['EXCHANGES'].items():
+            exchanges[name] = ExchangeCalendar(
+                name, exchange['TIME_ZONE'],
+                time.fromisoformat(exchange['OPEN']),
+                time.fromisoformat(exchange['CLOSE']),
+                holidays.get(name)
+            )
+            for suffix in exchange.get('SUFFIXES', []):
+                suffixes[suffix] = name
+        return cls(
+            exchanges, suffixes, calendar_settings['DEFAULT_EXCHANGE']
+        )
+
+
+    def for_symbol(self, symbol):
+        """Returns the calendar of exchange of a symbol.
+
+        Args:
+            symbol (str): Symbol, like `MSFT` or `TSCO.LON`.
+
+        Returns:
+            ExchangeCalendar: Calendar of exchange.
+        """
+
+        name, dot, suffix = symbol.rpartition('.')
+        return self.exchanges[
+            self.suffixes.get(suffix, self.default_exchange) if dot
+            else self.default_exchange
+        ]
+
+
+def read_holidays(path):
+    """Reads the holidays of exchanges from a CSV file. A missing file
+    means there are no holidays.
+
+    Args:
+        path (str): Path of holiday file.
+
+    Returns:
+        Dict[str, Dict[date, Optional[time]]]: Time of early close (or None
+        if closed all day) of each holiday of each exchange.
+    """
+
+    holidays = {}
+    if not path or not os.path.exists(path):
+        return holidays
+    with open(path, newline='', encoding='utf-8') as holidays_file:
+        for row in csv.DictReader(holidays_file):
+            close = (row.get('close') or '').strip()
+            holidays.setdefault(row['exchange'], {})[
+                date.fromisoformat(row['date'])
+            ] = time.fromisoformat(close) if close else None
+    return holidays
+
+
+_market_calendar = None
+_market_calendar_lock = threading.Lock()
+
+
+def get_market_calendar():
+    """Returns the process wide market calendar, loading the holiday file
+    on first use.
+
+    Returns:
+        MarketCalendar: Market calendar.
+    """
+
+    global _market_calendar
+    with _market_calendar_lock:
+        if _market_calendar is None:
+            _market_calendar = MarketCalendar.from_settings()
+        return _market_calendar
+
+
+@receiver(setting_changed)
+def reset_market_calendar_on_setting_change(sender, setting, **kwargs):
+    """Function to reload the market calendar when its settings are
+    changed, like in tests.
+
+    Args:
+        sender (Type): A sender of setting changed signal.
+        setting (str): Name of the changed setting.
+    """
+
+    global _market_calendar
+    if setting == 'MARKET_CALENDAR':
+        with _market_calendar_lock:
+            _market_calendar = None
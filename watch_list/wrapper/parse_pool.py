@@ -0,0 +1,278 @@
+"""
+Module that defines the parsing of upstream payloads, inline or in a pool
+of worker processes for large batches.
+
+Parsing a payload is CPU bound (JSON decoding and building typed arrays),
+so batches of at least `MIN_BATCH` payloads, like background refreshes of
+many symbols, are parsed by worker processes. Payloads are handed to
+workers as raw bytes of the response, and workers hand back the binary
+encoding of `CandleSeries` in a shared memory block, so neither side pickles
+nested python objects. Smaller batches are parsed inline, where starting
+work in another process would cost more than the parsing itself. A
+payload which can't be parsed fails alone, other payloads of its batch are
+still returned.
+
+Settings:
+    PARSE_POOL (Dict[str, Any]): Configuration of the parse pool. Like below:
+        - ENABLED (bool): Whether large batches are parsed in worker
+            processes, which only pays off with more than one cpu (default:
+            False).
+        - WORKERS (Optional[int]): Number of worker processes (default:
+            number of cpus).
+        - MIN_BATCH (int): Min number of payloads parsed in worker
+            processes (default: 16).
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .candle_series import CandleSeries
+
+from itertools import repeat
+from multiprocessing import get_context, resource_tracker, shared_memory
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_PARSE_POOL_SETTINGS = {
+    'ENABLED': False,
+    'WORKERS': None,
+    'MIN_BATCH': 16,
+}
+
+# Statuses of a parsed payload.
+PARSED = 'parsed'
+QUOTA_REACHED = 'quota_reached'
+INVALID = 'invalid'
+FAILED = 'failed'
+
+
+def get_parse_pool_settings():
+    """Returns the parse pool settings merged over defaults.
+
+    Returns:
+        Dict[str, Any]: Parse pool settings.
+    """
+
+    return {
+        **DEFAULT_PARSE_POOL_SETTINGS,
+        **getattr(settings, 'PARSE_POOL', {})
+    }
+
+
+def get_response_status(symbol_data):
+    """Returns the status of a response of upstream api for a symbol.
+
+    Args:
+        symbol_data (dict): JSON response of api for a symbol, or only its
+            top level values other than the time series.
+
+    Returns:
+        str: `QUOTA_REACHED` when api returns a note with a thank you
+        message, `INVALID` when api returns an error message (the symbol is
+        invalid or its data isn't available for free subscription),
+        otherwise `PARSED`.
+    """
+
+    if 'Note' in symbol_data and 'Thank you' in symbol_data['Note']:
+        return QUOTA_REACHED
+    if 'Error Message' in symbol_data:
+        return INVALID
+    return PARSED
+
+
+def parse_symbol_response(symbol_data, interval):
+    """Parses a decoded response of upstream api for a symbol.
+
+    Args:
+        symbol_data (dict): JSON response of api for a symbol.
+        interval (str): Time interval of the data.
+
+    Returns:
+        Tuple[str, Optional[CandleSeries]]: Status of the response (see
+        `get_response_status`), along with the candles of the symbol when it
+        is `PARSED`.
+    """
+
+    status = get_response_status(symbol_data)
+    if status != PARSED:
+        return status, None
+    return PARSED, CandleSeries.from_payload(symbol_data, interval)
+
+
+def _parse_in_worker(raw_payload, interval):
+    """Parses a raw payload in a worker process. Candles are written to a
+    new shared memory block, which is unlinked by the parent process.
+
+    Args:
+        raw_payload (bytes): Raw body of api response for a symbol.
+        interval (str): Time interval of the data.
+
+    Returns:
+        Tuple[str, Optional[str], int]: Status of the response, and name
+        and size of the shared memory block with the binary encoding of
+        candles. Status is `FAILED` along with the error when payload can't
+        be parsed.
+    """
+
+    try:
+        status, series = parse_symbol_response(
+            json.loads(raw_payload), interval
+        )
+    except (KeyError, TypeError, ValueError) as exc:
+        return FAILED, repr(exc), 0
+    if series is None:
+        return status, None, 0
+
+    data = series.to_bytes()
+    block = shared_memory.SharedMemory(create=True, size=len(data))
+    block.buf[:len(data)] = data
+    # Block is owned by the parent process from now on, so the worker must
+    # not unlink it when it exits.
+    resource_tracker.unregister(block._name, 'shared_memory')
+    block.close()
+    return status, block.name, len(data)
+
+
+def _read_shared_series(name, size):
+    """Reads the candles written by a worker and unlinks the shared memory
+    block.
+
+    Args:
+        name (str): Name of the shared memory block.
+        size (int): Size of the binary encoding of candles.
+
+    Returns:
+        CandleSeries: Candles of the symbol.
+    """
+
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        data = bytes(block.buf[:size])
+    finally:
+        block.close()
+        block.unlink()
+    return CandleSeries.from_bytes(data)
+
+
+class ParsePool:
+    """
+    Class defining a pool of worker processes which parse raw payloads.
+    Worker processes are spawned on first use, so they don't inherit the
+    threads and connections of the server process.
+
+    Attributes:
+        workers: Number of worker processes.
+
+    Methods:
+        parse: Parses raw payloads in worker processes.
+        shutdown: Stops the worker processes.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self._executor = None
+        self._lock = threading.Lock()
+
+
+    def parse(self, raw_payloads, interval):
+        """Parses raw payloads in worker processes.
+
+        Args:
+            raw_payloads (List[bytes]): Raw bodies of api responses.
+            interval (str): Time interval of the data.
+
+        Returns:
+            List[Tuple[str, Optional[CandleSeries]]]: Status and candles of
+            every payload, like `parse_symbol_response`. Status is `FAILED`
+            for a payload which can't be parsed.
+        """
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=get_context('spawn')
+                )
+            executor = self._executor
+
+        chunk_size = max(1, len(raw_payloads) // (self.workers * 4))
+        results = []
+        for status, name, size in executor.map(
+            _parse_in_worker, raw_payloads, repeat(interval),
+            chunksize=chunk_size
+        ):
+            series = None
+            if status == FAILED:
+                logger.warning('Unable to parse payload: %s', name)
+            elif name is not None:
+                series = _read_shared_series(name, size)
+            results.append((status, series))
+        return results
+
+
+    def shutdown(self):
+        """Stops the worker processes, they are spawned again on next use.
+        """
+
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+
+def get_parse_pool(batch_size):
+    """Returns the process wide parse pool when a batch should be parsed in
+    worker processes.
+
+    Args:
+        batch_size (int): Number of payloads of the batch.
+
+    Returns:
+        Optional[ParsePool]: Parse pool, or None if batch should be parsed
+        inline.
+    """
+
+    global _parse_pool
+    pool_settings = get_parse_pool_settings()
+    if not pool_settings['ENABLED'] or batch_size < pool_settings['MIN_BATCH']:
+        return None
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            _parse_pool = ParsePool(pool_settings['WORKERS'])
+        return _parse_pool
+
+
+def reset_parse_pool():
+    """Stops and drops the process wide parse pool, so that it is created
+    again with current settings on next use.
+    """
+
+    global _parse_pool
+    with _parse_pool_lock:
+        parse_pool, _parse_pool = _parse_pool, None
+    if parse_pool is not None:
+        parse_pool.shutdown()
+
+
+@receiver(setting_changed)
+def reset_parse_pool_on_setting_change(sender, setting, **kwargs):
+    """Function to recreate parse pool when its settings are changed, like
+    in tests.
+
+    Args:
+        sender (Type): A sender of setting changed signal.
+        setting (str): Name of the changed setting.
+    """
+
+    if setting == 'PARSE_POOL':
+        reset_parse_pool()
@@ -0,0 +1,270 @@
+"""
+Module that defines the accounting of upstream api quota.
+
+Upstream quota is spent by every worker process of the host (and by their
+background threads), so a budget can keep its window in a state file shared
+by the processes, which is locked while the window is read and changed.
+Times of a shared window are of `time.time`, as every process has to read
+them alike.
+"""
+
+from contextlib import contextmanager
+from collections import deque
+
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    # No file locks, like on Windows, windows are kept in process.
+    fcntl = None
+
+
+class SharedWindowState:
+    """
+    Class defining the state of a budget window shared by the processes of
+    the host, kept as JSON in a file which is exclusively locked while the
+    state is read and changed.
+
+    Attributes:
+        path: Path of state file.
+
+    Methods:
+        locked: Context manager giving the state, which is written back
+            when it is changed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+
+    @contextmanager
+    def locked(self):
+        """Context manager giving the state while the state file is locked,
+        the changed state is written back before the lock is released.
+
+        Yields:
+            Dict[str, Any]: State, empty when no state was written yet.
+        """
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        state_fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        with os.fdopen(state_fd, 'r+', encoding='utf-8') as state_file:
+            fcntl.flock(state_file, fcntl.LOCK_EX)
+            content = state_file.read()
+            try:
+                state = json.loads(content) if content else {}
+            except ValueError:
+                state = {}
+            yield state
+            new_content = json.dumps(state)
+            if new_content != content:
+                state_file.seek(0)
+                state_file.truncate()
+                state_file.write(new_content)
+
+
+class CallBudget:
+    """
+    Class defining a sliding window budget of upstream api calls, like 5
+    calls per minute of alpha avantage's free subscription. Timestamps of
+    the calls made within the window are kept, so the budget knows both how
+    many calls can be made now and when the next calls can be made. Budget
+    can also be blocked until a time, like when upstream reports that the
+    quota is reached.
+
+    Attributes:
+        calls: Number of calls allowed per window.
+        period: Length of window in seconds.
+
+    Methods:
+        acquire: Takes up to the asked number of calls from budget.
+        available: Returns the number of calls that can be made now.
+        eta: Returns seconds after which a queued call can be made.
+        slot_times: Returns times at which each call of window is free.
+        blocked_until: Returns the time until which no call can be made.
+        exhaust: Marks the budget of current window as used.
+        reset: Forgets all the made calls.
+    """
+
+    def __init__(self, calls, period=60.0, clock=time.monotonic,
+                 state=None):
+        self.calls = calls
+        self.period = period
+        self._clock = clock
+        self._state = state if fcntl is not None else None
+        self._made_calls = deque()
+        self._blocked_until = None
+        self._lock = threading.Lock()
+
+
+    @contextmanager
+    def _locked(self):
+        """Context manager holding the lock of budget, and the lock of its
+        shared state if any, along with the made calls of every process.
+        """
+
+        with self._lock:
+            if self._state is None:
+                yield
+                return
+            with self._state.locked() as state:
+                self._made_calls = deque(state.get('calls', ()))
+                self._blocked_until = state.get('blocked_until')
+                yield
+                state['calls'] = list(self._made_calls)
+                state['blocked_until'] = self._blocked_until
+
+
+    def acquire(self, count):
+        """Takes up to `count` calls from budget.
+
+        Args:
+            count (int): Number of calls wanted.
+
+        Returns:
+            int: Number of calls granted, which can be less than `count`.
+        """
+
+        with self._locked():
+            now = self._clock()
+            self._expire(now)
+            granted = max(0, min(count, self._free_calls()))
+            self._made_calls.extend([now] * granted)
+            return granted
+
+
+    def available(self):
+        """Returns the number of calls that can be made now.
+
+        Returns:
+            int: Number of available calls.
+        """
+
+        with self._locked():
+            self._expire(self._clock())
+            return self._free_calls()
+
+
+    def eta(self, position):
+        """Returns seconds after which a queued call can be made, assuming
+        every call ahead of it is made as soon as budget allows.
+
+        Args:
+            position (int): Number of calls queued ahead of the call.
+
+        Returns:
+            float: Seconds until the call can be made.
+        """
+
+        with self._locked():
+            now = self._clock()
+            self._expire(now)
+            slot_times = self._slot_times(now)
+        windows, index = divmod(position, self.calls)
+        return max(0.0, slot_times[index] - now) + windows * self.period
+
+
+    def slot_times(self):
+        """Returns the times at which each call of the window can be made,
+        current time for calls which can be made now.
+
+        Returns:
+            List[float]: Times of clock, earliest first.
+        """
+
+        with self._locked():
+            now = self._clock()
+            self._expire(now)
+            return self._slot_times(now)
+
+
+    def blocked_until(self):
+        """Returns the time until which no call can be made, even when calls
+        of window are free.
+
+        Returns:
+            Optional[float]: Time of clock, or None if budget isn't blocked.
+        """
+
+        with self._locked():
+            self._expire(self._clock())
+            return self._blocked_until
+
+
+    def exhaust(self, until=None):
+        """Marks the budget of current window as used, like when upstream
+        reports that the quota is reached.
+
+        Args:
+            until optional(float): Time of clock until which no call can be
+                made (default: None).
+        """
+
+        with self._locked():
+            now = self._clock()
+            self._expire(now)
+            self._made_calls.extend(
+                [now] * (self.calls - len(self._made_calls))
+            )
+            if until is not None:
+                self._blocked_until = max(until, self._blocked_until or until)
+
+
+    def reset(self):
+        """Forgets all the made calls, and unblocks the budget."""
+
+        with self._locked():
+            self._made_calls.clear()
+            self._blocked_until = None
+
+
+    def _free_calls(self):
+        """Returns the number of calls that can be made now, lock must be
+        held by caller and window expired.
+
+        Returns:
+            int: Number of free calls.
+        """
+
+        if self._blocked_until is not None:
+            return 0
+        return max(0, self.calls - len(self._made_calls))
+
+
+    def _slot_times(self, now):
+        """Returns the times at which each call of the window can be made,
+        lock must be held by caller and window expired.
+
+        Args:
+            now (float): Current time.
+
+        Returns:
+            List[float]: Times of clock, earliest first.
+        """
+
+        slot_times = [now] * max(0, self.calls - len(self._made_calls)) + [
+            made_at + self.period for made_at in self._made_calls
+        ]
+        if self._blocked_until is not None:
+            slot_times = [
+                max(slot_time, self._blocked_until) for slot_time in slot_times
+            ]
+        return slot_times
+
+
+    def _expire(self, now):
+        """Drops the calls made before the current window, lock must be
+        held by caller.
+
+        Args:
+            now (float): Current time.
+        """
+
+        while self._made_calls and self._made_calls[0] <= now - self.period:
+            self._made_calls.popleft()
+        if self._blocked_until is not None and self._blocked_until <= now:
+            self._blocked_until = None
@@ -1,14 +1,69 @@
 """
 Module that defines methods/functions which can be used to fetch symbols
 related data.
+
+Parsed data of every symbol is cached (`SYMBOLS_DATA_CACHE_TTL` setting), so
+the same symbol requested by many users within the cache ttl costs a single
+upstream api call. Cache is the `SYMBOLS_DATA_CACHE_ALIAS` backend, which is
+shared by all worker processes of a host, and holds the binary encoding of
+`CandleSeries` rather than pickled python objects. Fetched candles are also
+appended to the on-disk `candle_store`, from which the history of a symbol
+can be read by time range.
+
+Upstream calls are limited by `call_budget`, the pool of configured api keys
+(`ALPHA_AVANTAGE_API_KEYS`) with a budget per key. Symbols which can't be
+fetched within the budget are queued in `fetch_pipeline` and fetched in the
+background as soon as budget allows. Budget is shared fairly by users: while
+other users have queued symbols, a request takes at most its share of the
+available calls, and queued symbols of users are fetched in turns.
+
+Every ingest of fetched candles sends `symbols_data_ingested` signal, like
+to evaluate price alerts.
 """
 
-from .utils import fetch_urls_json_data
+from django.conf import settings
+from django.core.cache import caches
+from django.dispatch import Signal
 
+from .candle_series import (
+    CANDLE_VALUES, DEFAULT_DECIMALS, CandleSeries, to_timestamp
+)
+from .candle_store import get_candle_store
+from .fetch_pipeline import BatchFetchPipeline
+from .intraday_decoder import IntradayDecoder
+from .key_pool import ApiKeyPool
+from .parse_pool import FAILED, INVALID, QUOTA_REACHED, get_parse_pool
+from .utils import fetch_urls_decoded_data, fetch_urls_raw_data
+
+from urllib.parse import urlencode
 import os
 import sys
 import asyncio
-import pandas as pd
+import logging
+import struct
+
+
+logger = logging.getLogger(__name__)
+
+
+# Signal sent after fetched candles are cached, with `symbols_data`
+# argument mapping each fetched symbol to its `CandleSeries` and `interval`
+# argument.
+symbols_data_ingested = Signal()
+
+# Signal sent when candles of symbols are asked for, with `symbols` and
+# `interval` arguments.
+symbols_data_requested = Signal()
+
+# Time interval of the data, when it is not asked for.
+DEFAULT_INTERVAL = '5min'
+
+# Parts of symbols data which can be asked for.
+SYMBOLS_DATA_FIELDS = ('latest_prices', 'candles', 'values')
+
+# Cache value of the symbols for which api returns an error message, so
+# that no more api calls are spent on them within the cache ttl.
+INVALID_SYMBOL = 'invalid'
 
 
 # Condition to set the policy for windows otherwise asyncio will throw
@@ -21,107 +76,485 @@ if (
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
 
-def fetch_symbols_based_time_series_intraday_data(symbols, interval):
-    """Fetches intraday time series data for a list of symbols.
+def get_intraday_urls(symbols, interval, api_keys):
+    """Returns the urls of intraday time series api for a list of symbols,
+    on `ALPHA_AVANTAGE_API_URL` setting.
+
+    Args:
+        symbols (List[str]): List of symbols for which to fetch data.
+        interval (str): Time interval for the data.
+        api_keys (List[str]): Api key of each symbol's call.
+
+    Returns:
+        List[str]: Url of each symbol.
+    """
+
+    alpha_avantage_api_url = getattr(
+        settings, 'ALPHA_AVANTAGE_API_URL', 'https://www.alphavantage.co/query'
+    )
+    return [
+        '{}?{}'.format(alpha_avantage_api_url, urlencode({
+            'function': 'TIME_SERIES_INTRADAY', 'symbol': symbol,
+            'interval': interval, 'apikey': api_key,
+        }))
+        for symbol, api_key in zip(symbols, api_keys)
+    ]
+
+
+def fetch_symbols_intraday_series(symbols, interval, api_keys):
+    """Fetches intraday time series data for a list of symbols. Responses
+    are decoded incrementally as they arrive, straight into typed candles.
 
     Args:
         symbols (List[str]): List of symbols for which to fetch data.
         interval (str): Time interval for the data (e.g., '1min',
             '5min', '15min', '30min', '60min').
+        api_keys (List[str]): Api key of each symbol's call.
 
     Returns:
-        list: List of JSON responses containing intraday time series
-        data for each symbol.
+        List[Tuple[str, Optional[CandleSeries]]]: Status and candles of api
+        response for each symbol, like
+        `parse_pool.parse_symbol_response`. Status is `FAILED` for a
+        response which can't be decoded.
     """
 
-    api_key = 'E65YE0OJS72PFY26'
-    alpha_avantage_api_url = (
-        'https://www.alphavantage.co/query?function=TIME_SERIES_INTRADAY&' +
-        'symbol={}&interval={}&apikey={}'
+    return asyncio.run(fetch_urls_decoded_data(
+        get_intraday_urls(symbols, interval, api_keys),
+        lambda: IntradayDecoder(interval), on_error=get_failed_response
+    ))
+
+
+def get_failed_response(error):
+    """Returns the status of a response which can't be decoded, like an
+    error page of upstream api.
+
+    Args:
+        error (ValueError): Error of the decoder.
+
+    Returns:
+        Tuple[str, None]: `FAILED` status, like of
+        `parse_pool.parse_symbol_response`.
+    """
+
+    logger.warning('Unable to decode payload: %s', error)
+    return FAILED, None
+
+
+def fetch_symbols_raw_intraday_data(symbols, interval, api_keys):
+    """Fetches intraday time series data for a list of symbols, without
+    decoding the responses.
+
+    Args:
+        symbols (List[str]): List of symbols for which to fetch data.
+        interval (str): Time interval for the data.
+        api_keys (List[str]): Api key of each symbol's call.
+
+    Returns:
+        List[bytes]: Raw body of api response for each symbol.
+    """
+
+    return asyncio.run(
+        fetch_urls_raw_data(get_intraday_urls(symbols, interval, api_keys))
     )
-    symbol_based_api_urls = []
-    for symbol in symbols:
-        symbol_based_api_urls.append(
-            alpha_avantage_api_url.format(symbol, interval, api_key)
-        )
-    return asyncio.run(fetch_urls_json_data(symbol_based_api_urls))
 
 
-def get_symbols_latest_and_graph_data(symbols, interval='5min'):
-    """Retrieves the latest prices and candlestick graph data for
-    a list of symbols. Also, when an api is called 6th time within
-    a single minute then this function returns with 429 error, and
-    when symbol data is not available then that symbol is not included
-    in the response.
+def get_series_cache():
+    """Returns the cache backend of parsed symbols data.
+
+    Returns:
+        BaseCache: Cache backend of `SYMBOLS_DATA_CACHE_ALIAS` setting.
+    """
+
+    return caches[getattr(settings, 'SYMBOLS_DATA_CACHE_ALIAS', 'default')]
+
+
+def get_symbol_cache_key(symbol, interval):
+    """Returns the cache key of a symbol's parsed data.
 
     Args:
-        symbols (list): List of symbols for which to fetch data.
-        interval optional(str): Time interval for the data (default: '5min').
+        symbol (str): Symbol like MSFT.
+        interval (str): Time interval of the data.
 
     Returns:
-        dict: A dictionary containing the following information:
-            - symbols (list): List of symbols for which data was retrieved.
-            - values (list): List of names of values for each data point (eg:
-                open, close, volume and etc.).
-            - latest_prices (dict): Dictionary mapping symbols to their
-                latest prices.
-            - candle_stick_graph_data (dict): Dictionary mapping symbols
-                to their candlestick graph data.
+        str: Cache key.
     """
 
-    # Removing duplicate symbols.
-    symbols = list(set(symbols))
+    return 'symbols-data:{}:{}'.format(interval, symbol)
 
-    symbols_intraday_data = fetch_symbols_based_time_series_intraday_data(
-        symbols, interval
+
+def parse_symbol_data(symbol_data, interval):
+    """Parses the intraday time series data of a symbol returned by api.
+
+    Args:
+        symbol_data (dict): JSON response of api for a symbol.
+        interval (str): Time interval of the data.
+
+    Returns:
+        CandleSeries: Candles of the symbol.
+    """
+
+    return CandleSeries.from_payload(symbol_data, interval)
+
+
+def store_symbol_candles(series, interval):
+    """Appends the candles of a symbol to the candle store, when it is
+    enabled. Failures are logged, as the store is not needed to serve the
+    data.
+
+    Args:
+        series (CandleSeries): Candles of the symbol.
+        interval (str): Time interval of the data.
+    """
+
+    candle_store = get_candle_store()
+    if candle_store is None or not len(series):
+        return
+
+    try:
+        candle_store.append(series.symbol, interval, series.columns())
+    except (OSError, ValueError):
+        logger.exception('Unable to store candles of %s', series.symbol)
+
+
+def read_symbol_candles(symbol, interval, start=None, end=None,
+                        decimals=DEFAULT_DECIMALS):
+    """Reads the stored candles of a symbol in a time range, without
+    calling upstream api.
+
+    Args:
+        symbol (str): Symbol like MSFT.
+        interval (str): Time interval of the data.
+        start optional(Union[str, datetime]): Time of the first candle.
+        end optional(Union[str, datetime]): Time of the last candle.
+        decimals optional(int): Number of decimals of prices sent by api
+            (default: 4).
+
+    Returns:
+        Optional[CandleSeries]: Stored candles, or None if candle store is
+        disabled.
+    """
+
+    candle_store = get_candle_store()
+    if candle_store is None:
+        return None
+    return CandleSeries.from_columns(
+        symbol, candle_store.read(symbol, interval, start, end), decimals
     )
 
-    symbols_latest_prices_dict = dict()
-    symbols_candle_stick_graph_dict = dict()
-    fetched_symbols = []
-    values = []
 
-    for index, symbol_data in enumerate(symbols_intraday_data):
+def get_candles_window(series, interval, start=None, end=None, limit=None):
+    """Returns the candles of a symbol in a time range. When the range
+    starts before the oldest candle of series, the stored history of candle
+    store is used for it.
 
-        # Whenever a note is returned with a thank you message in response
-        # from api, then that means we have called apis 6 times in a row
-        # within a single minute, which is not allowed with free subscription.
-        if 'Note' in symbol_data and 'Thank you' in symbol_data['Note']:
-            return {
-                "Note": "You have reached the limit of 5 calls per minute."
-            }
+    Args:
+        series (CandleSeries): Candles of the symbol.
+        interval (str): Time interval of the data.
+        start optional(Union[str, datetime]): Time of the first candle.
+        end optional(Union[str, datetime]): Time of the last candle.
+        limit optional(int): Max number of newest candles of the range.
+
+    Returns:
+        CandleSeries: Candles in the range.
+    """
+
+    window = series.window(start, end, limit)
+    if start is not None and (
+        not len(series) or series.timestamps[0] > to_timestamp(start)
+    ):
+        stored_window = read_symbol_candles(
+            series.symbol, interval, start, end, series.decimals
+        )
+        if stored_window is not None and len(stored_window) > len(window):
+            window = stored_window.window(limit=limit)
+    return window
+
+
+def fetch_symbols_into_cache(symbols, interval):
+    """Fetches the data of symbols from api, parses and caches it. Large
+    batches are parsed in worker processes of `parse_pool`, smaller ones are
+    decoded by `IntradayDecoder` as responses arrive. Parsed candles are
+    sent along with `symbols_data_ingested` signal. Calls are made with the
+    api keys leased by `call_budget`, and the status of each response is
+    reported to it. Whenever a note is returned with a thank you message in
+    response from api, then that means the quota of the call's api key is
+    reached, so the key is quarantined and those symbols are not fetched.
+    Symbols whose payload can't be parsed are left out, and are fetched
+    again on their next request.
+
+    Args:
+        symbols (List[str]): List of symbols for which to fetch data.
+        interval (str): Time interval for the data.
+
+    Returns:
+        Tuple[Dict[str, CandleSeries], List[str]]: Candles of each fetched
+        symbol, and symbols which were not fetched due to the quota.
+    """
+
+    api_keys = call_budget.take_keys(len(symbols))
+    parse_pool = get_parse_pool(len(symbols))
+    if parse_pool is not None:
+        # Large batches are parsed by worker processes, from raw bodies.
+        parsed_responses = parse_pool.parse(
+            fetch_symbols_raw_intraday_data(symbols, interval, api_keys),
+            interval
+        )
+    else:
+        parsed_responses = fetch_symbols_intraday_series(
+            symbols, interval, api_keys
+        )
+
+    parsed_symbols_data = {}
+    limited_symbols = []
+    cache_values = {}
+    for symbol, api_key, (status, series) in zip(
+        symbols, api_keys, parsed_responses
+    ):
+        call_budget.report(api_key, status)
+        if status == QUOTA_REACHED:
+            limited_symbols.append(symbol)
+            continue
+        if status == FAILED:
+            continue
 
         # If data is not provided for a specific symbol from api then that means
         # either the symbol is invalid or the data for that symbol is not available
         # for free subscription. So, we are not including that particular symbol
         # in our response.
-        if 'Error Message' in symbol_data:
+        if status == INVALID:
+            cache_values[get_symbol_cache_key(symbol, interval)] = (
+                INVALID_SYMBOL
+            )
+            continue
+
+        parsed_symbols_data[symbol] = series
+        store_symbol_candles(series, interval)
+        cache_values[get_symbol_cache_key(symbol, interval)] = (
+            series.to_bytes()
+        )
+
+    get_series_cache().set_many(
+        cache_values, getattr(settings, 'SYMBOLS_DATA_CACHE_TTL', 60)
+    )
+    symbols_data_ingested.send(
+        sender=CandleSeries, symbols_data=parsed_symbols_data,
+        interval=interval
+    )
+    return parsed_symbols_data, limited_symbols
+
+
+def fetch_pipeline_batch(symbols, interval):
+    """Fetches a batch of queued symbols for `fetch_pipeline`.
+
+    Args:
+        symbols (List[str]): List of symbols for which to fetch data.
+        interval (str): Time interval for the data.
+
+    Returns:
+        List[str]: Symbols not fetched due to the quota, which are queued
+        again.
+    """
+
+    parsed_symbols_data, limited_symbols = fetch_symbols_into_cache(
+        symbols, interval
+    )
+    return limited_symbols
+
+
+def get_cached_symbols_data(symbols, interval, last=None):
+    """Returns the cached candles of symbols. Symbols cached as invalid
+    are neither in parsed data nor in missing symbols, and entries which
+    can't be decoded (like of an older format) are missing.
+
+    Args:
+        symbols (List[str]): List of symbols.
+        interval (str): Time interval of the data.
+        last optional(int): Number of newest candles to decode (default:
+            all candles).
+
+    Returns:
+        Tuple[Dict[str, CandleSeries], List[str]]: Candles of cached
+        symbols, and symbols which are not cached.
+    """
+
+    cached_symbols_data = get_series_cache().get_many([
+        get_symbol_cache_key(symbol, interval) for symbol in symbols
+    ])
+    parsed_symbols_data = {}
+    missing_symbols = []
+    for symbol in symbols:
+        symbol_data = cached_symbols_data.get(
+            get_symbol_cache_key(symbol, interval)
+        )
+        if symbol_data == INVALID_SYMBOL:
+            continue
+        if symbol_data is None:
+            missing_symbols.append(symbol)
             continue
+        try:
+            parsed_symbols_data[symbol] = CandleSeries.from_bytes(
+                symbol_data, last
+            )
+        except (ValueError, struct.error):
+            missing_symbols.append(symbol)
+    return parsed_symbols_data, missing_symbols
+
+
+call_budget = ApiKeyPool.from_settings()
+
+fetch_pipeline = BatchFetchPipeline(call_budget, fetch_pipeline_batch)
+
 
-        symbol_name = symbol_data['Meta Data']['2. Symbol']
-        symbol_data_df = pd.DataFrame(
-            symbol_data['Time Series ({})'.format(interval)]
+def get_fair_share(owner):
+    """Returns the number of available calls which a request of an owner
+    can take right away. While other owners have queued symbols, available
+    calls are shared with them.
+
+    Args:
+        owner (Hashable): Owner of the request, like id of user.
+
+    Returns:
+        int: Number of calls.
+    """
+
+    available = call_budget.available()
+    other_owners = fetch_pipeline.other_owners_count(owner)
+    if not other_owners:
+        return available
+    return -(-available // (other_owners + 1))
+
+
+def get_symbols_series(symbols, interval=DEFAULT_INTERVAL, last=None,
+                       owner=None):
+    """Returns the candles of symbols. Cached symbols are served right away
+    and uncached symbols are fetched as far as the fair share of call budget
+    of owner allows, the remaining symbols are queued in `fetch_pipeline`.
+
+    Args:
+        symbols (List[str]): List of symbols, without duplicates.
+        interval optional(str): Time interval of the data (default: '5min').
+        last optional(int): Number of newest candles to decode of cached
+            symbols (default: all candles).
+        owner optional(Hashable): Owner of the request, like id of user
+            (default: None).
+
+    Returns:
+        Tuple[Dict[str, CandleSeries], List[str], Dict[str, float], bool]:
+        Candles of served symbols, symbols queued for fetching along with
+        estimated seconds until they are fetched, and whether upstream api
+        reported that its quota is reached.
+    """
+
+    symbols_data_requested.send(
+        sender=CandleSeries, symbols=symbols, interval=interval
+    )
+    parsed_symbols_data, missing_symbols = get_cached_symbols_data(
+        symbols, interval, last
+    )
+    granted_calls = call_budget.acquire(
+        min(len(missing_symbols), get_fair_share(owner))
+    ) if missing_symbols else 0
+    pending_symbols = missing_symbols[granted_calls:]
+    limited_symbols = []
+    if granted_calls:
+        fetched_symbols_data, limited_symbols = fetch_symbols_into_cache(
+            missing_symbols[:granted_calls], interval
         )
-        symbol_data_df = symbol_data_df.transpose()
-        symbol_data_df['6. date_time'] = symbol_data_df.index
-        symbol_data_df.reset_index(inplace=True, drop=True)
-        symbol_data_df.columns = symbol_data_df.columns.str[3:]
-        symbol_data_df = symbol_data_df[[
-            "open", "close", "low", "high", "volume", "date_time"]]
-
-        fetched_symbols.append(symbol_name)
-        symbols_latest_prices_dict[symbol_name] = symbol_data_df.iloc[-1]
-        symbols_candle_stick_graph_dict[symbol_name] = (
-            symbol_data_df.to_numpy().tolist()
+        parsed_symbols_data.update(fetched_symbols_data)
+        pending_symbols = limited_symbols + pending_symbols
+
+    pending_symbols_eta = {}
+    if pending_symbols:
+        pending_symbols_eta = fetch_pipeline.schedule(
+            pending_symbols, interval, owner
         )
+    return (
+        parsed_symbols_data, pending_symbols, pending_symbols_eta,
+        bool(limited_symbols)
+    )
+
+
+def get_symbols_latest_and_graph_data(symbols, interval=DEFAULT_INTERVAL,
+                                      fields=SYMBOLS_DATA_FIELDS, start=None,
+                                      end=None, limit=None, owner=None):
+    """Retrieves the latest prices and candlestick graph data for
+    a list of symbols. Only the asked fields are built, so when candles are
+    not asked, just the newest candle of cached symbols is decoded and no
+    candle rows are formatted. Candlestick graph data can be limited to a
+    window of time and to the newest candles of it. Cached symbols are
+    served right away and uncached symbols are fetched as far as call budget
+    allows, the remaining symbols are queued in `fetch_pipeline` and
+    returned as pending along with their estimated wait. When upstream api
+    reports that its quota is reached and no symbol could be served, then
+    this function returns with a note (429 error). When symbol data is not
+    available then that symbol is not included in the response.
+
+    Args:
+        symbols (list): List of symbols for which to fetch data.
+        interval optional(str): Time interval for the data (default: '5min').
+        fields optional(Iterable[str]): Fields to return, out of
+            `SYMBOLS_DATA_FIELDS` (default: all of them).
+        start optional(Union[str, datetime]): Time of the first candle of
+            graph data, in the time zone of the data.
+        end optional(Union[str, datetime]): Time of the last candle of graph
+            data, in the time zone of the data.
+        limit optional(int): Max number of newest candles of graph data.
+        owner optional(Hashable): Owner of the request, like id of user,
+            whose share of call budget is used (default: None).
 
-        values = symbol_data_df.columns.tolist()
+    Returns:
+        dict: A dictionary containing the following information:
+            - symbols (list): List of symbols for which data was retrieved.
+            - values (list): List of names of values for each data point (eg:
+                open, close, volume and etc.), when `values` is asked.
+            - latest_prices (dict): Dictionary mapping symbols to their
+                latest prices, when `latest_prices` is asked.
+            - candle_stick_graph_data (dict): Dictionary mapping symbols
+                to their candlestick graph data, when `candles` is asked.
+            - pending_symbols (list): List of symbols queued for fetching.
+            - pending_symbols_eta (dict): Dictionary mapping pending symbols
+                to estimated seconds until they are fetched.
+    """
+
+    # Removing duplicate symbols while keeping their order.
+    symbols = list(dict.fromkeys(symbols))
+
+    if 'candles' not in fields:
+        last = 1
+    elif start is None and end is None:
+        last = limit
+    else:
+        last = None
+    parsed_symbols_data, pending_symbols, pending_symbols_eta, limited = (
+        get_symbols_series(symbols, interval, last, owner)
+    )
+    if limited and not parsed_symbols_data:
+        return {
+            "Note": "You have reached the limit of 5 calls per minute."
+        }
 
-    response = {
-        "symbols": fetched_symbols,
-        "values": values,
-        "latest_prices": symbols_latest_prices_dict,
-        "candle_stick_graph_data": symbols_candle_stick_graph_dict
-    }
+    fetched_symbols = [
+        parsed_symbols_data[symbol].symbol for symbol in symbols
+        if symbol in parsed_symbols_data
+    ]
+    response = {"symbols": fetched_symbols}
+    if 'values' in fields:
+        response["values"] = list(CANDLE_VALUES) if fetched_symbols else []
+    if 'latest_prices' in fields:
+        response["latest_prices"] = {
+            series.symbol: series.latest_row()
+            for series in map(parsed_symbols_data.get, symbols)
+            if series is not None
+        }
+    if 'candles' in fields:
+        response["candle_stick_graph_data"] = {
+            series.symbol: get_candles_window(
+                series, interval, start, end, limit
+            ).to_rows()
+            for series in map(parsed_symbols_data.get, symbols)
+            if series is not None
+        }
+    response["pending_symbols"] = pending_symbols
+    response["pending_symbols_eta"] = pending_symbols_eta
 
     return response
@@ -1,9 +1,72 @@
 """
 Module that defines common utility methods.
+
+Responses are recorded to or replayed from the upstream `cassette`, when a
+cassette mode is set. Requests in flight to a provider are bounded by its
+outbound limiter, so a batch of many urls doesn't fire all of them at once.
 """
 
+from .cassette import REPLAY, get_cassette
+from .concurrency import get_outbound_limiter
+from .lazy_imports import LazyModule
+
 import asyncio
-import aiohttp
+import json
+import time
+
+aiohttp = LazyModule('aiohttp')
+
+
+async def iter_url_chunks(session, url, chunk_size=64 * 1024):
+    """Yields the body of a URL chunk by chunk as it arrives. Body is
+    served from the cassette in replay mode, and appended to it in record
+    mode. Request waits for a slot of the outbound limiter of its provider.
+
+    Args:
+        session (aiohttp.ClientSession): Session of the request.
+        url (str): URL from which to fetch data.
+        chunk_size optional(int): Max size of chunks (default: 64 KB).
+
+    Yields:
+        bytes: Next chunk of the body.
+    """
+
+    cassette = get_cassette()
+    async with get_outbound_limiter(url):
+        if cassette is not None and cassette.mode == REPLAY:
+            body, elapsed = cassette.replay(url)
+            if elapsed:
+                await asyncio.sleep(elapsed)
+            for start in range(0, len(body), chunk_size):
+                yield body[start:start + chunk_size]
+            return
+
+        started = time.monotonic()
+        chunks = []
+        async with session.get(url, ssl=False) as response:
+            async for chunk in response.content.iter_chunked(chunk_size):
+                if cassette is not None:
+                    chunks.append(chunk)
+                yield chunk
+        if cassette is not None:
+            cassette.record(
+                url, response.status, b''.join(chunks),
+                time.monotonic() - started
+            )
+
+
+async def read_url(session, url):
+    """Reads the whole body of a URL.
+
+    Args:
+        session (aiohttp.ClientSession): Session of the request.
+        url (str): URL from which to fetch data.
+
+    Returns:
+        bytes: Body of the response.
+    """
+
+    return b''.join([chunk async for chunk in iter_url_chunks(session, url)])
 
 
 async def fetch_urls_json_data(urls):
@@ -16,12 +79,67 @@ async def fetch_urls_json_data(urls):
         list: List of JSON responses obtained from the URLs.
     """
 
+    raw_responses = await fetch_urls_raw_data(urls)
+    return [json.loads(raw_response) for raw_response in raw_responses]
+
+
+async def fetch_urls_raw_data(urls):
+    """Fetches raw bodies from multiple URLs asynchronously, without
+    decoding them.
+
+    Args:
+        urls (List[str]): List of URLs from which to fetch data.
+
+    Returns:
+        List[bytes]: List of response bodies obtained from the URLs.
+    """
+
     async with aiohttp.ClientSession(trust_env=True) as session:
-        tasks = []
-        for url in urls:
-            tasks.append(session.get(url, ssl=False))
-        responses = await asyncio.gather(*tasks)
-        json_responses = []
-        for response in responses:
-            json_responses.append(await response.json())
-        return json_responses
+        return await asyncio.gather(*[read_url(session, url) for url in urls])
+
+
+async def fetch_urls_decoded_data(urls, build_decoder, chunk_size=64 * 1024,
+                                  on_error=None):
+    """Fetches multiple URLs asynchronously, feeding each response body to
+    its own incremental decoder chunk by chunk as it arrives, so that whole
+    bodies are never buffered. A body which can't be decoded only fails its
+    own URL when `on_error` is given, the rest of a body is still read.
+
+    Args:
+        urls (List[str]): List of URLs from which to fetch data.
+        build_decoder (Callable[[], Any]): Returns a new decoder, with
+            `feed(chunk)` and `close()` methods.
+        chunk_size optional(int): Max size of fed chunks (default: 64 KB).
+        on_error optional(Callable[[ValueError], Any]): Returns the result
+            of a URL whose decoder raised an error (default: None, error is
+            raised).
+
+    Returns:
+        List[Any]: Result of `close()` of the decoder of each URL.
+
+    Raises:
+        ValueError: If a body can't be decoded and `on_error` isn't given.
+    """
+
+    async with aiohttp.ClientSession(trust_env=True) as session:
+
+        async def fetch_url(url):
+            decoder = build_decoder()
+            error = None
+            async for chunk in iter_url_chunks(session, url, chunk_size):
+                if error is not None:
+                    continue
+                try:
+                    decoder.feed(chunk)
+                except ValueError as exc:
+                    error = exc
+            if error is None:
+                try:
+                    return decoder.close()
+                except ValueError as exc:
+                    error = exc
+            if on_error is None:
+                raise error
+            return on_error(error)
+
+        return await asyncio.gather(*[fetch_url(url) for url in urls])